@@ -1,8 +1,10 @@
 # api/consumers.py
 import json
 import uuid
+from decimal import Decimal
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.core.exceptions import ValidationError
 from django.utils import timezone
 
 class NotificationConsumer(AsyncWebsocketConsumer):
@@ -119,11 +121,8 @@ class NotificationConsumer(AsyncWebsocketConsumer):
     def get_unread_count(self):
         if not self.user:
             return 0
-        from .models import Notification
-        return Notification.objects.filter(
-            user=self.user,
-            is_read=False
-        ).count()
+        from .utils.unread_counters import notification_unread_total
+        return notification_unread_total(self.user.id)
     
     @database_sync_to_async
     def get_recent_notifications(self):
@@ -148,26 +147,26 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         if not self.user:
             return
         from .models import Notification
-        Notification.objects.filter(
+        from .utils.unread_counters import mark_notifications_read
+        mark_notifications_read(Notification.objects.filter(
             id=notification_id,
             user=self.user
-        ).update(is_read=True)
+        ))
     
     @database_sync_to_async
     def mark_all_notifications_read(self):
         if not self.user:
             return
         from .models import Notification
-        Notification.objects.filter(
-            user=self.user,
-            is_read=False
-        ).update(is_read=True)
+        from .utils.unread_counters import mark_notifications_read
+        mark_notifications_read(Notification.objects.filter(user=self.user))
 
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.user = None
         self.conversation_id = None
         self.room_group_name = None
+        self.receivers = {}
         await self.accept()
     
     async def receive(self, text_data):
@@ -188,6 +187,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.handle_read_receipt(data)
         elif message_type == 'typing':
             await self.handle_typing(data)
+        elif message_type == 'load_history':
+            await self.handle_load_history(data)
     
     async def handle_authenticate(self, data):
         user_id = data.get('user_id')
@@ -243,10 +244,13 @@ class ChatConsumer(AsyncWebsocketConsumer):
             }))
     
     async def handle_chat_message(self, data):
+        from .models import Message
+        from .utils.chat_writes import PendingMessage, QueueFull, get_chat_writer
         if not self.user:
             return
         
         conversation_id = self.conversation_id or data.get('conversation_id')
+        client_id = data.get('client_id')
         
         if not conversation_id:
             await self.send(text_data=json.dumps({
@@ -256,43 +260,45 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return
             
         conversation_id = str(conversation_id)
-        self.room_group_name = f"chat_{conversation_id}"
+        room_group_name = f"chat_{conversation_id}"
+        if room_group_name != self.room_group_name:
+            self.room_group_name = room_group_name
+            await self.channel_layer.group_add(
+                self.room_group_name,
+                self.channel_name
+            )
         
-        await self.channel_layer.group_add(
-            self.room_group_name,
-            self.channel_name
-        )
+        receiver = await self.get_receiver(data.get('receiver_id'))
+        if not receiver:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': 'Receiver not found',
+                'client_id': client_id
+            }))
+            return
         
-        message = await self.save_message_to_db(
-            receiver_id=data['receiver_id'],
+        # Written, acknowledged and broadcast to the room by the chat writer (api.utils.chat_writes)
+        message = Message(
+            sender=self.user,
+            receiver=receiver,
             content=data['content'],
             message_type=data.get('message_type', 'text'),
-            conversation_id=conversation_id
-        )
-        
-        message_data = {
-            'type': 'chat_message',
-            'message_id': str(message.id),
-            'sender_id': str(self.user.id),
-            'sender_name': self.user.username or 'Unknown',
-            'receiver_id': data['receiver_id'],
-            'content': data['content'],
-            'timestamp': str(message.created_at),
-            'status': message.status,
-            'conversation_id': conversation_id
-        }
-        
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            message_data
-        )
-        
-        await self.send_notification_to_user(
-            receiver_id=data['receiver_id'],
-            sender_name=self.user.username or 'Unknown',
-            content=data['content'][:100],
-            conversation_id=conversation_id
+            conversation_id=conversation_id,
+            status='sent'
         )
+        try:
+            await get_chat_writer().enqueue(PendingMessage(
+                message=message,
+                sender_name=self.user.username or 'Unknown',
+                reply_channel=self.channel_name,
+                client_id=client_id
+            ))
+        except QueueFull:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': 'Server busy, please resend',
+                'client_id': client_id
+            }))
     
     async def handle_read_receipt(self, data):
         if not self.user:
@@ -334,9 +340,26 @@ class ChatConsumer(AsyncWebsocketConsumer):
             'content': event['content'],
             'timestamp': event['timestamp'],
             'status': event['status'],
+            'conversation_id': event['conversation_id'],
+            'client_id': event.get('client_id')
+        }))
+    
+    async def chat_message_saved(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'message_saved',
+            'message_id': event['message_id'],
+            'client_id': event['client_id'],
             'conversation_id': event['conversation_id']
         }))
     
+    async def chat_message_failed(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'error',
+            'message': 'Message could not be saved',
+            'message_id': event['message_id'],
+            'client_id': event['client_id']
+        }))
+    
     async def read_receipt(self, event):
         await self.send(text_data=json.dumps({
             'type': 'message_read',
@@ -359,16 +382,35 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 self.channel_name
             )
     
-    async def send_conversation_history(self):
+    async def handle_load_history(self, data):
+        """An older page of history, requested as the client scrolls up"""
+        from .utils.cursor_pagination import decode_cursor
         if not self.conversation_id:
             return
         
-        messages = await self.get_conversation_messages()
+        cursor = data.get('cursor')
+        if cursor and decode_cursor(cursor) is None:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': 'Invalid cursor'
+            }))
+            return
+        
+        await self.send_conversation_history(cursor, data.get('page_size'), always=True)
+    
+    async def send_conversation_history(self, cursor=None, page_size=None, always=False):
+        if not self.conversation_id:
+            return
         
-        if messages:
+        messages, next_cursor = await self.get_conversation_messages(cursor, page_size)
+        
+        if messages or always:
             await self.send(text_data=json.dumps({
                 'type': 'conversation_history',
-                'messages': messages
+                'messages': messages,
+                'cursor': cursor,
+                'has_next': next_cursor is not None,
+                'next_cursor': next_cursor
             }))
     
     @database_sync_to_async
@@ -379,24 +421,14 @@ class ChatConsumer(AsyncWebsocketConsumer):
         except User.DoesNotExist:
             return None
     
-    @database_sync_to_async
-    def save_message_to_db(self, receiver_id, content, message_type, conversation_id):
-        from .models import User, Message
-        try:
-            receiver = User.objects.get(id=receiver_id)
-            
-            message = Message.objects.create(
-                sender=self.user,
-                receiver=receiver,
-                content=content,
-                message_type=message_type,
-                conversation_id=conversation_id,
-                status='sent'
-            )
-            return message
-        except Exception as e:
-            print(f"Error saving message: {e}")
-            raise
+    async def get_receiver(self, receiver_id):
+        """The receiver's User, looked up once per connection"""
+        if not receiver_id:
+            return None
+        receiver_id = str(receiver_id)
+        if receiver_id not in self.receivers:
+            self.receivers[receiver_id] = await self.get_user(receiver_id)
+        return self.receivers[receiver_id]
     
     @database_sync_to_async
     def mark_message_read(self, message_id):
@@ -409,32 +441,13 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return None
     
     @database_sync_to_async
-    def get_conversation_messages(self):
-        from .models import Message
+    def get_conversation_messages(self, cursor=None, page_size=None):
+        """A page of history older than the cursor (api.utils.chat_history)"""
+        from .utils.chat_history import history_page
         if not self.conversation_id:
-            return []
-        
-        messages = Message.objects.filter(
-            conversation_id=self.conversation_id
-        ).select_related('sender', 'receiver').order_by('-created_at')[:50]
-        
-        history = []
-        for msg in reversed(messages):
-            if (msg.sender == self.user and msg.is_deleted_for_sender) or \
-               (msg.receiver == self.user and msg.is_deleted_for_receiver):
-                continue
-                
-            history.append({
-                'id': str(msg.id),
-                'sender_id': str(msg.sender.id) if msg.sender else None,
-                'sender_name': msg.sender.username if msg.sender else 'Unknown',
-                'content': msg.content,
-                'timestamp': str(msg.created_at),
-                'status': msg.status,
-                'message_type': msg.message_type
-            })
+            return [], None
         
-        return history
+        return history_page(self.conversation_id, self.user.id, cursor, page_size)
     
     @database_sync_to_async
     def get_conversation_id(self, user1_id, user2_id):
@@ -456,19 +469,85 @@ class ChatConsumer(AsyncWebsocketConsumer):
             pass
         
         return str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{ids[0]}_{ids[1]}"))
+
+class RiderLocationConsumer(AsyncWebsocketConsumer):
+    """
+    Position pings from the rider app, once it has authenticated with the
+    location token from login. Each ping updates the live location index
+    (api.utils.rider_locations); the rider's saved coordinates are only
+    written once per RIDER_LOCATION_DB_INTERVAL.
+    """
+    async def connect(self):
+        self.rider_id = None
+        await self.accept()
+    
+    async def receive(self, text_data):
+        try:
+            data = json.loads(text_data)
+        except ValueError:
+            await self.send_error('Invalid JSON')
+            return
+        message_type = data.get('type')
+        
+        if message_type == 'authenticate':
+            await self.handle_authenticate(data)
+        elif not self.rider_id:
+            await self.send_error('Not authenticated')
+        elif message_type == 'location':
+            await self.handle_location(data)
+    
+    async def handle_authenticate(self, data):
+        from .utils.rider_locations import token_user_id
+        # The location token from login, not a bare user id anyone could send
+        user_id = token_user_id(data.get('token'))
+        if not user_id or data.get('user_id') not in (None, user_id):
+            await self.send_error('Invalid or expired location token')
+            await self.close()
+            return
+        
+        self.rider_id = await self.get_rider_id(user_id)
+        if not self.rider_id:
+            await self.send_error('Rider not found')
+            await self.close()
+            return
+        
+        await self.send(text_data=json.dumps({
+            'type': 'authenticated',
+            'rider_id': self.rider_id
+        }))
+    
+    async def handle_location(self, data):
+        try:
+            lat = float(data.get('latitude'))
+            lng = float(data.get('longitude'))
+        except (TypeError, ValueError):
+            await self.send_error('latitude and longitude are required')
+            return
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            await self.send_error('Coordinates out of range')
+            return
+        
+        await self.save_location(lat, lng)
+    
+    async def send_error(self, message):
+        await self.send(text_data=json.dumps({
+            'type': 'error',
+            'message': message
+        }))
     
     @database_sync_to_async
-    def send_notification_to_user(self, receiver_id, sender_name, content, conversation_id):
-        from .models import User, Notification
+    def get_rider_id(self, user_id):
+        from .models import Rider
         try:
-            receiver = User.objects.get(id=receiver_id)
-            
-            Notification.objects.create(
-                user=receiver,
-                title=f"New message from {sender_name}",
-                message=content,
-                type='chat',
-                is_read=False
+            return str(Rider.objects.only('rider_id').get(rider_id=user_id).pk)
+        except (Rider.DoesNotExist, ValueError, ValidationError):
+            return None
+    
+    @database_sync_to_async
+    def save_location(self, lat, lng):
+        from .models import User
+        from .utils.rider_locations import record_location
+        if record_location(self.rider_id, lat, lng):
+            User.objects.filter(id=self.rider_id).update(
+                latitude=Decimal(str(round(lat, 7))), longitude=Decimal(str(round(lng, 7)))
             )
-        except User.DoesNotExist:
-            pass
\ No newline at end of file
@@ -2,10 +2,15 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 from django.db.models import Q
 from datetime import timedelta
-import requests
 import math
 from decimal import Decimal
-from api.models import Order, Delivery, Rider, Notification, Shop, User
+from api.models import Order, Delivery, Rider, User
+from api.utils.delivery_writes import DeliveryWrites
+from api.utils.distance_service import driving_distance
+from api.utils.geocoding import address_parts, lookup_coordinates
+from api.utils.offer_timers import get_offer_timeout
+from api.utils.order_pickups import PICKUP_RELATED, get_pickup, pickup_point
+from api.utils.rider_matching import RiderPool, get_candidate_count, plan_assignments, rank_riders, rejected_riders_by_order
 from django.conf import settings
 
 class Command(BaseCommand):
@@ -22,10 +27,18 @@ class Command(BaseCommand):
             action='store_true',
             help='Show detailed logs',
         )
+        parser.add_argument(
+            '--mode',
+            choices=['greedy', 'optimal'],
+            default=None,
+            help='greedy: nearest rider per order in turn; optimal: one global assignment for the whole sweep '
+                 '(default: DELIVERY_ASSIGNMENT_MODE)',
+        )
 
     def handle(self, *args, **options):
-        order_id_filter = options.get('order-id')
+        order_id_filter = options.get('order_id')
         verbose = options.get('verbose', False)
+        mode = options.get('mode') or getattr(settings, 'DELIVERY_ASSIGNMENT_MODE', 'greedy')
         
         self.stdout.write("=" * 80)
         self.stdout.write(f"[{timezone.now()}] 🚚 Starting delivery assignment...")
@@ -37,7 +50,7 @@ class Command(BaseCommand):
             delivery_method__icontains='delivery'
         ).exclude(
             delivery__status__in=['accepted', 'picked_up', 'delivered', 'in_progress']
-        ).distinct()
+        ).distinct().select_related('user', 'shipping_address', *PICKUP_RELATED)
         
         if order_id_filter:
             pending_orders = pending_orders.filter(order=order_id_filter)
@@ -69,74 +82,35 @@ class Command(BaseCommand):
             self.stdout.write(f"     🚗 Vehicle: {rider.vehicle_type or 'N/A'} | Plate: {rider.plate_number or 'N/A'}")
         self.stdout.write("=" * 80 + "\n")
         
-        for order in pending_orders:
-            self.assign_nearest_rider_to_order(order, available_riders, verbose)
+        # One pass over the riders' coordinates and one query for every
+        # order's rejections, instead of per-rider lookups for each order
+        rider_pool = RiderPool(available_riders)
+        pending_orders = list(pending_orders)
+        rejected_by_order = rejected_riders_by_order(order.pk for order in pending_orders)
+        
+        # Decide every order first, then write the whole sweep in one transaction
+        self.writes = DeliveryWrites()
+        if mode == 'optimal':
+            self.assign_optimally(pending_orders, rider_pool, rejected_by_order)
+        else:
+            for order in pending_orders:
+                self.assign_nearest_rider_to_order(order, rider_pool, verbose, rejected_by_order.get(order.pk, set()))
+        
+        notifications = len(self.writes.notifications)
+        offers = self.writes.flush()
+        self.stdout.write(f"\n💾 Saved {len(offers)} offers and {notifications} notifications")
     
-    def get_coordinates_from_address(self, address):
-        """Get coordinates from address using Google Maps Geocoding API"""
-        if not address:
-            return None, None
-        
-        GOOGLE_MAPS_API_KEY = getattr(settings, 'GOOGLE_MAPS_API_KEY', None)
-        if not GOOGLE_MAPS_API_KEY:
-            self.stdout.write(self.style.WARNING("⚠️ Google Maps API key not configured"))
-            return None, None
-        
-        try:
-            url = "https://maps.googleapis.com/maps/api/geocode/json"
-            params = {
-                'address': address,
-                'key': GOOGLE_MAPS_API_KEY,
-                'components': 'country:PH'
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
-            data = response.json()
-            
-            if data.get('status') == 'OK' and data.get('results'):
-                location = data['results'][0]['geometry']['location']
-                return location['lat'], location['lng']
-            else:
-                self.stdout.write(f"⚠️ Geocoding failed for address: {address} - {data.get('status')}")
-                return None, None
-                
-        except Exception as e:
-            self.stdout.write(f"❌ Geocoding error: {str(e)}")
+    def get_coordinates_from_address(self, *parts):
+        """Coordinates from the geocode cache; unknown addresses are queued for the geocode backfill"""
+        lat, lng = lookup_coordinates(*parts)
+        if lat is None or lng is None:
+            self.stdout.write(f"⚠️ No coordinates yet for address: {', '.join(str(p) for p in parts if p)} (queued for geocoding)")
             return None, None
+        return float(lat), float(lng)
     
     def get_driving_distance(self, origin_lat, origin_lng, dest_lat, dest_lng):
-        """Calculate actual driving distance using Google Maps Distance Matrix API"""
-        GOOGLE_MAPS_API_KEY = getattr(settings, 'GOOGLE_MAPS_API_KEY', None)
-        
-        if not GOOGLE_MAPS_API_KEY:
-            return self.haversine_distance(origin_lat, origin_lng, dest_lat, dest_lng)
-        
-        try:
-            url = "https://maps.googleapis.com/maps/api/distancematrix/json"
-            params = {
-                'origins': f"{origin_lat},{origin_lng}",
-                'destinations': f"{dest_lat},{dest_lng}",
-                'key': GOOGLE_MAPS_API_KEY,
-                'units': 'metric'
-            }
-            
-            response = requests.get(url, params=params, timeout=5)
-            data = response.json()
-            
-            if data.get('status') == 'OK':
-                rows = data.get('rows', [])
-                if rows:
-                    elements = rows[0].get('elements', [])
-                    if elements and elements[0].get('status') == 'OK':
-                        distance_meters = elements[0].get('distance', {}).get('value', 0)
-                        if distance_meters > 0:
-                            return distance_meters / 1000
-            
-            return self.haversine_distance(origin_lat, origin_lng, dest_lat, dest_lng)
-            
-        except Exception as e:
-            self.stdout.write(f"❌ Distance calculation error: {str(e)}")
-            return self.haversine_distance(origin_lat, origin_lng, dest_lat, dest_lng)
+        """Driving distance from the shared distance service (cached, haversine fallback)"""
+        return driving_distance(origin_lat, origin_lng, dest_lat, dest_lng)
     
     def haversine_distance(self, lat1, lng1, lat2, lng2):
         """Calculate straight-line distance using Haversine formula (fallback)"""
@@ -154,52 +128,24 @@ class Command(BaseCommand):
     
     def get_order_pickup_location(self, order):
         """Get the pickup location (shop or seller address) for the order"""
-        checkout_item = order.checkout_set.first()
-        if not checkout_item:
+        pickup = get_pickup(order)
+        if not pickup:
             return None, None, None
         
-        if checkout_item.direct_shop_id:
-            try:
-                shop = Shop.objects.get(id=checkout_item.direct_shop_id)
-                if shop.latitude and shop.longitude:
-                    return float(shop.latitude), float(shop.longitude), shop.name
-                
-                address = f"{shop.street}, {shop.barangay}, {shop.city}, {shop.province}, Philippines"
-                lat, lng = self.get_coordinates_from_address(address)
-                if lat and lng:
-                    shop.latitude = Decimal(str(lat))
-                    shop.longitude = Decimal(str(lng))
-                    shop.save()
-                    return lat, lng, shop.name
-            except Shop.DoesNotExist:
-                pass
-        
-        elif checkout_item.cart_item and checkout_item.cart_item.product:
-            product = checkout_item.cart_item.product
-            if product.shop:
-                shop = product.shop
-                if shop.latitude and shop.longitude:
-                    return float(shop.latitude), float(shop.longitude), shop.name
-                
-                address = f"{shop.street}, {shop.barangay}, {shop.city}, {shop.province}, Philippines"
-                lat, lng = self.get_coordinates_from_address(address)
-                if lat and lng:
-                    shop.latitude = Decimal(str(lat))
-                    shop.longitude = Decimal(str(lng))
-                    shop.save()
-                    return lat, lng, shop.name
-            elif product.customer:
-                seller = product.customer.customer
-                if seller.latitude and seller.longitude:
-                    return float(seller.latitude), float(seller.longitude), f"{seller.first_name} {seller.last_name}"
-                
-                address = f"{seller.street}, {seller.barangay}, {seller.city}, {seller.province}, Philippines"
-                lat, lng = self.get_coordinates_from_address(address)
-                if lat and lng:
-                    seller.latitude = Decimal(str(lat))
-                    seller.longitude = Decimal(str(lng))
-                    seller.save()
-                    return lat, lng, f"{seller.first_name} {seller.last_name}"
+        lat, lng, name = pickup_point(pickup)
+        if lat and lng:
+            return lat, lng, name
+        
+        # Not geocoded yet: try the geocode cache and keep what it knows
+        place = pickup.shop or pickup.seller
+        if place is None:
+            return None, None, None
+        lat, lng = self.get_coordinates_from_address(*address_parts(place))
+        if lat and lng:
+            place.latitude = Decimal(str(lat))
+            place.longitude = Decimal(str(lng))
+            place.save(update_fields=['latitude', 'longitude'])
+            return lat, lng, name
         
         return None, None, None
     
@@ -218,8 +164,7 @@ class Command(BaseCommand):
             return float(order.user.latitude), float(order.user.longitude)
         
         if order.shipping_address and order.shipping_address.get_full_address():
-            address = order.shipping_address.get_full_address()
-            lat, lng = self.get_coordinates_from_address(f"{address}, Philippines")
+            lat, lng = self.get_coordinates_from_address(*address_parts(order.shipping_address))
             if lat and lng:
                 order.shipping_address.latitude = Decimal(str(lat))
                 order.shipping_address.longitude = Decimal(str(lng))
@@ -242,9 +187,12 @@ class Command(BaseCommand):
         time_minutes = distance_km / 0.5
         return max(15, int(time_minutes))
     
-    def assign_nearest_rider_to_order(self, order, available_riders, verbose=False):
-        """Assign ONLY the nearest rider to the order (single rider assignment)"""
-        
+    def prepare_order(self, order):
+        """
+        Expire a stale offer and resolve the order's pickup and destination.
+        Returns {'pickup', 'pickup_name', 'destination'} or None when the
+        order is still waiting on a rider or can't be located.
+        """
         self.stdout.write("\n" + "=" * 80)
         self.stdout.write(f"📦 PROCESSING ORDER: {order.order}")
         self.stdout.write(f"   Status: {order.status} | Delivery Method: {order.delivery_method}")
@@ -257,19 +205,18 @@ class Command(BaseCommand):
         
         if existing_delivery:
             time_since_creation = timezone.now() - existing_delivery.created_at
-            if time_since_creation < timedelta(minutes=10):
+            if time_since_creation < timedelta(seconds=get_offer_timeout()):
                 self.stdout.write(f"⏳ Order {order.order} already has pending delivery (waiting for response)")
-                return
+                return None
             else:
-                existing_delivery.status = 'expired'
-                existing_delivery.save()
+                self.writes.set_delivery_status(existing_delivery, 'expired')
                 self.stdout.write(f"⌛ Previous delivery for order {order.order} expired")
         
         # Get pickup location
         pickup_lat, pickup_lng, pickup_name = self.get_order_pickup_location(order)
         if not pickup_lat or not pickup_lng:
             self.stdout.write(self.style.WARNING(f"❌ Cannot get pickup location for order {order.order}"))
-            return
+            return None
         
         self.stdout.write(f"\n📍 PICKUP LOCATION:")
         self.stdout.write(f"   Name: {pickup_name}")
@@ -279,65 +226,63 @@ class Command(BaseCommand):
         dest_lat, dest_lng = self.get_customer_destination(order)
         if not dest_lat or not dest_lng:
             self.stdout.write(self.style.WARNING(f"❌ Cannot get destination for order {order.order}"))
-            return
+            return None
         
         self.stdout.write(f"\n📍 DESTINATION LOCATION:")
         self.stdout.write(f"   Coordinates: ({dest_lat}, {dest_lng})")
         
-        # Calculate distances for each rider
-        rider_distances = []
+        return {
+            'pickup': (pickup_lat, pickup_lng),
+            'pickup_name': pickup_name,
+            'destination': (dest_lat, dest_lng)
+        }
+    
+    def assign_nearest_rider_to_order(self, order, rider_pool, verbose=False, rejected_rider_ids=None):
+        """Assign ONLY the nearest rider to the order (single rider assignment)"""
+        if not isinstance(rider_pool, RiderPool):
+            rider_pool = RiderPool(rider_pool)
+        if rejected_rider_ids is None:
+            rejected_rider_ids = rejected_riders_by_order([order.pk]).get(order.pk, set())
+        
+        endpoints = self.prepare_order(order)
+        if not endpoints:
+            return
+        (pickup_lat, pickup_lng), (dest_lat, dest_lng) = endpoints['pickup'], endpoints['destination']
+        
+        # Straight-line prefilter over every rider, then driving distances
+        # for the nearest few only
         self.stdout.write("\n" + "=" * 80)
         self.stdout.write("📊 COMPARING RIDER DISTANCES:")
         self.stdout.write("=" * 80)
         
-        for rider in available_riders:
-            # Get rider location
-            rider_lat, rider_lng = self.get_rider_location(rider)
-            if not rider_lat or not rider_lng:
+        if verbose:
+            for rider in rider_pool.without_location:
                 self.stdout.write(f"\n⚠️ Rider {rider.rider.username} has NO location data - SKIPPING")
-                continue
-            
-            # Check if this rider has rejected this order before
-            rejected_before = Delivery.objects.filter(
-                order=order,
-                rider=rider,
-                status='rejected'
-            ).exists()
-            
-            if rejected_before:
-                self.stdout.write(f"\n⚠️ Rider {rider.rider.username} previously rejected this order - SKIPPING")
-                continue
-            
-            # Calculate distances
-            distance_to_pickup = self.get_driving_distance(rider_lat, rider_lng, pickup_lat, pickup_lng)
-            distance_pickup_to_dest = self.get_driving_distance(pickup_lat, pickup_lng, dest_lat, dest_lng)
-            total_distance = distance_to_pickup + distance_pickup_to_dest
-            
-            rider_distances.append({
-                'rider': rider,
-                'distance_to_pickup': distance_to_pickup,
-                'distance_pickup_to_dest': distance_pickup_to_dest,
-                'total_distance': total_distance,
-                'rider_lat': rider_lat,
-                'rider_lng': rider_lng
-            })
-            
-            # Show comparison
-            self.stdout.write(f"\n🏍️ Rider: {rider.rider.username}")
-            self.stdout.write(f"   📍 Rider Location: ({rider_lat}, {rider_lng})")
-            self.stdout.write(f"   🚗 To Pickup: {distance_to_pickup:.2f} km")
-            self.stdout.write(f"   📦 Pickup to Destination: {distance_pickup_to_dest:.2f} km")
-            self.stdout.write(f"   📊 TOTAL DISTANCE: {total_distance:.2f} km")
+            for rider in rider_pool.riders:
+                if rider.pk in rejected_rider_ids:
+                    self.stdout.write(f"\n⚠️ Rider {rider.rider.username} previously rejected this order - SKIPPING")
+        
+        rider_distances = rank_riders(
+            rider_pool,
+            (pickup_lat, pickup_lng),
+            (dest_lat, dest_lng),
+            exclude=rejected_rider_ids,
+            k=get_candidate_count()
+        )
+        
+        for rd in rider_distances:
+            self.stdout.write(f"\n🏍️ Rider: {rd['rider'].rider.username}")
+            self.stdout.write(f"   📍 Rider Location: ({rd['rider_lat']}, {rd['rider_lng']})")
+            self.stdout.write(f"   📏 Straight Line: {rd['straight_line_km']:.2f} km")
+            self.stdout.write(f"   🚗 To Pickup: {rd['distance_to_pickup']:.2f} km")
+            self.stdout.write(f"   📦 Pickup to Destination: {rd['distance_pickup_to_dest']:.2f} km")
+            self.stdout.write(f"   📊 TOTAL DISTANCE: {rd['total_distance']:.2f} km")
         
         if not rider_distances:
             self.stdout.write(self.style.WARNING(f"\n❌ No eligible riders with location for order {order.order}"))
-            order.status = 'pending_rider'
-            order.save()
+            self.writes.set_order_status(order, 'pending_rider')
             return
         
-        # Sort by total distance (nearest first)
-        rider_distances.sort(key=lambda x: x['total_distance'])
-        
         # Display ranking
         self.stdout.write("\n" + "=" * 80)
         self.stdout.write("🏆 RIDER RANKING (Nearest to Farthest):")
@@ -347,7 +292,50 @@ class Command(BaseCommand):
             self.stdout.write(f"{medal} {rd['rider'].rider.username} - {rd['total_distance']:.2f} km total")
         
         # SELECT ONLY THE NEAREST RIDER (SINGLE ASSIGNMENT)
-        nearest = rider_distances[0]
+        self.create_delivery_offer(order, rider_distances[0], endpoints, rider_distances)
+    
+    def assign_optimally(self, orders, rider_pool, rejected_by_order):
+        """
+        Assign the whole sweep at once: one cost matrix over every order and
+        its candidate riders, solved for the least total distance within each
+        rider's capacity, then compared with greedy per-order matching. Orders
+        whose candidates were all taken get the nearest rider with room left.
+        """
+        jobs = []
+        for order in orders:
+            endpoints = self.prepare_order(order)
+            if endpoints:
+                jobs.append(dict(endpoints, order=order, exclude=rejected_by_order.get(order.pk, set())))
+        
+        if not jobs:
+            self.stdout.write("\nNo orders ready for assignment")
+            return
+        
+        plan = plan_assignments(jobs, rider_pool)
+        
+        for index, entry in sorted(plan['assignments'].items()):
+            job = jobs[index]
+            self.create_delivery_offer(job['order'], entry, job, [entry], extra_metadata={'assignment_mode': 'optimal'})
+        
+        for index in plan['unassigned']:
+            order = jobs[index]['order']
+            if index in plan['without_candidates']:
+                self.stdout.write(self.style.WARNING(f"\n❌ No eligible riders with location for order {order.order}"))
+                self.writes.set_order_status(order, 'pending_rider')
+            else:
+                self.stdout.write(self.style.WARNING(f"\n⏳ Every eligible rider is at capacity; order {order.order} waits for the next sweep"))
+        
+        self.stdout.write("\n" + "=" * 80)
+        self.stdout.write("📈 OPTIMAL ASSIGNMENT SUMMARY:")
+        self.stdout.write("=" * 80)
+        self.stdout.write(f"   Orders assigned: {len(plan['assignments'])} of {len(jobs)} (greedy: {plan['greedy_assigned']})")
+        self.stdout.write(f"   Total distance: {plan['total_km']:.2f} km (greedy: {plan['greedy_total_km']:.2f} km)")
+        self.stdout.write(self.style.SUCCESS(f"   Saved vs greedy: {plan['km_saved']:.2f} km"))
+    
+    def create_delivery_offer(self, order, nearest, endpoints, rider_distances, extra_metadata=None):
+        """Record the offer to the chosen rider: pending_offer delivery, order status and notification"""
+        (pickup_lat, pickup_lng), (dest_lat, dest_lng) = endpoints['pickup'], endpoints['destination']
+        pickup_name = endpoints['pickup_name']
         selected_rider = nearest['rider']
         total_distance = nearest['total_distance']
         distance_to_pickup = nearest['distance_to_pickup']
@@ -368,60 +356,47 @@ class Command(BaseCommand):
         self.stdout.write(f"   ⏱️ Estimated Time: {estimated_minutes} minutes")
         self.stdout.write("=" * 80)
         
-        # Cancel any existing pending deliveries for this order
-        Delivery.objects.filter(order=order, status='pending_offer').delete()
-        
-        # Create SINGLE delivery record for the nearest rider
-        delivery = Delivery.objects.create(
+        # The order's previous offer is cleared when the sweep is written
+        self.writes.add_offer(Delivery(
             order=order,
             rider=selected_rider,
             status='pending_offer',
-            created_at=timezone.now(),
             distance_km=Decimal(str(total_distance)),
             estimated_minutes=estimated_minutes,
-            delivery_fee=Decimal(str(delivery_fee))
-        )
-        
-        # Store metadata
-        delivery.metadata = {
-            'distance_to_pickup': distance_to_pickup,
-            'distance_pickup_to_dest': distance_pickup_to_dest,
-            'rider_location_at_assignment': {
-                'lat': nearest['rider_lat'],
-                'lng': nearest['rider_lng']
-            },
-            'pickup_location': {
-                'lat': pickup_lat,
-                'lng': pickup_lng,
-                'name': pickup_name
-            },
-            'destination_location': {
-                'lat': dest_lat,
-                'lng': dest_lng
-            },
-            'all_riders_considered': [
-                {
-                    'username': rd['rider'].rider.username,
-                    'total_distance': rd['total_distance']
-                }
-                for rd in rider_distances[:10]
-            ]
-        }
-        delivery.save()
-        
-        # Update order status
-        order.status = 'rider_assigned'
-        order.save()
-        
-        # Create notification for the rider
-        Notification.objects.create(
-            user=selected_rider.rider,
-            title='New Delivery Assignment',
-            type='delivery',
-            message=f'You have been assigned to deliver order #{str(order.order)[:8]}. '
-                    f'Distance: {total_distance:.1f}km, Fee: ₱{delivery_fee:.2f}. '
-                    f'Please respond within 10 minutes.',
-            is_read=False
+            delivery_fee=Decimal(str(delivery_fee)),
+            metadata={
+                'distance_to_pickup': distance_to_pickup,
+                'distance_pickup_to_dest': distance_pickup_to_dest,
+                'rider_location_at_assignment': {
+                    'lat': nearest['rider_lat'],
+                    'lng': nearest['rider_lng']
+                },
+                'pickup_location': {
+                    'lat': pickup_lat,
+                    'lng': pickup_lng,
+                    'name': pickup_name
+                },
+                'destination_location': {
+                    'lat': dest_lat,
+                    'lng': dest_lng
+                },
+                'all_riders_considered': [
+                    {
+                        'username': rd['rider'].rider.username,
+                        'total_distance': rd['total_distance']
+                    }
+                    for rd in rider_distances[:10]
+                ],
+                **(extra_metadata or {})
+            }
+        ))
+        self.writes.set_order_status(order, 'rider_assigned')
+        self.writes.notify(
+            selected_rider.rider,
+            'New Delivery Assignment',
+            f'You have been assigned to deliver order #{str(order.order)[:8]}. '
+            f'Distance: {total_distance:.1f}km, Fee: ₱{delivery_fee:.2f}. '
+            f'Please respond within {get_offer_timeout() // 60} minutes.',
         )
         
         self.stdout.write(self.style.SUCCESS(
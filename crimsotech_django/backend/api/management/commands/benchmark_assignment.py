@@ -0,0 +1,203 @@
+import json
+import random
+import time
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from api.models import (
+    CartItem, Checkout, Customer, Delivery, Order, OrderPickup, Product, Rider, ShippingAddress, Shop, User, Variants,
+)
+from api.utils import distance_service
+
+
+# Synthetic data is spread over Metro Manila
+BOUNDS = {'lat': (14.40, 14.80), 'lng': (120.95, 121.10)}
+# Local distance provider: straight line times a typical road detour, at 25 km/h
+ROAD_FACTOR = 1.3
+SPEED_KMH = 25
+
+
+class Rollback(Exception):
+    pass
+
+
+class LocalDistanceProvider:
+    """Deterministic stand-in for the Distance Matrix API that counts what would have been requested"""
+
+    def __init__(self):
+        self.requests = 0
+        self.elements = 0
+
+    def __call__(self, origins, destinations):
+        self.requests += 1
+        self.elements += len(origins) * len(destinations)
+        results = {}
+        for origin in origins:
+            straight = distance_service.haversine_km(
+                origin[0], origin[1], [d[0] for d in destinations], [d[1] for d in destinations]
+            )
+            for destination, km in zip(destinations, straight):
+                km = float(km) * ROAD_FACTOR
+                results[(origin, destination)] = (km, int(km / SPEED_KMH * 3600))
+        return results
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the delivery sweeps on synthetic riders, shops and orders: queries, distance '
+            'provider calls, wall time and assignments per second. Runs in a transaction that is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--riders', type=int, default=200, help='Available riders to generate')
+        parser.add_argument('--orders', type=int, default=100, help='Orders waiting for a rider')
+        parser.add_argument('--shops', type=int, default=20, help='Shops the orders are spread over')
+        parser.add_argument('--mode', choices=['greedy', 'optimal'], default=None,
+                            help='Assignment mode passed to assign_deliveries (default: DELIVERY_ASSIGNMENT_MODE)')
+        parser.add_argument('--expire', type=float, default=0.5,
+                            help='Share of the offers made that time out before check_delivery_responses runs')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed; the same seed generates the same data')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+        parser.add_argument('--verbose', action='store_true', help='Show the sweeps\' own output')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        results = {}
+        try:
+            with transaction.atomic():
+                self.generate(options['riders'], options['orders'], options['shops'])
+                results['assign_deliveries'] = self.measure(
+                    'assign_deliveries', options, mode=options['mode'],
+                    count=lambda: Delivery.objects.filter(status='pending_offer').count(),
+                )
+                self.age_offers(options['expire'])
+                results['check_delivery_responses'] = self.measure(
+                    'check_delivery_responses', options,
+                    count=lambda: Delivery.objects.filter(status='pending_offer', metadata__reassignment=True).count(),
+                )
+                raise Rollback
+        except Rollback:
+            pass
+
+        results['scale'] = {key: options[key] for key in ('riders', 'orders', 'shops', 'mode', 'seed')}
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(
+            f"Scale: {options['riders']} riders, {options['orders']} orders, {options['shops']} shops "
+            f"(seed {options['seed']}, mode {options['mode'] or 'default'})"
+        )
+        for name in ('assign_deliveries', 'check_delivery_responses'):
+            r = results[name]
+            self.stdout.write(
+                f"{name:<26} {r['seconds']:>8.3f}s  queries: {r['queries']:>6}  "
+                f"provider requests: {r['provider_requests']:>5} ({r['provider_elements']} elements)  "
+                f"assignments: {r['assignments']:>5}  ({r['assignments_per_second']:.1f}/s)"
+            )
+
+    def point(self):
+        return (
+            Decimal(str(round(self.rng.uniform(*BOUNDS['lat']), 7))),
+            Decimal(str(round(self.rng.uniform(*BOUNDS['lng']), 7))),
+        )
+
+    def generate(self, rider_count, order_count, shop_count):
+        """Bulk-create the synthetic world; every row is gone once the transaction rolls back"""
+        tag = f'bench{self.rng.randrange(10 ** 8)}'
+
+        owners = User.objects.bulk_create([
+            User(username=f'{tag}_owner{i}', email=f'{tag}_owner{i}@example.com') for i in range(shop_count)
+        ])
+        customers = Customer.objects.bulk_create([Customer(customer=owner) for owner in owners])
+        shops = []
+        for i, customer in enumerate(customers):
+            lat, lng = self.point()
+            shops.append(Shop(name=f'{tag} shop {i}', province='Metro Manila', city='Manila', barangay='B',
+                              street=f'{i} Bench St', customer=customer, latitude=lat, longitude=lng))
+        shops = Shop.objects.bulk_create(shops)
+        products = Product.objects.bulk_create([
+            Product(name=f'{tag} product {i}', description='benchmark', status='active', condition=3, shop=shop)
+            for i, shop in enumerate(shops)
+        ])
+        variants = Variants.objects.bulk_create([
+            Variants(product=product, shop=product.shop, title='Default', price=Decimal('100.00'), quantity=10 ** 6)
+            for product in products
+        ])
+
+        rider_users = []
+        for i in range(rider_count):
+            lat, lng = self.point()
+            rider_users.append(User(username=f'{tag}_rider{i}', email=f'{tag}_rider{i}@example.com',
+                                    is_rider=True, latitude=lat, longitude=lng))
+        rider_users = User.objects.bulk_create(rider_users)
+        Rider.objects.bulk_create([
+            Rider(rider=user, verified=True, availability_status='available', is_accepting_deliveries=True)
+            for user in rider_users
+        ])
+
+        buyers = User.objects.bulk_create([
+            User(username=f'{tag}_buyer{i}', email=f'{tag}_buyer{i}@example.com') for i in range(order_count)
+        ])
+        addresses = []
+        for i, buyer in enumerate(buyers):
+            lat, lng = self.point()
+            addresses.append(ShippingAddress(user=buyer, recipient_name=f'Buyer {i}', recipient_phone='09170000000',
+                                             street=f'{i} Buyer St', barangay='B', city='Manila',
+                                             province='Metro Manila', zip_code='1000', latitude=lat, longitude=lng))
+        addresses = ShippingAddress.objects.bulk_create(addresses)
+        orders = Order.objects.bulk_create([
+            Order(user=buyer, shipping_address=address, total_amount=Decimal('100.00'), payment_method='cash',
+                  status='ready_to_ship', delivery_method='Standard Delivery')
+            for buyer, address in zip(buyers, addresses)
+        ])
+
+        cart_items = []
+        for i, buyer in enumerate(buyers):
+            variant = variants[i % len(variants)]
+            cart_items.append(CartItem(product=variant.product, variant=variant, user=buyer, quantity=1))
+        cart_items = CartItem.objects.bulk_create(cart_items)
+        Checkout.objects.bulk_create([
+            Checkout(order=order, cart_item=item, quantity=1, total_amount=Decimal('100.00'))
+            for order, item in zip(orders, cart_items)
+        ])
+        # What the checkout signal records for orders placed through the API
+        OrderPickup.objects.bulk_create([
+            OrderPickup(order=order, shop_id=item.product.shop_id) for order, item in zip(orders, cart_items)
+        ])
+
+    def age_offers(self, share):
+        """Push a share of the new offers past their deadline so the response sweep reassigns them"""
+        offers = list(Delivery.objects.filter(status='pending_offer').values_list('id', flat=True))
+        expired = self.rng.sample(offers, int(len(offers) * share))
+        Delivery.objects.filter(id__in=expired).update(created_at=timezone.now() - timezone.timedelta(days=1))
+
+    def measure(self, command, options, count, **command_options):
+        """Run one sweep with a cold route cache and the local distance provider"""
+        provider = LocalDistanceProvider()
+        out = self.stdout if options['verbose'] else StringIO()
+        before = count()
+
+        # Offer timers and notification pushes wait for a commit, so they never fire here
+        with mock.patch.object(distance_service, '_fetch', side_effect=provider), \
+                mock.patch.object(distance_service, 'cache', LocMemCache('benchmark', {})), \
+                CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            call_command(command, stdout=out, **command_options)
+            seconds = time.perf_counter() - started
+
+        assignments = count() - before
+        return {
+            'seconds': round(seconds, 4),
+            'queries': len(queries),
+            'provider_requests': provider.requests,
+            'provider_elements': provider.elements,
+            'assignments': assignments,
+            'assignments_per_second': round(assignments / seconds, 2) if seconds else 0.0,
+        }
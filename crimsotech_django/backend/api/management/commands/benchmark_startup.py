@@ -0,0 +1,64 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+# Runs in a fresh interpreter so each measurement starts from an empty
+# module cache, the way a new gunicorn/daphne/celery worker does.
+PROBE = r'''
+import json, os, resource, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+import importlib
+importlib.import_module(os.environ['BENCH_URLCONF'])
+if os.environ.get('BENCH_WITH_ML') == '1':
+    import tensorflow
+elapsed = time.perf_counter() - started
+print(json.dumps({
+    'seconds': elapsed,
+    'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'tensorflow_loaded': 'tensorflow' in sys.modules,
+}))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Measure worker startup cost: time and peak RSS to set up Django and import the URLconf (and the API views)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=3, help='Fresh interpreters to start per scenario')
+        parser.add_argument('--with-ml', action='store_true', help='Also measure a worker that imports TensorFlow up front')
+
+    def _probe(self, with_ml):
+        env = dict(os.environ)
+        env['DJANGO_SETTINGS_MODULE'] = os.environ.get('DJANGO_SETTINGS_MODULE', 'backend.settings')
+        env['BENCH_URLCONF'] = settings.ROOT_URLCONF
+        env['BENCH_WITH_ML'] = '1' if with_ml else '0'
+        env.setdefault('TF_CPP_MIN_LOG_LEVEL', '3')
+
+        result = subprocess.run(
+            [sys.executable, '-c', PROBE],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+        )
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        scenarios = [('api (lazy ML)', False)]
+        if options['with_ml']:
+            scenarios.append(('api + tensorflow', True))
+
+        for label, with_ml in scenarios:
+            samples = [self._probe(with_ml) for _ in range(max(1, options['runs']))]
+            seconds = sorted(s['seconds'] for s in samples)
+            rss = sorted(s['max_rss_mb'] for s in samples)
+            self.stdout.write(
+                f"{label:<18} import: median {seconds[len(seconds) // 2]:.2f}s "
+                f"(min {seconds[0]:.2f}s, max {seconds[-1]:.2f}s)  "
+                f"peak RSS: median {rss[len(rss) // 2]:.0f} MB  "
+                f"tensorflow loaded: {samples[0]['tensorflow_loaded']}"
+            )
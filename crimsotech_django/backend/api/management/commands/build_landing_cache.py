@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.utils.landing_cache import rebuild_landing_payload, get_landing_cache_ttl
+
+
+class Command(BaseCommand):
+    help = 'Precompute the landing page payload and store it in the shared cache'
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        payload = rebuild_landing_payload()
+        elapsed = (timezone.now() - started).total_seconds()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"[{timezone.now()}] Landing payload cached for {get_landing_cache_ttl()}s "
+            f"({len(payload['featured_products'])} featured, {len(payload['hero_products'])} hero products) "
+            f"in {elapsed:.2f}s"
+        ))
@@ -4,16 +4,31 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 from django.db.models import Q
 from datetime import timedelta
-import requests
 import math
 from decimal import Decimal
-from api.models import Delivery, Order, Notification, Rider
+from api.models import Delivery, Order, Rider
+from api.utils.delivery_writes import DeliveryWrites
+from api.utils.distance_service import driving_distance
+from api.utils.offer_timers import delivery_deadline, get_offer_timeout, get_pickup_timeout, get_rejection_window
+from api.utils.order_pickups import PICKUP_RELATED, get_pickup, pickup_point
+from api.utils.rider_matching import ACTIVE_DELIVERY_STATUSES, RiderPool, rank_riders, rejected_riders_by_order
 from django.conf import settings
 
+# The delivery's rider and everything reassigning its order reads
+SWEEP_RELATED = ('order__user', 'order__shipping_address', 'rider__rider',
+                 *(f'order__{path}' for path in PICKUP_RELATED))
+
+
 class Command(BaseCommand):
-    help = 'Check for expired delivery offers and reassign to nearest available rider'
+    help = ('Expire, cancel or reassign one delivery whose timer fired (--delivery-id), or sweep for '
+            'deliveries whose timers were lost')
 
     def add_arguments(self, parser):
+        parser.add_argument(
+            '--delivery-id',
+            type=str,
+            help='Handle just this delivery (what its offer timer runs)',
+        )
         parser.add_argument(
             '--verbose',
             action='store_true',
@@ -22,131 +37,137 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         verbose = options.get('verbose', False)
+        delivery_id = options.get('delivery_id')
+        
+        if delivery_id:
+            delivery = Delivery.objects.select_related(*SWEEP_RELATED).filter(id=delivery_id).first()
+            if not delivery:
+                self.stdout.write(self.style.WARNING(f"⚠️ Delivery {delivery_id} not found"))
+                return
+            self.writes = DeliveryWrites()
+            if not self.handle_delivery(delivery, verbose=verbose):
+                self.stdout.write(f"⏭️ Delivery {delivery_id} is {delivery.status}; nothing due")
+            self.writes.flush()
+            return
         
         self.stdout.write("=" * 80)
         self.stdout.write(f"[{timezone.now()}] 🔍 Checking delivery responses...")
         self.stdout.write("=" * 80)
         
-        # Find deliveries that are pending and older than 10 minutes
-        expired_deliveries = Delivery.objects.filter(
-            status='pending_offer',
-            created_at__lte=timezone.now() - timedelta(minutes=10)
-        )
+        # Offers and pickups are normally handled by their own timers (see
+        # api.utils.offer_timers); this only catches the ones whose timers were lost
+        now = timezone.now()
+        overdue = Delivery.objects.filter(
+            Q(status='pending_offer', created_at__lte=now - timedelta(seconds=get_offer_timeout())) |
+            Q(status='accepted', updated_at__lte=now - timedelta(seconds=get_pickup_timeout())) |
+            Q(status='rejected', updated_at__gte=now - timedelta(seconds=get_rejection_window()))
+        ).select_related(*SWEEP_RELATED)
+        
+        # Decide every delivery first, then write the whole sweep in one transaction
+        self.writes = DeliveryWrites()
+        handled = sum(1 for delivery in overdue if self.handle_delivery(delivery, verbose=verbose))
+        notifications = len(self.writes.notifications)
+        offers = self.writes.flush()
         
-        self.stdout.write(f"📊 Found {expired_deliveries.count()} expired deliveries")
-        
-        for delivery in expired_deliveries:
-            self.stdout.write(f"\n⏰ Processing expired delivery: {delivery.id}")
-            self.stdout.write(f"   Order: {delivery.order.order}")
-            self.stdout.write(f"   Rider: {delivery.rider.rider.username if delivery.rider else 'None'}")
-            self.stdout.write(f"   Created: {delivery.created_at}")
-            
-            # Mark as expired
-            delivery.status = 'expired'
-            delivery.save()
-            
-            # Notify the rider
-            if delivery.rider:
-                Notification.objects.create(
-                    user=delivery.rider.rider,
-                    title='Delivery Offer Expired',
-                    type='delivery',
-                    message=f'Your delivery offer for order #{str(delivery.order.order)[:8]} has expired. '
-                            f'The order has been reassigned to another rider.',
-                    is_read=False
-                )
-                self.stdout.write(f"   📧 Notified rider {delivery.rider.rider.username}")
-            
-            self.stdout.write(f"   ❌ Delivery expired - will reassign")
-            
-            # Reassign to nearest available rider
-            self.reassign_nearest_rider(delivery.order, exclude_rider_id=delivery.rider.id if delivery.rider else None, verbose=verbose)
-        
-        # Find deliveries that were rejected
-        rejected_deliveries = Delivery.objects.filter(
-            status='rejected',
-            updated_at__gte=timezone.now() - timedelta(minutes=1)
-        )
+        self.stdout.write("\n" + "=" * 80)
+        self.stdout.write(f"✅ Delivery response check completed ({handled} deliveries handled)")
+        self.stdout.write(f"💾 Saved {len(offers)} new offers and {notifications} notifications")
+        self.stdout.write("=" * 80)
+    
+    def handle_delivery(self, delivery, verbose=False):
+        """
+        Act on one delivery if something is due: an offer past its deadline
+        expires, a rejected offer is reassigned, an accepted delivery that
+        wasn't picked up in time is cancelled. Returns False when nothing was due.
+        """
+        deadline = delivery_deadline(delivery)
+        if delivery.status == 'rejected':
+            self.reassign_rejected(delivery, verbose=verbose)
+        elif deadline is None or deadline > timezone.now():
+            return False
+        elif delivery.status == 'pending_offer':
+            self.expire_offer(delivery, verbose=verbose)
+        else:
+            self.cancel_no_show(delivery, verbose=verbose)
+        return True
+    
+    def expire_offer(self, delivery, verbose=False):
+        self.stdout.write(f"\n⏰ Processing expired delivery: {delivery.id}")
+        self.stdout.write(f"   Order: {delivery.order.order}")
+        self.stdout.write(f"   Rider: {delivery.rider.rider.username if delivery.rider else 'None'}")
+        self.stdout.write(f"   Created: {delivery.created_at}")
+        
+        # Mark as expired
+        self.writes.set_delivery_status(delivery, 'expired')
+        
+        # Notify the rider
+        if delivery.rider:
+            self.writes.notify(
+                delivery.rider.rider,
+                'Delivery Offer Expired',
+                f'Your delivery offer for order #{str(delivery.order.order)[:8]} has expired. '
+                f'The order has been reassigned to another rider.',
+            )
+            self.stdout.write(f"   📧 Notified rider {delivery.rider.rider.username}")
         
-        self.stdout.write(f"\n📊 Found {rejected_deliveries.count()} rejected deliveries")
-        
-        for delivery in rejected_deliveries:
-            self.stdout.write(f"\n❌ Rejected delivery: {delivery.id}")
-            self.stdout.write(f"   Order: {delivery.order.order}")
-            self.stdout.write(f"   Rider: {delivery.rider.rider.username if delivery.rider else 'Unknown'}")
-            self.stdout.write(f"   Rejected at: {delivery.updated_at}")
-            
-            # Reassign to nearest available rider
-            self.reassign_nearest_rider(delivery.order, exclude_rider_id=delivery.rider.id if delivery.rider else None, verbose=verbose)
-        
-        # Find deliveries that were accepted but not picked up within 30 minutes
-        accepted_not_picked = Delivery.objects.filter(
-            status='accepted',
-            updated_at__lte=timezone.now() - timedelta(minutes=30)
-        )
+        self.stdout.write(f"   ❌ Delivery expired - will reassign")
         
-        self.stdout.write(f"\n📊 Found {accepted_not_picked.count()} accepted but not picked up deliveries")
-        
-        for delivery in accepted_not_picked:
-            self.stdout.write(f"\n⚠️ No-show delivery: {delivery.id}")
-            self.stdout.write(f"   Order: {delivery.order.order}")
-            self.stdout.write(f"   Rider: {delivery.rider.rider.username if delivery.rider else 'None'}")
-            self.stdout.write(f"   Accepted at: {delivery.updated_at}")
-            
-            delivery.status = 'expired'
-            delivery.save()
-            
-            Notification.objects.create(
-                user=delivery.rider.rider,
-                title='Delivery Cancelled - No Show',
-                type='delivery',
-                message=f'Your accepted delivery for order #{str(delivery.order.order)[:8]} has been cancelled '
-                        f'because you did not pick it up within 30 minutes.',
-                is_read=False
+        # Reassign to nearest available rider
+        self.reassign_nearest_rider(delivery.order, exclude_rider_id=delivery.rider_id, verbose=verbose)
+    
+    def reassign_rejected(self, delivery, verbose=False):
+        self.stdout.write(f"\n❌ Rejected delivery: {delivery.id}")
+        self.stdout.write(f"   Order: {delivery.order.order}")
+        self.stdout.write(f"   Rider: {delivery.rider.rider.username if delivery.rider else 'Unknown'}")
+        self.stdout.write(f"   Rejected at: {delivery.updated_at}")
+        
+        # A rejection is seen by its own event and by the safety-net sweep;
+        # only reassign while the order has no other open offer or delivery
+        if (self.writes.has_offer(delivery.order) or
+                Delivery.objects.filter(order=delivery.order, status__in=ACTIVE_DELIVERY_STATUSES).exists()):
+            self.stdout.write(f"   ⏭️ Order already has an open delivery - not reassigning")
+            return
+        
+        # Reassign to nearest available rider
+        self.reassign_nearest_rider(delivery.order, exclude_rider_id=delivery.rider_id, verbose=verbose)
+    
+    def cancel_no_show(self, delivery, verbose=False):
+        pickup_minutes = get_pickup_timeout() // 60
+        self.stdout.write(f"\n⚠️ No-show delivery: {delivery.id}")
+        self.stdout.write(f"   Order: {delivery.order.order}")
+        self.stdout.write(f"   Rider: {delivery.rider.rider.username if delivery.rider else 'None'}")
+        self.stdout.write(f"   Accepted at: {delivery.updated_at}")
+        
+        self.writes.set_delivery_status(delivery, 'expired')
+        
+        if delivery.rider:
+            self.writes.notify(
+                delivery.rider.rider,
+                'Delivery Cancelled - No Show',
+                f'Your accepted delivery for order #{str(delivery.order.order)[:8]} has been cancelled '
+                f'because you did not pick it up within {pickup_minutes} minutes.',
             )
-            
             self.stdout.write(f"   📧 Notified rider {delivery.rider.rider.username}")
-            self.stdout.write(f"   ❌ Delivery cancelled - will reassign")
-            
-            # Reassign to another rider
-            self.reassign_nearest_rider(delivery.order, exclude_rider_id=delivery.rider.id if delivery.rider else None, verbose=verbose)
         
-        self.stdout.write("\n" + "=" * 80)
-        self.stdout.write("✅ Delivery response check completed")
-        self.stdout.write("=" * 80)
+        self.stdout.write(f"   ❌ Delivery cancelled - will reassign")
+        
+        # Reassign to another rider
+        self.reassign_nearest_rider(delivery.order, exclude_rider_id=delivery.rider_id, verbose=verbose)
     
     def reassign_nearest_rider(self, order, exclude_rider_id=None, verbose=False):
         """Reassign the nearest available rider to an order with comparison logs"""
+        if self.writes.has_offer(order):
+            self.stdout.write(f"\n⏭️ Order {order.order} was already reassigned in this sweep")
+            return False
         
         self.stdout.write(f"\n🔄 REASSIGNING order {order.order} to nearest available rider...")
         
         # Get pickup location
-        checkout_item = order.checkout_set.first()
-        if not checkout_item:
+        pickup = get_pickup(order)
+        if not pickup:
             self.stdout.write(self.style.WARNING(f"   ❌ Cannot find order items for reassignment"))
             return False
-        
-        # Get shop coordinates
-        pickup_lat = None
-        pickup_lng = None
-        pickup_name = None
-        
-        if checkout_item.direct_shop_id:
-            try:
-                from api.models import Shop
-                shop = Shop.objects.get(id=checkout_item.direct_shop_id)
-                if shop.latitude and shop.longitude:
-                    pickup_lat = float(shop.latitude)
-                    pickup_lng = float(shop.longitude)
-                    pickup_name = shop.name
-            except:
-                pass
-        elif checkout_item.cart_item and checkout_item.cart_item.product:
-            product = checkout_item.cart_item.product
-            if product.shop and product.shop.latitude and product.shop.longitude:
-                pickup_lat = float(product.shop.latitude)
-                pickup_lng = float(product.shop.longitude)
-                pickup_name = product.shop.name
+        pickup_lat, pickup_lng, pickup_name = pickup_point(pickup)
         
         if not pickup_lat or not pickup_lng:
             self.stdout.write(self.style.WARNING(f"   ❌ Cannot get pickup location for reassignment"))
@@ -179,46 +200,18 @@ class Command(BaseCommand):
         
         self.stdout.write(f"   👥 Available riders for reassignment: {available_riders.count()}")
         
-        # Calculate distances for each rider
-        rider_distances = []
-        for rider in available_riders:
-            if not (rider.rider.latitude and rider.rider.longitude):
-                continue
-            
-            rider_lat = float(rider.rider.latitude)
-            rider_lng = float(rider.rider.longitude)
-            
-            # Check if this rider has rejected this order
-            rejected_before = Delivery.objects.filter(
-                order=order,
-                rider=rider,
-                status='rejected'
-            ).exists()
-            
-            if rejected_before:
-                continue
-            
-            # Calculate distances
-            distance_to_pickup = self._get_driving_distance(rider_lat, rider_lng, pickup_lat, pickup_lng)
-            distance_pickup_to_dest = self._get_driving_distance(pickup_lat, pickup_lng, dest_lat, dest_lng)
-            total_distance = distance_to_pickup + distance_pickup_to_dest
-            
-            rider_distances.append({
-                'rider': rider,
-                'total_distance': total_distance,
-                'distance_to_pickup': distance_to_pickup,
-                'distance_pickup_to_dest': distance_pickup_to_dest,
-                'rider_lat': rider_lat,
-                'rider_lng': rider_lng
-            })
+        # Straight-line prefilter, then driving distances for the nearest few
+        rider_distances = rank_riders(
+            RiderPool(available_riders),
+            (pickup_lat, pickup_lng),
+            (dest_lat, dest_lng),
+            exclude=rejected_riders_by_order([order.pk]).get(order.pk, set())
+        )
         
         if not rider_distances:
             self.stdout.write(self.style.WARNING(f"   ❌ No eligible riders for reassignment"))
             return False
         
-        # Sort by distance and select nearest
-        rider_distances.sort(key=lambda x: x['total_distance'])
-        
         # Show ranking
         self.stdout.write(f"   🏆 Reassignment ranking:")
         for idx, rd in enumerate(rider_distances[:5], 1):
@@ -235,12 +228,11 @@ class Command(BaseCommand):
             f"   ✅ Selected: {selected_rider.rider.username} ({total_distance:.2f} km)"
         ))
         
-        # Create new delivery
-        delivery = Delivery.objects.create(
+        # Saved with the rest of the sweep
+        self.writes.add_offer(Delivery(
             order=order,
             rider=selected_rider,
             status='pending_offer',
-            created_at=timezone.now(),
             distance_km=Decimal(str(total_distance)),
             estimated_minutes=estimated_minutes,
             delivery_fee=Decimal(str(delivery_fee)),
@@ -253,53 +245,23 @@ class Command(BaseCommand):
                 },
                 'reassignment': True
             }
-        )
+        ))
         
         # Notify the new rider
-        Notification.objects.create(
-            user=selected_rider.rider,
-            title='New Delivery Assignment (Reassigned)',
-            type='delivery',
-            message=f'You have been assigned to deliver order #{str(order.order)[:8]}. '
-                    f'Distance: {total_distance:.1f}km, Fee: ₱{delivery_fee:.2f}. '
-                    f'Please respond within 10 minutes.',
-            is_read=False
+        self.writes.notify(
+            selected_rider.rider,
+            'New Delivery Assignment (Reassigned)',
+            f'You have been assigned to deliver order #{str(order.order)[:8]}. '
+            f'Distance: {total_distance:.1f}km, Fee: ₱{delivery_fee:.2f}. '
+            f'Please respond within {get_offer_timeout() // 60} minutes.',
         )
         
         self.stdout.write(self.style.SUCCESS(f"   ✅ Reassigned to {selected_rider.rider.username}"))
         return True
     
     def _get_driving_distance(self, origin_lat, origin_lng, dest_lat, dest_lng):
-        """Calculate driving distance using Google Maps API"""
-        GOOGLE_MAPS_API_KEY = getattr(settings, 'GOOGLE_MAPS_API_KEY', None)
-        
-        if not GOOGLE_MAPS_API_KEY:
-            return self._haversine_distance(origin_lat, origin_lng, dest_lat, dest_lng)
-        
-        try:
-            url = "https://maps.googleapis.com/maps/api/distancematrix/json"
-            params = {
-                'origins': f"{origin_lat},{origin_lng}",
-                'destinations': f"{dest_lat},{dest_lng}",
-                'key': GOOGLE_MAPS_API_KEY,
-                'units': 'metric'
-            }
-            
-            response = requests.get(url, params=params, timeout=5)
-            data = response.json()
-            
-            if data.get('status') == 'OK':
-                rows = data.get('rows', [])
-                if rows:
-                    elements = rows[0].get('elements', [])
-                    if elements and elements[0].get('status') == 'OK':
-                        distance_meters = elements[0].get('distance', {}).get('value', 0)
-                        if distance_meters > 0:
-                            return distance_meters / 1000
-            
-            return self._haversine_distance(origin_lat, origin_lng, dest_lat, dest_lng)
-        except Exception:
-            return self._haversine_distance(origin_lat, origin_lng, dest_lat, dest_lng)
+        """Driving distance from the shared distance service (cached, haversine fallback)"""
+        return driving_distance(origin_lat, origin_lng, dest_lat, dest_lng)
     
     def _haversine_distance(self, lat1, lng1, lat2, lng2):
         """Calculate straight-line distance using Haversine formula"""
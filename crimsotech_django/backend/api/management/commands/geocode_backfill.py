@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.utils.geocoding import Backfill
+
+
+class Command(BaseCommand):
+    help = 'Geocode queued addresses and shops, users and shipping addresses missing coordinates (rate limited)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-requests', type=int, default=None,
+                            help='Stop after this many geocoder calls (default: no limit)')
+        parser.add_argument('--batch-size', type=int, default=200, help='Rows loaded and updated per batch')
+        parser.add_argument('--rate', type=float, default=None,
+                            help='Geocoder calls per second (default: GEOCODE_RATE_LIMIT)')
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        backfill = Backfill(
+            max_requests=options['max_requests'],
+            batch_size=options['batch_size'],
+            rate=options['rate'],
+        ).run()
+
+        elapsed = (timezone.now() - started).total_seconds()
+        self.stdout.write(self.style.SUCCESS(
+            f"[{timezone.now()}] Geocoded {backfill.requests_made} address(es), "
+            f"updated {backfill.rows_updated} row(s) in {elapsed:.2f}s"
+        ))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.utils.unread_counters import reconcile_conversation_counters, reconcile_notification_counters
+
+
+class Command(BaseCommand):
+    help = 'Recount unread message and notification counters and repair the ones that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many counters are off')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        started = timezone.now()
+        conversations = reconcile_conversation_counters(dry_run=dry_run)
+        notifications = reconcile_notification_counters(dry_run=dry_run)
+
+        elapsed = (timezone.now() - started).total_seconds()
+        verb = 'Found' if dry_run else 'Repaired'
+        self.stdout.write(self.style.SUCCESS(
+            f"[{timezone.now()}] {verb} {conversations} conversation and {notifications} notification "
+            f"counter(s) in {elapsed:.2f}s"
+        ))
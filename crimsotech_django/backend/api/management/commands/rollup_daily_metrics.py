@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.utils.metrics_rollup import catch_up, rollup_range
+
+
+class Command(BaseCommand):
+    help = 'Roll up daily sales metrics (platform, per shop, per product/category) for the analytics dashboards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lookback-days', type=int, default=None,
+                            help='Already rolled-up days to recompute (default: METRICS_ROLLUP_LOOKBACK_DAYS)')
+        parser.add_argument('--start', help='Recompute from this date (YYYY-MM-DD) instead of catching up')
+        parser.add_argument('--end', help='Last date to recompute with --start (default: yesterday)')
+
+    def _parse(self, value):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Invalid date "{value}". Use YYYY-MM-DD.')
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+
+        if options['start']:
+            start_date = self._parse(options['start'])
+            end_date = self._parse(options['end']) if options['end'] else timezone.localdate() - timedelta(days=1)
+            if start_date > end_date:
+                raise CommandError('--start must not be after --end')
+            days = rollup_range(start_date, end_date)
+        else:
+            start_date, end_date, days = catch_up(lookback_days=options['lookback_days'])
+
+        elapsed = (timezone.now() - started).total_seconds()
+        if not days:
+            self.stdout.write(f"[{timezone.now()}] Daily metrics already up to date")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"[{timezone.now()}] Rolled up {days} day(s) of metrics ({start_date} to {end_date}) in {elapsed:.2f}s"
+        ))
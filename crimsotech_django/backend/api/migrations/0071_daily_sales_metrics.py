@@ -0,0 +1,71 @@
+# Generated by Django 5.2.7 on 2026-10-17 23:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0070_shopcompensation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesMetrics',
+            fields=[
+                ('date', models.DateField(primary_key=True, serialize=False)),
+                ('completed_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('pending_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('orders', models.IntegerField(default=0)),
+                ('completed_orders', models.IntegerField(default=0)),
+                ('pending_orders', models.IntegerField(default=0)),
+                ('transaction_fees', models.FloatField(default=0)),
+                ('discounts', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('shipping_fees', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('vat_collected', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('order_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('order_count', models.IntegerField(default=0)),
+                ('cancelled_orders', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyProductSalesMetrics',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('orders', models.IntegerField(default=0)),
+                ('quantity', models.IntegerField(default=0)),
+                ('transaction_fees', models.FloatField(default=0)),
+                ('vat_collected', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.category')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales_metrics', to='api.product')),
+                ('shop', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.shop')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['category', 'date'], name='api_dailypr_categor_7fa467_idx'), models.Index(fields=['product', 'date'], name='api_dailypr_product_d4afd8_idx')],
+                'unique_together': {('date', 'product')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyShopSalesMetrics',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('sales', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('orders', models.IntegerField(default=0)),
+                ('items_sold', models.IntegerField(default=0)),
+                ('transaction_fees', models.FloatField(default=0)),
+                ('discounts', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('shipping_fees', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('vat_collected', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales_metrics', to='api.shop')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['shop', 'date'], name='api_dailysh_shop_id_d3785c_idx')],
+                'unique_together': {('date', 'shop')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-17 23:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0071_daily_sales_metrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteDistance',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('route_key', models.CharField(max_length=100, unique=True)),
+                ('origin_lat', models.DecimalField(decimal_places=7, max_digits=10)),
+                ('origin_lng', models.DecimalField(decimal_places=7, max_digits=10)),
+                ('dest_lat', models.DecimalField(decimal_places=7, max_digits=10)),
+                ('dest_lng', models.DecimalField(decimal_places=7, max_digits=10)),
+                ('distance_km', models.FloatField()),
+                ('duration_seconds', models.IntegerField(blank=True, null=True)),
+                ('fetched_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['fetched_at'], name='api_routedi_fetched_066138_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-17 23:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0072_route_distance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeCache',
+            fields=[
+                ('address_hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('address', models.TextField()),
+                ('latitude', models.DecimalField(blank=True, decimal_places=7, max_digits=10, null=True)),
+                ('longitude', models.DecimalField(blank=True, decimal_places=7, max_digits=10, null=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('ok', 'OK'), ('not_found', 'Not Found'), ('error', 'Error')], default='pending', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'updated_at'], name='api_geocode_status_fc89d5_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-17 23:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0073_geocode_cache'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['status', 'created_at'], name='api_deliver_status_200b5a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['status', 'updated_at'], name='api_deliver_status_c44473_idx'),
+        ),
+    ]
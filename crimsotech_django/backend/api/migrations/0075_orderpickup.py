@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0074_delivery_timer_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderPickup',
+            fields=[
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='pickup', serialize=False, to='api.order')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('seller', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_pickups', to='api.user')),
+                ('shop', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_pickups', to='api.shop')),
+            ],
+        ),
+    ]
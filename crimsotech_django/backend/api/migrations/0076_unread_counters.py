@@ -0,0 +1,49 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:08
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_unread(apps, schema_editor):
+    """Start the counters from the current unread rows"""
+    ConversationParticipant = apps.get_model('api', 'ConversationParticipant')
+    Message = apps.get_model('api', 'Message')
+    Notification = apps.get_model('api', 'Notification')
+    User = apps.get_model('api', 'User')
+
+    messages = Message.objects.filter(
+        conversation_id=OuterRef('conversation_id'), receiver_id=OuterRef('user_id'),
+        read_at__isnull=True, is_deleted_for_receiver=False,
+    ).order_by().values('receiver_id').annotate(count=Count('id')).values('count')
+    ConversationParticipant.objects.update(
+        unread_count=Coalesce(Subquery(messages, output_field=IntegerField()), 0)
+    )
+
+    notifications = Notification.objects.filter(
+        user_id=OuterRef('id'), is_read=False,
+    ).order_by().values('user_id').annotate(count=Count('id')).values('count')
+    User.objects.update(
+        unread_notification_count=Coalesce(Subquery(notifications, output_field=IntegerField()), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0075_orderpickup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversationparticipant',
+            name='unread_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='unread_notification_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count_unread, migrations.RunPython.noop),
+    ]
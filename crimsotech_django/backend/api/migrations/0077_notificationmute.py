@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:16
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0076_unread_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationMute',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, unique=True)),
+                ('type', models.CharField(max_length=50)),
+                ('muted_until', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notification_mutes', to='api.user')),
+            ],
+            options={
+                'unique_together': {('user', 'type')},
+            },
+        ),
+    ]
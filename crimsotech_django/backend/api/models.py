@@ -43,6 +43,8 @@ class User(models.Model):
     profile_picture = models.ImageField(upload_to='user/profile_pictures/', blank=True, null=True, default=None)
     latitude = models.DecimalField(max_digits=10, decimal_places=7, null=True, blank=True)
     longitude = models.DecimalField(max_digits=10, decimal_places=7, null=True, blank=True)
+    # Unread notifications, kept in step by api.utils.unread_counters
+    unread_notification_count = models.IntegerField(default=0)
 
     class Meta:
         indexes = [
@@ -213,9 +215,26 @@ class Notification(models.Model):
 
     def mark_as_read(self):
         if not self.is_read:
+            from api.utils.unread_counters import adjust_notification_unread
             self.is_read = True
             self.read_at = timezone.now()
             self.save(update_fields=['is_read', 'read_at'])
+            adjust_notification_unread(self.user_id, -1)
+
+
+class NotificationMute(models.Model):
+    """A notification type the user has muted; new ones of that type are not created"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notification_mutes')
+    type = models.CharField(max_length=50)
+    muted_until = models.DateTimeField(null=True, blank=True)  # None: until unmuted
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['user', 'type']
+
+    def __str__(self):
+        return f"{self.user.username} muted {self.type}"
     
 class OTP(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
@@ -1404,6 +1423,9 @@ class Delivery(models.Model):
             models.Index(fields=['status', 'scheduled_delivery_time']),
             models.Index(fields=['created_at']),
             models.Index(fields=['delivered_at']),
+            # Safety-net sweep for lost offer/pickup timers
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['status', 'updated_at']),
         ]
 
     def __str__(self):
@@ -2310,19 +2332,27 @@ class Message(models.Model):
 
     def mark_as_read(self):
         """Mark message as read"""
+        from api.utils.unread_counters import adjust_conversation_unread, counts_as_unread
         if self.status in ['sent', 'delivered']:
+            was_unread = counts_as_unread(self)
             self.status = 'read'
             self.read_at = timezone.now()
             self.save(update_fields=['status', 'read_at'])
+            if was_unread:
+                adjust_conversation_unread(self.conversation_id, self.receiver_id, -1)
 
     def soft_delete_for_user(self, user):
         """Soft delete message for a specific user"""
-        if user == self.sender:
+        from api.utils.unread_counters import adjust_conversation_unread, counts_as_unread
+        was_unread = counts_as_unread(self)
+        if str(user.pk) == str(self.sender_id):
             self.is_deleted_for_sender = True
-        if user == self.receiver:
+        if str(user.pk) == str(self.receiver_id):
             self.is_deleted_for_receiver = True
         self.deleted_at = timezone.now()
         self.save(update_fields=['is_deleted_for_sender', 'is_deleted_for_receiver', 'deleted_at'])
+        if was_unread and self.is_deleted_for_receiver:
+            adjust_conversation_unread(self.conversation_id, self.receiver_id, -1)
 
     @classmethod
     def get_conversation(cls, user1_id, user2_id):
@@ -2334,13 +2364,9 @@ class Message(models.Model):
 
     @classmethod
     def get_unread_count(cls, user_id):
-        """Get count of unread messages for a user"""
-        return cls.objects.filter(
-            receiver_id=user_id,
-            status__in=['sent', 'delivered'],
-            read_at__isnull=True,
-            is_deleted_for_receiver=False
-        ).count()
+        """Get count of unread messages for a user (the sum of their conversations' counters)"""
+        from api.utils.unread_counters import message_unread_total
+        return message_unread_total(user_id)
 
     @classmethod
     def get_last_message(cls, user1_id, user2_id):
@@ -2420,6 +2446,8 @@ class ConversationParticipant(models.Model):
     muted_until = models.DateTimeField(null=True, blank=True)
     is_archived = models.BooleanField(default=False)
     archived_at = models.DateTimeField(null=True, blank=True)
+    # Unread messages to this participant here, kept in step by api.utils.unread_counters
+    unread_count = models.IntegerField(default=0)
     
     joined_at = models.DateTimeField(auto_now_add=True)
     left_at = models.DateTimeField(null=True, blank=True)
@@ -2436,26 +2464,19 @@ class ConversationParticipant(models.Model):
 
     def mark_as_read(self, up_to_message=None):
         """Mark all messages up to a point as read for this participant"""
+        from api.utils.unread_counters import mark_messages_read
         if up_to_message:
             self.last_read_message = up_to_message
         self.last_read_at = timezone.now()
         self.save(update_fields=['last_read_message', 'last_read_at'])
+        received = Message.objects.filter(conversation_id=self.conversation_id, receiver_id=self.user_id)
+        if up_to_message:
+            received = received.filter(created_at__lte=up_to_message.created_at)
+        mark_messages_read(received)
 
     def get_unread_count(self):
         """Get count of unread messages for this participant in this conversation"""
-        if not self.last_read_message:
-            return Message.objects.filter(
-                conversation_id=self.conversation_id,
-                receiver=self.user,
-                read_at__isnull=True
-            ).exclude(sender=self.user).count()
-        
-        return Message.objects.filter(
-            conversation_id=self.conversation_id,
-            receiver=self.user,
-            created_at__gt=self.last_read_message.created_at,
-            read_at__isnull=True
-        ).exclude(sender=self.user).count()
+        return self.unread_count
     
 
 # -----------------------------
@@ -2709,6 +2730,18 @@ class OrderShopStatus(models.Model):
     def __str__(self):
         return f"Order {self.order.order} - Shop {self.shop.name}: {self.status}"
 
+
+class OrderPickup(models.Model):
+    """Where a rider collects an order, resolved once from its first checkout row (see api.utils.order_pickups)"""
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, primary_key=True, related_name='pickup')
+    shop = models.ForeignKey(Shop, on_delete=models.SET_NULL, null=True, blank=True, related_name='order_pickups')
+    # Products sold without a shop are picked up from the seller
+    seller = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='order_pickups')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Pickup for order {self.order_id}"
+
 class ShopCompensation(models.Model):
     """
     Track compensation paid to shops when voucher refunds expire
@@ -2741,4 +2774,126 @@ class ShopCompensation(models.Model):
         ]
 
     def __str__(self):
-        return f"Compensation {self.id} - {self.shop.name}: ₱{self.compensation_amount}"
\ No newline at end of file
+        return f"Compensation {self.id} - {self.shop.name}: ₱{self.compensation_amount}"
+
+class DailySalesMetrics(models.Model):
+    """
+    Platform-wide sales totals for one day, maintained by the
+    rollup_daily_metrics command. A row exists for every rolled-up day,
+    even days without sales, so readers can tell which days are covered.
+    """
+    date = models.DateField(primary_key=True)
+    completed_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    pending_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    orders = models.IntegerField(default=0)
+    completed_orders = models.IntegerField(default=0)
+    pending_orders = models.IntegerField(default=0)
+    transaction_fees = models.FloatField(default=0)
+    discounts = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    shipping_fees = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    vat_collected = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    order_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    order_count = models.IntegerField(default=0)
+    cancelled_orders = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Sales metrics {self.date}"
+
+
+class DailyShopSalesMetrics(models.Model):
+    """Per-shop sales totals for one day (shop taken from the checked-out product)"""
+    id = models.BigAutoField(primary_key=True)
+    date = models.DateField()
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='daily_sales_metrics')
+    sales = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    orders = models.IntegerField(default=0)
+    items_sold = models.IntegerField(default=0)
+    transaction_fees = models.FloatField(default=0)
+    discounts = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    shipping_fees = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    vat_collected = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ['date', 'shop']
+        indexes = [
+            models.Index(fields=['shop', 'date']),
+        ]
+
+    def __str__(self):
+        return f"Shop {self.shop_id} metrics {self.date}"
+
+
+class DailyProductSalesMetrics(models.Model):
+    """
+    Per-product sales totals for one day. The product's category and shop
+    are copied in so per-category rollups are a single GROUP BY.
+    """
+    id = models.BigAutoField(primary_key=True)
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales_metrics')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
+    shop = models.ForeignKey(Shop, on_delete=models.SET_NULL, null=True, blank=True)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    orders = models.IntegerField(default=0)
+    quantity = models.IntegerField(default=0)
+    transaction_fees = models.FloatField(default=0)
+    vat_collected = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ['date', 'product']
+        indexes = [
+            models.Index(fields=['category', 'date']),
+            models.Index(fields=['product', 'date']),
+        ]
+
+    def __str__(self):
+        return f"Product {self.product_id} metrics {self.date}"
+
+
+class RouteDistance(models.Model):
+    """Provider driving distance between two rounded points (see api.utils.distance_service)"""
+    id = models.BigAutoField(primary_key=True)
+    route_key = models.CharField(max_length=100, unique=True)
+    origin_lat = models.DecimalField(max_digits=10, decimal_places=7)
+    origin_lng = models.DecimalField(max_digits=10, decimal_places=7)
+    dest_lat = models.DecimalField(max_digits=10, decimal_places=7)
+    dest_lng = models.DecimalField(max_digits=10, decimal_places=7)
+    distance_km = models.FloatField()
+    duration_seconds = models.IntegerField(null=True, blank=True)
+    fetched_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['fetched_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.route_key}: {self.distance_km:.2f} km"
+
+
+class GeocodeCache(models.Model):
+    """Geocoder result per normalized address (see api.utils.geocoding)"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('ok', 'OK'),
+        ('not_found', 'Not Found'),
+        ('error', 'Error'),
+    ]
+
+    address_hash = models.CharField(max_length=64, primary_key=True)
+    address = models.TextField()
+    latitude = models.DecimalField(max_digits=10, decimal_places=7, null=True, blank=True)
+    longitude = models.DecimalField(max_digits=10, decimal_places=7, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'updated_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.address} ({self.status})"
@@ -13,4 +13,5 @@ websocket_urlpatterns = [
     ),
     re_path(r'ws/chat/$', consumers.ChatConsumer.as_asgi()),
     re_path(r'ws/notifications/$', consumers.NotificationConsumer.as_asgi()),
+    re_path(r'ws/riders/location/$', consumers.RiderLocationConsumer.as_asgi()),
 ]
\ No newline at end of file
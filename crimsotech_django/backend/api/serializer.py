@@ -4,6 +4,7 @@ from .models import *
 from django.contrib.auth.hashers import make_password
 from django.db.models import Avg
 from api.utils.storage_utils import convert_s3_to_public_url
+from api.utils.unread_counters import adjust_notification_unread
 
 # Helper function to get media URL consistently
 def get_media_url(file_field):
@@ -132,8 +133,9 @@ class ShopSerializer(serializers.ModelSerializer):
         return ", ".join([p for p in parts if p])  # skip empty parts
 
     def get_avg_rating(self, obj):
-        reviews = obj.reviews.all()
-        if reviews.exists():
+        # Evaluate once so prefetched reviews (shop__reviews) cost no query
+        reviews = list(obj.reviews.all())
+        if reviews:
             # Use average_rating instead of rating
             valid_reviews = [r for r in reviews if r.average_rating is not None]
             if valid_reviews:
@@ -380,9 +382,33 @@ class ProductSerializer(serializers.ModelSerializer):
             'open_for_swap', 'min_variant_price', 'max_variant_price'
         ]
     
+    # Prefetch-aware mode: when the view prefetched 'variants' or
+    # 'productmedia_set' (and annotated min/max_variant_price), the
+    # fields below are computed from that data with no extra queries.
+    # Without prefetching they fall back to querying per product.
+    
+    def _get_prefetched(self, obj, cache_name):
+        """Return prefetched related rows for cache_name, or None if not prefetched"""
+        prefetched = getattr(obj, '_prefetched_objects_cache', {})
+        if cache_name in prefetched:
+            return list(prefetched[cache_name])
+        return None
+    
+    def _get_active_variants(self, obj):
+        """Get active variants, reusing prefetched rows when available"""
+        variants = self._get_prefetched(obj, 'variants')
+        if variants is not None:
+            return [v for v in variants if v.is_active]
+        return list(obj.variants.filter(is_active=True))
+    
     def get_primary_image(self, obj):
         """Get the first media file as primary image"""
-        media = obj.productmedia_set.first()
+        media_list = self._get_prefetched(obj, 'productmedia_set')
+        if media_list is not None:
+            # Match productmedia_set.first(), which orders by pk
+            media = min(media_list, key=lambda m: m.pk) if media_list else None
+        else:
+            media = obj.productmedia_set.first()
         if media and media.file_data:
             return {
                 'id': str(media.id),
@@ -410,7 +436,7 @@ class ProductSerializer(serializers.ModelSerializer):
         # Check if this is a detail view
         is_detail_view = request and request.parser_context.get('kwargs', {}).get('pk')
         
-        variants = obj.variants.filter(is_active=True)
+        variants = self._get_active_variants(obj)
         
         if is_detail_view:
             # Detail view - return all variants with full details
@@ -437,8 +463,8 @@ class ProductSerializer(serializers.ModelSerializer):
                 return f"₱{float(obj.min_variant_price):.2f} - ₱{float(obj.max_variant_price):.2f}"
         
         # Fallback to checking variants directly
-        variants = obj.variants.filter(is_active=True)
-        if variants.exists():
+        variants = self._get_active_variants(obj)
+        if variants:
             prices = [v.price for v in variants if v.price]
             if prices:
                 min_price = min(prices)
@@ -460,8 +486,8 @@ class ProductSerializer(serializers.ModelSerializer):
             }
         
         # Fallback to checking variants directly
-        variants = obj.variants.filter(is_active=True)
-        if variants.exists():
+        variants = self._get_active_variants(obj)
+        if variants:
             prices = [float(v.price) for v in variants if v.price]
             if prices:
                 min_price = min(prices)
@@ -1993,14 +2019,24 @@ class NotificationSerializer(serializers.ModelSerializer):
         validated_data.pop('related_delivery_id_field', None)
         
         # Handle marking as read
-        is_read = validated_data.get('is_read', False)
-        if is_read and not instance.is_read:
+        was_read = instance.is_read
+        is_read = validated_data.get('is_read', was_read)
+        if is_read and not was_read:
             instance.read_at = timezone.now()
+        elif was_read and not is_read:
+            instance.read_at = None
         
         # Update other fields
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         
+        # Flip is_read only if no one else just did, so the user's unread
+        # counter (api.utils.unread_counters) moves once
+        if is_read != was_read and Notification.objects.filter(pk=instance.pk, is_read=was_read).update(
+            is_read=is_read, read_at=instance.read_at
+        ):
+            adjust_notification_unread(instance.user_id, -1 if is_read else 1)
+        
         instance.save()
         return instance
 
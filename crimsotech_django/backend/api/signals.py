@@ -0,0 +1,123 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from .models import (
+    Product, Variants, ProductMedia, Boost, BoostPlan, Shop, ShopFollow,
+    Category, Review, Delivery, Checkout, Message, Notification,
+)
+from .utils.cache_helpers import invalidate, invalidate_many, invalidate_namespace
+from .utils.category_index import category_index
+from .utils.landing_cache import invalidate_landing_payload
+from .utils.offer_timers import schedule_delivery_timer
+from .utils.order_pickups import record_pickup
+from .utils.unread_counters import adjust_conversation_unread, adjust_notification_unread, counts_as_unread
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Variants)
+@receiver(post_delete, sender=Variants)
+@receiver(post_save, sender=Boost)
+@receiver(post_delete, sender=Boost)
+@receiver(post_save, sender=Shop)
+@receiver(post_delete, sender=Shop)
+def invalidate_landing_on_change(sender, **kwargs):
+    """Products, boosts and shops feed the landing page; drop it once the change commits"""
+    transaction.on_commit(invalidate_landing_payload)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_categories_on_change(sender, **kwargs):
+    """Bumping the namespace also tells the classifier's category index in other workers to reload"""
+    def _invalidate():
+        invalidate_namespace('categories')
+        category_index.invalidate()
+
+    transaction.on_commit(_invalidate)
+
+
+@receiver(post_save, sender=BoostPlan)
+@receiver(post_delete, sender=BoostPlan)
+def invalidate_boost_plans_on_change(sender, **kwargs):
+    transaction.on_commit(lambda: invalidate_namespace('boost_plans'))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Variants)
+@receiver(post_delete, sender=Variants)
+@receiver(post_save, sender=ProductMedia)
+@receiver(post_delete, sender=ProductMedia)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_product_detail_on_change(sender, instance, **kwargs):
+    """Drop the cached product detail and the owning shop's profile"""
+    product_id = instance.pk if sender is Product else instance.product_id
+    shop_id = getattr(instance, 'shop_id', None)
+
+    def _invalidate():
+        if product_id:
+            invalidate('product_detail', product_id)
+        if shop_id:
+            invalidate('shop_profile', shop_id)
+
+    transaction.on_commit(_invalidate)
+
+
+@receiver(post_save, sender=Shop)
+@receiver(post_delete, sender=Shop)
+@receiver(post_save, sender=ShopFollow)
+@receiver(post_delete, sender=ShopFollow)
+def invalidate_shop_profile_on_change(sender, instance, **kwargs):
+    shop_id = instance.pk if sender is Shop else instance.shop_id
+    transaction.on_commit(lambda: invalidate('shop_profile', shop_id))
+
+
+@receiver(post_save, sender=Shop)
+@receiver(pre_delete, sender=Shop)
+def invalidate_shop_products_on_change(sender, instance, **kwargs):
+    """Product details show their shop's name, picture and seller; drop those of the shop's products"""
+    # Collected before a delete, which unlinks the products
+    product_ids = list(Product.objects.filter(shop_id=instance.pk).values_list('id', flat=True))
+    if product_ids:
+        transaction.on_commit(lambda: invalidate_many('product_detail', product_ids))
+
+
+@receiver(post_save, sender=Delivery)
+def schedule_delivery_timer_on_change(sender, instance, **kwargs):
+    """Offers and accepted deliveries get a timeout; rejections are reassigned right away"""
+    if instance.status in ('pending_offer', 'accepted', 'rejected'):
+        schedule_delivery_timer(instance)
+
+
+@receiver(post_save, sender=Checkout)
+def record_order_pickup(sender, instance, created, **kwargs):
+    """The first checkout row of an order fixes where the order is picked up"""
+    if created and instance.order_id:
+        record_pickup(instance)
+
+
+@receiver(post_save, sender=Message)
+def count_new_message(sender, instance, created, **kwargs):
+    if created and counts_as_unread(instance):
+        adjust_conversation_unread(instance.conversation_id, instance.receiver_id, 1)
+
+
+@receiver(post_delete, sender=Message)
+def uncount_deleted_message(sender, instance, **kwargs):
+    if counts_as_unread(instance):
+        adjust_conversation_unread(instance.conversation_id, instance.receiver_id, -1)
+
+
+@receiver(post_save, sender=Notification)
+def count_new_notification(sender, instance, created, **kwargs):
+    if created and not instance.is_read:
+        adjust_notification_unread(instance.user_id, 1)
+
+
+@receiver(post_delete, sender=Notification)
+def uncount_deleted_notification(sender, instance, **kwargs):
+    if not instance.is_read:
+        adjust_notification_unread(instance.user_id, -1)
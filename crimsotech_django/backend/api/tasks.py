@@ -1,12 +1,81 @@
 # backend/api/tasks.py
 from celery import shared_task
+from django.conf import settings
 from django.core.management import call_command
 
-@shared_task
-def assign_deliveries_task():
-    call_command('assign_deliveries')
+from api.utils.task_runtime import DELIVERY_ASSIGNMENT_LOCK, run_locked, task_lock, timed_run, tracked
 
-@shared_task
+LOCK_TIMEOUT = getattr(settings, 'TASK_LOCK_TIMEOUT', 10 * 60)
+# Seconds before an on-demand assignment retries while a sweep holds the lock
+ASSIGNMENT_RETRY_DELAY = 5
+# Enough retries to outlast a sweep holding the lock until it expires
+ASSIGNMENT_MAX_RETRIES = LOCK_TIMEOUT // ASSIGNMENT_RETRY_DELAY + 1
+
+# Names the runs are recorded under (see task_metrics)
+ASSIGN_DELIVERIES = tracked('assign_deliveries')
+CHECK_DELIVERY_RESPONSES = tracked('check_delivery_responses')
+ASSIGN_ORDER_DELIVERY = tracked('assign_order_delivery')
+CHECK_ORDER_DELIVERY_RESPONSES = tracked('check_order_delivery_responses')
+BUILD_LANDING_CACHE = tracked('build_landing_cache')
+ROLLUP_DAILY_METRICS = tracked('rollup_daily_metrics')
+GEOCODE_BACKFILL = tracked('geocode_backfill')
+DELIVERY_TIMER = tracked('delivery_timer')
+RECONCILE_UNREAD_COUNTS = tracked('reconcile_unread_counts')
+
+@shared_task(time_limit=LOCK_TIMEOUT)
+def assign_deliveries_task(order_id=None, mode=None):
+    run_locked(ASSIGN_DELIVERIES, DELIVERY_ASSIGNMENT_LOCK,
+               call_command, 'assign_deliveries', order_id=order_id, mode=mode)
+
+@shared_task(time_limit=LOCK_TIMEOUT)
 def check_delivery_responses_task():
-    call_command('check_delivery_responses')
+    run_locked(CHECK_DELIVERY_RESPONSES, DELIVERY_ASSIGNMENT_LOCK,
+               call_command, 'check_delivery_responses')
+
+@shared_task(bind=True, max_retries=ASSIGNMENT_MAX_RETRIES, time_limit=LOCK_TIMEOUT)
+def assign_order_delivery_task(self, order_id, mode=None):
+    """Rider assignment for one order, queued by SellerOrderList.assign_deliveries"""
+    from api.views import SellerOrderList
+
+    with timed_run(ASSIGN_ORDER_DELIVERY):
+        with task_lock(DELIVERY_ASSIGNMENT_LOCK) as acquired:
+            if not acquired:
+                raise self.retry(countdown=ASSIGNMENT_RETRY_DELAY)
+            response = SellerOrderList()._assign_order_delivery(order_id, mode)
+        return {'success': response.data.get('success'), 'message': response.data.get('message')}
+
+@shared_task(bind=True, max_retries=ASSIGNMENT_MAX_RETRIES, time_limit=LOCK_TIMEOUT)
+def delivery_timer_task(self, delivery_id):
+    """A delivery's offer or pickup timer fired, or its offer was rejected (see api.utils.offer_timers)"""
+    with timed_run(DELIVERY_TIMER):
+        with task_lock(DELIVERY_ASSIGNMENT_LOCK) as acquired:
+            if not acquired:
+                raise self.retry(countdown=ASSIGNMENT_RETRY_DELAY)
+            call_command('check_delivery_responses', delivery_id=delivery_id)
+
+@shared_task(bind=True, max_retries=ASSIGNMENT_MAX_RETRIES, time_limit=LOCK_TIMEOUT)
+def check_order_delivery_responses_task(self, order_id):
+    """Settle one order's pending offers, queued by SellerOrderList.check_delivery_responses"""
+    from api.views import SellerOrderList
+
+    with timed_run(CHECK_ORDER_DELIVERY_RESPONSES):
+        with task_lock(DELIVERY_ASSIGNMENT_LOCK) as acquired:
+            if not acquired:
+                raise self.retry(countdown=ASSIGNMENT_RETRY_DELAY)
+            return SellerOrderList()._settle_delivery_responses(order_id)
+
+@shared_task(time_limit=LOCK_TIMEOUT)
+def build_landing_cache_task():
+    run_locked(BUILD_LANDING_CACHE, 'build-landing-cache', call_command, 'build_landing_cache')
+
+@shared_task(time_limit=LOCK_TIMEOUT)
+def rollup_daily_metrics_task():
+    run_locked(ROLLUP_DAILY_METRICS, 'rollup-daily-metrics', call_command, 'rollup_daily_metrics')
+
+@shared_task(time_limit=LOCK_TIMEOUT)
+def geocode_backfill_task(max_requests=None):
+    run_locked(GEOCODE_BACKFILL, 'geocode-backfill', call_command, 'geocode_backfill', max_requests=max_requests)
 
+@shared_task(time_limit=LOCK_TIMEOUT)
+def reconcile_unread_counts_task():
+    run_locked(RECONCILE_UNREAD_COUNTS, 'reconcile-unread-counts', call_command, 'reconcile_unread_counts')
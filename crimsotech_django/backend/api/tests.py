@@ -791,3 +791,1458 @@ class RiderDeliveryActionsTests(TestCase):
         self.order.refresh_from_db()
         self.assertEqual(self.order.status, 'shipped')
 
+
+
+class PublicProductsFeedTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        from .models import Variants, Favorites
+        self.seller = User.objects.create(username='feed_seller', email='feed_seller@example.com')
+        Customer.objects.create(customer=self.seller)
+        self.shop = Shop.objects.create(name='Feed Shop', province='P', city='C', barangay='B', street='S', customer=self.seller.customer)
+        self.buyer = User.objects.create(username='feed_buyer', email='feed_buyer@example.com')
+        buyer_customer = Customer.objects.create(customer=self.buyer)
+        self.products = []
+        for i in range(5):
+            product = Product.objects.create(name=f'Feed {i}', description='d', status='active', condition=3, shop=self.shop, upload_status='published')
+            Variants.objects.create(product=product, shop=self.shop, title='Default', price=Decimal('100.00') + i, quantity=3)
+            self.products.append(product)
+        Favorites.objects.create(product=self.products[0], customer=buyer_customer)
+
+    def test_feed_pages_through_catalog_without_duplicates(self):
+        seen = []
+        cursor = None
+        for _ in range(5):
+            params = {'page_size': 2}
+            if cursor:
+                params['cursor'] = cursor
+            res = self.client.get('/api/public-products/feed/', params, HTTP_X_USER_ID=str(self.buyer.id))
+            self.assertEqual(res.status_code, 200)
+            seen.extend(item['id'] for item in res.data['products'])
+            cursor = res.data['pagination']['next_cursor']
+            if not res.data['pagination']['has_next']:
+                break
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(set(seen), {str(p.id) for p in self.products})
+
+    def test_feed_marks_favorites_and_keeps_list_fields(self):
+        res = self.client.get('/api/public-products/feed/', {'page_size': 10}, HTTP_X_USER_ID=str(self.buyer.id))
+        self.assertEqual(res.status_code, 200)
+        items = {item['id']: item for item in res.data['products']}
+        self.assertTrue(items[str(self.products[0].id)]['is_favorite'])
+        self.assertFalse(items[str(self.products[1].id)]['is_favorite'])
+        for field in ('price_display_with_vat', 'available_stock', 'availability_status', 'seller_name', 'primary_image_url'):
+            self.assertIn(field, items[str(self.products[1].id)])
+
+    def test_feed_rejects_malformed_cursor(self):
+        res = self.client.get('/api/public-products/feed/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(res.status_code, 400)
+
+
+class ProductListQueryCountTests(TestCase):
+    """
+    Query-count regression tests for the main product list endpoints.
+    Each endpoint must issue the same number of queries no matter how
+    many products it returns, i.e. no per-product round-trips.
+    """
+    def setUp(self):
+        self.client = APIClient()
+        self.seller = User.objects.create(username='qc_seller', email='qc_seller@example.com')
+        self.seller_customer = Customer.objects.create(customer=self.seller)
+        self.shop = Shop.objects.create(name='QC Shop', province='P', city='C', barangay='B', street='S', customer=self.seller_customer)
+        self.buyer = User.objects.create(username='qc_buyer', email='qc_buyer@example.com')
+        Customer.objects.create(customer=self.buyer)
+
+    def _add_products(self, count, shop=True):
+        from .models import Variants, ProductMedia
+        for i in range(count):
+            product = Product.objects.create(
+                name=f'QC {i}', description='d', status='active', condition=3,
+                shop=self.shop if shop else None, customer=self.seller_customer,
+                upload_status='published'
+            )
+            Variants.objects.create(product=product, shop=product.shop, title='A', price=Decimal('50.00'), quantity=2)
+            Variants.objects.create(product=product, shop=product.shop, title='B', price=Decimal('75.00'), quantity=1)
+            ProductMedia.objects.create(product=product, file_data='product/qc.jpg', file_type='image/jpeg')
+
+    def _count_queries(self, url, params=None, **headers):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(url, params or {}, **headers)
+        self.assertEqual(res.status_code, 200)
+        return len(ctx.captured_queries), res
+
+    def _assert_constant_queries(self, url, params=None, shop=True, **headers):
+        self._add_products(2, shop=shop)
+        small, _ = self._count_queries(url, params, **headers)
+        self._add_products(6, shop=shop)
+        large, res = self._count_queries(url, params, **headers)
+        self.assertEqual(small, large)
+        return res
+
+    def test_public_products_list(self):
+        res = self._assert_constant_queries('/api/public-products/', HTTP_X_USER_ID=str(self.buyer.id))
+        self.assertEqual(len(res.data), 8)
+        item = res.data[0]
+        self.assertEqual(item['price_display'], '₱50.00 - ₱75.00')
+        self.assertEqual(item['price_range'], {'min': 50.0, 'max': 75.0, 'is_range': True})
+        self.assertIsNotNone(item['primary_image'])
+
+    def test_public_products_feed(self):
+        res = self._assert_constant_queries('/api/public-products/feed/', {'page_size': 50}, HTTP_X_USER_ID=str(self.buyer.id))
+        self.assertEqual(len(res.data['products']), 8)
+
+    def test_seller_products_list(self):
+        res = self._assert_constant_queries('/api/seller-products/', {'customer_id': str(self.seller.id)})
+        self.assertEqual(len(res.data['products']), 8)
+        self.assertEqual(res.data['products'][0]['starting_price'], '50.00')
+
+    def test_customer_products_list(self):
+        res = self._assert_constant_queries('/api/customer-products/', {'customer_id': str(self.seller.id)}, shop=False)
+        self.assertEqual(len(res.data['products']), 8)
+
+    def test_serializer_without_prefetch_matches_prefetched_output(self):
+        from .serializer import ProductSerializer
+        self._add_products(1)
+        plain = Product.objects.get()
+        prefetched = Product.objects.prefetch_related('variants', 'productmedia_set').get()
+        self.assertEqual(ProductSerializer(plain).data['price_range'], ProductSerializer(prefetched).data['price_range'])
+        self.assertEqual(ProductSerializer(plain).data['primary_image'], ProductSerializer(prefetched).data['primary_image'])
+
+
+class LandingCacheTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from .models import Variants
+        cache.clear()
+        self.client = APIClient()
+        seller = User.objects.create(username='landing_seller', email='landing_seller@example.com')
+        Customer.objects.create(customer=seller)
+        self.shop = Shop.objects.create(name='Landing Shop', province='P', city='C', barangay='B', street='S', customer=seller.customer, verified=True, status='Active')
+        self.product = Product.objects.create(name='Landing Product', description='d', status='active', condition=3, shop=self.shop, upload_status='published')
+        Variants.objects.create(product=self.product, shop=self.shop, title='Default', price=Decimal('120.00'), quantity=4)
+
+    def test_second_request_is_served_from_cache(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        first = self.client.get('/api/landing/')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.data['stats']['products_count'], 1)
+        self.assertEqual(first.data['featured_products'][0]['min_price'], 120.0)
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get('/api/landing/')
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(second.data, first.data)
+
+    def test_product_change_invalidates_cached_payload(self):
+        self.client.get('/api/landing/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Another', description='d', status='active', condition=3, shop=self.shop, upload_status='published')
+        res = self.client.get('/api/landing/')
+        self.assertEqual(res.data['stats']['products_count'], 2)
+
+    def test_build_landing_cache_command_stores_payload(self):
+        from django.core.management import call_command
+        from .utils.landing_cache import get_cached_landing_payload
+        from io import StringIO
+        call_command('build_landing_cache', stdout=StringIO())
+        payload = get_cached_landing_payload()
+        self.assertIsNotNone(payload)
+        self.assertEqual(payload['stats']['products_count'], 1)
+
+
+class CacheHelpersTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from .models import Variants
+        cache.clear()
+        self.client = APIClient()
+        seller = User.objects.create(username='cache_seller', email='cache_seller@example.com')
+        Customer.objects.create(customer=seller)
+        self.shop = Shop.objects.create(name='Cache Shop', province='P', city='C', barangay='B', street='S', customer=seller.customer, verified=True, status='Active')
+        self.product = Product.objects.create(name='Cache Product', description='d', status='active', condition=3, shop=self.shop, upload_status='published')
+        self.variant = Variants.objects.create(product=self.product, shop=self.shop, title='Default', price=Decimal('50.00'), quantity=3)
+
+    def test_get_or_build_caches_until_namespace_invalidated(self):
+        from .utils.cache_helpers import get_or_build, invalidate_namespace
+        calls = []
+
+        def builder():
+            calls.append(1)
+            return {'n': len(calls)}
+
+        self.assertEqual(get_or_build('categories', 'global', builder=builder), {'n': 1})
+        self.assertEqual(get_or_build('categories', 'global', builder=builder), {'n': 1})
+        invalidate_namespace('categories')
+        self.assertEqual(get_or_build('categories', 'global', builder=builder), {'n': 2})
+
+    def test_missing_entries_are_not_cached(self):
+        from .utils.cache_helpers import get_or_build
+        self.assertIsNone(get_or_build('product_detail', 'missing', builder=lambda: None))
+        self.assertEqual(get_or_build('product_detail', 'missing', builder=lambda: 'built'), 'built')
+
+    def test_product_detail_invalidated_when_variant_changes(self):
+        url = f'/api/public-products/{self.product.id}/'
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.data['total_stock'], 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.variant.quantity = 7
+            self.variant.save()
+        second = self.client.get(url)
+        self.assertEqual(second.data['total_stock'], 7)
+
+    def test_product_detail_invalidated_when_its_shop_changes(self):
+        url = f'/api/public-products/{self.product.id}/'
+        first = self.client.get(url)
+        self.assertIn('Cache Shop', str(first.data))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shop.name = 'Renamed Shop'
+            self.shop.save()
+        second = self.client.get(url)
+        self.assertIn('Renamed Shop', str(second.data))
+        self.assertNotIn('Cache Shop', str(second.data))
+
+    def test_shop_profile_follow_state_is_per_viewer(self):
+        from .models import ShopFollow
+        follower = User.objects.create(username='cache_follower', email='cache_follower@example.com')
+        Customer.objects.create(customer=follower)
+        url = f'/api/shops/{self.shop.id}/'
+        self.assertEqual(self.client.get(url).data['total_followers'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            ShopFollow.objects.create(shop=self.shop, customer=follower.customer)
+        res = self.client.get(url, HTTP_X_USER_ID=str(follower.id))
+        self.assertEqual(res.data['total_followers'], 1)
+        self.assertTrue(res.data['is_following'])
+        self.assertFalse(self.client.get(url).data['is_following'])
+
+
+class TextCategoryModelRegistryTests(TestCase):
+    def setUp(self):
+        import tempfile
+        from .utils.category_model import TextCategoryModelRegistry, TextCategoryModel
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.loads = []
+
+        test = self
+
+        class CountingRegistry(TextCategoryModelRegistry):
+            def _load(self, signature):
+                test.loads.append(signature)
+                return TextCategoryModel(None, None, None, ['price'], signature)
+
+        self.registry = CountingRegistry(model_dir=self.tmp.name)
+
+    def _write_artifacts(self, mtime):
+        import os
+        for path in self.registry._paths():
+            with open(path, 'w') as f:
+                f.write('x')
+            os.utime(path, (mtime, mtime))
+
+    def test_missing_artifacts_raise_file_not_found(self):
+        with self.assertRaises(FileNotFoundError):
+            self.registry.get()
+
+    def test_model_is_loaded_once_and_reloaded_when_files_change(self):
+        self._write_artifacts(1_000_000)
+        first = self.registry.get()
+        self.assertIs(self.registry.get(), first)
+        self.assertEqual(len(self.loads), 1)
+
+        self._write_artifacts(2_000_000)
+        self.assertIsNot(self.registry.get(), first)
+        self.assertEqual(len(self.loads), 2)
+
+
+class MicroBatcherTests(TestCase):
+    def test_concurrent_requests_share_a_batch(self):
+        import threading
+        import numpy as np
+        from .utils.inference_batcher import MicroBatcher
+        seen_batches = []
+
+        def predict_fn(batch):
+            seen_batches.append(len(batch))
+            return batch * 2
+
+        batcher = MicroBatcher(predict_fn, max_batch_size=8, max_wait_ms=200)
+        results = {}
+        start = threading.Barrier(4)
+
+        def worker(i):
+            start.wait()
+            results[i] = batcher.predict(np.array([[float(i)]]), timeout=5)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual({i: float(r[0]) for i, r in results.items()}, {0: 0.0, 1: 2.0, 2: 4.0, 3: 6.0})
+        self.assertLess(len(seen_batches), 4)
+        metrics = batcher.metrics()
+        self.assertEqual(metrics['requests'], 4)
+        self.assertEqual(metrics['batches'], len(seen_batches))
+        self.assertIsNotNone(metrics['latency_ms']['p95'])
+
+    def test_errors_are_raised_to_every_caller(self):
+        import numpy as np
+        from .utils.inference_batcher import MicroBatcher
+
+        def predict_fn(batch):
+            raise RuntimeError('model failed')
+
+        batcher = MicroBatcher(predict_fn, max_wait_ms=0)
+        with self.assertRaises(RuntimeError):
+            batcher.predict(np.zeros((1, 2)), timeout=5)
+        self.assertEqual(batcher.metrics()['errors'], 1)
+
+
+class CategoryIndexTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from .models import Category
+        from .utils.category_index import category_index
+        cache.clear()
+        category_index.invalidate()
+        self.index = category_index
+        self.phones = Category.objects.create(name='Mobile Phones')
+        Category.objects.create(name='Audio Devices')
+
+    def test_lookups_hit_memory_after_first_load(self):
+        self.assertEqual(self.index.names(), ['Audio Devices', 'Mobile Phones'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.index.mapping()['Mobile Phones']['uuid'], str(self.phones.id))
+            self.assertEqual(len(self.index.all_categories()), 2)
+
+    def test_category_change_refreshes_index(self):
+        from .models import Category
+        self.index.names()
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Wearables')
+        self.assertEqual(self.index.names(), ['Audio Devices', 'Mobile Phones', 'Wearables'])
+
+    def test_database_errors_fall_back_without_caching_the_defaults(self):
+        from unittest import mock
+        from .models import Category
+        with mock.patch.object(Category.objects, 'filter', side_effect=RuntimeError('db down')):
+            self.assertIn('Televisions', self.index.names())
+            self.assertEqual(self.index.mapping(), {})
+        self.assertEqual(self.index.names(), ['Audio Devices', 'Mobile Phones'])
+        self.assertEqual(self.index.mapping()['Mobile Phones']['id'], str(self.phones.id))
+
+    def test_classifier_rejects_outputs_that_do_not_match_categories(self):
+        import numpy as np
+        from .utils.model_handler import ElectronicsClassifier, CategoryMismatchError
+        classifier = ElectronicsClassifier.__new__(ElectronicsClassifier)
+        result = classifier._build_result(np.array([0.2, 0.8]))
+        self.assertEqual(result['predicted_class'], 'Mobile Phones')
+        self.assertEqual(result['category_uuid'], str(self.phones.id))
+        with self.assertRaises(CategoryMismatchError):
+            classifier._build_result(np.array([0.2, 0.5, 0.3]))
+
+
+class SalesTimeseriesTests(TestCase):
+    def setUp(self):
+        from datetime import date, datetime, time as dt_time
+        from django.core.cache import cache
+        from .models import CartItem, Checkout, Delivery, Variants
+        cache.clear()
+        self.start = date(2026, 1, 1)
+        seller = User.objects.create(username='ts_seller', email='ts_seller@example.com')
+        Customer.objects.create(customer=seller)
+        shop = Shop.objects.create(name='TS Shop', province='P', city='C', barangay='B', street='S', customer=seller.customer)
+        product = Product.objects.create(name='TS Product', description='d', status='active', condition=3, shop=shop)
+        variant = Variants.objects.create(product=product, shop=shop, title='Default', price=Decimal('100.00'), quantity=10, value_added_tax_amount=Decimal('12.00'))
+        buyer = User.objects.create(username='ts_buyer', email='ts_buyer@example.com')
+        Customer.objects.create(customer=buyer)
+
+        def place(day, status, amount, quantity=1, direct=False, shipping=None):
+            order = Order.objects.create(user=buyer, total_amount=amount, payment_method='cash', status=status)
+            Order.objects.filter(pk=order.pk).update(created_at=timezone.make_aware(datetime.combine(day, dt_time(12))))
+            if direct:
+                Checkout.objects.create(order=order, direct_variant_id=variant.id, quantity=quantity, total_amount=amount, transaction_fee=1.5)
+            else:
+                # Cart items are unique per (product, user, variant)
+                cart_variant = Variants.objects.create(product=product, shop=shop, title=f'V{day.day}', price=amount, quantity=10, value_added_tax_amount=Decimal('12.00'))
+                cart = CartItem.objects.create(product=product, variant=cart_variant, user=buyer, quantity=quantity)
+                Checkout.objects.create(order=order, cart_item=cart, quantity=quantity, total_amount=amount, discount_applied=Decimal('5.00'))
+            if shipping:
+                Delivery.objects.create(order=order, status='delivered', delivery_fee=shipping)
+
+        place(self.start, 'completed', Decimal('200.00'), quantity=2, shipping=50)
+        place(self.start.replace(day=3), 'pending', Decimal('100.00'))
+        place(self.start.replace(day=9), 'completed', Decimal('100.00'), direct=True)
+        place(self.start.replace(day=10), 'cancelled', Decimal('80.00'))
+
+    def test_weekly_checkout_series(self):
+        from .utils.sales_timeseries import checkout_sales_series
+        grouping, buckets = checkout_sales_series(self.start, self.start.replace(day=14), 'weekly', include_refunds=True)
+        self.assertEqual(grouping, 'weekly')
+        self.assertEqual([b['start'].day for b in buckets], [1, 8])
+        first, second = buckets
+        self.assertEqual(first['completed_revenue'], Decimal('200.00'))
+        self.assertEqual(first['pending_revenue'], Decimal('100.00'))
+        self.assertEqual(first['orders'], 2)
+        self.assertEqual(first['shipping_fees'], 50)
+        self.assertEqual(first['discounts'], Decimal('10.00'))
+        self.assertEqual(first['vat_collected'], Decimal('24.00'))
+        self.assertEqual(first['platform_fees'], Decimal('10.00'))
+        # Buy-now checkout: VAT comes from the direct variant
+        self.assertEqual(second['vat_collected'], Decimal('12.00'))
+        self.assertEqual(second['transaction_fees'], 1.5)
+        self.assertEqual(second['refunds'], 1)
+
+    def test_query_count_does_not_grow_with_range(self):
+        from datetime import timedelta
+        from .utils.sales_timeseries import checkout_sales_series, order_sales_series
+        # Nothing rolled up yet: one rollup lookup, then the live day-grouped
+        # queries (no buy-now checkouts in the first week, so no direct-variant lookup)
+        with self.assertNumQueries(5):
+            checkout_sales_series(self.start, self.start + timedelta(days=6), 'daily', include_refunds=True)
+        with self.assertNumQueries(6):
+            grouping, buckets = checkout_sales_series(self.start, self.start + timedelta(days=364), 'monthly', include_refunds=True)
+        # Months without orders are left out
+        self.assertEqual(grouping, 'monthly')
+        self.assertEqual(len(buckets), 1)
+        with self.assertNumQueries(6):
+            grouping, buckets = order_sales_series(self.start, self.start + timedelta(days=20), 'weekly')
+        self.assertEqual([b['orders'] for b in buckets], [2, 2, 0])
+
+    def test_rolled_up_days_are_read_from_rollup_tables(self):
+        from datetime import timedelta
+        from .utils.metrics_rollup import rollup_range, shop_sales_totals, product_sales_totals, category_sales_totals
+        from .utils.sales_timeseries import checkout_sales_series
+        end = self.start + timedelta(days=13)
+        live_series = checkout_sales_series(self.start, end, 'weekly', include_refunds=True)
+        live_shops = shop_sales_totals(self.start, end)
+        live_products = product_sales_totals(self.start, end)
+        live_categories = category_sales_totals(self.start, end)
+
+        self.assertEqual(rollup_range(self.start, end), 14)
+
+        with self.assertNumQueries(1):
+            rolled_series = checkout_sales_series(self.start, end, 'weekly', include_refunds=True)
+        self.assertEqual(rolled_series, live_series)
+        self.assertEqual(shop_sales_totals(self.start, end), live_shops)
+        self.assertEqual(product_sales_totals(self.start, end), live_products)
+        self.assertEqual(category_sales_totals(self.start, end), live_categories)
+        # The buy-now checkout has no cart item, so it isn't attributed to a shop
+        self.assertEqual(live_shops[0]['orders'], 3)
+
+    def test_catch_up_backfills_then_rolls_forward(self):
+        from datetime import timedelta
+        from .models import DailySalesMetrics
+        from .utils.metrics_rollup import catch_up
+        until = self.start + timedelta(days=9)
+        start, end, days = catch_up(lookback_days=2, until=until)
+        self.assertEqual((start, days), (self.start, 10))
+        start, end, days = catch_up(lookback_days=2, until=until + timedelta(days=3))
+        self.assertEqual((start, days), (until - timedelta(days=1), 5))
+        self.assertEqual(DailySalesMetrics.objects.count(), 13)
+
+    def test_catch_up_re_rolls_old_days_whose_orders_changed(self):
+        from datetime import timedelta
+        from .models import DailySalesMetrics, DailyShopSalesMetrics, Delivery
+        from .utils.metrics_rollup import catch_up
+        until = self.start + timedelta(days=9)
+        catch_up(lookback_days=2, until=until)
+        placed = self.start.replace(day=3)
+
+        # Completed and delivered a week after it was placed, outside the lookback
+        order = Order.objects.get(created_at__date=placed)
+        order.status = 'completed'
+        order.save()
+        Delivery.objects.create(order=order, shop=Shop.objects.get(name='TS Shop'), status='delivered', delivery_fee=30)
+
+        start, end, days = catch_up(lookback_days=2, until=until + timedelta(days=1))
+        self.assertEqual((start, days), (until - timedelta(days=1), 4))
+        self.assertEqual(DailySalesMetrics.objects.get(date=placed).completed_revenue, Decimal('100.00'))
+        shop_day = DailyShopSalesMetrics.objects.get(date=placed)
+        self.assertEqual(shop_day.shipping_fees, 30)
+        self.assertEqual(shop_day.vat_collected, Decimal('12.00'))
+
+    def test_catch_up_re_rolls_orders_changed_while_it_computed(self):
+        from datetime import timedelta
+        from unittest.mock import patch
+        from .models import DailySalesMetrics
+        from .utils import metrics_rollup
+        until = self.start + timedelta(days=9)
+        placed = self.start.replace(day=3)
+        live_shop_totals = metrics_rollup.live_shop_totals
+
+        def complete_meanwhile(start_date, end_date):
+            # Platform totals are already computed; the rows are written after this
+            order = Order.objects.get(created_at__date=placed)
+            order.status = 'completed'
+            order.save()
+            return live_shop_totals(start_date, end_date)
+
+        with patch.object(metrics_rollup, 'live_shop_totals', side_effect=complete_meanwhile):
+            metrics_rollup.catch_up(lookback_days=2, until=until)
+        self.assertEqual(DailySalesMetrics.objects.get(date=placed).completed_revenue, 0)
+
+        metrics_rollup.catch_up(lookback_days=2, until=until)
+        self.assertEqual(DailySalesMetrics.objects.get(date=placed).completed_revenue, Decimal('100.00'))
+
+    def test_rollup_command_catches_up_to_yesterday(self):
+        from datetime import timedelta
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import DailySalesMetrics
+        out = StringIO()
+        call_command('rollup_daily_metrics', stdout=out)
+        self.assertIn('Rolled up', out.getvalue())
+        self.assertEqual(
+            DailySalesMetrics.objects.order_by('-date').first().date,
+            timezone.localdate() - timedelta(days=1)
+        )
+
+    def test_dashboards_serve_the_shared_series(self):
+        client = APIClient()
+        params = 'start_date=2026-01-01&end_date=2026-01-14&range_type=weekly'
+        res = client.get(f'/api/admin-dashboard/get_comprehensive_dashboard/?{params}')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([row['orders'] for row in res.data['sales_analytics']['sales_data']], [2, 2])
+        res = client.get(f'/api/admin-analytics/get_comprehensive_analytics/?{params}')
+        self.assertEqual(res.status_code, 200)
+        metrics = res.data['order_sales_analytics']['order_metrics_data']
+        self.assertEqual([row['refunds'] for row in metrics], [0, 1])
+
+
+class RiderMatchingTests(TestCase):
+    def setUp(self):
+        from .models import CartItem, Checkout, Delivery, Rider, ShippingAddress, Variants
+        seller = User.objects.create(username='rm_seller', email='rm_seller@example.com')
+        Customer.objects.create(customer=seller)
+        shop = Shop.objects.create(name='RM Shop', province='P', city='C', barangay='B', street='S', customer=seller.customer,
+                                   latitude=Decimal('14.5995000'), longitude=Decimal('120.9842000'))
+        product = Product.objects.create(name='RM Product', description='d', status='active', condition=3, shop=shop)
+        variant = Variants.objects.create(product=product, shop=shop, title='Default', price=Decimal('100.00'), quantity=10)
+        buyer = User.objects.create(username='rm_buyer', email='rm_buyer@example.com')
+        Customer.objects.create(customer=buyer)
+        addr = ShippingAddress.objects.create(user=buyer, recipient_name='Buyer', recipient_phone='09171234567', street='Main St', barangay='B', city='City', province='Prov', zip_code='1000',
+                                              latitude=Decimal('14.6500000'), longitude=Decimal('121.0300000'))
+        self.order = Order.objects.create(user=buyer, total_amount=100, payment_method='cash', shipping_address=addr, status='ready_to_ship', delivery_method='Standard Delivery')
+        cart = CartItem.objects.create(product=product, variant=variant, user=buyer, quantity=1)
+        Checkout.objects.create(order=self.order, cart_item=cart, quantity=1, total_amount=100)
+
+        # Riders further and further north of the shop; one without a location
+        self.riders = []
+        for idx in range(8):
+            user = User.objects.create(username=f'rm_rider{idx}', email=f'rm_rider{idx}@example.com', is_rider=True,
+                                       latitude=Decimal('14.5995000') + Decimal('0.01') * (idx + 1), longitude=Decimal('120.9842000'))
+            self.riders.append(Rider.objects.create(rider=user, verified=True, availability_status='available', is_accepting_deliveries=True))
+        nowhere = User.objects.create(username='rm_nowhere', email='rm_nowhere@example.com', is_rider=True)
+        Rider.objects.create(rider=nowhere, verified=True, availability_status='available', is_accepting_deliveries=True)
+        # The nearest rider already turned this order down
+        Delivery.objects.create(order=self.order, rider=self.riders[0], status='rejected')
+
+    def test_vectorized_haversine_matches_scalar(self):
+        from .management.commands.assign_deliveries import Command
+        from .utils.rider_matching import haversine_km
+        lats, lngs = [14.6, 10.3157, 7.0731], [121.0, 123.8854, 125.6128]
+        expected = [Command().haversine_distance(14.5995, 120.9842, lat, lng) for lat, lng in zip(lats, lngs)]
+        for got, want in zip(haversine_km(14.5995, 120.9842, lats, lngs), expected):
+            self.assertAlmostEqual(got, want, places=6)
+
+    def test_pool_returns_top_k_skipping_rejected_and_unlocated(self):
+        from .models import Rider
+        from .utils.rider_matching import RiderPool, rejected_riders_by_order
+        pool = RiderPool(Rider.objects.select_related('rider'))
+        self.assertEqual(len(pool), 8)
+        self.assertEqual(len(pool.without_location), 1)
+
+        with self.assertNumQueries(1):
+            rejected = rejected_riders_by_order([self.order.pk])
+        nearest = pool.nearest(14.5995, 120.9842, 3, exclude=rejected[self.order.pk])
+        self.assertEqual([rider.pk for rider, _ in nearest], [r.pk for r in self.riders[1:4]])
+        self.assertLess(nearest[0][1], nearest[1][1])
+
+    def test_sweep_only_measures_top_k_candidates(self):
+        from io import StringIO
+        from unittest import mock
+        from django.core.management import call_command
+        from django.test import override_settings
+        from .models import Delivery
+        from .utils import distance_service
+
+        requests_made = []
+
+        def fake_fetch(origins, destinations):
+            requests_made.append((len(origins), len(destinations)))
+            return {}
+
+        with override_settings(RIDER_MATCH_CANDIDATES=3), mock.patch.object(distance_service, '_fetch', side_effect=fake_fetch):
+            call_command('assign_deliveries', stdout=StringIO())
+
+        # The 3 rider -> pickup legs share one request; pickup -> destination is another
+        self.assertEqual(sorted(requests_made), [(1, 1), (3, 1)])
+        offer = Delivery.objects.get(order=self.order, status='pending_offer')
+        self.assertEqual(offer.rider_id, self.riders[1].pk)
+        self.assertEqual(len(offer.metadata['all_riders_considered']), 3)
+
+
+    def test_optimal_mode_assigns_the_sweep_at_once(self):
+        from io import StringIO
+        from unittest import mock
+        from django.core.management import call_command
+        from .models import CartItem, Checkout, Delivery, Variants
+        from .utils import distance_service
+        buyer = User.objects.create(username='rm_buyer2', email='rm_buyer2@example.com', latitude=Decimal('14.5000000'), longitude=Decimal('120.9842000'))
+        Customer.objects.create(customer=buyer)
+        other = Order.objects.create(user=buyer, total_amount=100, payment_method='cash', status='ready_to_ship', delivery_method='Standard Delivery')
+        product = Product.objects.get(name='RM Product')
+        cart = CartItem.objects.create(product=product, variant=Variants.objects.get(product=product), user=buyer, quantity=1)
+        Checkout.objects.create(order=other, cart_item=cart, quantity=1, total_amount=100)
+
+        out = StringIO()
+        with mock.patch.object(distance_service, '_fetch', return_value={}):
+            call_command('assign_deliveries', mode='optimal', stdout=out)
+
+        offers = Delivery.objects.filter(status='pending_offer')
+        self.assertEqual(offers.count(), 2)
+        # One offer per rider; the rider who rejected the first order takes the other one
+        self.assertEqual(offers.values('rider').distinct().count(), 2)
+        self.assertEqual(offers.get(order=other).rider_id, self.riders[0].pk)
+        self.assertEqual(offers.get(order=self.order).metadata['assignment_mode'], 'optimal')
+        self.assertIn('Saved vs greedy', out.getvalue())
+
+    def test_seller_batch_mode_assigns_all_waiting_shop_orders(self):
+        from unittest import mock
+        from .models import CartItem, Checkout, Delivery, Variants
+        from .utils import distance_service
+        buyer = User.objects.create(username='rm_buyer3', email='rm_buyer3@example.com', latitude=Decimal('14.7000000'), longitude=Decimal('120.9842000'))
+        Customer.objects.create(customer=buyer)
+        other = Order.objects.create(user=buyer, total_amount=100, payment_method='cash', status='waiting_for_rider', delivery_method='Standard Delivery')
+        product = Product.objects.get(name='RM Product')
+        cart = CartItem.objects.create(product=product, variant=Variants.objects.get(product=product), user=buyer, quantity=1)
+        Checkout.objects.create(order=other, cart_item=cart, quantity=1, total_amount=100)
+
+        # The action only queues the work; tests run Celery tasks inline
+        with mock.patch.object(distance_service, '_fetch', return_value={}):
+            res = APIClient().post(f'/api/seller-order-list/assign_deliveries/?order_id={self.order.order}&mode=optimal')
+        self.assertEqual(res.status_code, 202)
+        self.assertTrue(res.data['data']['task_id'])
+        deliveries = Delivery.objects.filter(status='pending', order__in=[self.order, other])
+        self.assertEqual(deliveries.values('rider').distinct().count(), 2)
+        self.assertNotEqual(deliveries.get(order=self.order).rider_id, self.riders[0].pk)
+
+    def test_offer_timer_expires_and_reassigns(self):
+        from datetime import timedelta
+        from io import StringIO
+        from unittest import mock
+        from django.core.management import call_command
+        from .models import Delivery
+        from .utils import distance_service
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            offer = Delivery.objects.create(order=self.order, rider=self.riders[1], status='pending_offer')
+        with mock.patch('api.tasks.delivery_timer_task.apply_async') as schedule:
+            for callback in callbacks:
+                callback()
+        self.assertAlmostEqual(schedule.call_args.kwargs['countdown'], 600, delta=5)
+
+        # A timer firing before the deadline (or after the rider answered) does nothing
+        call_command('check_delivery_responses', delivery_id=str(offer.id), stdout=StringIO())
+        offer.refresh_from_db()
+        self.assertEqual(offer.status, 'pending_offer')
+
+        Delivery.objects.filter(id=offer.id).update(created_at=timezone.now() - timedelta(minutes=11))
+        with mock.patch.object(distance_service, '_fetch', return_value={}):
+            call_command('check_delivery_responses', delivery_id=str(offer.id), stdout=StringIO())
+        offer.refresh_from_db()
+        self.assertEqual(offer.status, 'expired')
+        # riders[0] rejected the order earlier and riders[1] let the offer expire
+        self.assertEqual(Delivery.objects.get(order=self.order, status='pending_offer').rider_id, self.riders[2].pk)
+
+    def test_rejection_is_reassigned_right_away_and_only_once(self):
+        from io import StringIO
+        from unittest import mock
+        from django.core.management import call_command
+        from .models import Delivery
+        from .utils import distance_service
+
+        offer = Delivery.objects.create(order=self.order, rider=self.riders[1], status='pending_offer')
+        offer.status = 'rejected'
+        # Tests run Celery tasks inline, so the rejection's task runs on commit
+        with mock.patch.object(distance_service, '_fetch', return_value={}):
+            with self.captureOnCommitCallbacks(execute=True):
+                offer.save()
+            call_command('check_delivery_responses', delivery_id=str(offer.id), stdout=StringIO())
+
+        offers = Delivery.objects.filter(order=self.order, status='pending_offer')
+        self.assertEqual(offers.count(), 1)
+        self.assertEqual(offers.get().rider_id, self.riders[2].pk)
+
+    def test_sweep_writes_offers_and_notifications_in_bulk(self):
+        from io import StringIO
+        from unittest import mock
+        from django.core.management import call_command
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .models import CartItem, Checkout, Delivery, Notification, Variants
+        from .utils import distance_service
+        product = Product.objects.get(name='RM Product')
+        for idx in range(2):
+            buyer = User.objects.create(username=f'rm_bulk{idx}', email=f'rm_bulk{idx}@example.com',
+                                        latitude=Decimal('14.6000000'), longitude=Decimal('121.0000000'))
+            order = Order.objects.create(user=buyer, total_amount=100, payment_method='cash', status='ready_to_ship', delivery_method='Standard Delivery')
+            cart = CartItem.objects.create(product=product, variant=Variants.objects.get(product=product), user=buyer, quantity=1)
+            Checkout.objects.create(order=order, cart_item=cart, quantity=1, total_amount=100)
+
+        with mock.patch.object(distance_service, '_fetch', return_value={}), \
+                self.captureOnCommitCallbacks() as callbacks, CaptureQueriesContext(connection) as queries:
+            call_command('assign_deliveries', stdout=StringIO())
+
+        inserts = [q['sql'] for q in queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len([sql for sql in inserts if 'api_delivery' in sql]), 1)
+        self.assertEqual(len([sql for sql in inserts if 'api_notification' in sql]), 1)
+        self.assertEqual(Delivery.objects.filter(status='pending_offer').count(), 3)
+        self.assertEqual(Notification.objects.filter(title='New Delivery Assignment').count(), 3)
+        self.assertEqual(Order.objects.filter(status='rider_assigned').count(), 3)
+
+        # One timer per offer plus one batched push of the notifications
+        with mock.patch('api.tasks.delivery_timer_task.apply_async') as schedule, \
+                mock.patch('api.utils.notifications.push_notifications') as push:
+            for callback in callbacks:
+                callback()
+        self.assertEqual(schedule.call_count, 3)
+        push.assert_called_once()
+        self.assertEqual(len(push.call_args.args[0]), 3)
+
+    def test_pickup_is_recorded_at_checkout_and_loaded_with_the_order(self):
+        from .models import OrderPickup
+        from .utils.order_pickups import PICKUP_RELATED, get_pickup, pickup_point
+        self.assertEqual(OrderPickup.objects.get(order=self.order).shop.name, 'RM Shop')
+        order = Order.objects.select_related(*PICKUP_RELATED).get(pk=self.order.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(pickup_point(get_pickup(order)), (14.5995, 120.9842, 'RM Shop'))
+
+        # Orders placed before pickups were stored get theirs on first use
+        OrderPickup.objects.all().delete()
+        order = Order.objects.select_related(*PICKUP_RELATED).get(pk=self.order.pk)
+        self.assertEqual(get_pickup(order).shop.name, 'RM Shop')
+        self.assertTrue(OrderPickup.objects.filter(order=self.order).exists())
+
+    def test_optimal_solver_beats_greedy_and_respects_capacity(self):
+        import numpy as np
+        from .utils.rider_matching import solve_greedy, solve_optimal
+        inf = np.inf
+        # Job 0 is a little closer to rider 0, but rider 0 is the only one near job 1
+        costs = np.array([[1.0, 2.0], [1.5, 10.0]])
+        self.assertEqual(solve_greedy(costs, [1, 1]), [(0, 0), (1, 1)])
+        self.assertEqual(sorted(solve_optimal(costs, [1, 1])), [(0, 1), (1, 0)])
+        # A rider with room for two takes both
+        self.assertEqual(sorted(solve_optimal(costs, [2, 0])), [(0, 0), (1, 0)])
+        # Riders that aren't candidates (rejected, too far) are never used
+        costs = np.array([[inf, 3.0], [inf, 4.0]])
+        self.assertEqual(solve_optimal(costs, [1, 1]), [(0, 1)])
+
+    def test_optimal_plan_serves_orders_whose_candidates_are_all_taken(self):
+        from unittest import mock
+        from .models import Rider
+        from .utils import distance_service
+        from .utils.rider_matching import RiderPool, plan_assignments
+        pool = RiderPool(Rider.objects.select_related('rider'))
+        # Four orders at the shop, all sharing the same two nearest riders
+        jobs = [{'pickup': (14.5995, 120.9842), 'destination': (14.65, 121.03)} for _ in range(4)]
+        with mock.patch.object(distance_service, '_fetch', return_value={}):
+            plan = plan_assignments(jobs, pool, capacities=[1] * len(pool), k=2)
+
+        self.assertEqual(plan['unassigned'], [])
+        self.assertEqual(plan['greedy_assigned'], 4)
+        riders = [plan['assignments'][i]['rider'].pk for i in range(4)]
+        self.assertEqual(sorted(riders, key=str), sorted([r.pk for r in self.riders[:4]], key=str))
+
+
+class DistanceServiceTests(TestCase):
+    class FakeSession:
+        """Distance Matrix stand-in: every element is 1 km per 0.01 degree of latitude"""
+
+        def __init__(self, status='OK'):
+            self.status = status
+            self.calls = []
+
+        def get(self, url, params=None, timeout=None):
+            from unittest import mock
+            origins = [tuple(map(float, point.split(','))) for point in params['origins'].split('|')]
+            destinations = [tuple(map(float, point.split(','))) for point in params['destinations'].split('|')]
+            self.calls.append((len(origins), len(destinations)))
+            rows = [
+                {'elements': [
+                    {'status': 'OK', 'distance': {'value': int(round(abs(o[0] - d[0]) * 100000))}, 'duration': {'value': 60}}
+                    for d in destinations
+                ]}
+                for o in origins
+            ]
+            return mock.Mock(json=mock.Mock(return_value={'status': self.status, 'rows': rows}))
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def _patched(self, session):
+        from unittest import mock
+        from .utils import distance_service
+        return mock.patch.object(distance_service, 'get_session', return_value=session)
+
+    def test_many_to_one_is_batched_and_cached(self):
+        from django.core.cache import cache
+        from .models import RouteDistance
+        from .utils.distance_service import distances_to
+        origins = [(14.6 + 0.01 * i, 121.0) for i in range(1, 31)]
+        session = self.FakeSession()
+        with self._patched(session):
+            first = distances_to(origins, (14.6, 121.0))
+        # 30 origins need two requests (at most 25 origins each)
+        self.assertEqual(sorted(session.calls), [(5, 1), (25, 1)])
+        self.assertAlmostEqual(first[0], 1.0)
+        self.assertAlmostEqual(first[-1], 30.0)
+        self.assertEqual(RouteDistance.objects.count(), 30)
+
+        # Served from Redis, then from the table once Redis forgets them
+        with self._patched(session):
+            self.assertEqual(distances_to(origins, (14.6, 121.0)), first)
+            cache.clear()
+            self.assertEqual(distances_to(origins, (14.6, 121.0)), first)
+        self.assertEqual(len(session.calls), 2)
+
+    def test_provider_failure_falls_back_to_haversine_without_caching(self):
+        from .models import RouteDistance
+        from .utils.distance_service import driving_distance, haversine_km
+        session = self.FakeSession(status='OVER_QUERY_LIMIT')
+        with self._patched(session):
+            self.assertIsNone(driving_distance(14.6, 121.0, 14.7, 121.0, fallback=False))
+            km = driving_distance(14.6, 121.0, 14.7, 121.0)
+        self.assertAlmostEqual(km, float(haversine_km(14.6, 121.0, [14.7], [121.0])[0]))
+        self.assertEqual(RouteDistance.objects.count(), 0)
+
+    def test_expired_routes_are_refetched(self):
+        from datetime import timedelta
+        from django.core.cache import cache
+        from .models import RouteDistance
+        from .utils.distance_service import driving_distance
+        session = self.FakeSession()
+        with self._patched(session):
+            driving_distance(14.6, 121.0, 14.7, 121.0)
+            RouteDistance.objects.update(fetched_at=timezone.now() - timedelta(days=30))
+            cache.clear()
+            driving_distance(14.6, 121.0, 14.7, 121.0)
+        self.assertEqual(len(session.calls), 2)
+        self.assertEqual(RouteDistance.objects.count(), 1)
+
+
+class GeocodingTests(TestCase):
+    class FakeSession:
+        """Geocoding stand-in: every address resolves to the same point unless listed as unknown"""
+
+        def __init__(self, unknown=()):
+            self.unknown = set(unknown)
+            self.calls = []
+
+        def get(self, url, params=None, timeout=None):
+            from unittest import mock
+            self.calls.append(params['address'])
+            if params['address'] in self.unknown:
+                data = {'status': 'ZERO_RESULTS', 'results': []}
+            else:
+                data = {'status': 'OK', 'results': [{'geometry': {'location': {'lat': 14.5995124, 'lng': 120.9842195}}}]}
+            return mock.Mock(json=mock.Mock(return_value=data))
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def _patched(self, session):
+        from unittest import mock
+        from .utils import geocoding
+        return mock.patch.object(geocoding, 'get_session', return_value=session)
+
+    def test_lookup_only_reads_the_cache_and_queues_misses(self):
+        from .models import GeocodeCache
+        from .utils.geocoding import lookup_coordinates, normalize_address
+        self.assertEqual(normalize_address('Rizal St,  Poblacion', 'Manila.'), normalize_address('rizal st', 'poblacion', 'MANILA'))
+
+        session = self.FakeSession()
+        with self._patched(session):
+            self.assertEqual(lookup_coordinates('Rizal St', 'Poblacion', 'Manila', 'Metro Manila', 'Philippines'), (None, None))
+            self.assertEqual(lookup_coordinates('rizal st', 'poblacion', 'manila', 'metro manila', 'philippines'), (None, None))
+        self.assertEqual(session.calls, [])
+        self.assertEqual(list(GeocodeCache.objects.values_list('status', flat=True)), ['pending'])
+
+    def test_backfill_fills_rows_once_per_address(self):
+        from django.core.management import call_command
+        from .models import GeocodeCache, ShippingAddress
+        from .utils.geocoding import Backfill, lookup_coordinates
+        user = User.objects.create(username='geo', email='geo@example.com', street='1 Rizal St', barangay='Poblacion', city='Manila', province='Metro Manila')
+        shop = Shop.objects.create(name='Geo Shop', street='1 Rizal St', barangay='Poblacion', city='Manila', province='Metro Manila')
+        ShippingAddress.objects.create(
+            user=user, recipient_name='Geo', recipient_phone='0917', street='Nowhere', barangay='X',
+            city='Y', province='Z', zip_code='1000'
+        )
+
+        session = self.FakeSession(unknown={'nowhere, x, y, z, philippines'})
+        with self._patched(session):
+            capped = Backfill(max_requests=0, rate=0).run()
+            self.assertEqual(capped.requests_made, 0)
+            call_command('geocode_backfill', rate=0)
+            call_command('geocode_backfill', rate=0)
+
+        # One call per distinct address; the unresolvable one isn't retried
+        self.assertEqual(sorted(session.calls), ['1 rizal st, poblacion, manila, metro manila, philippines', 'nowhere, x, y, z, philippines'])
+        shop.refresh_from_db()
+        user.refresh_from_db()
+        self.assertEqual(shop.latitude, Decimal('14.5995124'))
+        self.assertEqual(user.longitude, Decimal('120.9842195'))
+        self.assertEqual(GeocodeCache.objects.get(status='not_found').attempts, 1)
+        self.assertEqual(lookup_coordinates(shop.street, shop.barangay, shop.city, shop.province, "Philippines"), (shop.latitude, shop.longitude))
+
+
+class TaskRuntimeTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def test_sweep_is_skipped_while_the_assignment_lock_is_held(self):
+        from unittest import mock
+        from .tasks import assign_deliveries_task
+        from .utils.task_runtime import DELIVERY_ASSIGNMENT_LOCK, task_lock, task_metrics
+
+        with mock.patch('api.tasks.call_command') as command:
+            with task_lock(DELIVERY_ASSIGNMENT_LOCK) as acquired:
+                self.assertTrue(acquired)
+                with task_lock(DELIVERY_ASSIGNMENT_LOCK) as again:
+                    self.assertFalse(again)
+                assign_deliveries_task.delay()
+            command.assert_not_called()
+            assign_deliveries_task.delay(mode='optimal')
+            command.assert_called_once_with('assign_deliveries', order_id=None, mode='optimal')
+
+        stats = task_metrics()['assign_deliveries']
+        self.assertEqual((stats['runs'], stats['skipped'], stats['succeeded']), (2, 1, 1))
+        self.assertEqual(stats['last_outcome'], 'succeeded')
+        self.assertIsNotNone(stats['avg_seconds'])
+
+    def test_failures_are_recorded_and_release_the_lock(self):
+        from unittest import mock
+        from django.core.cache import cache
+        from .tasks import rollup_daily_metrics_task
+        from .utils.task_runtime import task_metrics
+
+        with mock.patch('api.tasks.call_command', side_effect=RuntimeError('boom')):
+            result = rollup_daily_metrics_task.delay()
+        self.assertTrue(result.failed())
+        self.assertIsNone(cache.get('task-lock:rollup-daily-metrics'))
+        self.assertEqual(task_metrics()['rollup_daily_metrics']['failed'], 1)
+
+        res = APIClient().get('/api/tasks/metrics/')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()['tasks']['rollup_daily_metrics']['runs'], 1)
+
+    def test_concurrent_runs_are_all_counted(self):
+        import threading
+        from .utils.task_runtime import TRACKED_TASKS, record_run, task_metrics
+        TRACKED_TASKS.append('concurrent_test')
+        try:
+            def worker():
+                for _ in range(50):
+                    record_run('concurrent_test', 'succeeded', 0.01)
+
+            threads = [threading.Thread(target=worker) for _ in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            stats = task_metrics()['concurrent_test']
+        finally:
+            TRACKED_TASKS.remove('concurrent_test')
+        self.assertEqual((stats['runs'], stats['succeeded']), (400, 400))
+        self.assertAlmostEqual(stats['total_seconds'], 4.0)
+        self.assertEqual(stats['last_outcome'], 'succeeded')
+
+    def test_order_settle_retries_instead_of_skipping_while_a_sweep_holds_the_lock(self):
+        from unittest import mock
+        from .tasks import check_order_delivery_responses_task
+        from .utils.task_runtime import DELIVERY_ASSIGNMENT_LOCK, task_lock
+
+        class Retried(Exception):
+            pass
+
+        with mock.patch('api.views.SellerOrderList._settle_delivery_responses', return_value={'settled': 1}) as settle, \
+                mock.patch.object(check_order_delivery_responses_task, 'retry', side_effect=Retried) as retry:
+            with task_lock(DELIVERY_ASSIGNMENT_LOCK):
+                with self.assertRaises(Retried):
+                    check_order_delivery_responses_task.run('order-1')
+            settle.assert_not_called()
+            retry.assert_called_once()
+            self.assertEqual(check_order_delivery_responses_task.run('order-1'), {'settled': 1})
+
+    def test_lock_waiting_tasks_retry_for_as_long_as_a_sweep_can_hold_the_lock(self):
+        from .tasks import (
+            ASSIGNMENT_RETRY_DELAY, assign_order_delivery_task, check_order_delivery_responses_task, delivery_timer_task,
+        )
+        from .utils.task_runtime import get_lock_timeout
+        for task in (assign_order_delivery_task, delivery_timer_task, check_order_delivery_responses_task):
+            self.assertGreaterEqual(task.max_retries * ASSIGNMENT_RETRY_DELAY, get_lock_timeout())
+
+
+class RiderLocationTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from .models import Rider
+        from .utils.rider_locations import get_index
+        cache.clear()
+        get_index().clear()
+        self.riders = []
+        for idx in range(3):
+            user = User.objects.create(username=f'rl_rider{idx}', email=f'rl_rider{idx}@example.com', is_rider=True,
+                                       latitude=Decimal('14.0000000'), longitude=Decimal('121.0000000'))
+            self.riders.append(Rider.objects.create(rider=user, verified=True, availability_status='available', is_accepting_deliveries=True))
+
+    def test_socket_pings_update_the_index_and_write_the_database_coarsely(self):
+        from asgiref.sync import async_to_sync
+        from django.contrib.auth.hashers import make_password
+        from channels.testing import WebsocketCommunicator
+        from django.test import override_settings
+        from .consumers import RiderLocationConsumer
+        from .utils.rider_locations import live_locations
+        rider = self.riders[0]
+
+        rider.rider.password = make_password('rider-pass')
+        rider.rider.save()
+        token = APIClient().post('/api/login/', {'username': 'rl_rider0', 'password': 'rider-pass'}).data['location_token']
+
+        async def stream():
+            communicator = WebsocketCommunicator(RiderLocationConsumer.as_asgi(), '/ws/riders/location/')
+            await communicator.connect()
+            await communicator.send_json_to({'type': 'location', 'latitude': 14.6, 'longitude': 121.0})
+            self.assertEqual((await communicator.receive_json_from())['message'], 'Not authenticated')
+            await communicator.send_json_to({'type': 'authenticate', 'token': token, 'user_id': str(rider.pk)})
+            self.assertEqual((await communicator.receive_json_from())['type'], 'authenticated')
+            await communicator.send_json_to({'type': 'location', 'latitude': 14.6, 'longitude': 121.0})
+            await communicator.send_json_to({'type': 'location', 'latitude': 14.61, 'longitude': 121.01})
+            await communicator.send_json_to({'type': 'location', 'latitude': 200, 'longitude': 121.0})
+            self.assertEqual((await communicator.receive_json_from())['message'], 'Coordinates out of range')
+            await communicator.disconnect()
+
+        with override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}):
+            async_to_sync(stream)()
+
+        # The index has the latest ping; the database only the first of the interval
+        self.assertEqual(live_locations([rider.pk]), {str(rider.pk): (14.61, 121.01)})
+        rider.rider.refresh_from_db()
+        self.assertEqual(rider.rider.latitude, Decimal('14.6000000'))
+
+    def test_socket_rejects_a_bare_user_id_or_a_forged_token(self):
+        from asgiref.sync import async_to_sync
+        from channels.testing import WebsocketCommunicator
+        from django.core import signing
+        from django.test import override_settings
+        from .consumers import RiderLocationConsumer
+        from .utils.rider_locations import live_locations, location_token
+        rider = self.riders[0]
+
+        async def authenticate(payload):
+            communicator = WebsocketCommunicator(RiderLocationConsumer.as_asgi(), '/ws/riders/location/')
+            await communicator.connect()
+            await communicator.send_json_to(dict(payload, type='authenticate'))
+            reply = await communicator.receive_json_from()
+            closed = await communicator.receive_output()
+            await communicator.disconnect()
+            return reply['message'], closed['type']
+
+        with override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}):
+            for payload in (
+                {'user_id': str(rider.pk)},
+                {'token': signing.dumps(str(rider.pk), salt='someone-else')},
+                # Someone else's valid token can't speak for this rider
+                {'token': location_token(self.riders[1].pk), 'user_id': str(rider.pk)},
+            ):
+                self.assertEqual(async_to_sync(authenticate)(payload), ('Invalid or expired location token', 'websocket.close'))
+        self.assertEqual(live_locations([rider.pk]), {})
+
+    def test_live_positions_feed_matching_and_expire(self):
+        from unittest import mock
+        from .models import Rider
+        from .utils import rider_locations
+        from .utils.rider_matching import RiderPool
+        rider_locations.record_location(self.riders[1].pk, 14.6, 121.0)
+        rider_locations.record_location(self.riders[2].pk, 14.7, 121.0)
+
+        pool = RiderPool(Rider.objects.select_related('rider'))
+        self.assertEqual(pool.position(self.riders[1]), (14.6, 121.0))
+        self.assertEqual(pool.position(self.riders[0]), (14.0, 121.0))
+        nearest = pool.nearest(14.59, 121.0, 1)
+        self.assertEqual(nearest[0][0].pk, self.riders[1].pk)
+
+        nearby = rider_locations.nearby_riders(14.59, 121.0, radius_km=5)
+        self.assertEqual([rider_id for rider_id, _ in nearby], [str(self.riders[1].pk)])
+
+        res = APIClient().get('/api/admin-riders/rider-locations/', {'lat': 14.59, 'lng': 121.0, 'radius_km': 20})
+        self.assertEqual([r['rider_id'] for r in res.data['riders']], [str(self.riders[1].pk), str(self.riders[2].pk)])
+        self.assertTrue(res.data['riders'][0]['is_live'])
+
+        later = rider_locations.time.time() + rider_locations.get_location_ttl() + 1
+        with mock.patch.object(rider_locations.time, 'time', return_value=later):
+            self.assertEqual(rider_locations.live_locations([self.riders[1].pk]), {})
+            self.assertEqual(rider_locations.nearby_riders(14.59, 121.0, radius_km=5), [])
+
+
+class BenchmarkAssignmentTests(TestCase):
+    def test_benchmark_reports_both_sweeps_and_leaves_no_rows(self):
+        import json
+        from io import StringIO
+        from django.core.cache import cache
+        from django.core.management import call_command
+        from .models import Delivery, Order, Rider
+        cache.clear()
+        out = StringIO()
+        call_command('benchmark_assignment', riders=12, orders=6, shops=3, json=True, stdout=out)
+        results = json.loads(out.getvalue())
+
+        assigned = results['assign_deliveries']
+        self.assertEqual(assigned['assignments'], 6)
+        self.assertGreater(assigned['queries'], 0)
+        self.assertGreater(assigned['provider_requests'], 0)
+        self.assertEqual(results['check_delivery_responses']['assignments'], 3)
+
+        # The synthetic world is rolled back
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Rider.objects.exists())
+        self.assertFalse(Delivery.objects.exists())
+
+
+class ConversationInboxTests(TestCase):
+    def setUp(self):
+        from .models import Conversation, ConversationParticipant, Message
+        self.user = User.objects.create(username='inbox_owner', email='inbox_owner@example.com')
+        self.conversations = []
+        for idx in range(4):
+            other = User.objects.create(username=f'inbox_friend{idx}', email=f'inbox_friend{idx}@example.com')
+            conv = Conversation.objects.create()
+            conv.participants.add(self.user, other)
+            for n in range(idx):
+                message = Message.objects.create(sender=other, receiver=self.user, conversation_id=conv.id, content=f'hi {n}')
+            if idx:
+                conv.update_last_message(message)
+            self.conversations.append(conv)
+        ConversationParticipant.objects.filter(conversation=self.conversations[1], user=self.user).update(is_archived=True)
+
+    def test_inbox_pages_with_a_fixed_number_of_queries(self):
+        client = APIClient(HTTP_X_USER_ID=str(self.user.id))
+        # user lookup, the page, the other participants
+        with self.assertNumQueries(3):
+            res = client.get('/api/conversation/inbox/', {'page_size': 2})
+        self.assertEqual(res.status_code, 200)
+        first = res.data['conversations']
+        self.assertEqual([c['participant_name'] for c in first], ['inbox_friend3', 'inbox_friend2'])
+        self.assertEqual([c['unread_count'] for c in first], [3, 2])
+        self.assertEqual(first[0]['last_message'], 'hi 2')
+        self.assertTrue(res.data['pagination']['has_next'])
+
+        res = client.get('/api/conversation/inbox/', {'page_size': 2, 'cursor': res.data['pagination']['next_cursor']})
+        second = res.data['conversations']
+        self.assertEqual([c['participant_name'] for c in second], ['inbox_friend1', 'inbox_friend0'])
+        self.assertTrue(second[0]['is_archived'])
+        self.assertIsNone(second[1]['last_message'])
+        self.assertFalse(res.data['pagination']['has_next'])
+
+        res = client.get('/api/conversation/inbox/', {'archived': 'true'})
+        self.assertEqual([c['participant_name'] for c in res.data['conversations']], ['inbox_friend1'])
+
+    def test_list_keeps_its_shape_and_counts_only_unread_since_the_read_marker(self):
+        from .models import ConversationParticipant, Message
+        conv = self.conversations[3]
+        marker = Message.objects.filter(conversation_id=conv.id).order_by('created_at').first()
+        ConversationParticipant.objects.get(conversation=conv, user=self.user).mark_as_read(up_to_message=marker)
+
+        res = APIClient(HTTP_X_USER_ID=str(self.user.id)).get('/api/conversation/list/')
+        self.assertEqual(len(res.data), 4)
+        self.assertEqual(res.data[0]['id'], str(conv.id))
+        self.assertEqual(res.data[0]['unread_count'], 2)
+
+
+class UnreadCounterTests(TestCase):
+    def setUp(self):
+        from .models import Conversation
+        self.user = User.objects.create(username='counter_owner', email='counter_owner@example.com')
+        self.other = User.objects.create(username='counter_friend', email='counter_friend@example.com')
+        self.conv = Conversation.objects.create()
+        self.conv.participants.add(self.user, self.other)
+
+    def participant(self):
+        from .models import ConversationParticipant
+        return ConversationParticipant.objects.get(conversation=self.conv, user=self.user)
+
+    def test_counters_follow_creates_reads_and_deletes(self):
+        from .models import Message, Notification
+        from .utils.unread_counters import mark_notifications_read
+        messages = [
+            Message.objects.create(sender=self.other, receiver=self.user, conversation_id=self.conv.id, content=f'm{n}')
+            for n in range(3)
+        ]
+        Message.objects.create(sender=self.user, receiver=self.other, conversation_id=self.conv.id, content='reply')
+        self.assertEqual(self.participant().unread_count, 3)
+
+        messages[0].mark_as_read()
+        messages[1].soft_delete_for_user(self.user)
+        messages[2].delete()
+        self.assertEqual(self.participant().unread_count, 0)
+        self.assertEqual(Message.get_unread_count(self.user.id), 0)
+
+        for n in range(2):
+            Notification.objects.create(user=self.user, title=f'n{n}', message='x', type='system')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.unread_notification_count, 2)
+        self.assertEqual(mark_notifications_read(Notification.objects.filter(user=self.user)), 2)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.unread_notification_count, 0)
+
+    def test_patching_is_read_moves_the_notification_counter(self):
+        from .models import Notification
+        notification = Notification.objects.create(user=self.user, title='n', message='x', type='system')
+        client = APIClient(HTTP_X_USER_ID=str(self.user.id))
+        url = f'/api/notifications/{notification.id}/'
+
+        self.assertEqual(client.patch(url, {'is_read': True}, format='json').status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.unread_notification_count, 0)
+        client.patch(url, {'is_read': True}, format='json')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.unread_notification_count, 0)
+
+        client.patch(url, {'is_read': False}, format='json')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.unread_notification_count, 1)
+        notification.refresh_from_db()
+        self.assertIsNone(notification.read_at)
+
+    def test_reconcile_repairs_drifted_counters(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import ConversationParticipant, Message
+        Message.objects.create(sender=self.other, receiver=self.user, conversation_id=self.conv.id, content='hi')
+        ConversationParticipant.objects.filter(conversation=self.conv, user=self.user).update(unread_count=7)
+        User.objects.filter(id=self.user.id).update(unread_notification_count=4)
+
+        call_command('reconcile_unread_counts', '--dry-run', stdout=StringIO())
+        self.assertEqual(self.participant().unread_count, 7)
+
+        call_command('reconcile_unread_counts', stdout=StringIO())
+        self.assertEqual(self.participant().unread_count, 1)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.unread_notification_count, 0)
+
+
+class ChatWriteBehindTests(TestCase):
+    def setUp(self):
+        from .models import Conversation
+        self.sender = User.objects.create(username='chat_sender', email='chat_sender@example.com')
+        self.receiver = User.objects.create(username='chat_receiver', email='chat_receiver@example.com')
+        self.conv = Conversation.objects.create()
+        self.conv.participants.add(self.sender, self.receiver)
+
+    def test_burst_is_written_in_one_batch_then_acknowledged_and_broadcast(self):
+        from unittest import mock
+        from asgiref.sync import async_to_sync
+        from channels.testing import WebsocketCommunicator
+        from django.test import override_settings
+        from .consumers import ChatConsumer
+        from .models import ConversationParticipant, Message, Notification
+        from .utils import chat_writes
+
+        async def chat():
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chat/')
+            communicator.scope['url_route'] = {'kwargs': {}}
+            await communicator.connect()
+            await communicator.send_json_to({'type': 'authenticate', 'user_id': str(self.sender.id), 'conversation_id': str(self.conv.id)})
+            self.assertEqual((await communicator.receive_json_from())['type'], 'authenticated')
+            for n in range(5):
+                await communicator.send_json_to({'type': 'message', 'receiver_id': str(self.receiver.id), 'content': f'hi {n}', 'client_id': f'c{n}'})
+            replies = [await communicator.receive_json_from(timeout=5) for _ in range(10)]
+            await communicator.disconnect()
+            return replies
+
+        write_messages = mock.Mock(wraps=chat_writes.write_messages)
+        with override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}, CHAT_WRITE_MAX_WAIT_MS=200), \
+                mock.patch.object(chat_writes, 'write_messages', write_messages):
+            replies = async_to_sync(chat)()
+
+        saved = [r for r in replies if r['type'] == 'message_saved']
+        broadcast = [r for r in replies if r['type'] == 'new_message']
+        self.assertEqual([r['client_id'] for r in saved], ['c0', 'c1', 'c2', 'c3', 'c4'])
+        self.assertEqual([r['content'] for r in broadcast], ['hi 0', 'hi 1', 'hi 2', 'hi 3', 'hi 4'])
+        self.assertEqual([r['message_id'] for r in broadcast], [r['message_id'] for r in saved])
+        write_messages.assert_called_once()
+
+        self.assertEqual(Message.objects.filter(conversation_id=self.conv.id).count(), 5)
+        self.assertEqual(Notification.objects.filter(user=self.receiver, type='chat').count(), 5)
+        self.assertEqual(ConversationParticipant.objects.get(conversation=self.conv, user=self.receiver).unread_count, 5)
+        self.receiver.refresh_from_db()
+        self.assertEqual(self.receiver.unread_notification_count, 5)
+
+    def test_unsaved_message_is_never_acknowledged(self):
+        from unittest import mock
+        from asgiref.sync import async_to_sync
+        from channels.testing import WebsocketCommunicator
+        from django.test import override_settings
+        from .consumers import ChatConsumer
+        from .models import Message
+        from .utils import chat_writes
+
+        async def chat():
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chat/')
+            communicator.scope['url_route'] = {'kwargs': {}}
+            await communicator.connect()
+            await communicator.send_json_to({'type': 'authenticate', 'user_id': str(self.sender.id), 'conversation_id': str(self.conv.id)})
+            await communicator.receive_json_from()
+            await communicator.send_json_to({'type': 'message', 'receiver_id': str(self.receiver.id), 'content': 'lost', 'client_id': 'c0'})
+            reply = await communicator.receive_json_from(timeout=5)
+            self.assertTrue(await communicator.receive_nothing(timeout=0.1))
+            await communicator.disconnect()
+            return reply
+
+        with override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}), \
+                mock.patch.object(chat_writes, 'write_messages', side_effect=lambda batch: ([], batch)):
+            reply = async_to_sync(chat)()
+
+        self.assertEqual((reply['type'], reply['client_id']), ('error', 'c0'))
+        self.assertFalse(Message.objects.filter(conversation_id=self.conv.id).exists())
+
+    def test_full_queue_pushes_back(self):
+        from asgiref.sync import async_to_sync
+        from .models import Message
+        from .utils.chat_writes import ChatWriter, PendingMessage, QueueFull
+
+        def pending(n):
+            message = Message(sender=self.sender, receiver=self.receiver, content=f'm{n}', conversation_id=self.conv.id)
+            return PendingMessage(message, 'chat_sender', 'reply', f'c{n}')
+
+        async def flood():
+            writer = ChatWriter(queue_size=1)
+            writer._ensure_flusher = lambda: None
+            await writer.enqueue(pending(0))
+            with self.assertRaises(QueueFull):
+                await writer.enqueue(pending(1), timeout=0.01)
+
+        async_to_sync(flood)()
+
+
+class ChatHistoryTests(TestCase):
+    def setUp(self):
+        from datetime import timedelta
+        from .models import Conversation, Message
+        self.user = User.objects.create(username='history_owner', email='history_owner@example.com')
+        self.other = User.objects.create(username='history_friend', email='history_friend@example.com')
+        self.conv = Conversation.objects.create()
+        self.conv.participants.add(self.user, self.other)
+        start = timezone.now() - timedelta(hours=1)
+        self.messages = []
+        for n in range(7):
+            message = Message.objects.create(sender=self.other, receiver=self.user, conversation_id=self.conv.id, content=f'm{n}')
+            Message.objects.filter(id=message.id).update(created_at=start + timedelta(minutes=n))
+            self.messages.append(message)
+        self.messages[5].soft_delete_for_user(self.user)
+
+    def test_rest_history_pages_backwards_and_skips_deleted_messages(self):
+        client = APIClient(HTTP_X_USER_ID=str(self.user.id))
+        url = f'/api/conversation/messages/{self.conv.id}/history/'
+        # user lookup, participant check, mark read (savepoint, count, update, counter, release), the page
+        with self.assertNumQueries(8):
+            res = client.get(url, {'page_size': 3})
+        self.assertEqual([m['content'] for m in res.data['messages']], ['m3', 'm4', 'm6'])
+        self.assertTrue(res.data['pagination']['has_next'])
+
+        res = client.get(url, {'page_size': 3, 'cursor': res.data['pagination']['next_cursor']})
+        self.assertEqual([m['content'] for m in res.data['messages']], ['m0', 'm1', 'm2'])
+        self.assertFalse(res.data['pagination']['has_next'])
+        self.assertEqual(client.get(url, {'cursor': 'bogus'}).status_code, 400)
+
+        res = client.get(f'/api/conversation/messages/{self.conv.id}/list/')
+        self.assertEqual([m['content'] for m in res.data], ['m0', 'm1', 'm2', 'm3', 'm4', 'm6'])
+        self.assertEqual(res.data[0]['status'], 'read')
+
+    def test_socket_sends_the_latest_page_then_older_pages_on_request(self):
+        from unittest import mock
+        from asgiref.sync import async_to_sync
+        from channels.testing import WebsocketCommunicator
+        from django.test import override_settings
+        from .consumers import ChatConsumer
+        from .utils import chat_history
+
+        async def scroll():
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chat/')
+            communicator.scope['url_route'] = {'kwargs': {}}
+            await communicator.connect()
+            await communicator.send_json_to({'type': 'authenticate', 'user_id': str(self.user.id), 'conversation_id': str(self.conv.id)})
+            await communicator.receive_json_from()
+            pages = [await communicator.receive_json_from()]
+            await communicator.send_json_to({'type': 'load_history', 'cursor': pages[0]['next_cursor'], 'page_size': 4})
+            pages.append(await communicator.receive_json_from())
+            await communicator.disconnect()
+            return pages
+
+        with override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}), \
+                mock.patch.object(chat_history, 'HISTORY_PAGE_SIZE', 2):
+            first, older = async_to_sync(scroll)()
+
+        self.assertEqual([m['content'] for m in first['messages']], ['m4', 'm6'])
+        self.assertTrue(first['has_next'])
+        self.assertEqual([m['content'] for m in older['messages']], ['m0', 'm1', 'm2', 'm3'])
+        self.assertFalse(older['has_next'])
+
+
+class NotificationDispatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='notify_owner', email='notify_owner@example.com')
+        self.other = User.objects.create(username='notify_other', email='notify_other@example.com')
+
+    def test_batch_writes_committed_notifications_once_without_muted_or_duplicates(self):
+        from unittest import mock
+        from django.db import transaction
+        from .models import Notification, NotificationMute
+        from .utils import notifications
+        NotificationMute.objects.create(user=self.user, type='payment')
+        Notification.objects.create(user=self.other, title='Welcome', message='Hello', type='system')
+
+        with mock.patch.object(notifications, 'push_notifications') as push, \
+                mock.patch.object(Notification.objects, 'bulk_create', wraps=Notification.objects.bulk_create) as bulk_create, \
+                self.captureOnCommitCallbacks(execute=True):
+            with notifications.notification_batch(), self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    notifications.notify(user=self.user, title='Shipped', message='Order 1 shipped', type='order_update')
+                    notifications.notify(user=self.user, title='Shipped', message='Order 1 shipped', type='order_update')
+                    notifications.notify(user=self.user, title='Paid', message='Order 1 paid', type='payment')
+                    notifications.notify(user=self.other, title='Welcome', message='Hello', type='system')
+                    notifications.notify(user=self.other, title='Shipped', message='Order 2 shipped', type='order_update')
+                try:
+                    with transaction.atomic():
+                        notifications.notify(user=self.user, title='Cancelled', message='Order 1 cancelled', type='order_update')
+                        raise ValueError('rolled back')
+                except ValueError:
+                    pass
+                self.assertEqual(Notification.objects.filter(type='order_update').count(), 0)
+
+        bulk_create.assert_called_once()
+        push.assert_called_once()
+        self.assertEqual(
+            sorted((n.user_id == self.user.id, n.message) for n in push.call_args[0][0]),
+            [(False, 'Order 2 shipped'), (True, 'Order 1 shipped')],
+        )
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.unread_notification_count, 1)
+
+    def test_mutes_endpoint(self):
+        client = APIClient(HTTP_X_USER_ID=str(self.user.id))
+        res = client.post('/api/notifications/mutes/', {'type': 'delivery', 'minutes': 30}, format='json')
+        self.assertEqual([m['type'] for m in res.data['mutes']], ['delivery'])
+        self.assertIsNotNone(res.data['mutes'][0]['muted_until'])
+        client.post('/api/notifications/mutes/', {'type': 'system'}, format='json')
+        res = client.delete('/api/notifications/mutes/?type=delivery')
+        self.assertEqual(res.data['mutes'], [{'type': 'system', 'muted_until': None}])
+        self.assertEqual(client.post('/api/notifications/mutes/', {}, format='json').status_code, 400)
@@ -0,0 +1,106 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+# Default TTLs (seconds) per namespace; override any of them with settings.CACHE_TTLS
+DEFAULT_CACHE_TTLS = {
+    'landing': 600,
+    'categories': 60 * 60,
+    'boost_plans': 60 * 60,
+    'shop_profile': 2 * 60,
+    'product_detail': 60,
+}
+
+# How long a rebuild may hold the lock before another worker may take over
+LOCK_TIMEOUT = 30
+# How long a worker waits for another worker's rebuild before building itself
+WAIT_TIMEOUT = 5
+WAIT_INTERVAL = 0.05
+
+
+def get_ttl(namespace):
+    overrides = getattr(settings, 'CACHE_TTLS', {})
+    return overrides.get(namespace, DEFAULT_CACHE_TTLS.get(namespace, 300))
+
+
+def _version_key(namespace):
+    return f'{namespace}:version'
+
+
+def get_namespace_version(namespace):
+    """
+    Current version of a namespace. Versions start from a timestamp so an
+    evicted version key never resurrects entries from an older version.
+    """
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        cache.add(_version_key(namespace), time.time_ns(), None)
+        version = cache.get(_version_key(namespace)) or 0
+    return version
+
+
+def make_key(namespace, *parts):
+    """Build a namespaced, versioned cache key, e.g. 'shop_profile:v123:<shop_id>'"""
+    version = get_namespace_version(namespace)
+    return ':'.join([namespace, f'v{version}', *[str(part) for part in parts]])
+
+
+def invalidate(namespace, *parts):
+    """Drop a single entry"""
+    cache.delete(make_key(namespace, *parts))
+
+
+def invalidate_many(namespace, keys):
+    """Drop the entries of several single-part keys, e.g. every product of a shop"""
+    version = get_namespace_version(namespace)
+    keys = [':'.join([namespace, f'v{version}', str(key)]) for key in keys]
+    if keys:
+        cache.delete_many(keys)
+
+
+def invalidate_namespace(namespace):
+    """Drop every entry in a namespace at once by moving to a new version"""
+    try:
+        cache.incr(_version_key(namespace))
+    except ValueError:
+        cache.set(_version_key(namespace), time.time_ns(), None)
+
+
+def get_or_build(namespace, *parts, builder, ttl=None):
+    """
+    Cache-aside read: return the cached value for (namespace, *parts), or
+    call builder() on a miss and cache its result.
+
+    Only one worker rebuilds a missing key at a time; the others wait
+    briefly for its result instead of all hitting the database (stampede
+    protection). A builder returning None is not cached.
+    """
+    key = make_key(namespace, *parts)
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            value = builder()
+            if value is not None:
+                cache.set(key, value, ttl if ttl is not None else get_ttl(namespace))
+            return value
+        finally:
+            cache.delete(lock_key)
+
+    # Another worker is rebuilding this key; wait for its result
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        value = cache.get(key)
+        if value is not None:
+            return value
+        if cache.get(lock_key) is None:
+            # The rebuild finished without caching anything (e.g. not found)
+            break
+
+    return builder()
@@ -0,0 +1,72 @@
+import threading
+
+from api.utils.cache_helpers import get_namespace_version
+
+
+# Used when the database can't be reached, in the order the image model was trained on
+DEFAULT_CATEGORY_NAMES = [
+    'Audio Devices', 'Computer Accessories', 'Controllers',
+    'Desktop and Laptops', 'Home Appliances', 'Mobile Phones',
+    'Storage Devices', 'Televisions', 'Wearables'
+]
+
+
+class CategoryIndex:
+    """
+    In-memory copy of the admin (shop-less) categories, ordered by name.
+
+    Category save/delete signals mark the local copy stale and bump the
+    shared 'categories' cache version, so other worker processes notice the
+    change on their next lookup too. Reads after that cost one cache get and
+    no database queries until a category actually changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (entries, name -> entry for entries with an id), or None until loaded
+        self._state = None
+        self._version = None
+
+    def _load(self):
+        from api.models import Category
+
+        categories = Category.objects.filter(shop__isnull=True).order_by('name').values_list('id', 'name')
+        entries = [{'id': str(pk), 'uuid': str(pk), 'name': name} for pk, name in categories]
+        return entries, {entry['name']: entry for entry in entries}
+
+    def _current(self):
+        version = get_namespace_version('categories')
+        state = self._state
+        if state is not None and self._version == version:
+            return state
+
+        with self._lock:
+            if self._state is None or self._version != version:
+                try:
+                    state = self._load()
+                except Exception as e:
+                    print(f"Warning: Failed to fetch categories from database: {e}")
+                    print("Falling back to default categories...")
+                    # Not kept, so the next lookup tries the database again
+                    return [{'id': None, 'uuid': None, 'name': name} for name in DEFAULT_CATEGORY_NAMES], {}
+                self._state = state
+                self._version = version
+            return self._state
+
+    def invalidate(self):
+        """Force a reload on the next lookup in this process"""
+        with self._lock:
+            self._state = None
+
+    def names(self):
+        return [entry['name'] for entry in self._current()[0]]
+
+    def mapping(self):
+        """category name -> {'id', 'uuid'} for categories that exist in the database"""
+        return self._current()[1]
+
+    def all_categories(self):
+        return [dict(entry) for entry in self._current()[0] if entry['id']]
+
+
+category_index = CategoryIndex()
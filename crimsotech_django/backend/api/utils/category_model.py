@@ -0,0 +1,103 @@
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'model')
+
+LABEL_ENCODER_FILE = 'category_label_encoder.pkl'
+SCALER_FILE = 'scaler.pkl'
+FEATURE_COLUMNS_FILE = 'feature_columns.pkl'
+MODEL_FILE = 'category_classifier.keras'
+
+
+class TextCategoryModel:
+    """The loaded text category classifier and its preprocessing artifacts"""
+
+    def __init__(self, label_encoder, scaler, model, feature_columns, signature):
+        self.label_encoder = label_encoder
+        self.scaler = scaler
+        self.model = model
+        self.feature_columns = feature_columns
+        self.signature = signature
+
+    def artifacts(self):
+        return self.label_encoder, self.scaler, self.model, self.feature_columns
+
+    def predict_proba(self, X):
+        """
+        Class probabilities for a feature matrix. Calls the model directly
+        rather than model.predict(), which sets up a whole input pipeline on
+        every call and is much slower for the single-row requests we serve.
+        """
+        import numpy as np
+
+        return np.asarray(self.model(np.asarray(X, dtype=np.float32), training=False))
+
+
+class TextCategoryModelRegistry:
+    """
+    Process-wide holder for the text category model.
+
+    Artifacts are loaded on first use and shared by every request thread.
+    Each lookup compares the files' modification times with the loaded
+    copy, so retraining the model on disk is picked up without a restart.
+    """
+
+    def __init__(self, model_dir=MODEL_DIR):
+        self.model_dir = model_dir
+        self._lock = threading.Lock()
+        self._loaded = None
+
+    def _paths(self):
+        return [
+            os.path.join(self.model_dir, name)
+            for name in (LABEL_ENCODER_FILE, SCALER_FILE, MODEL_FILE, FEATURE_COLUMNS_FILE)
+        ]
+
+    def _signature(self):
+        # Raises FileNotFoundError if any artifact is missing
+        return tuple(os.stat(path).st_mtime_ns for path in self._paths())
+
+    def _load(self, signature):
+        import joblib
+        import tensorflow as tf
+
+        label_encoder_path, scaler_path, model_path, feature_columns_path = self._paths()
+        loaded = TextCategoryModel(
+            label_encoder=joblib.load(label_encoder_path),
+            scaler=joblib.load(scaler_path),
+            model=tf.keras.models.load_model(model_path),
+            feature_columns=joblib.load(feature_columns_path),
+            signature=signature,
+        )
+        logger.info(f"Text category model loaded from {self.model_dir} ({len(loaded.feature_columns)} features)")
+        return loaded
+
+    def get(self):
+        """Return the current model, loading or reloading it if needed"""
+        signature = self._signature()
+        loaded = self._loaded
+        if loaded is not None and loaded.signature == signature:
+            return loaded
+
+        with self._lock:
+            # Another thread may have finished loading while we waited
+            loaded = self._loaded
+            if loaded is None or loaded.signature != signature:
+                loaded = self._load(signature)
+                self._loaded = loaded
+            return loaded
+
+    def clear(self):
+        with self._lock:
+            self._loaded = None
+
+
+text_category_registry = TextCategoryModelRegistry()
+
+
+def get_text_category_model():
+    """Shared text category model for this process; raises FileNotFoundError if it hasn't been trained"""
+    return text_category_registry.get()
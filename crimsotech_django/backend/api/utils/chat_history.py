@@ -0,0 +1,91 @@
+"""
+Chat history, newest first, in keyset pages.
+
+Messages the user deleted on their side are filtered out in SQL, and only
+the columns a history item shows are read, with .values(). Pages are
+ordered by (created_at, id) descending; the cursor of a page points at the
+next older one (api.utils.cursor_pagination). Within a page, items are
+returned oldest first, ready to prepend above what the client shows.
+Used by ConversationViewSet (REST) and ChatConsumer (WebSocket).
+"""
+from django.db.models import Q
+
+from api.models import Message
+from api.utils.cursor_pagination import paginate_keyset, parse_page_size
+
+
+HISTORY_PAGE_SIZE = 50
+
+HISTORY_FIELDS = (
+    'id', 'sender_id', 'sender__username', 'receiver_id', 'receiver__username',
+    'content', 'message_type', 'status', 'created_at', 'delivered_at', 'read_at',
+    'is_edited', 'edited_at',
+    'attachment', 'attachment_name', 'attachment_size', 'attachment_mime_type',
+    'reply_to_id', 'reply_to__content', 'reply_to__sender__username',
+)
+
+
+def visible_messages(conversation_id, user_id):
+    """The conversation's messages, minus those the user deleted on their side"""
+    return Message.objects.filter(conversation_id=conversation_id).exclude(
+        Q(sender_id=user_id, is_deleted_for_sender=True) |
+        Q(receiver_id=user_id, is_deleted_for_receiver=True)
+    )
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def history_item(row):
+    """One .values(*HISTORY_FIELDS) row in the shape the chat clients read"""
+    item = {
+        'id': str(row['id']),
+        'sender_id': str(row['sender_id']) if row['sender_id'] else None,
+        'sender_name': row['sender__username'] or 'Unknown',
+        'receiver_id': str(row['receiver_id']) if row['receiver_id'] else None,
+        'receiver_name': row['receiver__username'] or 'Unknown',
+        'content': row['content'],
+        'message_type': row['message_type'],
+        'status': row['status'],
+        'timestamp': _isoformat(row['created_at']),
+        'delivered_at': _isoformat(row['delivered_at']),
+        'read_at': _isoformat(row['read_at']),
+        'is_edited': row['is_edited'],
+        'edited_at': _isoformat(row['edited_at']),
+    }
+    if row['attachment']:
+        storage = Message._meta.get_field('attachment').storage
+        item['attachment'] = {
+            'url': storage.url(row['attachment']),
+            'name': row['attachment_name'],
+            'size': row['attachment_size'],
+            'mime_type': row['attachment_mime_type'],
+        }
+    if row['reply_to_id']:
+        item['reply_to'] = {
+            'id': str(row['reply_to_id']),
+            'content': row['reply_to__content'][:100] if row['reply_to__content'] else '',
+            'sender_name': row['reply_to__sender__username'] or 'Unknown',
+        }
+    return item
+
+
+def history_items(queryset):
+    """Serialize a queryset of messages, in its own order, from one .values() query"""
+    return [history_item(row) for row in queryset.values(*HISTORY_FIELDS)]
+
+
+def history_page(conversation_id, user_id, cursor=None, page_size=None):
+    """
+    One page of the user's view of a conversation, older than the cursor.
+
+    Returns (items, next_cursor); next_cursor is None once the oldest
+    message has been returned.
+    """
+    page_size = parse_page_size(page_size, default=HISTORY_PAGE_SIZE)
+    rows, next_cursor = paginate_keyset(
+        visible_messages(conversation_id, user_id).order_by('-created_at', '-id').values(*HISTORY_FIELDS),
+        cursor, page_size,
+    )
+    return [history_item(row) for row in reversed(rows)], next_cursor
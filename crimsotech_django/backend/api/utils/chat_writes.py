@@ -0,0 +1,214 @@
+"""
+Write-behind persistence for chat messages.
+
+ChatConsumer hands each message to the process's ChatWriter. One flusher
+task per event loop takes up to CHAT_WRITE_BATCH_SIZE queued messages, or
+whatever arrives within CHAT_WRITE_MAX_WAIT_MS of the first, and writes
+them in one transaction: one bulk_create for the messages, one for their
+chat notifications (api.utils.notifications) and the receivers' unread
+counters. Only once that commits is the sender acknowledged and each
+message sent to its conversation group, in the order it was queued, so
+nobody sees (or is told they sent) a message that was not stored.
+
+The queue holds at most CHAT_WRITE_QUEUE_SIZE messages. When it is full,
+enqueue() waits up to CHAT_WRITE_ENQUEUE_TIMEOUT seconds for room before
+raising QueueFull, and the consumer tells the sender to retry. The queue
+is in the worker's memory: messages still queued when the process dies
+are never stored, broadcast or acknowledged, so the sender can resend
+whatever it has no ack for.
+"""
+import asyncio
+import weakref
+from collections import namedtuple
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+from api.models import Message, Notification
+from api.utils.notifications import create_notifications
+from api.utils.unread_counters import messages_created
+
+
+def get_batch_size():
+    return getattr(settings, 'CHAT_WRITE_BATCH_SIZE', 100)
+
+
+def get_max_wait_ms():
+    return getattr(settings, 'CHAT_WRITE_MAX_WAIT_MS', 20)
+
+
+def get_queue_size():
+    return getattr(settings, 'CHAT_WRITE_QUEUE_SIZE', 1000)
+
+
+def get_enqueue_timeout():
+    return getattr(settings, 'CHAT_WRITE_ENQUEUE_TIMEOUT', 2)
+
+
+# An unsaved Message, who sent it, and the sender's channel for its ack or failure
+PendingMessage = namedtuple('PendingMessage', ['message', 'sender_name', 'reply_channel', 'client_id'])
+
+
+class QueueFull(Exception):
+    """The write queue had no room within the enqueue timeout"""
+
+
+def message_event(pending):
+    """The chat_<conversation> group event ChatConsumer.chat_message() sends on"""
+    message = pending.message
+    return {
+        'type': 'chat_message',
+        'message_id': str(message.id),
+        'client_id': pending.client_id,
+        'sender_id': str(message.sender_id),
+        'sender_name': pending.sender_name,
+        'receiver_id': str(message.receiver_id),
+        'content': message.content,
+        'timestamp': str(message.created_at),
+        'status': message.status,
+        'conversation_id': str(message.conversation_id),
+    }
+
+
+def reply_event(event_type, pending):
+    """The event telling the sender's consumer whether its message was stored"""
+    return {
+        'type': event_type,
+        'message_id': str(pending.message.id),
+        'client_id': pending.client_id,
+        'conversation_id': str(pending.message.conversation_id),
+    }
+
+
+def _insert(batch):
+    messages = Message.objects.bulk_create([pending.message for pending in batch])
+    messages_created(messages)
+    create_notifications([
+        Notification(
+            user_id=pending.message.receiver_id,
+            title=f"New message from {pending.sender_name}",
+            message=(pending.message.content or '')[:100],
+            type='chat',
+            is_read=False,
+        )
+        for pending in batch
+    ])
+
+
+def write_messages(batch):
+    """Store a batch with its notifications; returns (saved, failed) lists of PendingMessage"""
+    try:
+        with transaction.atomic():
+            _insert(batch)
+        return batch, []
+    except Exception as e:
+        print(f"[CHAT] Could not write a batch of {len(batch)} messages, retrying one by one: {e}")
+
+    # One bad row (say, a receiver deleted meanwhile) shouldn't lose the rest
+    saved, failed = [], []
+    for pending in batch:
+        try:
+            with transaction.atomic():
+                _insert([pending])
+            saved.append(pending)
+        except Exception as e:
+            print(f"Error saving message: {e}")
+            failed.append(pending)
+    return saved, failed
+
+
+class ChatWriter:
+    """The bounded message queue of one event loop and the task that flushes it"""
+
+    def __init__(self, batch_size=None, max_wait_ms=None, queue_size=None):
+        self.batch_size = max(1, int(batch_size or get_batch_size()))
+        self.max_wait = max(0, get_max_wait_ms() if max_wait_ms is None else max_wait_ms) / 1000
+        self.queue = asyncio.Queue(maxsize=queue_size or get_queue_size())
+        self._flusher = None
+
+    def _ensure_flusher(self):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.ensure_future(self._run())
+
+    async def enqueue(self, pending, timeout=None):
+        """Queue a PendingMessage, waiting for room up to the timeout; raises QueueFull"""
+        self._ensure_flusher()
+        try:
+            self.queue.put_nowait(pending)
+        except asyncio.QueueFull:
+            timeout = get_enqueue_timeout() if timeout is None else timeout
+            try:
+                await asyncio.wait_for(self.queue.put(pending), timeout)
+            except asyncio.TimeoutError:
+                raise QueueFull(f"{self.queue.qsize()} chat messages are waiting to be written")
+
+    async def join(self):
+        """Wait until everything queued so far is written and broadcast"""
+        await self.queue.join()
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            try:
+                saved, failed = await database_sync_to_async(write_messages)(batch)
+                await self._fan_out(saved, failed)
+            except Exception as e:
+                print(f"[CHAT] Error flushing {len(batch)} messages: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _fan_out(self, saved, failed):
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        by_group = {}
+        by_sender = {}
+        for pending in saved:
+            by_group.setdefault(f'chat_{pending.message.conversation_id}', []).append(message_event(pending))
+            by_sender.setdefault(pending.reply_channel, []).append(reply_event('chat_message_saved', pending))
+        for pending in failed:
+            by_sender.setdefault(pending.reply_channel, []).append(reply_event('chat_message_failed', pending))
+
+        async def send_in_order(send, target, events):
+            for event in events:
+                await send(target, event)
+
+        sends = [send_in_order(channel_layer.send, channel, events) for channel, events in by_sender.items()]
+        sends += [send_in_order(channel_layer.group_send, group, events) for group, events in by_group.items()]
+        for result in await asyncio.gather(*sends, return_exceptions=True):
+            if isinstance(result, Exception):
+                print(f"[CHAT] Could not broadcast a message: {result}")
+
+
+_writers = weakref.WeakKeyDictionary()
+
+
+def get_chat_writer():
+    """The ChatWriter of the running event loop"""
+    loop = asyncio.get_running_loop()
+    writer = _writers.get(loop)
+    if writer is None:
+        writer = _writers[loop] = ChatWriter()
+    return writer
@@ -0,0 +1,65 @@
+"""
+A user's conversation list, built from a fixed number of queries.
+
+The page itself is one query over the user's ConversationParticipant rows,
+joined to the conversation and its last message. The unread count is the
+participant's own counter (see api.utils.unread_counters). A second query
+fetches the other participants of every conversation on the page. Rows are
+ordered by last activity (the last message, or when the conversation was
+started), newest first, so they can be keyset-paginated with
+api.utils.cursor_pagination.
+"""
+from django.db.models.functions import Coalesce
+
+from api.models import ConversationParticipant
+
+
+def inbox_queryset(user_id, archived=None):
+    """The user's participant rows, newest activity first, with everything the inbox shows"""
+    participants = ConversationParticipant.objects.filter(user_id=user_id)
+    if archived is not None:
+        participants = participants.filter(is_archived=archived)
+    return participants.select_related(
+        'conversation__last_message'
+    ).annotate(
+        activity_at=Coalesce('conversation__last_message_at', 'conversation__created_at'),
+    ).order_by('-activity_at', '-id')
+
+
+def inbox_items(participants, user_id):
+    """Serialize participant rows from inbox_queryset(); one query for the other participants"""
+    user_id = str(user_id)
+    others = {}
+    for other in ConversationParticipant.objects.filter(
+        conversation_id__in=[p.conversation_id for p in participants]
+    ).exclude(user_id=user_id).select_related('user').order_by('joined_at'):
+        others.setdefault(other.conversation_id, other.user)
+
+    items = []
+    for participant in participants:
+        conv = participant.conversation
+        other = others.get(conv.id)
+
+        # The preview is hidden if the user deleted that message on their side
+        last_message = conv.last_message
+        last_message_content = None
+        last_message_time = None
+        if last_message and not (
+            (str(last_message.sender_id) == user_id and last_message.is_deleted_for_sender) or
+            (str(last_message.receiver_id) == user_id and last_message.is_deleted_for_receiver)
+        ):
+            last_message_content = last_message.content
+            last_message_time = last_message.created_at.isoformat()
+
+        items.append({
+            'id': str(conv.id),
+            'participant_id': str(other.id) if other else None,
+            'participant_name': other.username if other else 'Unknown',
+            'participant_email': other.email if other else None,
+            'last_message': last_message_content,
+            'last_message_time': last_message_time,
+            'unread_count': participant.unread_count,
+            'is_archived': participant.is_archived,
+            'is_muted': participant.is_muted,
+        })
+    return items
@@ -0,0 +1,96 @@
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(created_at, pk):
+    """
+    Encode a (created_at, id) pair into an opaque, URL-safe cursor token.
+    """
+    if created_at is None or pk is None:
+        return None
+
+    payload = json.dumps({'c': created_at.isoformat(), 'i': str(pk)})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Decode a cursor token back into a (created_at, id) pair.
+
+    Returns None if the token is missing or malformed.
+    """
+    if not token:
+        return None
+
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        return datetime.fromisoformat(payload['c']), payload['i']
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def parse_page_size(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Parse a page size query param, clamped to [1, maximum]"""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, maximum))
+
+
+def keyset_filter(queryset, cursor, created_field='created_at', pk_field='id', descending=True):
+    """
+    Restrict a queryset to rows strictly after the cursor in
+    (created_at, id) order. The queryset must already be ordered by the
+    same two fields in the same direction.
+    """
+    if not cursor:
+        return queryset
+
+    created_at, pk = cursor
+    if descending:
+        return queryset.filter(
+            Q(**{f'{created_field}__lt': created_at}) |
+            Q(**{created_field: created_at, f'{pk_field}__lt': pk})
+        )
+    return queryset.filter(
+        Q(**{f'{created_field}__gt': created_at}) |
+        Q(**{created_field: created_at, f'{pk_field}__gt': pk})
+    )
+
+
+def paginate_keyset(queryset, cursor_token, page_size, created_field='created_at', pk_field='id', descending=True):
+    """
+    Fetch one keyset page from an ordered queryset.
+
+    Fetches page_size + 1 rows in a single query so the caller knows
+    whether another page exists without running a count.
+
+    Returns (rows, next_cursor) where next_cursor is None on the last page.
+    """
+    cursor = decode_cursor(cursor_token)
+    rows = list(keyset_filter(
+        queryset, cursor,
+        created_field=created_field, pk_field=pk_field, descending=descending
+    )[:page_size + 1])
+
+    has_next = len(rows) > page_size
+    rows = rows[:page_size]
+
+    next_cursor = None
+    if has_next and rows:
+        last = rows[-1]
+        if isinstance(last, dict):
+            next_cursor = encode_cursor(last[created_field], last[pk_field])
+        else:
+            next_cursor = encode_cursor(getattr(last, created_field), getattr(last, pk_field))
+
+    return rows, next_cursor
@@ -0,0 +1,70 @@
+"""
+Batched writes for the delivery sweeps.
+
+assign_deliveries and check_delivery_responses first work out every
+order's outcome and only record what should change in a DeliveryWrites.
+flush() then applies it all in one transaction:
+  - delivery and order status changes with bulk_update;
+  - the new offers with one bulk_create, after clearing the orders' old ones;
+  - every notification of the sweep in one insert (api.utils.notifications).
+bulk_create skips post_save, so flush() schedules the new offers' timers
+itself (see api.utils.offer_timers).
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import Delivery, Notification, Order
+from api.utils.notifications import create_notifications
+from api.utils.offer_timers import schedule_delivery_timer
+
+
+class DeliveryWrites:
+    """What one sweep will write; nothing touches the database until flush()"""
+
+    def __init__(self):
+        self.deliveries = {}
+        self.orders = {}
+        self.offers = []
+        self.notifications = []
+
+    def set_delivery_status(self, delivery, status):
+        delivery.status = status
+        delivery.updated_at = timezone.now()
+        self.deliveries[delivery.pk] = delivery
+
+    def set_order_status(self, order, status):
+        order.status = status
+        order.updated_at = timezone.now()
+        self.orders[order.pk] = order
+
+    def add_offer(self, delivery):
+        self.offers.append(delivery)
+
+    def has_offer(self, order):
+        """True if this sweep already offered the order to a rider"""
+        return any(offer.order_id == order.pk for offer in self.offers)
+
+    def notify(self, user, title, message, type='delivery'):
+        self.notifications.append(Notification(user=user, title=title, message=message, type=type, is_read=False))
+
+    def flush(self):
+        """Apply everything in one transaction. Returns the saved offers."""
+        offers = self.offers
+        with transaction.atomic():
+            if self.deliveries:
+                Delivery.objects.bulk_update(list(self.deliveries.values()), ['status', 'updated_at'])
+            if offers:
+                # An order has at most one open offer
+                Delivery.objects.filter(
+                    order_id__in={offer.order_id for offer in offers}, status='pending_offer'
+                ).delete()
+                offers = Delivery.objects.bulk_create(offers)
+                for offer in offers:
+                    schedule_delivery_timer(offer)
+            if self.orders:
+                Order.objects.bulk_update(list(self.orders.values()), ['status', 'updated_at'])
+            if self.notifications:
+                create_notifications(self.notifications)
+
+        self.deliveries, self.orders, self.offers, self.notifications = {}, {}, [], []
+        return offers
@@ -0,0 +1,237 @@
+"""
+Driving distances for delivery assignment and checkout fees.
+
+distance_matrix() answers many origin/destination pairs at once:
+  1. the shared cache (Redis), then the RouteDistance table, keyed by
+     coordinates rounded to ROUTE_CACHE_PRECISION decimals and ignored once
+     older than ROUTE_CACHE_TTL;
+  2. Google's Distance Matrix API for the rest, packing as many pairs into
+     each request as the API allows, over one pooled requests.Session;
+  3. a vectorized haversine for whatever the provider couldn't resolve.
+"""
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+
+DISTANCE_MATRIX_URL = 'https://maps.googleapis.com/maps/api/distancematrix/json'
+EARTH_RADIUS_KM = 6371.0
+
+# Distance Matrix limits per request
+MAX_ORIGINS = 25
+MAX_DESTINATIONS = 25
+MAX_ELEMENTS = 100
+
+REQUEST_TIMEOUT = 5
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Process-wide session so requests reuse pooled keep-alive connections"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=4, pool_maxsize=16,
+                    max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504], allowed_methods=['GET']),
+                )
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+def haversine_km(lat, lng, lats, lngs):
+    """Great-circle distance in km from one point to arrays of points"""
+    lat1 = np.radians(lat)
+    lat2 = np.radians(np.asarray(lats, dtype=float))
+    delta_lat = lat2 - lat1
+    delta_lng = np.radians(np.asarray(lngs, dtype=float) - lng)
+
+    a = np.sin(delta_lat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(delta_lng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def get_precision():
+    return getattr(settings, 'ROUTE_CACHE_PRECISION', 4)
+
+
+def get_route_ttl():
+    return getattr(settings, 'ROUTE_CACHE_TTL', 7 * 24 * 60 * 60)
+
+
+def round_point(point):
+    precision = get_precision()
+    return round(float(point[0]), precision), round(float(point[1]), precision)
+
+
+def route_key(origin, destination):
+    """'lat,lng>lat,lng' for two already rounded points"""
+    return f'{origin[0]},{origin[1]}>{destination[0]},{destination[1]}'
+
+
+def _cache_key(key):
+    return f'route:{key}'
+
+
+def _read_cache(pairs):
+    """{(origin, destination): km} for the pairs cached in Redis or the table"""
+    from api.models import RouteDistance
+
+    keys = {route_key(*pair): pair for pair in pairs}
+    found = {}
+
+    cached = cache.get_many([_cache_key(key) for key in keys])
+    for key, pair in keys.items():
+        value = cached.get(_cache_key(key))
+        if value is not None:
+            found[pair] = value
+
+    missing = [key for key, pair in keys.items() if pair not in found]
+    if missing:
+        ttl = get_route_ttl()
+        rows = RouteDistance.objects.filter(
+            route_key__in=missing, fetched_at__gte=timezone.now() - timedelta(seconds=ttl)
+        ).values_list('route_key', 'distance_km')
+        warm = {}
+        for key, distance_km in rows:
+            found[keys[key]] = distance_km
+            warm[_cache_key(key)] = distance_km
+        if warm:
+            cache.set_many(warm, ttl)
+    return found
+
+
+def _write_cache(results):
+    """Store provider results ({(origin, destination): (km, seconds)}) in both layers"""
+    from api.models import RouteDistance
+
+    if not results:
+        return
+    ttl = get_route_ttl()
+    cache.set_many({_cache_key(route_key(*pair)): km for pair, (km, _) in results.items()}, ttl)
+    try:
+        RouteDistance.objects.bulk_create(
+            [
+                RouteDistance(
+                    route_key=route_key(origin, destination),
+                    origin_lat=origin[0], origin_lng=origin[1],
+                    dest_lat=destination[0], dest_lng=destination[1],
+                    distance_km=km, duration_seconds=seconds,
+                )
+                for (origin, destination), (km, seconds) in results.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['route_key'],
+            update_fields=['distance_km', 'duration_seconds', 'fetched_at'],
+        )
+    except Exception as e:
+        print(f"Failed to store route distances: {e}")
+
+
+def _fetch(origins, destinations):
+    """
+    One Distance Matrix request. Returns {(origin, destination): (km, seconds)}
+    for the elements the provider resolved.
+    """
+    api_key = getattr(settings, 'GOOGLE_MAPS_API_KEY', None)
+    if not api_key:
+        return {}
+
+    try:
+        response = get_session().get(DISTANCE_MATRIX_URL, params={
+            'origins': '|'.join(f'{lat},{lng}' for lat, lng in origins),
+            'destinations': '|'.join(f'{lat},{lng}' for lat, lng in destinations),
+            'key': api_key,
+            'units': 'metric',
+        }, timeout=REQUEST_TIMEOUT)
+        data = response.json()
+    except Exception as e:
+        print(f"Distance Matrix request failed: {e}")
+        return {}
+
+    if data.get('status') != 'OK':
+        print(f"Distance Matrix returned {data.get('status')}: {data.get('error_message', '')}")
+        return {}
+
+    results = {}
+    for origin, row in zip(origins, data.get('rows', [])):
+        for destination, element in zip(destinations, row.get('elements', [])):
+            distance_meters = element.get('distance', {}).get('value', 0) if element.get('status') == 'OK' else 0
+            if distance_meters > 0:
+                results[(origin, destination)] = (distance_meters / 1000, element.get('duration', {}).get('value'))
+    return results
+
+
+def _request_batches(pairs):
+    """
+    Group the missing pairs into (origins, destinations) requests within the
+    API limits. Destinations that need the same origins share requests, so
+    one-to-many and many-to-one lookups never fetch unneeded elements.
+    """
+    origins_by_destination = defaultdict(list)
+    for origin, destination in pairs:
+        origins_by_destination[destination].append(origin)
+
+    destinations_by_origins = defaultdict(list)
+    for destination, origins in origins_by_destination.items():
+        destinations_by_origins[tuple(origins)].append(destination)
+
+    for origins, destinations in destinations_by_origins.items():
+        for d in range(0, len(destinations), MAX_DESTINATIONS):
+            destination_chunk = destinations[d:d + MAX_DESTINATIONS]
+            origin_step = max(1, min(MAX_ORIGINS, MAX_ELEMENTS // len(destination_chunk)))
+            for o in range(0, len(origins), origin_step):
+                yield list(origins[o:o + origin_step]), destination_chunk
+
+
+def distance_matrix(origins, destinations, fallback=True):
+    """
+    Driving distance in km for every (origin, destination), as a list of rows.
+    Points are (lat, lng). Pairs the provider can't resolve get the haversine
+    distance, or None with fallback=False.
+    """
+    origins = [round_point(point) for point in origins]
+    destinations = [round_point(point) for point in destinations]
+
+    needed = {(o, d) for o in origins for d in destinations if o != d}
+    known = _read_cache(needed) if needed else {}
+
+    missing = [pair for pair in needed if pair not in known]
+    for origin_batch, destination_batch in _request_batches(missing):
+        fetched = _fetch(origin_batch, destination_batch)
+        _write_cache(fetched)
+        known.update({pair: km for pair, (km, _) in fetched.items()})
+
+    rows = []
+    for origin in origins:
+        row = [0.0 if origin == destination else known.get((origin, destination)) for destination in destinations]
+        if fallback and None in row:
+            straight = haversine_km(origin[0], origin[1], [d[0] for d in destinations], [d[1] for d in destinations])
+            row = [float(straight[j]) if km is None else km for j, km in enumerate(row)]
+        rows.append(row)
+    return rows
+
+
+def distances_to(origins, destination, fallback=True):
+    """Driving distances in km from each origin to one destination, in origin order"""
+    if not origins:
+        return []
+    return [row[0] for row in distance_matrix(origins, [destination], fallback=fallback)]
+
+
+def driving_distance(origin_lat, origin_lng, dest_lat, dest_lng, fallback=True):
+    """Driving distance in km between two points"""
+    return distance_matrix([(origin_lat, origin_lng)], [(dest_lat, dest_lng)], fallback=fallback)[0][0]
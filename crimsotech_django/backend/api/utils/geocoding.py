@@ -0,0 +1,244 @@
+"""
+Geocoding without blocking requests.
+
+Request handlers and the delivery sweeps call lookup_coordinates(), which
+only reads the GeocodeCache table (fronted by the shared cache). An address
+that isn't known yet is recorded as pending and comes back as (None, None).
+The geocode_backfill command / geocode_backfill_task resolves pending
+addresses and every Shop, User and ShippingAddress still missing
+coordinates, in rate-limited batches.
+"""
+import hashlib
+import re
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from api.utils.distance_service import get_session
+
+
+GEOCODE_URL = 'https://maps.googleapis.com/maps/api/geocode/json'
+REQUEST_TIMEOUT = 10
+DEFAULT_COUNTRY = 'Philippines'
+
+# Positive results hardly ever change; keep them in the shared cache for a day
+CACHE_TTL = 24 * 60 * 60
+
+# Coordinates are stored with 7 decimals everywhere
+COORDINATE_PLACES = Decimal('0.0000001')
+
+
+def normalize_address(*parts):
+    """
+    Canonical form used as the cache key: comma-separated parts, lower-cased,
+    whitespace collapsed, empty parts dropped. "Rizal St,  Poblacion" and
+    "rizal st, poblacion" are the same address.
+    """
+    pieces = []
+    for part in parts:
+        for piece in str(part or '').split(','):
+            piece = re.sub(r'\s+', ' ', piece).strip(' .').lower()
+            if piece:
+                pieces.append(piece)
+    return ', '.join(pieces)
+
+
+def address_hash(address):
+    return hashlib.sha256(address.encode('utf-8')).hexdigest()
+
+
+def address_parts(instance):
+    """Address components of a Shop, User or ShippingAddress, in geocoding order"""
+    country = getattr(instance, 'country', '') or DEFAULT_COUNTRY
+    return instance.street, instance.barangay, instance.city, instance.province, country
+
+
+def _cache_key(key):
+    return f'geocode:{key}'
+
+
+def lookup_coordinates(*parts):
+    """
+    Coordinates for an address from the geocode cache, as Decimals, or
+    (None, None). Never calls the geocoder: unknown addresses are queued for
+    the backfill instead.
+    """
+    from api.models import GeocodeCache
+
+    address = normalize_address(*parts)
+    if not address:
+        return None, None
+    key = address_hash(address)
+
+    cached = cache.get(_cache_key(key))
+    if cached is not None:
+        return Decimal(cached[0]), Decimal(cached[1])
+
+    entry, created = GeocodeCache.objects.get_or_create(address_hash=key, defaults={'address': address})
+    if entry.status == 'ok':
+        cache.set(_cache_key(key), (str(entry.latitude), str(entry.longitude)), CACHE_TTL)
+        return entry.latitude, entry.longitude
+    if created:
+        print(f"[GEOCODE] Queued for backfill: {address}")
+    return None, None
+
+
+class RateLimiter:
+    """Spaces calls at least 1 / rate seconds apart"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self._last = 0.0
+
+    def wait(self):
+        delay = self._last + self.interval - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._last = time.monotonic()
+
+
+def geocode(address):
+    """
+    Ask the geocoder (blocking). Returns (status, lat, lng): status is 'ok',
+    'not_found' (the address doesn't resolve) or 'error' (try again later).
+    """
+    api_key = getattr(settings, 'GOOGLE_MAPS_API_KEY', None)
+    if not api_key:
+        return 'error', None, None
+
+    try:
+        response = get_session().get(GEOCODE_URL, params={
+            'address': address,
+            'key': api_key,
+            'components': 'country:PH',
+        }, timeout=REQUEST_TIMEOUT)
+        data = response.json()
+    except Exception as e:
+        print(f"[GEOCODE] ❌ Error: {str(e)}")
+        return 'error', None, None
+
+    if data.get('status') == 'OK' and data.get('results'):
+        location = data['results'][0]['geometry']['location']
+        lat = Decimal(str(location['lat'])).quantize(COORDINATE_PLACES)
+        lng = Decimal(str(location['lng'])).quantize(COORDINATE_PLACES)
+        return 'ok', lat, lng
+    if data.get('status') == 'ZERO_RESULTS':
+        return 'not_found', None, None
+    print(f"[GEOCODE] ⚠️ Geocoding failed: {data.get('status')}")
+    return 'error', None, None
+
+
+class Backfill:
+    """
+    One backfill run. Each distinct address costs at most one geocoder call,
+    spaced by GEOCODE_RATE_LIMIT per second and capped at max_requests.
+    Failed addresses are retried after GEOCODE_RETRY_AFTER seconds, at most
+    GEOCODE_MAX_ATTEMPTS times.
+    """
+
+    def __init__(self, max_requests=None, batch_size=200, rate=None):
+        self.max_requests = max_requests
+        self.batch_size = batch_size
+        self.limiter = RateLimiter(rate if rate is not None else getattr(settings, 'GEOCODE_RATE_LIMIT', 10))
+        self.requests_made = 0
+        self.rows_updated = 0
+        self.resolved = {}
+
+    @property
+    def exhausted(self):
+        return self.max_requests is not None and self.requests_made >= self.max_requests
+
+    def _retryable(self, entry):
+        retry_after = timedelta(seconds=getattr(settings, 'GEOCODE_RETRY_AFTER', 24 * 60 * 60))
+        max_attempts = getattr(settings, 'GEOCODE_MAX_ATTEMPTS', 5)
+        if entry.status == 'pending':
+            return True
+        if entry.status == 'not_found' or entry.attempts >= max_attempts:
+            return False
+        return entry.updated_at <= timezone.now() - retry_after
+
+    def resolve(self, addresses):
+        """{address: (lat, lng)} for the addresses that have coordinates, geocoding new ones"""
+        from api.models import GeocodeCache
+
+        wanted = {address_hash(address): address for address in addresses if address}
+        entries = GeocodeCache.objects.in_bulk(list(wanted))
+        results = {}
+        for key, address in wanted.items():
+            if address in self.resolved:
+                results[address] = self.resolved[address]
+                continue
+            entry = entries.get(key)
+            if entry and entry.status == 'ok':
+                results[address] = self.resolved[address] = (entry.latitude, entry.longitude)
+                continue
+            if (entry and not self._retryable(entry)) or self.exhausted:
+                continue
+
+            self.limiter.wait()
+            self.requests_made += 1
+            status, lat, lng = geocode(address)
+            entry = entry or GeocodeCache(address_hash=key, address=address)
+            entry.status = status
+            entry.attempts += 1
+            entry.latitude, entry.longitude = lat, lng
+            entry.save()
+            if status == 'ok':
+                cache.set(_cache_key(key), (str(lat), str(lng)), CACHE_TTL)
+                results[address] = self.resolved[address] = (lat, lng)
+        return results
+
+    def fill(self, model):
+        """Set coordinates on every `model` row that lacks them and whose address resolves"""
+        queryset = model.objects.filter(
+            Q(latitude__isnull=True) | Q(longitude__isnull=True)
+        ).exclude(street='', city='').only(
+            'pk', 'street', 'barangay', 'city', 'province', *(['country'] if hasattr(model, 'country') else [])
+        ).order_by('pk')
+
+        batch = []
+        for instance in queryset.iterator(chunk_size=self.batch_size):
+            batch.append(instance)
+            if len(batch) >= self.batch_size:
+                self._fill_batch(model, batch)
+                batch = []
+                if self.exhausted:
+                    return
+        if batch:
+            self._fill_batch(model, batch)
+
+    def _fill_batch(self, model, instances):
+        by_address = {}
+        for instance in instances:
+            by_address.setdefault(normalize_address(*address_parts(instance)), []).append(instance)
+
+        coordinates = self.resolve(list(by_address))
+        updated = []
+        for address, (lat, lng) in coordinates.items():
+            for instance in by_address[address]:
+                instance.latitude, instance.longitude = lat, lng
+                updated.append(instance)
+        if updated:
+            model.objects.bulk_update(updated, ['latitude', 'longitude'])
+            self.rows_updated += len(updated)
+
+    def run(self):
+        """Resolve queued addresses, then fill shops, users and shipping addresses"""
+        from api.models import GeocodeCache, ShippingAddress, Shop, User
+
+        pending = list(GeocodeCache.objects.filter(status='pending').values_list('address', flat=True))
+        for start in range(0, len(pending), self.batch_size):
+            if self.exhausted:
+                break
+            self.resolve(pending[start:start + self.batch_size])
+
+        for model in (Shop, ShippingAddress, User):
+            if self.exhausted:
+                break
+            self.fill(model)
+        return self
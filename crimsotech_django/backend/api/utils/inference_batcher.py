@@ -0,0 +1,140 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+
+DEFAULT_MAX_BATCH_SIZE = 16
+DEFAULT_MAX_WAIT_MS = 5
+# Number of recent requests kept for latency percentiles
+LATENCY_WINDOW = 1000
+
+
+class MicroBatcher:
+    """
+    Collects concurrent single-item inference requests and runs them through
+    the model as one batch.
+
+    Request threads call predict() with one preprocessed input (a leading
+    batch dimension of 1). A single worker thread takes the first waiting
+    request, keeps collecting for up to max_wait_ms or until max_batch_size
+    items are queued, then calls predict_fn once on the stacked batch and
+    hands each caller its own row of the output.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS, name='inference'):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0, max_wait_ms) / 1000
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._batches = 0
+        self._errors = 0
+        self._largest_batch = 0
+        self._batch_sizes = {}
+        self._latencies_ms = deque(maxlen=LATENCY_WINDOW)
+        self._inference_ms = deque(maxlen=LATENCY_WINDOW)
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name=f'{self.name}-batcher', daemon=True)
+                self._worker.start()
+
+    def submit(self, item):
+        """Queue one input and return a Future for its output row"""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def predict(self, item, timeout=None):
+        """Blocking helper: submit one input and wait for its output row"""
+        return self.submit(item).result(timeout=timeout)
+
+    def _collect(self):
+        first = self._queue.get()
+        pending = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(pending) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                pending.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            started = time.perf_counter()
+            try:
+                batch = np.concatenate([item for item, _, _ in pending], axis=0)
+                outputs = np.asarray(self.predict_fn(batch))
+            except Exception as e:
+                with self._stats_lock:
+                    self._errors += len(pending)
+                for _, future, _ in pending:
+                    future.set_exception(e)
+                continue
+
+            finished = time.perf_counter()
+            for index, (_, future, _) in enumerate(pending):
+                future.set_result(outputs[index])
+
+            self._record(pending, started, finished)
+
+    def _record(self, pending, started, finished):
+        size = len(pending)
+        with self._stats_lock:
+            self._requests += size
+            self._batches += 1
+            self._largest_batch = max(self._largest_batch, size)
+            self._batch_sizes[size] = self._batch_sizes.get(size, 0) + 1
+            self._inference_ms.append((finished - started) * 1000)
+            for _, _, queued_at in pending:
+                self._latencies_ms.append((finished - queued_at) * 1000)
+
+    def metrics(self):
+        """Counters plus latency percentiles over the most recent requests"""
+        with self._stats_lock:
+            latencies = sorted(self._latencies_ms)
+            inference = list(self._inference_ms)
+            return {
+                'requests': self._requests,
+                'batches': self._batches,
+                'errors': self._errors,
+                'queue_depth': self._queue.qsize(),
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'avg_batch_size': round(self._requests / self._batches, 2) if self._batches else 0,
+                'largest_batch': self._largest_batch,
+                'batch_size_counts': dict(sorted(self._batch_sizes.items())),
+                'latency_ms': {
+                    'p50': _percentile(latencies, 50),
+                    'p95': _percentile(latencies, 95),
+                    'p99': _percentile(latencies, 99),
+                    'max': round(latencies[-1], 2) if latencies else None,
+                },
+                'avg_inference_ms': round(sum(inference) / len(inference), 2) if inference else None,
+            }
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return round(sorted_values[index], 2)
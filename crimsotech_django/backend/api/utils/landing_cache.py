@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from api.utils.cache_helpers import get_or_build, invalidate, make_key
+
+
+LANDING_NAMESPACE = 'landing'
+
+
+def get_landing_cache_ttl():
+    return getattr(settings, 'LANDING_CACHE_TTL', 600)
+
+
+def get_cached_landing_payload():
+    """Return the precomputed landing document, or None on a miss"""
+    return cache.get(make_key(LANDING_NAMESPACE, 'payload'))
+
+
+def store_landing_payload(payload):
+    cache.set(make_key(LANDING_NAMESPACE, 'payload'), payload, get_landing_cache_ttl())
+
+
+def get_or_build_landing_payload(builder):
+    """Read the landing document, building it with builder() once on a miss"""
+    return get_or_build(LANDING_NAMESPACE, 'payload', builder=builder, ttl=get_landing_cache_ttl())
+
+
+def invalidate_landing_payload():
+    """Drop the landing document so the next read (or rebuild job) recomputes it"""
+    invalidate(LANDING_NAMESPACE, 'payload')
+
+
+def rebuild_landing_payload():
+    """
+    Build the landing document outside a request and store it.
+    Used by the build_landing_cache command and the Celery task.
+    """
+    # Imported here so callers (signals, tasks) don't load the views module eagerly
+    from api.views import build_landing_payload
+
+    payload = build_landing_payload()
+    store_landing_payload(payload)
+    return payload
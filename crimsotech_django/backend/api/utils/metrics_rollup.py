@@ -0,0 +1,316 @@
+"""
+Daily sales rollups for the admin and moderator analytics.
+
+rollup_range() recomputes the DailySalesMetrics, DailyShopSalesMetrics and
+DailyProductSalesMetrics rows for a span of days from the order tables;
+catch_up() is what the scheduled rollup_daily_metrics command runs. The
+readers below serve leaderboards from the rollups and compute only the days
+that aren't rolled up yet (normally just today) live.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from api.models import (
+    Checkout, DailyProductSalesMetrics, DailySalesMetrics, DailyShopSalesMetrics,
+    Delivery, Order,
+)
+from api.utils.sales_timeseries import DAILY_FIELDS, completed_checkout_vat, live_daily_totals
+
+
+SHOP_FIELDS = ['sales', 'orders', 'items_sold', 'transaction_fees', 'discounts', 'shipping_fees', 'vat_collected']
+PRODUCT_FIELDS = ['revenue', 'orders', 'quantity', 'transaction_fees', 'vat_collected']
+
+# Days are rolled up in chunks to bound memory on a first full backfill
+CHUNK_DAYS = 31
+
+# When the last successful catch_up() started; changes after it are re-rolled next time
+LAST_RUN_KEY = 'metrics-rollup:last-run-started'
+
+
+def _in_range(start_date, end_date, field='order__created_at'):
+    return {f'{field}__date__gte': start_date, f'{field}__date__lte': end_date}
+
+
+def live_shop_totals(start_date, end_date):
+    """{(day, shop_id): {field: value}} straight from the order tables"""
+    totals = defaultdict(lambda: dict.fromkeys(SHOP_FIELDS, 0))
+
+    rows = Checkout.objects.filter(
+        cart_item__product__shop__isnull=False, **_in_range(start_date, end_date)
+    ).annotate(
+        day=TruncDate('order__created_at')
+    ).values('day', 'cart_item__product__shop_id').annotate(
+        sales=Sum('total_amount'),
+        orders=Count('order', distinct=True),
+        items_sold=Sum('quantity'),
+        transaction_fees=Sum('transaction_fee', filter=Q(transaction_fee__isnull=False)),
+        discounts=Sum('discount_applied', filter=Q(discount_applied__gt=0)),
+    )
+    for row in rows:
+        entry = totals[(row['day'], row['cart_item__product__shop_id'])]
+        for field in ('sales', 'orders', 'items_sold', 'transaction_fees', 'discounts'):
+            entry[field] = row[field] or 0
+
+    shipping = Delivery.objects.filter(
+        shop__isnull=False, status='delivered', **_in_range(start_date, end_date)
+    ).annotate(
+        day=TruncDate('order__created_at')
+    ).values('day', 'shop_id').annotate(shipping_fees=Sum('delivery_fee'))
+    for row in shipping:
+        key = (row['day'], row['shop_id'])
+        if key in totals:
+            totals[key]['shipping_fees'] = row['shipping_fees'] or 0
+
+    for row, vat in completed_checkout_vat(start_date, end_date):
+        key = (row['day'], row['cart_item__product__shop_id'])
+        if vat and key in totals:
+            totals[key]['vat_collected'] += Decimal(str(vat)) * row['quantity']
+
+    return totals
+
+
+def live_product_totals(start_date, end_date):
+    """{(day, product_id): {field: value, 'category_id', 'shop_id'}} straight from the order tables"""
+    totals = {}
+
+    rows = Checkout.objects.filter(
+        cart_item__product__isnull=False, **_in_range(start_date, end_date)
+    ).annotate(
+        day=TruncDate('order__created_at')
+    ).values(
+        'day', 'cart_item__product_id', 'cart_item__product__category_id', 'cart_item__product__shop_id'
+    ).annotate(
+        revenue=Sum('total_amount'),
+        orders=Count('order', distinct=True),
+        quantity=Sum('quantity'),
+        transaction_fees=Sum('transaction_fee', filter=Q(transaction_fee__isnull=False)),
+    )
+    for row in rows:
+        totals[(row['day'], row['cart_item__product_id'])] = {
+            'category_id': row['cart_item__product__category_id'],
+            'shop_id': row['cart_item__product__shop_id'],
+            'revenue': row['revenue'] or 0,
+            'orders': row['orders'] or 0,
+            'quantity': row['quantity'] or 0,
+            'transaction_fees': row['transaction_fees'] or 0,
+            'vat_collected': Decimal('0'),
+        }
+
+    for row, vat in completed_checkout_vat(start_date, end_date):
+        key = (row['day'], row['cart_item__product_id'])
+        if vat and key in totals:
+            totals[key]['vat_collected'] += Decimal(str(vat)) * row['quantity']
+
+    return totals
+
+
+def rollup_range(start_date, end_date):
+    """
+    Recompute the rollup rows for every day in [start_date, end_date].
+    Each day gets a DailySalesMetrics row, even without sales, to mark it
+    as covered. Returns the number of days written.
+    """
+    days = 0
+    chunk_start = start_date
+    while chunk_start <= end_date:
+        chunk_end = min(chunk_start + timedelta(days=CHUNK_DAYS - 1), end_date)
+        platform = live_daily_totals(chunk_start, chunk_end)
+        shops = live_shop_totals(chunk_start, chunk_end)
+        products = live_product_totals(chunk_start, chunk_end)
+
+        platform_rows = []
+        day = chunk_start
+        while day <= chunk_end:
+            values = platform.get(day, {})
+            platform_rows.append(DailySalesMetrics(
+                date=day, **{field: values.get(field) or 0 for field in DAILY_FIELDS}
+            ))
+            day += timedelta(days=1)
+
+        shop_rows = [
+            DailyShopSalesMetrics(date=day, shop_id=shop_id, **values)
+            for (day, shop_id), values in shops.items()
+        ]
+        product_rows = [
+            DailyProductSalesMetrics(date=day, product_id=product_id, **values)
+            for (day, product_id), values in products.items()
+        ]
+
+        with transaction.atomic():
+            DailySalesMetrics.objects.filter(date__gte=chunk_start, date__lte=chunk_end).delete()
+            DailyShopSalesMetrics.objects.filter(date__gte=chunk_start, date__lte=chunk_end).delete()
+            DailyProductSalesMetrics.objects.filter(date__gte=chunk_start, date__lte=chunk_end).delete()
+            DailySalesMetrics.objects.bulk_create(platform_rows)
+            DailyShopSalesMetrics.objects.bulk_create(shop_rows, batch_size=1000)
+            DailyProductSalesMetrics.objects.bulk_create(product_rows, batch_size=1000)
+
+        days += len(platform_rows)
+        chunk_start = chunk_end + timedelta(days=1)
+    return days
+
+
+def changed_days(since, before):
+    """
+    Order days (by order__created_at, as the rollups bucket them) before
+    `before` whose order or delivery was updated since `since`: their
+    completed revenue, shipping fees and VAT may have changed.
+    """
+    days = set(Order.objects.filter(
+        updated_at__gte=since, created_at__date__lt=before
+    ).annotate(day=TruncDate('created_at')).values_list('day', flat=True).distinct())
+    days |= set(Delivery.objects.filter(
+        updated_at__gte=since, order__created_at__date__lt=before
+    ).annotate(day=TruncDate('order__created_at')).values_list('day', flat=True).distinct())
+    return sorted(days)
+
+
+def _day_ranges(days):
+    """Sorted days as (start, end) runs of consecutive days"""
+    ranges = []
+    for day in days:
+        if ranges and ranges[-1][1] + timedelta(days=1) == day:
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return ranges
+
+
+def catch_up(lookback_days=None, until=None):
+    """
+    Incremental rollup: re-roll the last `lookback_days` already covered days
+    (order statuses keep changing for a while), every day after them up to
+    `until` (yesterday by default), and any older day with an order or
+    delivery updated since the previous run started, so orders completed or
+    delivered long after they were placed still count. The first run
+    backfills from the oldest order. Returns (start_date, end_date,
+    days_written).
+    """
+    if lookback_days is None:
+        lookback_days = getattr(settings, 'METRICS_ROLLUP_LOOKBACK_DAYS', 3)
+    end_date = until or timezone.localdate() - timedelta(days=1)
+
+    started = timezone.now()
+    covered = DailySalesMetrics.objects.aggregate(last_rolled=Max('date'), last_written=Max('updated_at'))
+    last_rolled = covered['last_rolled']
+    days = 0
+    if last_rolled:
+        start_date = last_rolled - timedelta(days=max(lookback_days, 1) - 1)
+        # Without the recorded start (evicted cache), the last write time is the best guess
+        since = cache.get(LAST_RUN_KEY) or covered['last_written']
+        for stale_start, stale_end in _day_ranges(changed_days(since, start_date)):
+            days += rollup_range(stale_start, stale_end)
+    else:
+        first_order = Order.objects.aggregate(first=Min('created_at'))['first']
+        start_date = timezone.localdate(first_order) if first_order else end_date
+
+    if start_date <= end_date:
+        days += rollup_range(start_date, end_date)
+    # The start, not the end: anything updated while this run computed is re-rolled next run
+    cache.set(LAST_RUN_KEY, started, None)
+    return start_date, end_date, days
+
+
+def _coverage(start_date, end_date):
+    """Days in the range that aren't rolled up yet (today is never rolled up)"""
+    rolled = set(DailySalesMetrics.objects.filter(
+        date__gte=start_date, date__lte=min(end_date, timezone.localdate() - timedelta(days=1))
+    ).values_list('date', flat=True))
+
+    missing = []
+    day = start_date
+    while day <= end_date:
+        if day not in rolled:
+            missing.append(day)
+        day += timedelta(days=1)
+    return missing
+
+
+def shop_sales_totals(start_date, end_date, limit=10):
+    """Top shops by sales in the range, with the per-shop fee/VAT breakdown"""
+    missing = _coverage(start_date, end_date)
+    totals = defaultdict(lambda: dict.fromkeys(SHOP_FIELDS, 0))
+
+    rolled = DailyShopSalesMetrics.objects.filter(
+        date__gte=start_date, date__lte=end_date
+    ).exclude(date__in=missing).values('shop_id').annotate(
+        **{field: Sum(field) for field in SHOP_FIELDS}
+    )
+    for row in rolled:
+        for field in SHOP_FIELDS:
+            totals[row['shop_id']][field] += row[field] or 0
+
+    if missing:
+        missing_days = set(missing)
+        for (day, shop_id), values in live_shop_totals(missing[0], missing[-1]).items():
+            if day in missing_days:
+                for field in SHOP_FIELDS:
+                    totals[shop_id][field] += values[field] or 0
+
+    ranked = sorted(
+        ({'shop_id': shop_id, **values} for shop_id, values in totals.items() if values['orders']),
+        key=lambda entry: entry['sales'], reverse=True
+    )
+    return ranked[:limit]
+
+
+def _product_rows(start_date, end_date):
+    """Per-(category, product) totals over the range, rollup plus live days"""
+    missing = _coverage(start_date, end_date)
+    totals = {}
+
+    rolled = DailyProductSalesMetrics.objects.filter(
+        date__gte=start_date, date__lte=end_date
+    ).exclude(date__in=missing).values('product_id', 'category_id').annotate(
+        **{field: Sum(field) for field in PRODUCT_FIELDS}
+    )
+    for row in rolled:
+        entry = totals.setdefault(row['product_id'], dict.fromkeys(PRODUCT_FIELDS, 0))
+        entry['category_id'] = row['category_id']
+        for field in PRODUCT_FIELDS:
+            entry[field] += row[field] or 0
+
+    if missing:
+        missing_days = set(missing)
+        for (day, product_id), values in live_product_totals(missing[0], missing[-1]).items():
+            if day in missing_days:
+                entry = totals.setdefault(product_id, dict.fromkeys(PRODUCT_FIELDS, 0))
+                entry['category_id'] = values['category_id']
+                for field in PRODUCT_FIELDS:
+                    entry[field] += values[field] or 0
+
+    return totals
+
+
+def product_sales_totals(start_date, end_date, limit=10, order_by='revenue'):
+    """Top products in the range by revenue (or orders)"""
+    ranked = sorted(
+        ({'product_id': product_id, **values} for product_id, values in _product_rows(start_date, end_date).items()),
+        key=lambda entry: entry[order_by], reverse=True
+    )
+    return ranked[:limit]
+
+
+def category_sales_totals(start_date, end_date, limit=10):
+    """Top categories by revenue, with the number of distinct products sold"""
+    categories = {}
+    for product_id, values in _product_rows(start_date, end_date).items():
+        if not values['category_id']:
+            continue
+        entry = categories.setdefault(values['category_id'], {'revenue': 0, 'quantity': 0, 'products': 0})
+        entry['revenue'] += values['revenue']
+        entry['quantity'] += values['quantity']
+        entry['products'] += 1
+
+    ranked = sorted(
+        ({'category_id': category_id, **values} for category_id, values in categories.items()),
+        key=lambda entry: entry['revenue'], reverse=True
+    )
+    return ranked[:limit]
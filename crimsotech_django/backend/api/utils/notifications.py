@@ -0,0 +1,163 @@
+"""
+Notification dispatch.
+
+Code that notifies a user calls notify() with the Notification fields.
+Nothing is written until the surrounding transaction commits, so a rolled
+back change notifies nobody. Inside notification_batch() (every request
+runs in one, see NotificationBatchMiddleware) committed notifications are
+gathered and written together when the block ends; elsewhere each is
+written on commit.
+
+create_notifications() is the single write path. It drops notifications
+of types the recipient muted (NotificationMute) and duplicates: the same
+recipient, type, title and message as another in the batch or one created
+in the last NOTIFICATION_DEDUPE_SECONDS. It inserts the rest in one
+statement and, once the transaction commits, pushes them with each
+recipient's new unread count to the NotificationConsumer groups
+(notifications_<user id>) in one round over the channel layer.
+"""
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from api.models import Notification, NotificationMute, User
+from api.utils.unread_counters import notifications_created
+
+
+# The open notification_batch() of this request or task, if any
+_batch = ContextVar('notification_batch', default=None)
+
+
+def get_dedupe_window():
+    return getattr(settings, 'NOTIFICATION_DEDUPE_SECONDS', 60)
+
+
+def group_name(user_id):
+    return f'notifications_{user_id}'
+
+
+def notification_event(notification, data=None):
+    """The channel layer event NotificationConsumer.notification() sends on"""
+    return {
+        'type': 'notification',
+        'notification_id': str(notification.id),
+        'title': notification.title,
+        'message': notification.message,
+        'notification_type': notification.type,
+        'created_at': str(notification.created_at),
+        'data': data or {},
+    }
+
+
+def push_notifications(notifications):
+    """Send saved notifications and their recipients' unread counts over the channel layer"""
+    if not notifications:
+        return
+    user_ids = {notification.user_id for notification in notifications}
+    unread = dict(User.objects.filter(id__in=user_ids).values_list('id', 'unread_notification_count'))
+    events = [(group_name(n.user_id), notification_event(n)) for n in notifications]
+    events += [(group_name(user_id), {'type': 'unread_count', 'count': unread.get(user_id, 0)}) for user_id in user_ids]
+
+    async def send_all(channel_layer):
+        await asyncio.gather(*(channel_layer.group_send(group, event) for group, event in events))
+
+    try:
+        channel_layer = get_channel_layer()
+        if channel_layer is not None:
+            async_to_sync(send_all)(channel_layer)
+    except Exception as e:
+        # The notifications are saved; clients see them on their next fetch
+        print(f"[NOTIFICATIONS] Could not push {len(notifications)} notifications: {e}")
+
+
+def muted_types(user_ids):
+    """{(user_id, type)} muted right now for any of the users"""
+    return set(NotificationMute.objects.filter(user_id__in=user_ids).filter(
+        Q(muted_until__isnull=True) | Q(muted_until__gt=timezone.now())
+    ).values_list('user_id', 'type'))
+
+
+def deliverable(notifications):
+    """The notifications that are neither muted nor duplicates, in order"""
+    user_ids = {n.user_id for n in notifications}
+    muted = muted_types(user_ids)
+    seen = set()
+    window = get_dedupe_window()
+    if window:
+        seen = set(Notification.objects.filter(
+            user_id__in=user_ids, created_at__gte=timezone.now() - timedelta(seconds=window)
+        ).values_list('user_id', 'type', 'title', 'message'))
+
+    kept = []
+    for notification in notifications:
+        key = (notification.user_id, notification.type, notification.title, notification.message)
+        if (notification.user_id, notification.type) in muted or key in seen:
+            continue
+        seen.add(key)
+        kept.append(notification)
+    return kept
+
+
+def create_notifications(notifications):
+    """Insert unsaved Notification objects in one statement and push them after commit; returns those written"""
+    notifications = deliverable(notifications) if notifications else []
+    if not notifications:
+        return []
+    with transaction.atomic():
+        notifications = Notification.objects.bulk_create(notifications)
+        notifications_created(notifications)
+    transaction.on_commit(lambda: push_notifications(notifications))
+    return notifications
+
+
+def notify(**fields):
+    """Notify a user (Notification fields as keywords) once the current transaction commits"""
+    notification = Notification(**fields)
+
+    def dispatch():
+        batch = _batch.get()
+        if batch is not None:
+            batch.append(notification)
+        else:
+            create_notifications([notification])
+
+    transaction.on_commit(dispatch)
+
+
+@contextmanager
+def notification_batch():
+    """Write the notifications committed inside the block together when it ends"""
+    if _batch.get() is not None:
+        # Nested: the outer batch writes them
+        yield
+        return
+    batch = []
+    token = _batch.set(batch)
+    try:
+        yield
+    finally:
+        _batch.reset(token)
+        if batch:
+            try:
+                create_notifications(batch)
+            except Exception as e:
+                print(f"[NOTIFICATIONS] Could not write {len(batch)} notifications: {e}")
+
+
+class NotificationBatchMiddleware:
+    """Runs each request in a notification_batch()"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with notification_batch():
+            return self.get_response(request)
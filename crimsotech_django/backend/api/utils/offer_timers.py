@@ -0,0 +1,66 @@
+"""
+Per-delivery timers for rider offers.
+
+When a delivery is saved as an offer ('pending_offer') or as accepted, a
+delayed Celery task is scheduled for its deadline (see signals.py):
+  - an offer expires DELIVERY_OFFER_TIMEOUT seconds after it was made;
+  - an accepted delivery that isn't picked up within DELIVERY_PICKUP_TIMEOUT
+    seconds is cancelled.
+Both are then reassigned. A rejection is reassigned right away.
+
+A timer re-reads its delivery when it fires and does nothing if the
+delivery has moved on, so stale or duplicate timers are harmless. The
+periodic check_delivery_responses sweep only catches timers lost with the
+broker.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+
+
+def get_offer_timeout():
+    return getattr(settings, 'DELIVERY_OFFER_TIMEOUT', 10 * 60)
+
+
+def get_pickup_timeout():
+    return getattr(settings, 'DELIVERY_PICKUP_TIMEOUT', 30 * 60)
+
+
+def get_rejection_window():
+    """How far back the safety-net sweep looks for rejections (a little over one sweep interval)"""
+    return getattr(settings, 'DELIVERY_RESPONSE_CHECK_INTERVAL', 15 * 60) + 60
+
+
+def delivery_deadline(delivery):
+    """When the delivery times out in its current status, or None if it can't"""
+    if delivery.status == 'pending_offer' and delivery.created_at:
+        return delivery.created_at + timedelta(seconds=get_offer_timeout())
+    if delivery.status == 'accepted' and delivery.updated_at:
+        return delivery.updated_at + timedelta(seconds=get_pickup_timeout())
+    return None
+
+
+def schedule_delivery_timer(delivery):
+    """Queue the delivery's timeout, or its reassignment if it was rejected, once the save commits"""
+    from django.utils import timezone
+
+    if delivery.status == 'rejected':
+        countdown = 0
+    else:
+        deadline = delivery_deadline(delivery)
+        if deadline is None:
+            return
+        countdown = max(0, (deadline - timezone.now()).total_seconds())
+
+    delivery_id = str(delivery.pk)
+
+    def _schedule():
+        from api.tasks import delivery_timer_task
+        try:
+            delivery_timer_task.apply_async((delivery_id,), countdown=countdown)
+        except Exception as e:
+            # The safety-net sweep still picks the delivery up
+            print(f"[OFFER TIMER] Could not schedule delivery {delivery_id}: {e}")
+
+    transaction.on_commit(_schedule)
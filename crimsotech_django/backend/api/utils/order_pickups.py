@@ -0,0 +1,70 @@
+"""
+Order pickup origins.
+
+Where a rider collects an order is the shop of its first checkout row,
+or the seller for products sold without a shop. That row is only reached
+through checkout -> cart item -> product -> shop, so it is resolved once,
+when the order's first checkout row is saved (see signals.py), and kept
+in OrderPickup. The delivery sweeps load it with the order via
+PICKUP_RELATED. The coordinates are read from the shop or seller through
+that join, so later geocoding or address changes still apply.
+"""
+from api.models import OrderPickup, Shop
+
+
+# select_related() paths that bring an order's pickup along in the same query
+PICKUP_RELATED = ('pickup__shop', 'pickup__seller')
+
+
+def pickup_source(checkout):
+    """{'shop_id', 'seller_id'} a checkout row is picked up from, or None"""
+    if checkout.direct_shop_id:
+        # direct_shop_id is a plain UUID, not a foreign key
+        if not Shop.objects.filter(id=checkout.direct_shop_id).exists():
+            return None
+        return {'shop_id': checkout.direct_shop_id, 'seller_id': None}
+    product = checkout.cart_item.product if checkout.cart_item_id else None
+    if product is None:
+        return None
+    if product.shop_id:
+        return {'shop_id': product.shop_id, 'seller_id': None}
+    if product.customer_id:
+        return {'shop_id': None, 'seller_id': product.customer_id}
+    return None
+
+
+def record_pickup(checkout):
+    """Store the order's pickup from this checkout row unless the order already has one"""
+    if not checkout.order_id:
+        return None
+    pickup = OrderPickup.objects.filter(order_id=checkout.order_id).first()
+    if pickup:
+        return pickup
+    source = pickup_source(checkout)
+    if source is None:
+        return None
+    pickup, _ = OrderPickup.objects.get_or_create(order_id=checkout.order_id, defaults=source)
+    return pickup
+
+
+def get_pickup(order):
+    """The order's OrderPickup; orders placed before pickups were stored get theirs recorded now"""
+    try:
+        return order.pickup
+    except OrderPickup.DoesNotExist:
+        pass
+    checkout = order.checkout_set.select_related('cart_item__product').first()
+    return record_pickup(checkout) if checkout else None
+
+
+def pickup_point(pickup):
+    """(lat, lng, name) of a pickup; lat and lng are None while its coordinates are unknown"""
+    if pickup.shop_id and pickup.shop:
+        place, name = pickup.shop, pickup.shop.name
+    elif pickup.seller_id and pickup.seller:
+        place, name = pickup.seller, f"{pickup.seller.first_name} {pickup.seller.last_name}"
+    else:
+        return None, None, None
+    if place.latitude and place.longitude:
+        return float(place.latitude), float(place.longitude), name
+    return None, None, name
@@ -0,0 +1,188 @@
+"""
+Live rider positions.
+
+Riders stream position pings over the rider location WebSocket
+(RiderLocationConsumer). The latest ping per rider is kept in a Redis GEO
+set, with a companion sorted set of ping times. A position counts as live
+for RIDER_LOCATION_TTL seconds after its ping. User.latitude/longitude is
+only written once per RIDER_LOCATION_DB_INTERVAL per rider.
+
+Without Redis (tests, USE_LOCAL_CACHE development) an in-process index
+stands in, with the same interface.
+
+The socket only takes pings from a rider holding a location token: a
+signed user id issued by the login view, valid for
+RIDER_LOCATION_TOKEN_MAX_AGE seconds.
+"""
+import threading
+import time
+
+import numpy as np
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+
+from api.utils.distance_service import haversine_km
+
+
+GEO_KEY = 'crimsotech:rider-locations'
+SEEN_KEY = 'crimsotech:rider-locations:seen'
+
+
+def get_location_ttl():
+    return getattr(settings, 'RIDER_LOCATION_TTL', 120)
+
+
+def get_db_interval():
+    return getattr(settings, 'RIDER_LOCATION_DB_INTERVAL', 60)
+
+
+def get_token_max_age():
+    return getattr(settings, 'RIDER_LOCATION_TOKEN_MAX_AGE', 7 * 24 * 3600)
+
+
+TOKEN_SALT = 'crimsotech.rider-location'
+
+
+def location_token(user_id):
+    """A token proving the holder logged in as the user, for the location socket"""
+    return signing.dumps(str(user_id), salt=TOKEN_SALT)
+
+
+def token_user_id(token):
+    """The user id a location token was issued for, or None if it is forged or expired"""
+    try:
+        return signing.loads(token, salt=TOKEN_SALT, max_age=get_token_max_age())
+    except (signing.BadSignature, TypeError):
+        return None
+
+
+class MemoryLocationIndex:
+    """Per-process stand-in for the Redis index: {rider_id: (lat, lng, seen_at)}"""
+
+    def __init__(self):
+        self._positions = {}
+        self._lock = threading.Lock()
+
+    def add(self, rider_id, lat, lng, seen_at):
+        with self._lock:
+            self._positions[rider_id] = (lat, lng, seen_at)
+
+    def _fresh(self):
+        cutoff = time.time() - get_location_ttl()
+        with self._lock:
+            for rider_id in [r for r, (_, _, seen_at) in self._positions.items() if seen_at < cutoff]:
+                del self._positions[rider_id]
+            return dict(self._positions)
+
+    def get(self, rider_ids):
+        fresh = self._fresh()
+        return {rider_id: fresh[rider_id] for rider_id in rider_ids if rider_id in fresh}
+
+    def nearby(self, lat, lng, radius_km, limit):
+        fresh = self._fresh()
+        if not fresh:
+            return []
+        ids = list(fresh)
+        distances = haversine_km(lat, lng, [fresh[r][0] for r in ids], [fresh[r][1] for r in ids])
+        order = np.argsort(distances, kind='stable')
+        return [(ids[i], float(distances[i])) for i in order if distances[i] <= radius_km][:limit]
+
+    def clear(self):
+        with self._lock:
+            self._positions.clear()
+
+
+class RedisLocationIndex:
+    """GEO set of positions plus a sorted set of ping times; stale members are pruned on read"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def add(self, rider_id, lat, lng, seen_at):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.geoadd(GEO_KEY, (lng, lat, rider_id))
+        pipe.zadd(SEEN_KEY, {rider_id: seen_at})
+        pipe.execute()
+
+    def _prune(self):
+        stale = self.client.zrangebyscore(SEEN_KEY, '-inf', time.time() - get_location_ttl())
+        if stale:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.zrem(GEO_KEY, *stale)
+            pipe.zrem(SEEN_KEY, *stale)
+            pipe.execute()
+
+    def get(self, rider_ids):
+        if not rider_ids:
+            return {}
+        self._prune()
+        pipe = self.client.pipeline(transaction=False)
+        pipe.geopos(GEO_KEY, *rider_ids)
+        pipe.zmscore(SEEN_KEY, rider_ids)
+        positions, seen = pipe.execute()
+        return {
+            rider_id: (position[1], position[0], seen_at)
+            for rider_id, position, seen_at in zip(rider_ids, positions, seen)
+            if position and seen_at
+        }
+
+    def nearby(self, lat, lng, radius_km, limit):
+        self._prune()
+        rows = self.client.geosearch(
+            GEO_KEY, longitude=lng, latitude=lat, radius=radius_km, unit='km',
+            sort='ASC', count=limit, withdist=True,
+        )
+        return [(rider_id, float(distance)) for rider_id, distance in rows]
+
+    def clear(self):
+        self.client.delete(GEO_KEY, SEEN_KEY)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Redis-backed index, or the in-process one when the shared cache is local"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                if getattr(settings, 'USE_LOCAL_CACHE', False):
+                    _index = MemoryLocationIndex()
+                else:
+                    import redis
+                    options = dict(getattr(settings, 'REDIS_CONNECTION_KWARGS', {}))
+                    if settings.REDIS_URL.startswith('rediss://'):
+                        options['ssl_cert_reqs'] = None
+                    client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True, **options)
+                    _index = RedisLocationIndex(client)
+    return _index
+
+
+def record_location(rider_id, lat, lng):
+    """
+    Store a ping. Returns True when this ping should also be written to the
+    database (at most once per RIDER_LOCATION_DB_INTERVAL per rider).
+    """
+    rider_id = str(rider_id)
+    get_index().add(rider_id, float(lat), float(lng), time.time())
+    return cache.add(f'rider-location-db:{rider_id}', 1, get_db_interval())
+
+
+def live_locations(rider_ids):
+    """{rider id: (lat, lng)} for the riders with a live position"""
+    try:
+        found = get_index().get([str(rider_id) for rider_id in rider_ids])
+    except Exception as e:
+        # Matching falls back to the saved locations
+        print(f"[RIDER LOCATIONS] Live positions unavailable: {e}")
+        return {}
+    return {rider_id: (float(lat), float(lng)) for rider_id, (lat, lng, _) in found.items()}
+
+
+def nearby_riders(lat, lng, radius_km, limit=50):
+    """[(rider id, km)] of live positions within radius_km, nearest first"""
+    return get_index().nearby(float(lat), float(lng), float(radius_km), limit)
@@ -0,0 +1,271 @@
+"""
+Rider matching for the delivery sweeps.
+
+A sweep loads the available riders once into a RiderPool. For each order,
+the pool ranks every rider with one vectorized haversine pass. Only the k
+nearest riders who haven't rejected the order are then sent to the
+driving-distance service, in one batched lookup. The pickup -> destination
+leg is the same for every rider, so it is requested once per order.
+
+plan_assignments() is the batch mode: it builds one cost matrix over a
+set of orders and their candidate riders and solves it globally, so an
+early order can't take the only rider who is close to a later one. Orders
+whose candidates all end up taken then get the nearest rider who still
+has room, as per-order matching would.
+"""
+from collections import defaultdict
+
+import numpy as np
+
+from django.conf import settings
+from django.db.models import Count
+
+from api.models import Delivery
+from api.utils.distance_service import distances_to, driving_distance, haversine_km
+from api.utils.rider_locations import live_locations
+
+
+def get_candidate_count():
+    return max(1, getattr(settings, 'RIDER_MATCH_CANDIDATES', 5))
+
+
+class RiderPool:
+    """
+    The riders one sweep can assign, with their coordinates as NumPy arrays.
+    A rider's live position (see api.utils.rider_locations) wins over the
+    last one saved on their profile.
+    """
+
+    def __init__(self, riders):
+        riders = list(riders)
+        live = live_locations([rider.pk for rider in riders])
+
+        self.riders = []
+        self.without_location = []
+        self.positions = {}
+        for rider in riders:
+            position = live.get(str(rider.pk))
+            if position is None and rider.rider.latitude and rider.rider.longitude:
+                position = (float(rider.rider.latitude), float(rider.rider.longitude))
+            if position:
+                self.riders.append(rider)
+                self.positions[rider.pk] = position
+            else:
+                self.without_location.append(rider)
+
+        self.ids = np.array([str(rider.pk) for rider in self.riders], dtype=object)
+        self.lats = np.array([self.positions[rider.pk][0] for rider in self.riders], dtype=float)
+        self.lngs = np.array([self.positions[rider.pk][1] for rider in self.riders], dtype=float)
+
+    def __len__(self):
+        return len(self.riders)
+
+    def position(self, rider):
+        """(lat, lng) the pool matched the rider at"""
+        return self.positions[rider.pk]
+
+    def nearest(self, lat, lng, k, exclude=()):
+        """
+        Up to k (rider, straight-line km) pairs closest to the point, nearest
+        first, skipping rider ids in `exclude`.
+        """
+        if not self.riders:
+            return []
+
+        distances = haversine_km(lat, lng, self.lats, self.lngs)
+        eligible = np.arange(len(self.riders))
+        if exclude:
+            excluded = {str(rider_id) for rider_id in exclude}
+            eligible = eligible[[rider_id not in excluded for rider_id in self.ids]]
+        if not len(eligible):
+            return []
+
+        if len(eligible) > k:
+            # Partial sort: only the k smallest need ordering
+            eligible = eligible[np.argpartition(distances[eligible], k - 1)[:k]]
+        eligible = eligible[np.argsort(distances[eligible], kind='stable')]
+        return [(self.riders[i], float(distances[i])) for i in eligible]
+
+
+def rejected_riders_by_order(order_ids, statuses=('rejected',)):
+    """order id -> ids of riders who rejected it, for all the orders in one query"""
+    rejected = defaultdict(set)
+    rows = Delivery.objects.filter(
+        order_id__in=list(order_ids), status__in=list(statuses), rider__isnull=False
+    ).values_list('order_id', 'rider_id')
+    for order_id, rider_id in rows:
+        rejected[order_id].add(rider_id)
+    return rejected
+
+
+def rank_riders(pool, pickup, destination, exclude=(), k=None):
+    """
+    Driving-distance ranking of the k straight-line nearest eligible riders.
+
+    `pickup` and `destination` are (lat, lng). The rider -> pickup legs are
+    one batched distance lookup. Returns dicts with 'rider', 'rider_lat',
+    'rider_lng', 'straight_line_km', 'distance_to_pickup',
+    'distance_pickup_to_dest' and 'total_distance', nearest first.
+    """
+    candidates = pool.nearest(pickup[0], pickup[1], k or get_candidate_count(), exclude=exclude)
+    if not candidates:
+        return []
+
+    points = [pool.position(rider) for rider, _ in candidates]
+    to_pickup = distances_to(points, pickup)
+    distance_pickup_to_dest = driving_distance(pickup[0], pickup[1], destination[0], destination[1])
+
+    ranked = []
+    for (rider, straight_line_km), (rider_lat, rider_lng), distance_to_pickup in zip(candidates, points, to_pickup):
+        ranked.append({
+            'rider': rider,
+            'rider_lat': rider_lat,
+            'rider_lng': rider_lng,
+            'straight_line_km': straight_line_km,
+            'distance_to_pickup': distance_to_pickup,
+            'distance_pickup_to_dest': distance_pickup_to_dest,
+            'total_distance': distance_to_pickup + distance_pickup_to_dest,
+        })
+
+    ranked.sort(key=lambda x: x['total_distance'])
+    return ranked
+
+
+# Deliveries that keep a rider busy (and count against their capacity)
+ACTIVE_DELIVERY_STATUSES = ['pending', 'pending_offer', 'accepted', 'picked_up', 'in_progress']
+
+
+def rider_capacities(pool):
+    """
+    How many more offers each pool rider can take, in pool order:
+    RIDER_MAX_ACTIVE_DELIVERIES minus their active deliveries (one query).
+    """
+    limit = getattr(settings, 'RIDER_MAX_ACTIVE_DELIVERIES', 1)
+    active = dict(
+        Delivery.objects.filter(
+            rider_id__in=[rider.pk for rider in pool.riders], status__in=ACTIVE_DELIVERY_STATUSES
+        ).values('rider_id').annotate(count=Count('id')).values_list('rider_id', 'count')
+    )
+    return [max(0, limit - active.get(rider.pk, 0)) for rider in pool.riders]
+
+
+def assignment_costs(jobs, pool, k=None):
+    """
+    Cost matrix for a batch of jobs (dicts with 'pickup', 'destination' and
+    optionally 'exclude', a set of rider ids). Returns (costs, options):
+    costs is a jobs x riders array of total km, inf where the rider isn't
+    one of the job's k candidates; options[(i, j)] is the rank_riders entry.
+    """
+    costs = np.full((len(jobs), len(pool)), np.inf)
+    column = {rider.pk: j for j, rider in enumerate(pool.riders)}
+    options = {}
+    for i, job in enumerate(jobs):
+        for entry in rank_riders(pool, job['pickup'], job['destination'], exclude=job.get('exclude', ()), k=k):
+            j = column[entry['rider'].pk]
+            costs[i, j] = entry['total_distance']
+            options[(i, j)] = entry
+    return costs, options
+
+
+def solve_optimal(costs, capacities):
+    """
+    Minimum total-km assignment (Hungarian algorithm). A rider with capacity
+    c can take up to c jobs. Serves as many jobs as the constraints allow,
+    then minimizes distance. Returns [(job index, rider index)].
+    """
+    from scipy.optimize import linear_sum_assignment
+
+    finite = np.isfinite(costs)
+    # One column per free slot, only for riders who are a candidate somewhere
+    slots = [j for j in range(costs.shape[1]) if finite[:, j].any() for _ in range(capacities[j])]
+    if not slots or not costs.shape[0]:
+        return []
+
+    expanded = costs[:, slots]
+    feasible = finite[:, slots]
+    # Costlier than every feasible assignment combined, so it is only used when unavoidable
+    unassignable = costs[finite].sum() + 1
+    rows, cols = linear_sum_assignment(np.where(feasible, expanded, unassignable))
+    return [(int(i), slots[c]) for i, c in zip(rows, cols) if feasible[i, c]]
+
+
+def solve_greedy(costs, capacities):
+    """What per-order matching does: each job in turn takes its nearest rider with capacity left"""
+    remaining = list(capacities)
+    pairs = []
+    for i in range(costs.shape[0]):
+        row = np.where(np.array(remaining) > 0, costs[i], np.inf)
+        j = int(np.argmin(row)) if len(row) else 0
+        if len(row) and np.isfinite(row[j]):
+            remaining[j] -= 1
+            pairs.append((i, j))
+    return pairs
+
+
+def fill_unassigned(jobs, pool, pairs, capacities, costs, options, k=None):
+    """
+    Second pass for the jobs `pairs` leaves out: each in turn takes its
+    nearest eligible rider who still has capacity, ranked among those riders
+    only. Adds the new entries to costs and options; returns the extra pairs.
+    """
+    remaining = list(capacities)
+    for _, j in pairs:
+        remaining[j] -= 1
+    assigned = {i for i, _ in pairs}
+    column = {rider.pk: j for j, rider in enumerate(pool.riders)}
+
+    extra = []
+    for i, job in enumerate(jobs):
+        if i in assigned:
+            continue
+        full = {pool.ids[j] for j in range(len(pool)) if remaining[j] <= 0}
+        if len(full) == len(pool):
+            break
+        ranked = rank_riders(pool, job['pickup'], job['destination'], exclude=set(job.get('exclude', ())) | full, k=k)
+        if not ranked:
+            continue
+        entry = ranked[0]
+        j = column[entry['rider'].pk]
+        costs[i, j] = entry['total_distance']
+        options[(i, j)] = entry
+        remaining[j] -= 1
+        extra.append((i, j))
+    return extra
+
+
+def plan_assignments(jobs, pool, capacities=None, k=None):
+    """
+    Assign a batch of jobs to riders at once and compare with greedy matching.
+
+    Jobs are first solved over their k candidates; those left over take the
+    nearest rider with capacity left (fill_unassigned), in both plans.
+    Returns a dict with 'assignments' ({job index: rank_riders entry}),
+    'unassigned' (job indices), 'without_candidates' (jobs no rider could
+    take at all), 'total_km', and the greedy baseline's
+    'greedy_assigned' and 'greedy_total_km', plus 'km_saved'. The two plans
+    can serve different numbers of jobs; the distance of the extra jobs one
+    serves counts against it in km_saved.
+    """
+    if capacities is None:
+        capacities = rider_capacities(pool)
+    k = k or get_candidate_count()
+    costs, options = assignment_costs(jobs, pool, k=k)
+    without_candidates = {i for i in range(len(jobs)) if not np.isfinite(costs[i]).any()}
+
+    optimal = solve_optimal(costs, capacities)
+    greedy = solve_greedy(costs, capacities)
+    optimal += fill_unassigned(jobs, pool, optimal, capacities, costs, options, k=k)
+    greedy += fill_unassigned(jobs, pool, greedy, capacities, costs, options, k=k)
+    total_km = float(sum(costs[i, j] for i, j in optimal))
+    greedy_total_km = float(sum(costs[i, j] for i, j in greedy))
+
+    assignments = {i: options[(i, j)] for i, j in optimal}
+    return {
+        'assignments': assignments,
+        'unassigned': [i for i in range(len(jobs)) if i not in assignments],
+        'without_candidates': without_candidates,
+        'total_km': total_km,
+        'greedy_assigned': len(greedy),
+        'greedy_total_km': greedy_total_km,
+        'km_saved': greedy_total_km - total_km,
+    }
@@ -0,0 +1,158 @@
+"""
+Locking and timing for the Celery tasks in api/tasks.py.
+
+Locks live in the shared cache (Redis in production). cache.add() is atomic,
+so only one worker can hold a lock at a time. A lock always expires after
+TASK_LOCK_TIMEOUT, so a killed worker can't leave it held forever.
+Every task that assigns riders takes DELIVERY_ASSIGNMENT_LOCK. A sweep and
+an on-demand assignment therefore never offer the same order at once.
+
+Every run's duration and outcome are also counted in the shared cache,
+one key per counter updated with cache.incr(), so concurrent workers don't
+overwrite each other's counts. Any process can report them (see
+task_metrics()).
+"""
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+
+DELIVERY_ASSIGNMENT_LOCK = 'delivery-assignment'
+
+# Tasks whose runs are recorded, in registration order
+TRACKED_TASKS = []
+
+# Recorded outcomes are kept for a week after a task's last run
+METRICS_TTL = 7 * 24 * 60 * 60
+
+# Counters kept per task; durations are summed in whole milliseconds
+COUNTERS = ('runs', 'succeeded', 'failed', 'skipped', 'retried', 'total_ms')
+
+
+def get_lock_timeout():
+    return getattr(settings, 'TASK_LOCK_TIMEOUT', 10 * 60)
+
+
+def _lock_key(name):
+    return f'task-lock:{name}'
+
+
+def _metrics_key(name, field):
+    return f'task-metrics:{name}:{field}'
+
+
+@contextmanager
+def task_lock(name, timeout=None):
+    """
+    Yields True if the lock was acquired, False if another run holds it.
+    Released on exit, unless it already expired and someone else took it.
+    """
+    key = _lock_key(name)
+    token = uuid.uuid4().hex
+    acquired = cache.add(key, token, timeout or get_lock_timeout())
+    try:
+        yield acquired
+    finally:
+        if acquired and cache.get(key) == token:
+            cache.delete(key)
+
+
+def _incr(key, delta=1):
+    cache.add(key, 0, METRICS_TTL)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # Expired between add() and incr()
+        cache.add(key, delta, METRICS_TTL)
+    cache.touch(key, METRICS_TTL)
+
+
+def record_run(name, outcome, seconds):
+    """Add one run ('succeeded', 'failed', 'skipped' or 'retried') to the task's counters"""
+    _incr(_metrics_key(name, 'runs'))
+    _incr(_metrics_key(name, outcome))
+    if outcome in ('succeeded', 'failed'):
+        ms = int(round(seconds * 1000))
+        _incr(_metrics_key(name, 'total_ms'), ms)
+        # Only the slowest run is kept; a near-simultaneous slower one can lose
+        if ms > (cache.get(_metrics_key(name, 'max_ms')) or 0):
+            cache.set(_metrics_key(name, 'max_ms'), ms, METRICS_TTL)
+    cache.set(_metrics_key(name, 'last'), {
+        'last_outcome': outcome,
+        'last_seconds': round(seconds, 4),
+        'last_run_at': timezone.now().isoformat(),
+    }, METRICS_TTL)
+
+
+class TaskRun:
+    """Outcome of one timed run; a run can mark itself skipped or retried"""
+
+    def __init__(self):
+        self.outcome = 'succeeded'
+
+
+@contextmanager
+def timed_run(name):
+    """Time the block and record it under `name`. Exceptions count as failures."""
+    from celery.exceptions import Retry
+
+    run = TaskRun()
+    started = time.perf_counter()
+    try:
+        yield run
+    except Retry:
+        run.outcome = 'retried'
+        raise
+    except Exception:
+        run.outcome = 'failed'
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        record_run(name, run.outcome, seconds)
+        print(f"[TASK] {name} {run.outcome} in {seconds:.2f}s")
+
+
+def tracked(name):
+    """Register a task name so task_metrics() reports it"""
+    if name not in TRACKED_TASKS:
+        TRACKED_TASKS.append(name)
+    return name
+
+
+def run_locked(name, lock, func, *args, **kwargs):
+    """
+    Run func(*args, **kwargs) under `lock`, timed as `name`. If another run
+    holds the lock, this run is recorded as skipped and returns None.
+    """
+    with timed_run(name) as run:
+        with task_lock(lock) as acquired:
+            if not acquired:
+                run.outcome = 'skipped'
+                return None
+            return func(*args, **kwargs)
+
+
+def task_metrics():
+    """{task name: counters plus the average duration} for every tracked task"""
+    fields = COUNTERS + ('max_ms', 'last')
+    stored = cache.get_many([_metrics_key(name, field) for name in TRACKED_TASKS for field in fields])
+    metrics = {}
+    for name in TRACKED_TASKS:
+        if not stored.get(_metrics_key(name, 'runs')):
+            metrics[name] = None
+            continue
+        counts = {field: stored.get(_metrics_key(name, field)) or 0 for field in COUNTERS}
+        total_seconds = counts.pop('total_ms') / 1000
+        timed_runs = counts['succeeded'] + counts['failed']
+        metrics[name] = {
+            **counts,
+            'total_seconds': total_seconds,
+            'max_seconds': (stored.get(_metrics_key(name, 'max_ms')) or 0) / 1000,
+            **(stored.get(_metrics_key(name, 'last')) or {}),
+            'avg_seconds': round(total_seconds / timed_runs, 4) if timed_runs else None,
+        }
+    return metrics
@@ -0,0 +1,133 @@
+"""
+Denormalized unread counters.
+
+ConversationParticipant.unread_count is how many messages in the
+conversation the participant has received and not read (or deleted on
+their side). User.unread_notification_count is how many of the user's
+notifications are unread. Both are adjusted with F() updates when the
+rows they count change:
+  - new and deleted messages/notifications, via signals.py, or
+    messages_created() / notifications_created() after a bulk_create;
+  - reads, via mark_messages_read() / mark_notifications_read() and the
+    models' mark_as_read();
+  - a receiver's soft delete, via Message.soft_delete_for_user().
+Readers then fetch one row instead of counting. A write that bypasses
+these paths leaves a counter off. The reconcile_unread_counts command
+recounts the counters and repairs any that have drifted.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from api.models import ConversationParticipant, Message, Notification, User
+
+
+# A message counts as unread for its receiver while this holds
+UNREAD_MESSAGE = Q(read_at__isnull=True, is_deleted_for_receiver=False)
+
+RECONCILE_BATCH_SIZE = 1000
+
+
+def counts_as_unread(message):
+    """Whether the message is one of its receiver's unread messages"""
+    return bool(message.receiver_id) and message.read_at is None and not message.is_deleted_for_receiver
+
+
+def adjust_conversation_unread(conversation_id, user_id, delta):
+    if delta:
+        ConversationParticipant.objects.filter(conversation_id=conversation_id, user_id=user_id).update(
+            unread_count=Greatest(F('unread_count') + delta, 0)
+        )
+
+
+def adjust_notification_unread(user_id, delta):
+    if delta:
+        User.objects.filter(id=user_id).update(
+            unread_notification_count=Greatest(F('unread_notification_count') + delta, 0)
+        )
+
+
+def message_unread_total(user_id):
+    """All of the user's unread messages, summed over their conversations"""
+    return ConversationParticipant.objects.filter(user_id=user_id).aggregate(
+        total=Coalesce(Sum('unread_count'), 0)
+    )['total']
+
+
+def notification_unread_total(user_id):
+    return User.objects.filter(id=user_id).values_list('unread_notification_count', flat=True).first() or 0
+
+
+def mark_messages_read(queryset):
+    """Mark the queryset's unread messages read and lower their receivers' counters; returns how many changed"""
+    unread = queryset.filter(read_at__isnull=True)
+    with transaction.atomic():
+        counted = list(
+            unread.filter(UNREAD_MESSAGE).order_by()
+            .values('conversation_id', 'receiver_id').annotate(count=Count('id'))
+        )
+        updated = unread.update(status='read', read_at=timezone.now())
+        for row in counted:
+            adjust_conversation_unread(row['conversation_id'], row['receiver_id'], -row['count'])
+    return updated
+
+
+def mark_notifications_read(queryset):
+    """Mark the queryset's unread notifications read and lower the counters; returns how many changed"""
+    unread = queryset.filter(is_read=False)
+    with transaction.atomic():
+        counted = list(unread.order_by().values('user_id').annotate(count=Count('id')))
+        updated = unread.update(is_read=True, read_at=timezone.now())
+        for row in counted:
+            adjust_notification_unread(row['user_id'], -row['count'])
+    return updated
+
+
+def messages_created(messages):
+    """Raise the counters for messages inserted without post_save (bulk_create)"""
+    counts = Counter((m.conversation_id, m.receiver_id) for m in messages if counts_as_unread(m))
+    for (conversation_id, receiver_id), count in counts.items():
+        adjust_conversation_unread(conversation_id, receiver_id, count)
+
+
+def notifications_created(notifications):
+    """Raise the counters for notifications inserted without post_save (bulk_create)"""
+    for user_id, count in Counter(n.user_id for n in notifications if not n.is_read).items():
+        adjust_notification_unread(user_id, count)
+
+
+def participant_unread_actual():
+    unread = Message.objects.filter(
+        UNREAD_MESSAGE, conversation_id=OuterRef('conversation_id'), receiver_id=OuterRef('user_id'),
+    ).order_by().values('receiver_id').annotate(count=Count('id')).values('count')
+    return Coalesce(Subquery(unread, output_field=IntegerField()), 0)
+
+
+def user_notification_unread_actual():
+    unread = Notification.objects.filter(
+        user_id=OuterRef('id'), is_read=False,
+    ).order_by().values('user_id').annotate(count=Count('id')).values('count')
+    return Coalesce(Subquery(unread, output_field=IntegerField()), 0)
+
+
+def _reconcile(queryset, field, actual, dry_run):
+    """Recount the rows whose stored counter disagrees with a fresh count; returns how many drifted"""
+    drifted = list(
+        queryset.annotate(actual=actual).exclude(**{field: F('actual')}).values_list('pk', flat=True)
+    )
+    if not dry_run:
+        # Recounted inside the UPDATE, so writes since the check aren't lost
+        for start in range(0, len(drifted), RECONCILE_BATCH_SIZE):
+            queryset.filter(pk__in=drifted[start:start + RECONCILE_BATCH_SIZE]).update(**{field: actual})
+    return len(drifted)
+
+
+def reconcile_conversation_counters(dry_run=False):
+    return _reconcile(ConversationParticipant.objects.all(), 'unread_count', participant_unread_actual(), dry_run)
+
+
+def reconcile_notification_counters(dry_run=False):
+    return _reconcile(User.objects.all(), 'unread_notification_count', user_notification_unread_actual(), dry_run)
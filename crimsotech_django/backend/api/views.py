@@ -87,11 +87,28 @@ from .models import (
 # views.py
 from django.core.files.storage import FileSystemStorage
 import os
-from .utils.model_handler import ElectronicsClassifier
 import json
 from api.utils.storage_utils import convert_s3_to_public_url
+from api.utils.cursor_pagination import decode_cursor, paginate_keyset, parse_page_size
+from api.utils.conversation_inbox import inbox_items, inbox_queryset
+from api.utils.chat_history import HISTORY_PAGE_SIZE, history_items, history_page, visible_messages
+from api.utils.unread_counters import mark_messages_read, mark_notifications_read
+from api.utils.notifications import notify
+from api.utils.landing_cache import get_or_build_landing_payload
+from api.utils.cache_helpers import get_or_build
+from api.utils.category_model import get_text_category_model
+from api.utils.sales_timeseries import checkout_sales_series, order_sales_series
+from api.utils.metrics_rollup import category_sales_totals, product_sales_totals, shop_sales_totals
+from api.utils.distance_service import distances_to, driving_distance
+from api.utils.rider_matching import RiderPool, plan_assignments, rejected_riders_by_order
+from api.utils.geocoding import lookup_coordinates
+from api.utils.offer_timers import get_offer_timeout
+from api.utils.rider_locations import live_locations, location_token, nearby_riders
 from django.shortcuts import get_object_or_404
-from .tasks import assign_deliveries_task, check_delivery_responses_task
+from .tasks import (
+    assign_deliveries_task, assign_order_delivery_task, check_delivery_responses_task,
+    check_order_delivery_responses_task,
+)
 import traceback
 import base64
 
@@ -113,6 +130,8 @@ def get_classifier():
     """Lazy load the classifier only when needed"""
     global _classifier
     if _classifier is None:
+        # Imported here so TensorFlow is only loaded by workers that classify images
+        from .utils.model_handler import ElectronicsClassifier
         _classifier = ElectronicsClassifier(MODEL_PATH)
     return _classifier
 
@@ -120,25 +139,14 @@ def get_classifier():
 @csrf_exempt
 def predict_image(request):
     if request.method == 'POST' and request.FILES.get('image'):
-        # Save uploaded file
         uploaded_file = request.FILES['image']
-        fs = FileSystemStorage(location='temp_uploads/')
-        
-        # Create directory if it doesn't exist
-        os.makedirs('temp_uploads', exist_ok=True)
-        
-        filename = fs.save(uploaded_file.name, uploaded_file)
-        file_path = os.path.join('temp_uploads', filename)
         
         try:
             # Get classifier lazily (won't load until first request)
             classifier = get_classifier()
             
-            # Make prediction
-            result = classifier.predict(file_path)
-            
-            # Clean up temporary file
-            os.remove(file_path)
+            # Decode in memory and predict through the shared batching queue
+            result = classifier.predict_from_bytes(uploaded_file.read())
             
             return JsonResponse({
                 'success': True,
@@ -146,9 +154,6 @@ def predict_image(request):
             })
         
         except Exception as e:
-            # Clean up on error
-            if os.path.exists(file_path):
-                os.remove(file_path)
             return JsonResponse({
                 'success': False,
                 'error': str(e)
@@ -160,421 +165,475 @@ def predict_image(request):
     }, status=400)
 
 
+def get_inference_metrics(request):
+    """API endpoint exposing latency and batch-size metrics of the image classifier"""
+    if _classifier is None:
+        return JsonResponse({'loaded': False, 'metrics': None})
+    return JsonResponse({'loaded': True, 'metrics': _classifier.get_metrics()})
+
+
+def get_task_metrics(request):
+    """API endpoint exposing run counts and durations of the Celery tasks"""
+    from .utils.task_runtime import task_metrics
+    return JsonResponse({'tasks': task_metrics()})
+
+
 def get_classes(request):
     """API endpoint to get available classes"""
-    classifier = get_classifier()
+    # Same in-memory index the classifier labels its outputs with; no need to load the model
+    from .utils.category_index import category_index
     return JsonResponse({
-        'classes': classifier.class_names
+        'classes': category_index.names()
     })
 
 
-class Landing(viewsets.ViewSet):
-    def list(self, request):
-        """
-        Get landing page data including stats, categories, and featured products.
-        STRICTLY respects data model integrity - all data comes from database.
-        Fetches ALL product images from ProductMedia model.
-        Hero products are ACTUAL products with images, not categories.
-        ONLY PUBLISHED PRODUCTS ARE FETCHED.
-        NOW FIXED: Uses variants instead of skus for stock calculation
-        """
-        try:
-            # 1. MARKETPLACE STATS (respects model constraints)
-            products_count = Product.objects.filter(
-                upload_status='published',
-                is_removed=False
-            ).count()
-            
-            shops_count = Shop.objects.filter(
-                verified=True,
-                is_suspended=False,
-                status='Active'
-            ).count()
-            
-            boosted_count = Boost.objects.filter(
-                status='active',
-                end_date__gt=timezone.now()
-            ).count()
-            
-            avg_rating_result = Review.objects.aggregate(
-                avg_rating=Avg('rating')
-            )
-            avg_rating = avg_rating_result['avg_rating'] if avg_rating_result['avg_rating'] else 4.8
-            
-            # 2. CATEGORIES with product counts - ONLY PUBLISHED PRODUCTS COUNTED
-            categories_with_products = Category.objects.annotate(
-                product_count=Count('products', filter=Q(
-                    products__upload_status='published',
-                    products__is_removed=False
-                ))
-            ).order_by('-product_count')[:10]
-            
-            # 3. FEATURED PRODUCTS with ALL images - ONLY PUBLISHED
-            # FIXED: Using variants instead of skus
-            featured_products = Product.objects.annotate(
-                variant_total=Coalesce(Sum('variants__quantity', filter=Q(variants__is_active=True)), 0)
-            ).filter(
-                upload_status='published',
-                is_removed=False,
-                shop__isnull=False,
-                shop__is_suspended=False,
-                shop__verified=True,
-                shop__status='Active'
-            ).select_related('shop').prefetch_related(
-                'productmedia_set',
-                'variants'
-            ).order_by('-created_at')[:15]
-            
-            # 4. TRENDING SHOPS - ONLY WITH PUBLISHED PRODUCTS
-            trending_shops_queryset = Shop.objects.filter(
-                verified=True,
-                is_suspended=False,
-                status='Active'
-            ).annotate(
-                follower_count=Count('followers', distinct=True),
-                active_product_count=Count('products', filter=Q(
-                    products__upload_status='published',
-                    products__is_removed=False
-                ), distinct=True)
-            ).filter(
-                active_product_count__gt=0
-            ).order_by('-follower_count', '-total_sales')
-            
-            has_shops_with_followers = trending_shops_queryset.filter(
-                follower_count__gt=0
-            ).exists()
-            
-            trending_shops = list(trending_shops_queryset[:10])
-            
-            # 5. HERO PRODUCTS - ONLY PUBLISHED PRODUCTS WITH IMAGES
-            hero_products_list = []
-            
-            # Get products with images for hero section - ONLY PUBLISHED
-            products_with_images = Product.objects.filter(
-                upload_status='published',
-                is_removed=False,
-                productmedia__isnull=False,
-                shop__isnull=False,
-                shop__is_suspended=False,
-                shop__verified=True,
-                shop__status='Active'
-            ).select_related('shop').prefetch_related(
-                'productmedia_set',
-                'variants'
-            ).distinct().order_by('-created_at')[:12]  # Get 12 products for hero
-            
-            for product in products_with_images:
-                # Get first image
-                media = product.productmedia_set.first()
+def get_global_categories_data():
+    """Global (shop-less) categories, read through the shared cache"""
+    def build():
+        global_categories = Category.objects.filter(shop__isnull=True).select_related('user').order_by('name')
+        return [
+            {
+                "id": str(category.id),
+                "name": category.name,
+                "shop": None,
+                "user": {
+                    "id": str(category.user.id),
+                    "username": category.user.username
+                } if category.user else None,
+            }
+            for category in global_categories
+        ]
+    return get_or_build('categories', 'global', builder=build)
+
+
+def _first_media(product):
+    """First media file from the prefetched productmedia_set (same pick as .first())"""
+    media_files = list(product.productmedia_set.all())
+    return min(media_files, key=lambda m: m.pk) if media_files else None
+
+
+def _active_variant_prices(product):
+    """Prices of active variants, read from the prefetched variants"""
+    return [v.price for v in product.variants.all() if v.is_active and v.price is not None]
+
+
+# Minimal fallback, served (but never cached) when building the payload fails
+LANDING_FALLBACK_PAYLOAD = {
+    'stats': {
+        'products_count': 0,
+        'shops_count': 0,
+        'boosted_count': 0,
+        'avg_rating': 4.8
+    },
+    'categories': [],
+    'featured_products': [],
+    'trending_shops': [],
+    'hero_products': [],
+    'ui_data': {
+        'hero_sections': [],
+        'trust_badges': []
+    }
+}
+
+
+def build_landing_payload(absolute_url=None):
+    """
+    Build the landing page document: stats, categories, featured products,
+    trending shops, hero products and UI sections.
+    ONLY PUBLISHED PRODUCTS ARE FETCHED.
+    
+    The result does not depend on the requesting user, so it is built once
+    and shared through the landing cache (see api.utils.landing_cache).
+    absolute_url turns stored media URLs into absolute ones; when building
+    outside a request (background rebuild) media URLs are used as stored.
+    """
+    if absolute_url is None:
+        absolute_url = lambda url: url
+    
+    # 1. MARKETPLACE STATS (respects model constraints)
+    products_count = Product.objects.filter(
+        upload_status='published',
+        is_removed=False
+    ).count()
+    
+    shops_count = Shop.objects.filter(
+        verified=True,
+        is_suspended=False,
+        status='Active'
+    ).count()
+    
+    boosted_count = Boost.objects.filter(
+        status='active',
+        end_date__gt=timezone.now()
+    ).count()
+    
+    avg_rating_result = Review.objects.aggregate(
+        avg_rating=Avg('average_rating')
+    )
+    avg_rating = avg_rating_result['avg_rating'] if avg_rating_result['avg_rating'] else 4.8
+    
+    # 2. CATEGORIES with product counts - ONLY PUBLISHED PRODUCTS COUNTED
+    categories_with_products = Category.objects.annotate(
+        product_count=Count('products', filter=Q(
+            products__upload_status='published',
+            products__is_removed=False
+        ))
+    ).order_by('-product_count')[:10]
+    
+    # 3. FEATURED PRODUCTS with ALL images - ONLY PUBLISHED
+    # FIXED: Using variants instead of skus
+    featured_products = Product.objects.annotate(
+        variant_total=Coalesce(Sum('variants__quantity', filter=Q(variants__is_active=True)), 0)
+    ).filter(
+        upload_status='published',
+        is_removed=False,
+        shop__isnull=False,
+        shop__is_suspended=False,
+        shop__verified=True,
+        shop__status='Active'
+    ).select_related('shop', 'category').prefetch_related(
+        'productmedia_set',
+        'variants'
+    ).order_by('-created_at')[:15]
+    
+    # 4. TRENDING SHOPS - ONLY WITH PUBLISHED PRODUCTS
+    trending_shops_queryset = Shop.objects.filter(
+        verified=True,
+        is_suspended=False,
+        status='Active'
+    ).annotate(
+        follower_count=Count('followers', distinct=True),
+        active_product_count=Count('products', filter=Q(
+            products__upload_status='published',
+            products__is_removed=False
+        ), distinct=True)
+    ).filter(
+        active_product_count__gt=0
+    ).order_by('-follower_count', '-total_sales')
+    
+    has_shops_with_followers = trending_shops_queryset.filter(
+        follower_count__gt=0
+    ).exists()
+    
+    trending_shops = list(trending_shops_queryset[:10])
+    
+    # 5. HERO PRODUCTS - ONLY PUBLISHED PRODUCTS WITH IMAGES
+    hero_products_list = []
+    
+    # Get products with images for hero section - ONLY PUBLISHED
+    products_with_images = Product.objects.filter(
+        upload_status='published',
+        is_removed=False,
+        productmedia__isnull=False,
+        shop__isnull=False,
+        shop__is_suspended=False,
+        shop__verified=True,
+        shop__status='Active'
+    ).select_related('shop').prefetch_related(
+        'productmedia_set',
+        'variants'
+    ).distinct().order_by('-created_at')[:12]  # Get 12 products for hero
+    
+    for product in products_with_images:
+        # Get first image
+        media = _first_media(product)
+        if media and media.file_data:
+            image_url = absolute_url(media.file_data.url)
+            
+            # Get min price from the prefetched variants
+            prices = _active_variant_prices(product)
+            min_price = float(min(prices)) if prices else None
+            
+            hero_products_list.append({
+                'id': str(product.id),
+                'title': product.name,
+                'link': f'/products/{product.id}',
+                'thumbnail': image_url,
+                'description': product.description[:100] + '...' if len(product.description) > 100 else product.description,
+                'price': min_price,
+                'shop_name': product.shop.name if product.shop else 'No Shop',
+                'is_product': True  # Flag to identify this is a real product
+            })
+    
+    # If we don't have enough products with images, supplement with boosted products - ONLY PUBLISHED
+    if len(hero_products_list) < 8:
+        boosted_products = Boost.objects.filter(
+            status='active',
+            end_date__gt=timezone.now(),
+            product__isnull=False,
+            product__upload_status='published',  # ONLY PUBLISHED
+            product__is_removed=False,
+            product__productmedia__isnull=False
+        ).select_related('product', 'product__shop').prefetch_related(
+            'product__productmedia_set',
+            'product__variants'
+        ).distinct()[:8 - len(hero_products_list)]
+        
+        for boost in boosted_products:
+            product = boost.product
+            if product.upload_status == 'published' and not product.is_removed:  # Double-check
+                media = _first_media(product)
                 if media and media.file_data:
-                    image_url = request.build_absolute_uri(media.file_data.url)
+                    image_url = absolute_url(media.file_data.url)
                     
-                    # Get min price from variants
-                    min_price = None
-                    active_variants = product.variants.filter(is_active=True, price__isnull=False)
-                    if active_variants.exists():
-                        min_price = float(active_variants.aggregate(Min('price'))['price__min'])
+                    # Get min price from the prefetched variants
+                    prices = _active_variant_prices(product)
+                    min_price = float(min(prices)) if prices else None
                     
                     hero_products_list.append({
                         'id': str(product.id),
-                        'title': product.name,
+                        'title': f"🔥 {product.name}",
                         'link': f'/products/{product.id}',
                         'thumbnail': image_url,
-                        'description': product.description[:100] + '...' if len(product.description) > 100 else product.description,
+                        'description': f"Boosted • {product.description[:80]}..." if len(product.description) > 80 else f"Boosted • {product.description}",
                         'price': min_price,
                         'shop_name': product.shop.name if product.shop else 'No Shop',
-                        'is_product': True  # Flag to identify this is a real product
+                        'is_product': True,
+                        'is_boosted': True
                     })
-            
-            # If we don't have enough products with images, supplement with boosted products - ONLY PUBLISHED
-            if len(hero_products_list) < 8:
-                boosted_products = Boost.objects.filter(
-                    status='active',
-                    end_date__gt=timezone.now(),
-                    product__isnull=False,
-                    product__upload_status='published',  # ONLY PUBLISHED
-                    product__is_removed=False,
-                    product__productmedia__isnull=False
-                ).select_related('product', 'product__shop').prefetch_related(
-                    'product__productmedia_set',
-                    'product__variants'
-                ).distinct()[:8 - len(hero_products_list)]
-                
-                for boost in boosted_products:
-                    product = boost.product
-                    if product.upload_status == 'published' and not product.is_removed:  # Double-check
-                        media = product.productmedia_set.first()
-                        if media and media.file_data:
-                            image_url = request.build_absolute_uri(media.file_data.url)
-                            
-                            # Get min price from variants
-                            min_price = None
-                            active_variants = product.variants.filter(is_active=True, price__isnull=False)
-                            if active_variants.exists():
-                                min_price = float(active_variants.aggregate(Min('price'))['price__min'])
-                            
-                            hero_products_list.append({
-                                'id': str(product.id),
-                                'title': f"🔥 {product.name}",
-                                'link': f'/products/{product.id}',
-                                'thumbnail': image_url,
-                                'description': f"Boosted • {product.description[:80]}..." if len(product.description) > 80 else f"Boosted • {product.description}",
-                                'price': min_price,
-                                'shop_name': product.shop.name if product.shop else 'No Shop',
-                                'is_product': True,
-                                'is_boosted': True
-                            })
-            
-            # If STILL not enough, get any products with images - ONLY PUBLISHED
-            if len(hero_products_list) < 6:
-                any_products = Product.objects.filter(
-                    upload_status='published',  # ONLY PUBLISHED
-                    is_removed=False,
-                    productmedia__isnull=False
-                ).exclude(
-                    id__in=[p['id'] for p in hero_products_list if 'id' in p]
-                ).select_related('shop').prefetch_related(
-                    'productmedia_set',
-                    'variants'
-                ).order_by('?')[:6 - len(hero_products_list)]  # Random products
-                
-                for product in any_products:
-                    media = product.productmedia_set.first()
-                    if media and media.file_data:
-                        image_url = request.build_absolute_uri(media.file_data.url)
-                        
-                        # Get min price from variants
-                        min_price = None
-                        active_variants = product.variants.filter(is_active=True, price__isnull=False)
-                        if active_variants.exists():
-                            min_price = float(active_variants.aggregate(Min('price'))['price__min'])
-                        
-                        hero_products_list.append({
-                            'id': str(product.id),
-                            'title': product.name,
-                            'link': f'/products/{product.id}',
-                            'thumbnail': image_url,
-                            'description': product.description[:100] + '...' if len(product.description) > 100 else product.description,
-                            'price': min_price,
-                            'shop_name': product.shop.name if product.shop else 'No Shop',
-                            'is_product': True
-                        })
-            
-            # 6. HERO SECTIONS - NOW ONLY FOR NON-PRODUCT LINKS
-            hero_sections = []
-            
-            if has_shops_with_followers:
-                hero_sections.append({
-                    'title': 'Trending Shops',
-                    'link': '/shops/trending',
-                    'description': 'Discover the most popular shops this week',
-                    'is_category': False,
-                    'is_product': False
-                })
-            
-            if boosted_count > 0:
-                hero_sections.append({
-                    'title': 'Boosted Products',
-                    'link': '/boosts',
-                    'description': 'Featured products with maximum visibility',
-                    'is_category': False,
-                    'is_product': False
-                })
-            
-            has_top_rated = Review.objects.filter(rating=5).exists()
-            if has_top_rated:
-                hero_sections.append({
-                    'title': 'Top Rated',
-                    'link': '/products/top-rated',
-                    'description': '5-star favorites from the community',
-                    'is_category': False,
-                    'is_product': False
-                })
-            
-            has_deals = Product.objects.filter(
-                upload_status='published',  # ONLY PUBLISHED
-                is_removed=False,
-                variants__compare_price__isnull=False,
-                variants__compare_price__gt=F('variants__price')
-            ).exists()
-            if has_deals:
-                hero_sections.append({
-                    'title': 'Best Deals',
-                    'link': '/deals',
-                    'description': 'Save big on amazing offers',
-                    'is_category': False,
-                    'is_product': False
-                })
-            
-            # 7. TRUST BADGES
-            trust_badges = []
-            
-            verified_shops_count = Shop.objects.filter(
-                verified=True,
-                is_suspended=False
-            ).count()
-            if verified_shops_count > 0:
-                trust_badges.append({
-                    'title': 'Verified Shops',
-                    'description': f'{verified_shops_count} verified shops',
-                    'icon': '✓'
-                })
-            
-            completed_orders = Order.objects.filter(
-                status__in=['delivered', 'completed']
-            ).count()
-            if completed_orders > 0:
-                trust_badges.append({
-                    'title': 'Secure Payments',
-                    'description': f'{completed_orders} secure transactions',
-                    'icon': '🛡️'
-                })
-            
-            verified_riders = Rider.objects.filter(
-                verified=True,
-                rider__is_suspended=False
-            ).count()
-            if verified_riders > 0:
-                trust_badges.append({
-                    'title': 'Verified Riders',
-                    'description': f'{verified_riders} verified delivery partners',
-                    'icon': '🚚'
-                })
-            
-            # 8. FORMAT CATEGORIES
-            categories_list = list(categories_with_products)
-            category_list = [
-                {
-                    'id': str(cat.id),
-                    'name': cat.name,
-                    'slug': slugify(cat.name),
-                    'product_count': cat.product_count,
-                    'shop_id': str(cat.shop.id) if cat.shop else None,
-                    'user_id': str(cat.user.id) if cat.user else None
-                }
-                for cat in categories_list
-            ]
-            
-            # 9. FORMAT PRODUCTS WITH ALL IMAGES - ONLY PUBLISHED
-            product_list = []
-            for product in featured_products:
-                all_images = []
-                media_files = product.productmedia_set.all()
-                
-                for media in media_files:
-                    if media and media.file_data:
-                        image_url = request.build_absolute_uri(media.file_data.url)
-                        all_images.append({
-                            'id': str(media.id),
-                            'url': image_url,
-                            'file_type': media.file_type,
-                            'is_primary': len(all_images) == 0
-                        })
+    
+    # If STILL not enough, get any products with images - ONLY PUBLISHED
+    if len(hero_products_list) < 6:
+        any_products = Product.objects.filter(
+            upload_status='published',  # ONLY PUBLISHED
+            is_removed=False,
+            productmedia__isnull=False
+        ).exclude(
+            id__in=[p['id'] for p in hero_products_list if 'id' in p]
+        ).select_related('shop').prefetch_related(
+            'productmedia_set',
+            'variants'
+        ).order_by('?')[:6 - len(hero_products_list)]  # Random products
+        
+        for product in any_products:
+            media = _first_media(product)
+            if media and media.file_data:
+                image_url = absolute_url(media.file_data.url)
                 
-                primary_image_url = all_images[0]['url'] if all_images else None
+                # Get min price from the prefetched variants
+                prices = _active_variant_prices(product)
+                min_price = float(min(prices)) if prices else None
                 
-                # FIXED: Using variant_total instead of sku_total
-                try:
-                    variant_total = int(getattr(product, 'variant_total', 0) or 0)
-                except Exception:
-                    variant_total = 0
-
-                stock = variant_total
-
-                # Get min and max prices from variants
-                min_price = None
-                max_price = None
-                compare_price = None
-                
-                active_variants = product.variants.filter(is_active=True, price__isnull=False)
-                if active_variants.exists():
-                    price_stats = active_variants.aggregate(
-                        min_price=Min('price'),
-                        max_price=Max('price'),
-                        sample_compare=Max('compare_price')
-                    )
-                    min_price = float(price_stats['min_price']) if price_stats['min_price'] else None
-                    max_price = float(price_stats['max_price']) if price_stats['max_price'] else None
-                    compare_price = float(price_stats['sample_compare']) if price_stats['sample_compare'] else None
-
-                product_list.append({
+                hero_products_list.append({
                     'id': str(product.id),
                     'title': product.name,
-                    'description': product.description[:150] + '...' if len(product.description) > 150 else product.description,
-                    'min_price': min_price,
-                    'max_price': max_price,
-                    'price_range': f"₱{min_price:,.2f}" + (f" - ₱{max_price:,.2f}" if max_price and max_price != min_price else ""),
-                    'compare_price': compare_price,
-                    'shop_id': str(product.shop.id) if product.shop else None,
+                    'link': f'/products/{product.id}',
+                    'thumbnail': image_url,
+                    'description': product.description[:100] + '...' if len(product.description) > 100 else product.description,
+                    'price': min_price,
                     'shop_name': product.shop.name if product.shop else 'No Shop',
-                    'category_id': str(product.category.id) if product.category else None,
-                    'category_name': product.category.name if product.category else None,
-                    'primary_image': primary_image_url,
-                    'all_images': all_images,
-                    'image_count': len(all_images),
-                    'stock': stock,
-                    'variant_count': product.total_variants,
-                    'is_out_of_stock': stock <= 0,
-                    'created_at': product.created_at.isoformat()
+                    'is_product': True
                 })
-            
-            # 10. FORMAT TRENDING SHOPS
-            trending_shop_list = [
-                {
-                    'id': str(shop.id),
-                    'name': shop.name,
-                    'description': shop.description or f"Shop in {shop.city}",
-                    'follower_count': shop.follower_count,
-                    'active_product_count': shop.active_product_count,
-                    'total_sales': float(shop.total_sales),
-                    'city': shop.city,
-                    'verified': shop.verified,
-                    'status': shop.status
-                }
-                for shop in trending_shops
+    
+    # 6. HERO SECTIONS - NOW ONLY FOR NON-PRODUCT LINKS
+    hero_sections = []
+    
+    if has_shops_with_followers:
+        hero_sections.append({
+            'title': 'Trending Shops',
+            'link': '/shops/trending',
+            'description': 'Discover the most popular shops this week',
+            'is_category': False,
+            'is_product': False
+        })
+    
+    if boosted_count > 0:
+        hero_sections.append({
+            'title': 'Boosted Products',
+            'link': '/boosts',
+            'description': 'Featured products with maximum visibility',
+            'is_category': False,
+            'is_product': False
+        })
+    
+    has_top_rated = Review.objects.filter(average_rating=5).exists()
+    if has_top_rated:
+        hero_sections.append({
+            'title': 'Top Rated',
+            'link': '/products/top-rated',
+            'description': '5-star favorites from the community',
+            'is_category': False,
+            'is_product': False
+        })
+    
+    has_deals = Product.objects.filter(
+        upload_status='published',  # ONLY PUBLISHED
+        is_removed=False,
+        variants__compare_price__isnull=False,
+        variants__compare_price__gt=F('variants__price')
+    ).exists()
+    if has_deals:
+        hero_sections.append({
+            'title': 'Best Deals',
+            'link': '/deals',
+            'description': 'Save big on amazing offers',
+            'is_category': False,
+            'is_product': False
+        })
+    
+    # 7. TRUST BADGES
+    trust_badges = []
+    
+    verified_shops_count = Shop.objects.filter(
+        verified=True,
+        is_suspended=False
+    ).count()
+    if verified_shops_count > 0:
+        trust_badges.append({
+            'title': 'Verified Shops',
+            'description': f'{verified_shops_count} verified shops',
+            'icon': '✓'
+        })
+    
+    completed_orders = Order.objects.filter(
+        status__in=['delivered', 'completed']
+    ).count()
+    if completed_orders > 0:
+        trust_badges.append({
+            'title': 'Secure Payments',
+            'description': f'{completed_orders} secure transactions',
+            'icon': '🛡️'
+        })
+    
+    verified_riders = Rider.objects.filter(
+        verified=True,
+        rider__is_suspended=False
+    ).count()
+    if verified_riders > 0:
+        trust_badges.append({
+            'title': 'Verified Riders',
+            'description': f'{verified_riders} verified delivery partners',
+            'icon': '🚚'
+        })
+    
+    # 8. FORMAT CATEGORIES
+    categories_list = list(categories_with_products)
+    category_list = [
+        {
+            'id': str(cat.id),
+            'name': cat.name,
+            'slug': slugify(cat.name),
+            'product_count': cat.product_count,
+            'shop_id': str(cat.shop_id) if cat.shop_id else None,
+            'user_id': str(cat.user_id) if cat.user_id else None
+        }
+        for cat in categories_list
+    ]
+    
+    # 9. FORMAT PRODUCTS WITH ALL IMAGES - ONLY PUBLISHED
+    product_list = []
+    for product in featured_products:
+        all_images = []
+        media_files = product.productmedia_set.all()
+        
+        for media in media_files:
+            if media and media.file_data:
+                image_url = absolute_url(media.file_data.url)
+                all_images.append({
+                    'id': str(media.id),
+                    'url': image_url,
+                    'file_type': media.file_type,
+                    'is_primary': len(all_images) == 0
+                })
+        
+        primary_image_url = all_images[0]['url'] if all_images else None
+        
+        # FIXED: Using variant_total instead of sku_total
+        try:
+            variant_total = int(getattr(product, 'variant_total', 0) or 0)
+        except Exception:
+            variant_total = 0
+
+        stock = variant_total
+
+        # Get min and max prices from the prefetched variants
+        min_price = None
+        max_price = None
+        compare_price = None
+        
+        prices = _active_variant_prices(product)
+        if prices:
+            compare_prices = [
+                v.compare_price for v in product.variants.all()
+                if v.is_active and v.price is not None and v.compare_price is not None
             ]
-            
-            # 11. BUILD RESPONSE
-            response_data = {
-                'stats': {
-                    'products_count': products_count,
-                    'shops_count': shops_count,
-                    'boosted_count': boosted_count,
-                    'avg_rating': round(avg_rating, 1)
-                },
-                'categories': category_list,
-                'featured_products': product_list,
-                'trending_shops': trending_shop_list,
-                'hero_products': hero_products_list,  # CONTAINS REAL PRODUCTS - ONLY PUBLISHED
-                'ui_data': {
-                    'hero_sections': hero_sections,  # Non-product links
-                    'trust_badges': trust_badges
-                }
-            }
-            
-            return Response(response_data, status=status.HTTP_200_OK)
-            
+            min_price = float(min(prices)) if min(prices) else None
+            max_price = float(max(prices)) if max(prices) else None
+            compare_price = float(max(compare_prices)) if compare_prices and max(compare_prices) else None
+
+        product_list.append({
+            'id': str(product.id),
+            'title': product.name,
+            'description': product.description[:150] + '...' if len(product.description) > 150 else product.description,
+            'min_price': min_price,
+            'max_price': max_price,
+            'price_range': f"₱{min_price:,.2f}" + (f" - ₱{max_price:,.2f}" if max_price and max_price != min_price else "") if min_price is not None else None,
+            'compare_price': compare_price,
+            'shop_id': str(product.shop.id) if product.shop else None,
+            'shop_name': product.shop.name if product.shop else 'No Shop',
+            'category_id': str(product.category.id) if product.category else None,
+            'category_name': product.category.name if product.category else None,
+            'primary_image': primary_image_url,
+            'all_images': all_images,
+            'image_count': len(all_images),
+            'stock': stock,
+            'variant_count': sum(1 for v in product.variants.all() if v.is_active),
+            'is_out_of_stock': stock <= 0,
+            'created_at': product.created_at.isoformat()
+        })
+    
+    # 10. FORMAT TRENDING SHOPS
+    trending_shop_list = [
+        {
+            'id': str(shop.id),
+            'name': shop.name,
+            'description': shop.description or f"Shop in {shop.city}",
+            'follower_count': shop.follower_count,
+            'active_product_count': shop.active_product_count,
+            'total_sales': float(shop.total_sales),
+            'city': shop.city,
+            'verified': shop.verified,
+            'status': shop.status
+        }
+        for shop in trending_shops
+    ]
+    
+    # 11. BUILD RESPONSE
+    return {
+        'stats': {
+            'products_count': products_count,
+            'shops_count': shops_count,
+            'boosted_count': boosted_count,
+            'avg_rating': round(avg_rating, 1)
+        },
+        'categories': category_list,
+        'featured_products': product_list,
+        'trending_shops': trending_shop_list,
+        'hero_products': hero_products_list,  # CONTAINS REAL PRODUCTS - ONLY PUBLISHED
+        'ui_data': {
+            'hero_sections': hero_sections,  # Non-product links
+            'trust_badges': trust_badges
+        }
+    }
+
+
+class Landing(viewsets.ViewSet):
+    def list(self, request):
+        """
+        Get landing page data including stats, categories, and featured products.
+        The payload is precomputed and read from the shared cache; on a miss it
+        is built once and stored for every other client.
+        """
+        try:
+            payload = get_or_build_landing_payload(
+                lambda: build_landing_payload(request.build_absolute_uri)
+            )
         except Exception as e:
             print(f"Error in landing endpoint: {str(e)}")
             print(traceback.format_exc())
-            
-            # Minimal fallback
-            return Response({
-                'stats': {
-                    'products_count': 0,
-                    'shops_count': 0,
-                    'boosted_count': 0,
-                    'avg_rating': 4.8
-                },
-                'categories': [],
-                'featured_products': [],
-                'trending_shops': [],
-                'hero_products': [],
-                'ui_data': {
-                    'hero_sections': [],
-                    'trust_badges': []
-                }
-            }, status=status.HTTP_200_OK)
+            return Response(LANDING_FALLBACK_PAYLOAD, status=status.HTTP_200_OK)
+        
+        return Response(payload, status=status.HTTP_200_OK)
         
 class FetchUser(viewsets.ViewSet):
     
@@ -705,7 +764,7 @@ class Login(APIView):
             )
         
         # Login successful
-        return Response({
+        data = {
             "message": "Login successful",
             "user_id": str(user.id),  # Keep key as "user_id" but value from user.id
             "username": user.username,
@@ -715,7 +774,11 @@ class Login(APIView):
             "is_rider": user.is_rider,
             "is_moderator": user.is_moderator,
             "registration_stage": user.registration_stage
-        })
+        }
+        if user.is_rider:
+            # Authenticates the rider app's location socket (RiderLocationConsumer)
+            data["location_token"] = location_token(user.id)
+        return Response(data)
     
 class Register(APIView):
     def get(self, request):
@@ -846,62 +909,14 @@ class Profiling(APIView):
     
     def _get_coordinates_from_address(self, street, barangay, city, province, country="Philippines"):
         """
-        Get latitude and longitude from address using Google Maps Geocoding API
-        Returns (latitude, longitude) tuple
+        Get latitude and longitude for the address from the geocode cache
+        Returns (latitude, longitude) tuple, or (None, None) until the
+        geocode backfill has resolved a new address
         """
-        # Build full address string
-        address_parts = []
-        if street:
-            address_parts.append(street)
-        if barangay:
-            address_parts.append(barangay)
-        if city:
-            address_parts.append(city)
-        if province:
-            address_parts.append(province)
-        if country:
-            address_parts.append(country)
-        
-        full_address = ", ".join(filter(None, address_parts))
-        
-        if not full_address:
-            print(f"[GEOCODE] No address to geocode")
-            return None, None
-        
-        GOOGLE_MAPS_API_KEY = getattr(settings, 'GOOGLE_MAPS_API_KEY', None)
-        
-        if not GOOGLE_MAPS_API_KEY:
-            print(f"[GEOCODE] Google Maps API key not configured")
-            return None, None
-        
-        try:
-            url = "https://maps.googleapis.com/maps/api/geocode/json"
-            params = {
-                'address': full_address,
-                'key': GOOGLE_MAPS_API_KEY
-            }
-            
-            print(f"[GEOCODE] Geocoding address: {full_address}")
-            
-            response = requests.get(url, params=params, timeout=10)
-            data = response.json()
-            
-            if data.get('status') == 'OK':
-                location = data['results'][0]['geometry']['location']
-                latitude = location['lat']
-                longitude = location['lng']
-                print(f"[GEOCODE] ✅ Got coordinates: ({latitude}, {longitude})")
-                return Decimal(str(latitude)), Decimal(str(longitude))
-            else:
-                print(f"[GEOCODE] ❌ Geocoding failed: {data.get('status')}")
-                return None, None
-                
-        except requests.exceptions.Timeout:
-            print(f"[GEOCODE] ❌ Google Maps API timeout")
-            return None, None
-        except Exception as e:
-            print(f"[GEOCODE] ❌ Error: {str(e)}")
-            return None, None
+        latitude, longitude = lookup_coordinates(street, barangay, city, province, country)
+        if latitude is None:
+            print(f"[GEOCODE] No cached coordinates yet for: {street}, {barangay}, {city}, {province}")
+        return latitude, longitude
     
     def get(self, request):
         user_id = request.headers.get('X-User-Id')
@@ -985,7 +1000,7 @@ class Profiling(APIView):
         
         # Get coordinates from the address if address fields are present
         if has_address_data:
-            # Get coordinates from Google Maps API using the updated address
+            # Get coordinates for the updated address from the geocode cache
             latitude, longitude = self._get_coordinates_from_address(
                 street=updated_user.street,
                 barangay=updated_user.barangay,
@@ -1000,6 +1015,11 @@ class Profiling(APIView):
                 updated_user.longitude = longitude
                 updated_user.save(update_fields=['latitude', 'longitude'])
                 print(f"[PROFILE] Updated user {updated_user.id} with coordinates ({latitude}, {longitude})")
+            else:
+                # The old coordinates belong to the old address; the geocode backfill fills these in
+                updated_user.latitude = None
+                updated_user.longitude = None
+                updated_user.save(update_fields=['latitude', 'longitude'])
         
         # Create or update the default shipping address from user profile
         try:
@@ -1047,8 +1067,8 @@ class Profiling(APIView):
                 existing_default.zip_code = updated_user.zip_code or ""
                 existing_default.country = updated_user.country or "Philippines"
                 
-                # Update coordinates if available
-                if latitude and longitude:
+                # Update coordinates (cleared for the geocode backfill when the new address isn't known yet)
+                if has_address_data:
                     existing_default.latitude = latitude
                     existing_default.longitude = longitude
                 
@@ -1686,233 +1706,33 @@ class AdminDashboard(viewsets.ViewSet):
 
     def _get_sales_analytics_data(self, start_date, end_date, range_type='weekly'):
         try:
-            from decimal import Decimal
-            
-            sales_data = []
-            date_range_days = (end_date - start_date).days + 1
-
-            if range_type == 'daily' or date_range_days <= 7:
-                current_date = start_date
-                while current_date <= end_date:
-                    day_checkouts = Checkout.objects.filter(
-                        order__created_at__date=current_date
-                    )
-                    
-                    day_completed = day_checkouts.filter(order__status='completed')
-                    day_completed_revenue = day_completed.aggregate(
-                        revenue=Sum('total_amount')
-                    )['revenue'] or Decimal('0')
-                    
-                    day_pending = day_checkouts.filter(order__status__in=['pending', 'processing', 'shipped'])
-                    day_pending_revenue = day_pending.aggregate(
-                        revenue=Sum('total_amount')
-                    )['revenue'] or Decimal('0')
-                    
-                    day_revenue = day_completed_revenue + day_pending_revenue
-                    
-                    day_shipping = Delivery.objects.filter(
-                        order__created_at__date=current_date,
-                        status='delivered'
-                    ).aggregate(shipping=Sum('delivery_fee'))['shipping'] or Decimal('0')
-                    
-                    day_platform_fees = day_completed_revenue * Decimal('0.05')
-                    
-                    day_transaction_fees = day_checkouts.filter(
-                        transaction_fee__isnull=False
-                    ).aggregate(fees=Sum('transaction_fee'))['fees'] or Decimal('0')
-                    
-                    day_discounts = day_checkouts.filter(
-                        discount_applied__gt=0
-                    ).aggregate(discount=Sum('discount_applied'))['discount'] or Decimal('0')
-                    
-                    # Calculate VAT
-                    day_vat_collected = Decimal('0')
-                    for checkout in day_completed.select_related('cart_item__variant'):
-                        if checkout.cart_item and checkout.cart_item.variant:
-                            variant = checkout.cart_item.variant
-                            if variant.value_added_tax_amount:
-                                day_vat_collected += Decimal(str(variant.value_added_tax_amount)) * checkout.quantity
-                        elif checkout.direct_variant_id:
-                            try:
-                                variant = Variants.objects.get(id=checkout.direct_variant_id)
-                                if variant.value_added_tax_amount:
-                                    day_vat_collected += Decimal(str(variant.value_added_tax_amount)) * checkout.quantity
-                            except Variants.DoesNotExist:
-                                pass
-
-                    sales_data.append({
-                        'date': current_date.isoformat(),
-                        'name': current_date.strftime('%a, %b %d'),
-                        'revenue': float(day_revenue),
-                        'completed_revenue': float(day_completed_revenue),
-                        'pending_revenue': float(day_pending_revenue),
-                        'orders': day_checkouts.values('order').distinct().count(),
-                        'completed_orders': day_completed.values('order').distinct().count(),
-                        'pending_orders': day_pending.values('order').distinct().count(),
-                        'shipping_fees': float(day_shipping),
-                        'platform_fees': float(day_platform_fees),
-                        'transaction_fees': float(day_transaction_fees),
-                        'discounts': float(day_discounts),
-                        'vat_collected': float(day_vat_collected),
-                    })
-
-                    current_date += timedelta(days=1)
-                grouping = 'daily'
-
-            elif range_type == 'monthly' or date_range_days > 60:
-                monthly_sales = Checkout.objects.filter(
-                    order__created_at__date__gte=start_date,
-                    order__created_at__date__lte=end_date
-                ).annotate(
-                    month=TruncMonth('order__created_at')
-                ).values('month').annotate(
-                    total_revenue=Sum('total_amount'),
-                    unique_orders=Count('order', distinct=True)
-                ).order_by('month')
-
-                for month_data in monthly_sales:
-                    if month_data['month']:
-                        month_start = month_data['month'].date()
-                        month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-                        
-                        month_checkouts = Checkout.objects.filter(
-                            order__created_at__date__gte=month_start,
-                            order__created_at__date__lte=month_end
-                        )
-                        
-                        month_completed = month_checkouts.filter(order__status='completed')
-                        month_completed_revenue = month_completed.aggregate(
-                            revenue=Sum('total_amount')
-                        )['revenue'] or Decimal('0')
-                        
-                        month_pending = month_checkouts.filter(order__status__in=['pending', 'processing', 'shipped'])
-                        month_pending_revenue = month_pending.aggregate(
-                            revenue=Sum('total_amount')
-                        )['revenue'] or Decimal('0')
-                        
-                        month_revenue = month_completed_revenue + month_pending_revenue
-                        
-                        month_shipping = Delivery.objects.filter(
-                            order__created_at__date__gte=month_start,
-                            order__created_at__date__lte=month_end,
-                            status='delivered'
-                        ).aggregate(shipping=Sum('delivery_fee'))['shipping'] or Decimal('0')
-                        
-                        month_platform_fees = month_completed_revenue * Decimal('0.05')
-                        
-                        month_transaction_fees = month_checkouts.filter(
-                            transaction_fee__isnull=False
-                        ).aggregate(fees=Sum('transaction_fee'))['fees'] or Decimal('0')
-                        
-                        month_discounts = month_checkouts.filter(
-                            discount_applied__gt=0
-                        ).aggregate(discount=Sum('discount_applied'))['discount'] or Decimal('0')
-                        
-                        # Calculate VAT
-                        month_vat_collected = Decimal('0')
-                        for checkout in month_completed.select_related('cart_item__variant'):
-                            if checkout.cart_item and checkout.cart_item.variant:
-                                variant = checkout.cart_item.variant
-                                if variant.value_added_tax_amount:
-                                    month_vat_collected += Decimal(str(variant.value_added_tax_amount)) * checkout.quantity
-                            elif checkout.direct_variant_id:
-                                try:
-                                    variant = Variants.objects.get(id=checkout.direct_variant_id)
-                                    if variant.value_added_tax_amount:
-                                        month_vat_collected += Decimal(str(variant.value_added_tax_amount)) * checkout.quantity
-                                except Variants.DoesNotExist:
-                                    pass
+            # A handful of day-grouped queries for the whole range, rolled up into buckets
+            grouping, buckets = checkout_sales_series(start_date, end_date, range_type)
 
-                        sales_data.append({
-                            'date': month_data['month'].strftime('%Y-%m-%d'),
-                            'name': month_data['month'].strftime('%b %Y'),
-                            'revenue': float(month_revenue),
-                            'completed_revenue': float(month_completed_revenue),
-                            'pending_revenue': float(month_pending_revenue),
-                            'orders': month_data['unique_orders'] or 0,
-                            'completed_orders': month_completed.values('order').distinct().count(),
-                            'pending_orders': month_pending.values('order').distinct().count(),
-                            'shipping_fees': float(month_shipping),
-                            'platform_fees': float(month_platform_fees),
-                            'transaction_fees': float(month_transaction_fees),
-                            'discounts': float(month_discounts),
-                            'vat_collected': float(month_vat_collected),
-                        })
-                grouping = 'monthly'
-
-            else:
-                current_date = start_date
-                week_num = 1
-                while current_date <= end_date:
-                    week_end = min(current_date + timedelta(days=6), end_date)
-                    
-                    week_checkouts = Checkout.objects.filter(
-                        order__created_at__date__gte=current_date,
-                        order__created_at__date__lte=week_end
-                    )
-                    
-                    week_completed = week_checkouts.filter(order__status='completed')
-                    week_completed_revenue = week_completed.aggregate(
-                        revenue=Sum('total_amount')
-                    )['revenue'] or Decimal('0')
-                    
-                    week_pending = week_checkouts.filter(order__status__in=['pending', 'processing', 'shipped'])
-                    week_pending_revenue = week_pending.aggregate(
-                        revenue=Sum('total_amount')
-                    )['revenue'] or Decimal('0')
-                    
-                    week_revenue = week_completed_revenue + week_pending_revenue
-                    
-                    week_shipping = Delivery.objects.filter(
-                        order__created_at__date__gte=current_date,
-                        order__created_at__date__lte=week_end,
-                        status='delivered'
-                    ).aggregate(shipping=Sum('delivery_fee'))['shipping'] or Decimal('0')
-                    
-                    week_platform_fees = week_completed_revenue * Decimal('0.05')
-                    
-                    week_transaction_fees = week_checkouts.filter(
-                        transaction_fee__isnull=False
-                    ).aggregate(fees=Sum('transaction_fee'))['fees'] or Decimal('0')
-                    
-                    week_discounts = week_checkouts.filter(
-                        discount_applied__gt=0
-                    ).aggregate(discount=Sum('discount_applied'))['discount'] or Decimal('0')
-                    
-                    # Calculate VAT
-                    week_vat_collected = Decimal('0')
-                    for checkout in week_completed.select_related('cart_item__variant'):
-                        if checkout.cart_item and checkout.cart_item.variant:
-                            variant = checkout.cart_item.variant
-                            if variant.value_added_tax_amount:
-                                week_vat_collected += Decimal(str(variant.value_added_tax_amount)) * checkout.quantity
-                        elif checkout.direct_variant_id:
-                            try:
-                                variant = Variants.objects.get(id=checkout.direct_variant_id)
-                                if variant.value_added_tax_amount:
-                                    week_vat_collected += Decimal(str(variant.value_added_tax_amount)) * checkout.quantity
-                            except Variants.DoesNotExist:
-                                pass
-
-                    sales_data.append({
-                        'date': current_date.isoformat(),
-                        'name': f'Week {week_num}',
-                        'revenue': float(week_revenue),
-                        'completed_revenue': float(week_completed_revenue),
-                        'pending_revenue': float(week_pending_revenue),
-                        'orders': week_checkouts.values('order').distinct().count(),
-                        'completed_orders': week_completed.values('order').distinct().count(),
-                        'pending_orders': week_pending.values('order').distinct().count(),
-                        'shipping_fees': float(week_shipping),
-                        'platform_fees': float(week_platform_fees),
-                        'transaction_fees': float(week_transaction_fees),
-                        'discounts': float(week_discounts),
-                        'vat_collected': float(week_vat_collected),
-                    })
-
-                    current_date = week_end + timedelta(days=1)
-                    week_num += 1
-                grouping = 'weekly'
+            sales_data = []
+            for bucket in buckets:
+                if grouping == 'daily':
+                    date, name = bucket['start'].isoformat(), bucket['start'].strftime('%a, %b %d')
+                elif grouping == 'monthly':
+                    date, name = bucket['period_start'].strftime('%Y-%m-%d'), bucket['period_start'].strftime('%b %Y')
+                else:
+                    date, name = bucket['start'].isoformat(), f"Week {bucket['number']}"
+
+                sales_data.append({
+                    'date': date,
+                    'name': name,
+                    'revenue': float(bucket['revenue']),
+                    'completed_revenue': float(bucket['completed_revenue']),
+                    'pending_revenue': float(bucket['pending_revenue']),
+                    'orders': bucket['orders'],
+                    'completed_orders': bucket['completed_orders'],
+                    'pending_orders': bucket['pending_orders'],
+                    'shipping_fees': float(bucket['shipping_fees']),
+                    'platform_fees': float(bucket['platform_fees']),
+                    'transaction_fees': float(bucket['transaction_fees']),
+                    'discounts': float(bucket['discounts']),
+                    'vat_collected': float(bucket['vat_collected']),
+                })
 
             order_status_data = Order.objects.filter(
                 created_at__date__gte=start_date,
@@ -2501,246 +2321,33 @@ class AdminAnalytics(viewsets.ViewSet):
     
     def _get_order_sales_analytics(self, start_date, end_date, range_type='weekly'):
         try:
-            from decimal import Decimal
-            
-            date_range_days = (end_date - start_date).days + 1
-            
-            if range_type == 'daily' or date_range_days <= 7:
-                current_date = start_date
-                order_metrics_data = []
-                
-                while current_date <= end_date:
-                    # Use Checkout instead of Order for more accurate data
-                    day_checkouts = Checkout.objects.filter(
-                        order__created_at__date=current_date
-                    )
-                    
-                    day_completed = day_checkouts.filter(order__status='completed')
-                    day_completed_revenue = day_completed.aggregate(total=Sum('total_amount'))['total'] or Decimal('0')
-                    
-                    day_pending = day_checkouts.filter(order__status__in=['pending', 'processing', 'shipped'])
-                    day_pending_revenue = day_pending.aggregate(total=Sum('total_amount'))['total'] or Decimal('0')
-                    
-                    day_revenue = day_completed_revenue + day_pending_revenue
-                    day_orders = day_checkouts.values('order').distinct().count()
-                    day_avg_order = day_revenue / day_orders if day_orders > 0 else 0
-                    
-                    # Calculate transaction fees
-                    day_transaction_fees = day_checkouts.filter(
-                        transaction_fee__isnull=False
-                    ).aggregate(total=Sum('transaction_fee'))['total'] or Decimal('0')
-                    
-                    # Calculate shipping fees
-                    day_shipping_fees = Delivery.objects.filter(
-                        order__created_at__date=current_date,
-                        status='delivered'
-                    ).aggregate(total=Sum('delivery_fee'))['total'] or Decimal('0')
-                    
-                    # Calculate VAT
-                    day_vat = Decimal('0')
-                    for checkout in day_completed.select_related('cart_item__variant'):
-                        if checkout.cart_item and checkout.cart_item.variant:
-                            variant = checkout.cart_item.variant
-                            if variant.value_added_tax_amount:
-                                day_vat += Decimal(str(variant.value_added_tax_amount)) * checkout.quantity
-                        elif checkout.direct_variant_id:
-                            try:
-                                variant = Variants.objects.get(id=checkout.direct_variant_id)
-                                if variant.value_added_tax_amount:
-                                    day_vat += Decimal(str(variant.value_added_tax_amount)) * checkout.quantity
-                            except Variants.DoesNotExist:
-                                pass
-                    
-                    # Calculate discounts
-                    day_discounts = day_checkouts.filter(
-                        discount_applied__gt=0
-                    ).aggregate(total=Sum('discount_applied'))['total'] or Decimal('0')
-                    
-                    # Platform fees (5% of completed revenue)
-                    day_platform_fees = day_completed_revenue * Decimal('0.05')
-                    
-                    # Refunds (cancelled orders)
-                    refunds = Order.objects.filter(
-                        created_at__date=current_date,
-                        status='cancelled'
-                    ).count()
-                    
-                    order_metrics_data.append({
-                        'month': current_date.strftime('%a, %b %d'),
-                        'revenue': float(day_revenue),
-                        'completed_revenue': float(day_completed_revenue),
-                        'pending_revenue': float(day_pending_revenue),
-                        'orders': day_orders,
-                        'avgOrderValue': float(day_avg_order),
-                        'transaction_fees': float(day_transaction_fees),
-                        'shipping_fees': float(day_shipping_fees),
-                        'vat_collected': float(day_vat),
-                        'discounts': float(day_discounts),
-                        'platform_fees': float(day_platform_fees),
-                        'refunds': refunds,
-                    })
-                    
-                    current_date += timedelta(days=1)
-                    
-            elif range_type == 'monthly' or date_range_days > 60:
-                monthly_orders = Checkout.objects.filter(
-                    order__created_at__date__gte=start_date,
-                    order__created_at__date__lte=end_date
-                ).annotate(
-                    month=TruncMonth('order__created_at')
-                ).values('month').annotate(
-                    total_revenue=Sum('total_amount'),
-                    unique_orders=Count('order', distinct=True)
-                ).order_by('month')
-                
-                order_metrics_data = []
-                for month_data in monthly_orders:
-                    if month_data['month']:
-                        month_start = month_data['month'].date()
-                        month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-                        
-                        month_checkouts = Checkout.objects.filter(
-                            order__created_at__date__gte=month_start,
-                            order__created_at__date__lte=month_end
-                        )
-                        
-                        month_completed = month_checkouts.filter(order__status='completed')
-                        month_completed_revenue = month_completed.aggregate(total=Sum('total_amount'))['total'] or Decimal('0')
-                        
-                        month_pending = month_checkouts.filter(order__status__in=['pending', 'processing', 'shipped'])
-                        month_pending_revenue = month_pending.aggregate(total=Sum('total_amount'))['total'] or Decimal('0')
-                        
-                        month_revenue = month_completed_revenue + month_pending_revenue
-                        month_orders = month_data['unique_orders'] or 0
-                        month_avg_order = month_revenue / month_orders if month_orders > 0 else 0
-                        
-                        month_transaction_fees = month_checkouts.filter(
-                            transaction_fee__isnull=False
-                        ).aggregate(total=Sum('transaction_fee'))['total'] or Decimal('0')
-                        
-                        month_shipping_fees = Delivery.objects.filter(
-                            order__created_at__date__gte=month_start,
-                            order__created_at__date__lte=month_end,
-                            status='delivered'
-                        ).aggregate(total=Sum('delivery_fee'))['total'] or Decimal('0')
-                        
-                        month_vat = Decimal('0')
-                        for checkout in month_completed.select_related('cart_item__variant'):
-                            if checkout.cart_item and checkout.cart_item.variant:
-                                variant = checkout.cart_item.variant
-                                if variant.value_added_tax_amount:
-                                    month_vat += Decimal(str(variant.value_added_tax_amount)) * checkout.quantity
-                            elif checkout.direct_variant_id:
-                                try:
-                                    variant = Variants.objects.get(id=checkout.direct_variant_id)
-                                    if variant.value_added_tax_amount:
-                                        month_vat += Decimal(str(variant.value_added_tax_amount)) * checkout.quantity
-                                except Variants.DoesNotExist:
-                                    pass
-                        
-                        month_discounts = month_checkouts.filter(
-                            discount_applied__gt=0
-                        ).aggregate(total=Sum('discount_applied'))['total'] or Decimal('0')
-                        
-                        month_platform_fees = month_completed_revenue * Decimal('0.05')
-                        
-                        refunds = Order.objects.filter(
-                            created_at__date__gte=month_start,
-                            created_at__date__lte=month_end,
-                            status='cancelled'
-                        ).count()
-                        
-                        order_metrics_data.append({
-                            'month': month_data['month'].strftime('%b %Y'),
-                            'revenue': float(month_revenue),
-                            'completed_revenue': float(month_completed_revenue),
-                            'pending_revenue': float(month_pending_revenue),
-                            'orders': month_orders,
-                            'avgOrderValue': float(month_avg_order),
-                            'transaction_fees': float(month_transaction_fees),
-                            'shipping_fees': float(month_shipping_fees),
-                            'vat_collected': float(month_vat),
-                            'discounts': float(month_discounts),
-                            'platform_fees': float(month_platform_fees),
-                            'refunds': refunds,
-                        })
-            else:
-                current_date = start_date
-                week_num = 1
-                order_metrics_data = []
-                
-                while current_date <= end_date:
-                    week_end = min(current_date + timedelta(days=6), end_date)
-                    
-                    week_checkouts = Checkout.objects.filter(
-                        order__created_at__date__gte=current_date,
-                        order__created_at__date__lte=week_end
-                    )
-                    
-                    week_completed = week_checkouts.filter(order__status='completed')
-                    week_completed_revenue = week_completed.aggregate(total=Sum('total_amount'))['total'] or Decimal('0')
-                    
-                    week_pending = week_checkouts.filter(order__status__in=['pending', 'processing', 'shipped'])
-                    week_pending_revenue = week_pending.aggregate(total=Sum('total_amount'))['total'] or Decimal('0')
-                    
-                    week_revenue = week_completed_revenue + week_pending_revenue
-                    week_orders = week_checkouts.values('order').distinct().count()
-                    week_avg_order = week_revenue / week_orders if week_orders > 0 else 0
-                    
-                    week_transaction_fees = week_checkouts.filter(
-                        transaction_fee__isnull=False
-                    ).aggregate(total=Sum('transaction_fee'))['total'] or Decimal('0')
-                    
-                    week_shipping_fees = Delivery.objects.filter(
-                        order__created_at__date__gte=current_date,
-                        order__created_at__date__lte=week_end,
-                        status='delivered'
-                    ).aggregate(total=Sum('delivery_fee'))['total'] or Decimal('0')
-                    
-                    week_vat = Decimal('0')
-                    for checkout in week_completed.select_related('cart_item__variant'):
-                        if checkout.cart_item and checkout.cart_item.variant:
-                            variant = checkout.cart_item.variant
-                            if variant.value_added_tax_amount:
-                                week_vat += Decimal(str(variant.value_added_tax_amount)) * checkout.quantity
-                        elif checkout.direct_variant_id:
-                            try:
-                                variant = Variants.objects.get(id=checkout.direct_variant_id)
-                                if variant.value_added_tax_amount:
-                                    week_vat += Decimal(str(variant.value_added_tax_amount)) * checkout.quantity
-                            except Variants.DoesNotExist:
-                                pass
-                    
-                    week_discounts = week_checkouts.filter(
-                        discount_applied__gt=0
-                    ).aggregate(total=Sum('discount_applied'))['total'] or Decimal('0')
-                    
-                    week_platform_fees = week_completed_revenue * Decimal('0.05')
-                    
-                    refunds = Order.objects.filter(
-                        created_at__date__gte=current_date,
-                        created_at__date__lte=week_end,
-                        status='cancelled'
-                    ).count()
-                    
-                    order_metrics_data.append({
-                        'month': f'Week {week_num}',
-                        'revenue': float(week_revenue),
-                        'completed_revenue': float(week_completed_revenue),
-                        'pending_revenue': float(week_pending_revenue),
-                        'orders': week_orders,
-                        'avgOrderValue': float(week_avg_order),
-                        'transaction_fees': float(week_transaction_fees),
-                        'shipping_fees': float(week_shipping_fees),
-                        'vat_collected': float(week_vat),
-                        'discounts': float(week_discounts),
-                        'platform_fees': float(week_platform_fees),
-                        'refunds': refunds,
-                    })
-                    
-                    current_date = week_end + timedelta(days=1)
-                    week_num += 1
-            
+            # A handful of day-grouped queries for the whole range, rolled up into buckets
+            grouping, buckets = checkout_sales_series(start_date, end_date, range_type, include_refunds=True)
+
+            order_metrics_data = []
+            for bucket in buckets:
+                if grouping == 'daily':
+                    label = bucket['start'].strftime('%a, %b %d')
+                elif grouping == 'monthly':
+                    label = bucket['period_start'].strftime('%b %Y')
+                else:
+                    label = f"Week {bucket['number']}"
+
+                order_metrics_data.append({
+                    'month': label,
+                    'revenue': float(bucket['revenue']),
+                    'completed_revenue': float(bucket['completed_revenue']),
+                    'pending_revenue': float(bucket['pending_revenue']),
+                    'orders': bucket['orders'],
+                    'avgOrderValue': float(bucket['avg_order_value']),
+                    'transaction_fees': float(bucket['transaction_fees']),
+                    'shipping_fees': float(bucket['shipping_fees']),
+                    'vat_collected': float(bucket['vat_collected']),
+                    'discounts': float(bucket['discounts']),
+                    'platform_fees': float(bucket['platform_fees']),
+                    'refunds': bucket['refunds'],
+                })
+
             # Order status distribution
             order_status_data = Order.objects.filter(
                 created_at__date__gte=start_date,
@@ -2914,123 +2521,68 @@ class AdminAnalytics(viewsets.ViewSet):
         try:
             from decimal import Decimal
             
-            product_stats = Checkout.objects.filter(
-                order__created_at__date__gte=start_date,
-                order__created_at__date__lte=end_date,
-                cart_item__product__isnull=False
-            ).values(
-                'cart_item__product__id',
-                'cart_item__product__name'
-            ).annotate(
-                order_count=Count('order', distinct=True),
-                total_revenue=Sum('total_amount'),
-                total_quantity=Sum('quantity')
-            ).order_by('-total_revenue')[:10]
+            # Top products and categories come from the daily product rollup
+            product_stats = product_sales_totals(start_date, end_date, limit=10)
+            products_by_id = Product.objects.in_bulk([stat['product_id'] for stat in product_stats])
             
             product_performance = []
             for stat in product_stats:
-                product_id = stat['cart_item__product__id']
-                product_name = stat['cart_item__product__name'] or 'Unknown Product'
-                
-                try:
-                    product = Product.objects.get(id=product_id)
-                    
-                    views = CustomerActivity.objects.filter(
-                        product=product,
-                        activity_type='view',
-                        created_at__date__gte=start_date,
-                        created_at__date__lte=end_date
-                    ).count()
-                    
-                    # FIX: Remove created_at filter since Favorites doesn't have it
-                    favorites = Favorites.objects.filter(product=product).count()
-                    
-                    total_stock = product.total_stock
-                    
-                    # Calculate transaction fees for this product
-                    product_transaction_fees = Checkout.objects.filter(
-                        order__created_at__date__gte=start_date,
-                        order__created_at__date__lte=end_date,
-                        cart_item__product__id=product_id,
-                        transaction_fee__isnull=False
-                    ).aggregate(total=Sum('transaction_fee'))['total'] or Decimal('0')
-                    
-                    # Calculate VAT for this product
-                    product_vat = Decimal('0')
-                    product_checkouts = Checkout.objects.filter(
-                        order__created_at__date__gte=start_date,
-                        order__created_at__date__lte=end_date,
-                        cart_item__product__id=product_id,
-                        order__status='completed'
-                    ).select_related('cart_item__variant')
-                    
-                    for checkout in product_checkouts:
-                        if checkout.cart_item and checkout.cart_item.variant:
-                            variant = checkout.cart_item.variant
-                            if variant.value_added_tax_amount:
-                                product_vat += Decimal(str(variant.value_added_tax_amount)) * checkout.quantity
-                        elif checkout.direct_variant_id:
-                            try:
-                                variant = Variants.objects.get(id=checkout.direct_variant_id)
-                                if variant.value_added_tax_amount:
-                                    product_vat += Decimal(str(variant.value_added_tax_amount)) * checkout.quantity
-                            except Variants.DoesNotExist:
-                                pass
-                    
-                    product_revenue = float(stat['total_revenue'] or 0)
-                    product_quantity = stat['total_quantity'] or 0
-                    
-                    product_performance.append({
-                        'name': product_name[:30] + ('...' if len(product_name) > 30 else ''),
-                        'orders': stat['order_count'],
-                        'revenue': product_revenue,
-                        'quantity_sold': product_quantity,
-                        'average_price': round(product_revenue / product_quantity, 2) if product_quantity > 0 else 0,
-                        'transaction_fees': float(product_transaction_fees),
-                        'vat_collected': float(product_vat),
-                        'views': views,
-                        'favorites': favorites,
-                        'stock': total_stock,
-                    })
-                except Product.DoesNotExist:
+                product = products_by_id.get(stat['product_id'])
+                if not product:
                     continue
+                
+                product_name = product.name or 'Unknown Product'
+                
+                views = CustomerActivity.objects.filter(
+                    product=product,
+                    activity_type='view',
+                    created_at__date__gte=start_date,
+                    created_at__date__lte=end_date
+                ).count()
+                
+                # FIX: Remove created_at filter since Favorites doesn't have it
+                favorites = Favorites.objects.filter(product=product).count()
+                
+                total_stock = product.total_stock
+                
+                product_revenue = float(stat['revenue'] or 0)
+                product_quantity = stat['quantity'] or 0
+                
+                product_performance.append({
+                    'name': product_name[:30] + ('...' if len(product_name) > 30 else ''),
+                    'orders': stat['orders'],
+                    'revenue': product_revenue,
+                    'quantity_sold': product_quantity,
+                    'average_price': round(product_revenue / product_quantity, 2) if product_quantity > 0 else 0,
+                    'transaction_fees': float(stat['transaction_fees'] or 0),
+                    'vat_collected': float(stat['vat_collected'] or 0),
+                    'views': views,
+                    'favorites': favorites,
+                    'stock': total_stock,
+                })
             
-            category_stats = Checkout.objects.filter(
-                order__created_at__date__gte=start_date,
-                order__created_at__date__lte=end_date,
-                cart_item__product__category__isnull=False
-            ).values(
-                'cart_item__product__category__id',
-                'cart_item__product__category__name'
-            ).annotate(
-                total_revenue=Sum('total_amount'),
-                product_count=Count('cart_item__product', distinct=True),
-                total_quantity=Sum('quantity')
-            ).order_by('-total_revenue')[:10]
+            category_stats = category_sales_totals(start_date, end_date, limit=10)
+            categories_by_id = Category.objects.in_bulk([stat['category_id'] for stat in category_stats])
             
             category_data = []
             for stat in category_stats:
-                category_id = stat['cart_item__product__category__id']
-                category_name = stat['cart_item__product__category__name'] or 'Unknown Category'
-                
-                try:
-                    category = Category.objects.get(id=category_id)
-                    
-                    avg_rating = Review.objects.filter(
-                        product__category=category,
-                        created_at__date__gte=start_date,
-                        created_at__date__lte=end_date
-                    ).aggregate(avg=Avg('average_rating'))['avg'] or 0
-                    
-                    category_data.append({
-                        'category': category_name,
-                        'revenue': float(stat['total_revenue'] or 0),
-                        'products': stat['product_count'],
-                        'quantity_sold': stat['total_quantity'],
-                        'avgRating': round(float(avg_rating), 1)
-                    })
-                except Category.DoesNotExist:
+                category = categories_by_id.get(stat['category_id'])
+                if not category:
                     continue
+                
+                avg_rating = Review.objects.filter(
+                    product__category=category,
+                    created_at__date__gte=start_date,
+                    created_at__date__lte=end_date
+                ).aggregate(avg=Avg('average_rating'))['avg'] or 0
+                
+                category_data.append({
+                    'category': category.name or 'Unknown Category',
+                    'revenue': float(stat['revenue'] or 0),
+                    'products': stat['products'],
+                    'quantity_sold': stat['quantity'],
+                    'avgRating': round(float(avg_rating), 1)
+                })
             
             products_with_low_stock = 0
             products_with_stock = 0
@@ -3102,110 +2654,52 @@ class AdminAnalytics(viewsets.ViewSet):
         try:
             from decimal import Decimal
             
-            shop_stats = Checkout.objects.filter(
-                order__created_at__date__gte=start_date,
-                order__created_at__date__lte=end_date,
-                cart_item__product__shop__isnull=False
-            ).values(
-                'cart_item__product__shop__id',
-                'cart_item__product__shop__name'
-            ).annotate(
-                total_sales=Sum('total_amount'),
-                order_count=Count('order', distinct=True),
-                total_items=Sum('quantity')
-            ).order_by('-total_sales')[:10]
+            # Top shops come from the daily shop rollup (plus today's live totals)
+            shop_stats = shop_sales_totals(start_date, end_date, limit=10)
+            shops_by_id = Shop.objects.in_bulk([stat['shop_id'] for stat in shop_stats])
             
             shop_performance = []
             for stat in shop_stats:
-                shop_id = stat['cart_item__product__shop__id']
-                shop_name = stat['cart_item__product__shop__name'] or 'Unknown Shop'
-                
-                try:
-                    shop = Shop.objects.get(id=shop_id)
-                    
-                    shop_sales = float(stat['total_sales'] or 0)
-                    shop_orders = stat['order_count'] or 0
-                    shop_items = stat['total_items'] or 0
-                    
-                    # Calculate platform fees (5% of sales)
-                    platform_fee = shop_sales * 0.05
-                    
-                    # Calculate transaction fees for this shop
-                    shop_transaction_fees = Checkout.objects.filter(
-                        order__created_at__date__gte=start_date,
-                        order__created_at__date__lte=end_date,
-                        cart_item__product__shop=shop,
-                        transaction_fee__isnull=False
-                    ).aggregate(total=Sum('transaction_fee'))['total'] or Decimal('0')
-                    
-                    # Calculate shipping fees for this shop
-                    shop_shipping_fees = Delivery.objects.filter(
-                        order__created_at__date__gte=start_date,
-                        order__created_at__date__lte=end_date,
-                        shop=shop,
-                        status='delivered'
-                    ).aggregate(total=Sum('delivery_fee'))['total'] or Decimal('0')
-                    
-                    # Calculate VAT for this shop
-                    shop_vat = Decimal('0')
-                    shop_checkouts = Checkout.objects.filter(
-                        order__created_at__date__gte=start_date,
-                        order__created_at__date__lte=end_date,
-                        cart_item__product__shop=shop,
-                        order__status='completed'
-                    ).select_related('cart_item__variant')
-                    
-                    for checkout in shop_checkouts:
-                        if checkout.cart_item and checkout.cart_item.variant:
-                            variant = checkout.cart_item.variant
-                            if variant.value_added_tax_amount:
-                                shop_vat += Decimal(str(variant.value_added_tax_amount)) * checkout.quantity
-                        elif checkout.direct_variant_id:
-                            try:
-                                variant = Variants.objects.get(id=checkout.direct_variant_id)
-                                if variant.value_added_tax_amount:
-                                    shop_vat += Decimal(str(variant.value_added_tax_amount)) * checkout.quantity
-                            except Variants.DoesNotExist:
-                                pass
-                    
-                    # Calculate discounts given by this shop
-                    shop_discounts = Checkout.objects.filter(
-                        order__created_at__date__gte=start_date,
-                        order__created_at__date__lte=end_date,
-                        cart_item__product__shop=shop,
-                        discount_applied__gt=0
-                    ).aggregate(total=Sum('discount_applied'))['total'] or Decimal('0')
-                    
-                    avg_rating = Review.objects.filter(
-                        shop=shop,
-                        created_at__date__gte=start_date,
-                        created_at__date__lte=end_date
-                    ).aggregate(avg=Avg('average_rating'))['avg'] or 0
-                    
-                    follower_count = ShopFollow.objects.filter(shop=shop).count()
-                    product_count = Product.objects.filter(
-                        shop=shop,
-                        is_removed=False,
-                        upload_status='published'
-                    ).count()
-                    
-                    shop_performance.append({
-                        'name': shop_name,
-                        'sales': round(shop_sales, 2),
-                        'orders': shop_orders,
-                        'items_sold': shop_items,
-                        'average_order_value': round(shop_sales / shop_orders, 2) if shop_orders > 0 else 0,
-                        'platform_fee': round(platform_fee, 2),
-                        'transaction_fees': round(float(shop_transaction_fees), 2),
-                        'shipping_fees': round(float(shop_shipping_fees), 2),
-                        'vat_collected': round(float(shop_vat), 2),
-                        'discounts_given': round(float(shop_discounts), 2),
-                        'rating': round(float(avg_rating), 1),
-                        'followers': follower_count,
-                        'products': product_count
-                    })
-                except Shop.DoesNotExist:
+                shop = shops_by_id.get(stat['shop_id'])
+                if not shop:
                     continue
+                
+                shop_name = shop.name or 'Unknown Shop'
+                shop_sales = float(stat['sales'] or 0)
+                shop_orders = stat['orders'] or 0
+                shop_items = stat['items_sold'] or 0
+                
+                # Calculate platform fees (5% of sales)
+                platform_fee = shop_sales * 0.05
+                
+                avg_rating = Review.objects.filter(
+                    shop=shop,
+                    created_at__date__gte=start_date,
+                    created_at__date__lte=end_date
+                ).aggregate(avg=Avg('average_rating'))['avg'] or 0
+                
+                follower_count = ShopFollow.objects.filter(shop=shop).count()
+                product_count = Product.objects.filter(
+                    shop=shop,
+                    is_removed=False,
+                    upload_status='published'
+                ).count()
+                
+                shop_performance.append({
+                    'name': shop_name,
+                    'sales': round(shop_sales, 2),
+                    'orders': shop_orders,
+                    'items_sold': shop_items,
+                    'average_order_value': round(shop_sales / shop_orders, 2) if shop_orders > 0 else 0,
+                    'platform_fee': round(platform_fee, 2),
+                    'transaction_fees': round(float(stat['transaction_fees'] or 0), 2),
+                    'shipping_fees': round(float(stat['shipping_fees'] or 0), 2),
+                    'vat_collected': round(float(stat['vat_collected'] or 0), 2),
+                    'discounts_given': round(float(stat['discounts'] or 0), 2),
+                    'rating': round(float(avg_rating), 1),
+                    'followers': follower_count,
+                    'products': product_count
+                })
             
             date_range_days = (end_date - start_date).days + 1
             
@@ -3718,45 +3212,6 @@ class AdminProduct(viewsets.ViewSet):
     Admin viewset for managing products with comprehensive data
     """
     
-    def _send_websocket_notification(self, user_id, notification):
-        """
-        Send real-time notification via WebSocket to specific user
-        """
-        try:
-            channel_layer = get_channel_layer()
-            group_name = f'notifications_{user_id}'
-            
-            async_to_sync(channel_layer.group_send)(
-                group_name,
-                {
-                    'type': 'notification',
-                    'notification_id': str(notification.id),
-                    'title': notification.title,
-                    'message': notification.message,
-                    'notification_type': notification.type,
-                    'created_at': str(notification.created_at),
-                    'data': {}
-                }
-            )
-            
-            unread_count = Notification.objects.filter(
-                user_id=user_id,
-                is_read=False
-            ).count()
-            
-            async_to_sync(channel_layer.group_send)(
-                group_name,
-                {
-                    'type': 'unread_count',
-                    'count': unread_count
-                }
-            )
-            
-            print(f"WebSocket notification sent to user {user_id}")
-        except Exception as e:
-            print(f"Error sending websocket notification: {str(e)}")
-            traceback.print_exc()
-
     @action(detail=False, methods=['get'])
     def get_metrics(self, request):
         """
@@ -4662,14 +4117,13 @@ class AdminProduct(viewsets.ViewSet):
                     )
                     
                     if product.customer and product.customer.customer:
-                        notification = Notification.objects.create(
+                        notify(
                             user=product.customer.customer,
                             title="Product Published",
                             type="product_published",
                             message=f"Your product '{product.name}' has been published and is now live.",
                             is_read=False
                         )
-                        self._send_websocket_notification(product.customer.customer.id, notification)
                     
                     return Response({
                         "message": "Product published successfully",
@@ -4716,14 +4170,13 @@ class AdminProduct(viewsets.ViewSet):
                     )
                     
                     if product.customer and product.customer.customer:
-                        notification = Notification.objects.create(
+                        notify(
                             user=product.customer.customer,
                             title="Product Unpublished",
                             type="product_unpublished",
                             message=f"Your product '{product.name}' has been unpublished and is now in draft mode.",
                             is_read=False
                         )
-                        self._send_websocket_notification(product.customer.customer.id, notification)
                     
                     return Response({
                         "message": "Product unpublished successfully",
@@ -4747,14 +4200,13 @@ class AdminProduct(viewsets.ViewSet):
                     )
                     
                     if product.customer and product.customer.customer:
-                        notification = Notification.objects.create(
+                        notify(
                             user=product.customer.customer,
                             title="Product Archived",
                             type="product_archived",
                             message=f"Your product '{product.name}' has been archived.",
                             is_read=False
                         )
-                        self._send_websocket_notification(product.customer.customer.id, notification)
                     
                     return Response({
                         "message": "Product archived successfully",
@@ -4778,14 +4230,13 @@ class AdminProduct(viewsets.ViewSet):
                     )
                     
                     if product.customer and product.customer.customer:
-                        notification = Notification.objects.create(
+                        notify(
                             user=product.customer.customer,
                             title="Product Restored",
                             type="product_restored",
                             message=f"Your product '{product.name}' has been restored from archive.",
                             is_read=False
                         )
-                        self._send_websocket_notification(product.customer.customer.id, notification)
                     
                     return Response({
                         "message": "Product restored successfully",
@@ -4817,14 +4268,13 @@ class AdminProduct(viewsets.ViewSet):
                     )
                     
                     if product.customer and product.customer.customer:
-                        notification = Notification.objects.create(
+                        notify(
                             user=product.customer.customer,
                             title="Product Removed",
                             type="product_removal",
                             message=f"Your product '{product.name}' has been removed. Reason: {reason}",
                             is_read=False
                         )
-                        self._send_websocket_notification(product.customer.customer.id, notification)
                     
                     return Response({
                         "message": "Product removed successfully",
@@ -4852,14 +4302,13 @@ class AdminProduct(viewsets.ViewSet):
                     )
                     
                     if product.customer and product.customer.customer:
-                        notification = Notification.objects.create(
+                        notify(
                             user=product.customer.customer,
                             title="Product Restored",
                             type="product_restoration",
                             message=f"Your product '{product.name}' has been restored.",
                             is_read=False
                         )
-                        self._send_websocket_notification(product.customer.customer.id, notification)
                     
                     return Response({
                         "message": "Product restored successfully",
@@ -4895,14 +4344,13 @@ class AdminProduct(viewsets.ViewSet):
                     )
                     
                     if product.customer and product.customer.customer:
-                        notification = Notification.objects.create(
+                        notify(
                             user=product.customer.customer,
                             title="Product Suspended",
                             type="product_suspension",
                             message=f"Your product '{product.name}' has been suspended for {suspension_days} days. Reason: {reason}",
                             is_read=False
                         )
-                        self._send_websocket_notification(product.customer.customer.id, notification)
                     
                     return Response({
                         "message": "Product suspended successfully",
@@ -4927,14 +4375,13 @@ class AdminProduct(viewsets.ViewSet):
                     )
                     
                     if product.customer and product.customer.customer:
-                        notification = Notification.objects.create(
+                        notify(
                             user=product.customer.customer,
                             title="Product Unsuspended",
                             type="product_unsuspension",
                             message=f"Your product '{product.name}' has been unsuspended.",
                             is_read=False
                         )
-                        self._send_websocket_notification(product.customer.customer.id, notification)
                     
                     return Response({
                         "message": "Product unsuspended successfully",
@@ -6686,7 +6133,7 @@ class AdminShops(viewsets.ViewSet):
 
             def notify_owner(title, notif_type, message):
                 if shop.customer and shop.customer.customer:
-                    Notification.objects.create(
+                    notify(
                         user=shop.customer.customer,
                         title=title,
                         type=notif_type,
@@ -8559,7 +8006,7 @@ class AdminOrders(viewsets.ViewSet):
             order.save()
 
             try:
-                Notification.objects.create(
+                notify(
                     user=order.user,
                     title='Order Shipped',
                     type='order',
@@ -8622,7 +8069,7 @@ class AdminOrders(viewsets.ViewSet):
                             wallet=wallet, order=order, shop=shop, status='pending'
                         ).update(status='completed')
 
-                        Notification.objects.create(
+                        notify(
                             user=seller,
                             title='Payment Released',
                             type='wallet',
@@ -8633,7 +8080,7 @@ class AdminOrders(viewsets.ViewSet):
                 print(f"Error releasing wallet balance: {wallet_error}")
 
             try:
-                Notification.objects.create(
+                notify(
                     user=order.user,
                     title='Order Delivered',
                     type='order',
@@ -8672,7 +8119,7 @@ class AdminOrders(viewsets.ViewSet):
             order.save()
 
             try:
-                Notification.objects.create(
+                notify(
                     user=order.user,
                     title='Order Refunded',
                     type='order',
@@ -8821,7 +8268,7 @@ class AdminOrders(viewsets.ViewSet):
             )
             
             # Create notification for rider
-            Notification.objects.create(
+            notify(
                 user=rider_user,
                 title='Delivery Compensation',
                 type='wallet',
@@ -9482,23 +8929,46 @@ class AdminRiders(viewsets.ViewSet):
     
     @action(detail=False, methods=['get'], url_path='rider-locations')
     def get_rider_locations(self, request):
-        """Get all riders with their current locations for mapping"""
+        """
+        Get all riders with their current locations for mapping. Live positions
+        (streamed over the rider location socket) win over saved ones. With
+        lat, lng and radius_km, only riders streaming within the radius are
+        returned, nearest first.
+        """
         try:
             riders = Rider.objects.filter(
                 verified=True,
                 is_accepting_deliveries=True
             ).select_related('rider')
             
+            distances = None
+            if request.query_params.get('lat') and request.query_params.get('lng'):
+                nearby = nearby_riders(
+                    float(request.query_params['lat']), float(request.query_params['lng']),
+                    float(request.query_params.get('radius_km', 5)),
+                    limit=int(request.query_params.get('limit', 50))
+                )
+                distances = dict(nearby)
+                riders = sorted(riders.filter(rider_id__in=list(distances)), key=lambda rider: distances[str(rider.pk)])
+            
+            riders = list(riders)
+            live = live_locations([rider.pk for rider in riders])
+            
             rider_locations = []
             for rider in riders:
-                if rider.rider.latitude and rider.rider.longitude:
+                position = live.get(str(rider.pk))
+                if position is None and rider.rider.latitude and rider.rider.longitude:
+                    position = (float(rider.rider.latitude), float(rider.rider.longitude))
+                if position:
                     rider_locations.append({
-                        'rider_id': str(rider.id),
+                        'rider_id': str(rider.pk),
                         'user_id': str(rider.rider.id),
                         'name': f"{rider.rider.first_name} {rider.rider.last_name}".strip() or rider.rider.username,
                         'username': rider.rider.username,
-                        'latitude': float(rider.rider.latitude),
-                        'longitude': float(rider.rider.longitude),
+                        'latitude': position[0],
+                        'longitude': position[1],
+                        'is_live': str(rider.pk) in live,
+                        'distance_km': round(distances[str(rider.pk)], 3) if distances is not None else None,
                         'availability_status': rider.availability_status,
                         'vehicle_type': rider.vehicle_type,
                         'plate_number': rider.plate_number,
@@ -12965,159 +12435,27 @@ class ModeratorDashboard(viewsets.ViewSet):
         """Extract sales analytics data with dynamic grouping"""
 
         try:
+            # Determine grouping based on range type and number of days, then
+            # aggregate the whole range in one day-grouped query
+            grouping, buckets = order_sales_series(start_date, end_date, range_type)
 
             sales_data = []
+            for bucket in buckets:
+                if grouping == 'daily':
+                    date, name = bucket['start'].isoformat(), bucket['start'].strftime('%a, %b %d')
+                elif grouping == 'monthly':
+                    date, name = bucket['period_start'].strftime('%Y-%m-%d'), bucket['period_start'].strftime('%b %Y')
+                else:
+                    date, name = bucket['start'].isoformat(), f'Week {bucket["number"]} ({bucket["start"].strftime("%b %d")})'
 
-            date_range_days = (end_date - start_date).days + 1
-
-            
-
-            # Determine grouping based on range type and number of days
-
-            if range_type == 'daily' or date_range_days <= 7:
-
-                # Daily grouping for short ranges
-
-                current_date = start_date
-
-                while current_date <= end_date:
-
-                    day_data = Order.objects.filter(
-
-                        created_at__date=current_date
-
-                    ).aggregate(
-
-                        revenue=Sum('total_amount'),
-
-                        orders=Count('order')
-
-                    )
-
-                    
-
-                    sales_data.append({
-
-                        'date': current_date.isoformat(),
-
-                        'name': current_date.strftime('%a, %b %d'),
-
-                        'revenue': float(day_data['revenue'] or 0),
-
-                        'orders': day_data['orders'] or 0,
-
-                    })
-
-                    
-
-                    current_date += timedelta(days=1)
-
-                
-
-                grouping = 'daily'
-
-                    
-
-            elif range_type == 'monthly' or date_range_days > 60:
-
-                # Monthly grouping for long ranges
-
-                monthly_sales = Order.objects.filter(
-
-                    created_at__date__gte=start_date,
-
-                    created_at__date__lte=end_date
-
-                ).annotate(
-
-                    month=TruncMonth('created_at')
-
-                ).values('month').annotate(
-
-                    revenue=Sum('total_amount'),
-
-                    orders=Count('order')
-
-                ).order_by('month')
-
-                
-
-                for month_data in monthly_sales:
-
-                    sales_data.append({
-
-                        'date': month_data['month'].strftime('%Y-%m-%d'),
-
-                        'name': month_data['month'].strftime('%b %Y'),
-
-                        'revenue': float(month_data['revenue'] or 0),
-
-                        'orders': month_data['orders'] or 0,
-
-                    })
-
-                
-
-                grouping = 'monthly'
-
-                    
-
-            else:
-
-                # Weekly grouping (default)
-
-                current_date = start_date
-
-                week_num = 1
-
-                while current_date <= end_date:
-
-                    week_end = min(current_date + timedelta(days=6), end_date)
-
-                    
-
-                    week_data = Order.objects.filter(
-
-                        created_at__date__gte=current_date,
-
-                        created_at__date__lte=week_end
-
-                    ).aggregate(
-
-                        revenue=Sum('total_amount'),
-
-                        orders=Count('order')
-
-                    )
-
-                    
-
-                    sales_data.append({
-
-                        'date': current_date.isoformat(),
-
-                        'name': f'Week {week_num} ({current_date.strftime("%b %d")})',
-
-                        'revenue': float(week_data['revenue'] or 0),
-
-                        'orders': week_data['orders'] or 0,
-
-                    })
-
-                    
-
-                    current_date = week_end + timedelta(days=1)
-
-                    week_num += 1
-
-                
-
-                grouping = 'weekly'
-
-            
+                sales_data.append({
+                    'date': date,
+                    'name': name,
+                    'revenue': float(bucket['revenue'] or 0),
+                    'orders': bucket['orders'],
+                })
 
             # Order status distribution for the period
-
             order_status_data = Order.objects.filter(
 
                 created_at__date__gte=start_date,
@@ -13762,87 +13100,27 @@ class ModeratorAnalytics(viewsets.ViewSet):
     def _get_order_sales_analytics(self, start_date, end_date, range_type='weekly'):
         """Get order and sales analytics data with date filtering"""
         try:
-            date_range_days = (end_date - start_date).days + 1
-            
-            # Determine grouping based on range type
-            if range_type == 'daily' or date_range_days <= 7:
-                # Daily grouping
-                current_date = start_date
-                order_metrics_data = []
-                
-                while current_date <= end_date:
-                    day_data = Order.objects.filter(
-                        created_at__date=current_date
-                    ).aggregate(
-                        revenue=Sum('total_amount'),
-                        orders=Count('order'),
-                        avg_order_value=Avg('total_amount'),
-                        refunds=Count('order', filter=Q(status='cancelled'))
-                    )
-                    
-                    order_metrics_data.append({
-                        'month': current_date.strftime('%a, %b %d'),
-                        'revenue': float(day_data['revenue'] or 0),
-                        'orders': day_data['orders'] or 0,
-                        'avgOrderValue': float(day_data['avg_order_value'] or 0),
-                        'refunds': day_data['refunds'] or 0,
-                    })
-                    
-                    current_date += timedelta(days=1)
-                    
-            elif range_type == 'monthly' or date_range_days > 60:
-                # Monthly grouping
-                monthly_orders = Order.objects.filter(
-                    created_at__date__gte=start_date,
-                    created_at__date__lte=end_date
-                ).annotate(
-                    month=TruncMonth('created_at')
-                ).values('month').annotate(
-                    revenue=Sum('total_amount'),
-                    orders=Count('order'),
-                    avg_order_value=Avg('total_amount'),
-                    refunds=Count('order', filter=Q(status='cancelled'))
-                ).order_by('month')
-                
-                order_metrics_data = []
-                for month_data in monthly_orders:
-                    order_metrics_data.append({
-                        'month': month_data['month'].strftime('%b %Y'),
-                        'revenue': float(month_data['revenue'] or 0),
-                        'orders': month_data['orders'],
-                        'avgOrderValue': float(month_data['avg_order_value'] or 0),
-                        'refunds': month_data['refunds'],
-                    })
-            else:
-                # Weekly grouping
-                current_date = start_date
-                week_num = 1
-                order_metrics_data = []
-                
-                while current_date <= end_date:
-                    week_end = min(current_date + timedelta(days=6), end_date)
-                    
-                    week_data = Order.objects.filter(
-                        created_at__date__gte=current_date,
-                        created_at__date__lte=week_end
-                    ).aggregate(
-                        revenue=Sum('total_amount'),
-                        orders=Count('order'),
-                        avg_order_value=Avg('total_amount'),
-                        refunds=Count('order', filter=Q(status='cancelled'))
-                    )
-                    
-                    order_metrics_data.append({
-                        'month': f'Week {week_num}',
-                        'revenue': float(week_data['revenue'] or 0),
-                        'orders': week_data['orders'] or 0,
-                        'avgOrderValue': float(week_data['avg_order_value'] or 0),
-                        'refunds': week_data['refunds'] or 0,
-                    })
-                    
-                    current_date = week_end + timedelta(days=1)
-                    week_num += 1
-            
+            # Determine grouping based on range type, then aggregate the whole
+            # range in one day-grouped query
+            grouping, buckets = order_sales_series(start_date, end_date, range_type)
+
+            order_metrics_data = []
+            for bucket in buckets:
+                if grouping == 'daily':
+                    label = bucket['start'].strftime('%a, %b %d')
+                elif grouping == 'monthly':
+                    label = bucket['period_start'].strftime('%b %Y')
+                else:
+                    label = f"Week {bucket['number']}"
+
+                order_metrics_data.append({
+                    'month': label,
+                    'revenue': float(bucket['revenue'] or 0),
+                    'orders': bucket['orders'],
+                    'avgOrderValue': float(bucket['avg_order_value'] or 0),
+                    'refunds': bucket['refunds'],
+                })
+
             # Order status distribution (within date range)
             order_status_data = Order.objects.filter(
                 created_at__date__gte=start_date,
@@ -14023,80 +13301,56 @@ class ModeratorAnalytics(viewsets.ViewSet):
         """Get product and inventory analytics data with date filtering"""
         try:
             # Top performing products (within date range)
-            product_stats = Checkout.objects.filter(
-                created_at__gte=start_date,
-                created_at__lte=end_date,
-                cart_item__product__isnull=False
-            ).values(
-                'cart_item__product__id',
-                'cart_item__product__name'
-            ).annotate(
-                order_count=Count('id'),
-                total_revenue=Sum('total_amount')
-            ).order_by('-order_count')[:10]
+            product_stats = product_sales_totals(start_date, end_date, limit=10, order_by='orders')
+            products_by_id = Product.objects.in_bulk([stat['product_id'] for stat in product_stats])
             
             product_performance = []
             for stat in product_stats:
-                product_id = stat['cart_item__product__id']
-                product_name = stat['cart_item__product__name']
-                
-                try:
-                    product = Product.objects.get(id=product_id)
-                    
-                    # Get views and favorites count (within date range)
-                    views = CustomerActivity.objects.filter(
-                        product=product,
-                        activity_type='view',
-                        created_at__date__gte=start_date,
-                        created_at__date__lte=end_date
-                    ).count()
-                    
-                    favorites = Favorites.objects.filter(product=product).count()
-                    
-                    product_performance.append({
-                        'name': product_name[:30] + ('...' if len(product_name) > 30 else ''),
-                        'orders': stat['order_count'],
-                        'revenue': float(stat['total_revenue'] or 0),
-                        'views': views,
-                        'favorites': favorites,
-                        'stock': product.quantity
-                    })
-                except Product.DoesNotExist:
+                product = products_by_id.get(stat['product_id'])
+                if not product:
                     continue
+                
+                # Get views and favorites count (within date range)
+                views = CustomerActivity.objects.filter(
+                    product=product,
+                    activity_type='view',
+                    created_at__date__gte=start_date,
+                    created_at__date__lte=end_date
+                ).count()
+                
+                favorites = Favorites.objects.filter(product=product).count()
+                
+                product_performance.append({
+                    'name': product.name[:30] + ('...' if len(product.name) > 30 else ''),
+                    'orders': stat['orders'],
+                    'revenue': float(stat['revenue'] or 0),
+                    'views': views,
+                    'favorites': favorites,
+                    'stock': product.total_stock
+                })
             
             # Category performance (within date range)
-            category_stats = Checkout.objects.filter(
-                created_at__gte=start_date,
-                created_at__lte=end_date,
-                cart_item__product__category__isnull=False
-            ).values(
-                'cart_item__product__category__id',
-                'cart_item__product__category__name'
-            ).annotate(
-                total_revenue=Sum('total_amount'),
-                product_count=Count('cart_item__product', distinct=True)
-            ).order_by('-total_revenue')[:10]
+            category_stats = category_sales_totals(start_date, end_date, limit=10)
+            categories_by_id = Category.objects.in_bulk([stat['category_id'] for stat in category_stats])
             
             category_data = []
             for stat in category_stats:
-                category_id = stat['cart_item__product__category__id']
-                
-                try:
-                    category = Category.objects.get(id=category_id)
-                    avg_rating = Review.objects.filter(
-                        product__category=category,
-                        created_at__date__gte=start_date,
-                        created_at__date__lte=end_date
-                    ).aggregate(avg=Avg('rating'))['avg'] or 0
-                    
-                    category_data.append({
-                        'category': stat['cart_item__product__category__name'],
-                        'revenue': float(stat['total_revenue'] or 0),
-                        'products': stat['product_count'],
-                        'avgRating': float(avg_rating)
-                    })
-                except Category.DoesNotExist:
+                category = categories_by_id.get(stat['category_id'])
+                if not category:
                     continue
+                
+                avg_rating = Review.objects.filter(
+                    product__category=category,
+                    created_at__date__gte=start_date,
+                    created_at__date__lte=end_date
+                ).aggregate(avg=Avg('average_rating'))['avg'] or 0
+                
+                category_data.append({
+                    'category': category.name,
+                    'revenue': float(stat['revenue'] or 0),
+                    'products': stat['products'],
+                    'avgRating': float(avg_rating)
+                })
             
             # Inventory status (current snapshot)
             inventory_status = [
@@ -14181,48 +13435,36 @@ class ModeratorAnalytics(viewsets.ViewSet):
         """Get shop and merchant analytics data with date filtering"""
         try:
             # Top performing shops (within date range)
-            shop_stats = Checkout.objects.filter(
-                created_at__gte=start_date,
-                created_at__lte=end_date,
-                cart_item__product__shop__isnull=False
-            ).values(
-                'cart_item__product__shop__id',
-                'cart_item__product__shop__name'
-            ).annotate(
-                total_sales=Sum('total_amount'),
-                order_count=Count('order', distinct=True)
-            ).order_by('-total_sales')[:10]
+            shop_stats = shop_sales_totals(start_date, end_date, limit=10)
+            shops_by_id = Shop.objects.in_bulk([stat['shop_id'] for stat in shop_stats])
             
             shop_performance = []
             for stat in shop_stats:
-                shop_id = stat['cart_item__product__shop__id']
-                
-                try:
-                    shop = Shop.objects.get(id=shop_id)
-                    
-                    avg_rating = Review.objects.filter(
-                        shop=shop,
-                        created_at__date__gte=start_date,
-                        created_at__date__lte=end_date
-                    ).aggregate(avg=Avg('rating'))['avg'] or 0
-                    
-                    follower_count = ShopFollow.objects.filter(shop=shop).count()
-                    product_count = Product.objects.filter(
-                        shop=shop,
-                        is_removed=False,
-                        upload_status='published'
-                    ).count()
-                    
-                    shop_performance.append({
-                        'name': stat['cart_item__product__shop__name'],
-                        'sales': float(stat['total_sales'] or 0),
-                        'orders': stat['order_count'] or 0,
-                        'rating': float(avg_rating),
-                        'followers': follower_count,
-                        'products': product_count
-                    })
-                except Shop.DoesNotExist:
+                shop = shops_by_id.get(stat['shop_id'])
+                if not shop:
                     continue
+                
+                avg_rating = Review.objects.filter(
+                    shop=shop,
+                    created_at__date__gte=start_date,
+                    created_at__date__lte=end_date
+                ).aggregate(avg=Avg('average_rating'))['avg'] or 0
+                
+                follower_count = ShopFollow.objects.filter(shop=shop).count()
+                product_count = Product.objects.filter(
+                    shop=shop,
+                    is_removed=False,
+                    upload_status='published'
+                ).count()
+                
+                shop_performance.append({
+                    'name': shop.name,
+                    'sales': float(stat['sales'] or 0),
+                    'orders': stat['orders'] or 0,
+                    'rating': float(avg_rating),
+                    'followers': follower_count,
+                    'products': product_count
+                })
             
             # Shop growth over time (within date range)
             date_range_days = (end_date - start_date).days + 1
@@ -15567,7 +14809,7 @@ class ModeratorProduct(viewsets.ViewSet):
                     
                     # Get user to send notification (customer)
                     if product.customer and product.customer.customer:
-                        Notification.objects.create(
+                        notify(
                             user=product.customer.customer,
                             title="Product Removal",
                             type="product_removal",
@@ -15605,7 +14847,7 @@ class ModeratorProduct(viewsets.ViewSet):
                     
                     # Get user to send notification (customer)
                     if product.customer and product.customer.customer:
-                        Notification.objects.create(
+                        notify(
                             user=product.customer.customer,
                             title="Product Restored",
                             type="product_restoration",
@@ -15661,7 +14903,7 @@ class ModeratorProduct(viewsets.ViewSet):
                     
                     # Get user to send notification (customer)
                     if product.customer and product.customer.customer:
-                        Notification.objects.create(
+                        notify(
                             user=product.customer.customer,
                             title="Product Suspension",
                             type="product_suspension",
@@ -15706,7 +14948,7 @@ class ModeratorProduct(viewsets.ViewSet):
                     
                     # Get user to send notification (customer)
                     if product.customer and product.customer.customer:
-                        Notification.objects.create(
+                        notify(
                             user=product.customer.customer,
                             title="Product Unsuspended",
                             type="product_unsuspension",
@@ -18131,52 +17373,12 @@ class CustomerShops(APIView):
     # ── Geocoding Helper ───────────────────────────────────────────────────────
 
     def geocode_address(self, street, barangay, city, province):
-        """Convert address to coordinates using Google Maps Geocoding API."""
+        """Coordinates for the address from the geocode cache; new addresses are queued for the backfill."""
         if not all([street, barangay, city, province]):
             print(f"[GEOCODE] Missing address parts - street:{bool(street)}, barangay:{bool(barangay)}, city:{bool(city)}, province:{bool(province)}")
             return None, None
         
-        full_address = f"{street}, {barangay}, {city}, {province}, Philippines"
-        
-        GOOGLE_MAPS_API_KEY = getattr(settings, 'GOOGLE_MAPS_API_KEY', None)
-        if not GOOGLE_MAPS_API_KEY:
-            print(f"[GEOCODE] ⚠️ Google Maps API key not configured")
-            return None, None
-        
-        try:
-            url = "https://maps.googleapis.com/maps/api/geocode/json"
-            params = {
-                'address': full_address,
-                'key': GOOGLE_MAPS_API_KEY,
-                'components': 'country:PH'
-            }
-            
-            print(f"[GEOCODE] Geocoding address: {full_address}")
-            response = requests.get(url, params=params, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                if data.get('status') == 'OK' and data.get('results'):
-                    location = data['results'][0]['geometry']['location']
-                    lat = Decimal(str(location['lat']))
-                    lng = Decimal(str(location['lng']))
-                    
-                    print(f"[GEOCODE] ✅ Success: ({lat}, {lng})")
-                    return lat, lng
-                else:
-                    print(f"[GEOCODE] ⚠️ Geocoding failed: {data.get('status')}")
-                    return None, None
-            else:
-                print(f"[GEOCODE] ❌ HTTP Error: {response.status_code}")
-                return None, None
-                
-        except requests.exceptions.Timeout:
-            print(f"[GEOCODE] ❌ Request timeout")
-            return None, None
-        except Exception as e:
-            print(f"[GEOCODE] ❌ Error: {str(e)}")
-            return None, None
+        return lookup_coordinates(street, barangay, city, province, "Philippines")
 
     def get_coordinates_from_shop(self, shop):
         """Get coordinates from shop address, returns (latitude, longitude) tuple"""
@@ -18512,7 +17714,7 @@ class CustomerShops(APIView):
 
                 # Notify admins
                 for admin_user in User.objects.filter(is_admin=True):
-                    Notification.objects.create(
+                    notify(
                         user=admin_user,
                         title='New Shop Pending Approval',
                         type='shop_pending_approval',
@@ -18644,9 +17846,10 @@ class CustomerShops(APIView):
                     shop.longitude = longitude
                     logger.info(f"📍 Shop '{shop.name}' coordinates updated to: ({latitude}, {longitude})")
                 else:
-                    logger.warning(f"⚠️ Could not geocode updated address for shop '{shop.name}'")
-                    if not (shop.latitude and shop.longitude):
-                        logger.warning(f"⚠️ Shop '{shop.name}' has no coordinates after update")
+                    # Clear the old address's coordinates; the geocode backfill fills in the new ones
+                    shop.latitude = None
+                    shop.longitude = None
+                    logger.warning(f"⚠️ Shop '{shop.name}' address queued for geocoding")
             
             shop.save()
 
@@ -19656,22 +18859,7 @@ class SellerProducts(viewsets.ModelViewSet):
         Fetch global categories (where shop_id is null/empty)
         """
         try:
-            # Fetch categories where shop is null (global categories)
-            global_categories = Category.objects.filter(shop__isnull=True).order_by('name')
-            
-            # Serialize the data
-            categories_data = []
-            for category in global_categories:
-                category_data = {
-                    "id": str(category.id),
-                    "name": category.name,
-                    "shop": None,
-                    "user": {
-                        "id": str(category.user.id),
-                        "username": category.user.username
-                    } if category.user else None,
-                }
-                categories_data.append(category_data)
+            categories_data = get_global_categories_data()
             
             return Response({
                 "success": True,
@@ -19697,8 +18885,6 @@ class SellerProducts(viewsets.ModelViewSet):
         try:
             import pandas as pd
             import numpy as np
-            import tensorflow as tf
-            import joblib
             import os
             
             CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -19708,10 +18894,9 @@ class SellerProducts(viewsets.ModelViewSet):
 
             # Load the trained models
             try:
-                category_le = joblib.load(os.path.join(MODEL_DIR, 'category_label_encoder.pkl'))
-                scaler = joblib.load(os.path.join(MODEL_DIR, 'scaler.pkl'))
-                model = tf.keras.models.load_model(os.path.join(MODEL_DIR, 'category_classifier.keras'))
-                feature_columns = joblib.load(os.path.join(MODEL_DIR, 'feature_columns.pkl'))
+                # Loaded once per process and shared; reloaded when the files change
+                predictor = get_text_category_model()
+                category_le, scaler, model, feature_columns = predictor.artifacts()
                 
                 logger.info(f"Models loaded successfully! Model expects {len(feature_columns)} features")
                 
@@ -19891,7 +19076,7 @@ class SellerProducts(viewsets.ModelViewSet):
                 logger.error(f"Scaling error: {e}, using raw features")
                 X_scaled = X_item.values.astype(np.float32)
             
-            prediction_probs = model.predict(X_scaled, verbose=0)
+            prediction_probs = predictor.predict_proba(X_scaled)
             predicted_class = np.argmax(prediction_probs, axis=1)[0]
             confidence = float(np.max(prediction_probs, axis=1)[0])
             
@@ -20738,10 +19923,9 @@ class SellerProducts(viewsets.ModelViewSet):
                 
                 # Calculate aggregate values from variants
                 total_quantity = sum(v.quantity for v in product.variants.all())
-                min_price = None
-                if product.variants.exists():
-                    min_price_variant = product.variants.filter(price__isnull=False).order_by('price').first()
-                    min_price = str(min_price_variant.price) if min_price_variant else None
+                # Use the prefetched variants instead of re-querying for the cheapest one
+                priced_variants = [v for v in product.variants.all() if v.price is not None]
+                min_price = str(min(v.price for v in priced_variants)) if priced_variants else None
                 
                 product_data = {
                     "id": str(product.id),
@@ -21575,22 +20759,7 @@ class CustomerProducts(viewsets.ModelViewSet):
         Fetch global categories (where shop_id is null/empty)
         """
         try:
-            # Fetch categories where shop is null (global categories)
-            global_categories = Category.objects.filter(shop__isnull=True).order_by('name')
-            
-            # Serialize the data
-            categories_data = []
-            for category in global_categories:
-                category_data = {
-                    "id": str(category.id),
-                    "name": category.name,
-                    "shop": None,
-                    "user": {
-                        "id": str(category.user.id),
-                        "username": category.user.username
-                    } if category.user else None,
-                }
-                categories_data.append(category_data)
+            categories_data = get_global_categories_data()
             
             return Response({
                 "success": True,
@@ -21616,8 +20785,6 @@ class CustomerProducts(viewsets.ModelViewSet):
         try:
             import pandas as pd
             import numpy as np
-            import tensorflow as tf
-            import joblib
             import os
             
             CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -21627,10 +20794,9 @@ class CustomerProducts(viewsets.ModelViewSet):
 
             # Load the trained models
             try:
-                category_le = joblib.load(os.path.join(MODEL_DIR, 'category_label_encoder.pkl'))
-                scaler = joblib.load(os.path.join(MODEL_DIR, 'scaler.pkl'))
-                model = tf.keras.models.load_model(os.path.join(MODEL_DIR, 'category_classifier.keras'))
-                feature_columns = joblib.load(os.path.join(MODEL_DIR, 'feature_columns.pkl'))
+                # Loaded once per process and shared; reloaded when the files change
+                predictor = get_text_category_model()
+                category_le, scaler, model, feature_columns = predictor.artifacts()
                 
                 logger.info(f"Models loaded successfully! Model expects {len(feature_columns)} features")
                 
@@ -21809,7 +20975,7 @@ class CustomerProducts(viewsets.ModelViewSet):
                 logger.error(f"Scaling error: {e}, using raw features")
                 X_scaled = X_item.values.astype(np.float32)
             
-            prediction_probs = model.predict(X_scaled, verbose=0)
+            prediction_probs = predictor.predict_proba(X_scaled)
             predicted_class = np.argmax(prediction_probs, axis=1)[0]
             confidence = float(np.max(prediction_probs, axis=1)[0])
             
@@ -22441,10 +21607,9 @@ class CustomerProducts(viewsets.ModelViewSet):
                 
                 # Calculate aggregate values from variants
                 total_quantity = sum(v.quantity for v in product.variants.all())
-                min_price = None
-                if product.variants.exists():
-                    min_price_variant = product.variants.filter(price__isnull=False).order_by('price').first()
-                    min_price = str(min_price_variant.price) if min_price_variant else None
+                # Use the prefetched variants instead of re-querying for the cheapest one
+                priced_variants = [v for v in product.variants.all() if v.price is not None]
+                min_price = str(min(v.price for v in priced_variants)) if priced_variants else None
                 
                 product_data = {
                     "id": str(product.id),
@@ -22736,6 +21901,10 @@ class PublicProducts(viewsets.ReadOnlyModelViewSet):
             Prefetch(
                 'variants',
                 queryset=Variants.objects.filter(is_active=True).order_by('price')
+            ),
+            Prefetch(
+                'shop__reviews',
+                queryset=Review.objects.only('id', 'shop_id', 'average_rating')
             )
         ).distinct()
 
@@ -22885,21 +22054,36 @@ class PublicProducts(viewsets.ReadOnlyModelViewSet):
             'price_with_vat': round(price_with_vat, 2),
         }
     
-    def list(self, request, *args, **kwargs):
-        """Return list of products with all necessary info for display including VAT"""
-        queryset = self.get_queryset()
+    def _get_favorite_ids(self, product_ids, user_id):
+        """Return the subset of product_ids the user has favorited, in one query"""
+        if not user_id or not product_ids:
+            return set()
         
-        # Debug logging
-        print(f"PublicProducts.list: Found {queryset.count()} products")
-        
-        # Get user_id for favorite checking
-        user_id = request.headers.get('X-User-Id')
+        try:
+            favorite_ids = Favorites.objects.filter(
+                customer__customer__id=user_id,
+                product_id__in=product_ids
+            ).values_list('product_id', flat=True)
+            return {str(product_id) for product_id in favorite_ids}
+        except Exception as e:
+            print(f"Error checking favorites: {e}")
+            return set()
+    
+    def _build_list_items(self, products, user_id):
+        """
+        Serialize already-fetched products into the list/feed item shape.
+        Ratings and VAT prices are read from the queryset annotations on
+        the product objects, and favorites/ordered quantities are resolved
+        for the whole batch at once.
+        """
+        products_by_id = {str(p.id): p for p in products}
+        product_ids = list(products_by_id.keys())
         
-        # Get ordered quantities for all products in the queryset
-        product_ids = [str(p.id) for p in queryset]
+        # Get ordered quantities and favorites for all products in the batch
         ordered_quantities = self._get_ordered_quantities(product_ids)
+        favorite_ids = self._get_favorite_ids(product_ids, user_id)
         
-        serializer = self.get_serializer(queryset, many=True)
+        serializer = self.get_serializer(products, many=True)
         data = serializer.data
         
         # Transform data to show variant-based pricing and availability including VAT
@@ -22907,10 +22091,10 @@ class PublicProducts(viewsets.ReadOnlyModelViewSet):
             product_id = item.get('id')
             
             # Check if product is in user's favorites
-            item['is_favorite'] = self._check_if_favorite(product_id, user_id)
+            item['is_favorite'] = product_id in favorite_ids
 
             # Get rating values from the annotated queryset
-            product_obj = queryset.filter(id=product_id).first()
+            product_obj = products_by_id.get(product_id)
             if product_obj:
                 item['average_rating'] = getattr(product_obj, 'average_rating', None)
                 item['review_count'] = getattr(product_obj, 'review_count', 0)
@@ -22971,7 +22155,7 @@ class PublicProducts(viewsets.ReadOnlyModelViewSet):
             item['ordered_quantity'] = ordered_quantity
             
             # Count variants with stock > 0 (from annotation)
-            in_stock_variant_count = item.get('in_stock_variant_count', 0)
+            in_stock_variant_count = getattr(product_obj, 'in_stock_variant_count', 0) or 0
             
             # Determine if product has any available stock
             item['has_stock'] = available_stock > 0
@@ -23047,103 +22231,66 @@ class PublicProducts(viewsets.ReadOnlyModelViewSet):
                     })
                 item['variants'] = minimal_variants
         
+        return data
+    
+    def list(self, request, *args, **kwargs):
+        """Return list of products with all necessary info for display including VAT"""
+        products = list(self.get_queryset())
+        
+        # Get user_id for favorite checking
+        user_id = request.headers.get('X-User-Id')
+        
+        data = self._build_list_items(products, user_id)
+        
         return Response(data)
     
+    @action(detail=False, methods=['get'])
+    def feed(self, request):
+        """
+        Keyset-paginated catalog feed ordered by (created_at, id), newest first.
+        Items have the same shape as list(); pass pagination.next_cursor
+        back as ?cursor= to fetch the next page.
+        """
+        user_id = request.headers.get('X-User-Id')
+        page_size = parse_page_size(request.query_params.get('page_size'))
+        cursor = request.query_params.get('cursor')
+        
+        if cursor and decode_cursor(cursor) is None:
+            return Response(
+                {'success': False, 'error': 'Invalid cursor'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        queryset = self.get_queryset().order_by('-created_at', '-id')
+        products, next_cursor = paginate_keyset(queryset, cursor, page_size)
+        
+        return Response({
+            'success': True,
+            'products': self._build_list_items(products, user_id),
+            'pagination': {
+                'page_size': page_size,
+                'has_next': next_cursor is not None,
+                'next_cursor': next_cursor,
+            }
+        })
+    
     def retrieve(self, request, pk=None):
         """Return a single product with all variant details including VAT and ownership info"""
-        try:
-            product = self.get_detail_queryset().get(pk=pk)
-        except Product.DoesNotExist:
+        # Product, reviews and seller info are cached; favorites and stock
+        # (which move with every order) are resolved per request.
+        data = get_or_build(
+            'product_detail', pk,
+            builder=lambda: self._build_product_detail(request, pk)
+        )
+        if data is None:
             return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
 
         # Get user_id for favorite checking
         user_id = request.headers.get('X-User-Id')
         
-        # Get the serializer data with full context
-        serializer = ProductSerializer(product, context={'request': request})
-        data = serializer.data
-
-        # Calculate average rating and review count from the Review model
-        reviews_aggregate = Review.objects.filter(
-            product=product,
-            average_rating__isnull=False
-        ).aggregate(
-            avg_rating=Avg('average_rating'),
-            review_count=Count('id')
-        )
-        
-        data['average_rating'] = round(reviews_aggregate['avg_rating'], 1) if reviews_aggregate['avg_rating'] else None
-        data['total_reviews'] = reviews_aggregate['review_count'] or 0
-        
-        # Also include the reviews list with media
-        reviews = Review.objects.filter(product=product).select_related('customer__customer').prefetch_related('medias').order_by('-created_at')
-        reviews_data = []
-        for review in reviews:
-            # Get customer name and profile picture
-            customer_name = None
-            profile_picture = None
-            if review.customer and review.customer.customer:
-                first = review.customer.customer.first_name or ''
-                last = review.customer.customer.last_name or ''
-                customer_name = f"{first} {last}".strip() or review.customer.customer.username
-                profile_picture = get_media_url(review.customer.customer.profile_picture)
-            
-            # Get media
-            media_data = []
-            for media in review.medias.all():
-                media_data.append({
-                    'id': str(media.id),
-                    'file_url': get_media_url(media.file_data),
-                    'file_data': get_media_url(media.file_data),
-                    'file_type': media.file_type,
-                })
-            
-            reviews_data.append({
-                'id': str(review.id),
-                'average_rating': review.average_rating,
-                'condition_rating': review.condition_rating,
-                'accuracy_rating': review.accuracy_rating,
-                'value_rating': review.value_rating,
-                'delivery_rating': review.delivery_rating,
-                'comment': review.comment,
-                'created_at': review.created_at.isoformat(),
-                'customer': {
-                    'id': str(review.customer.customer.id) if review.customer and review.customer.customer else None,
-                    'username': review.customer.customer.username if review.customer and review.customer.customer else None,
-                    'name': customer_name,
-                    'profile_picture': profile_picture,
-                },
-                'media': media_data,
-                'variant_title': review.variant.title if review.variant else None,
-            })
-        
-        data['reviews'] = reviews_data
-        
         # Check if product is in user's favorites
         data['is_favorite'] = self._check_if_favorite(pk, user_id)
         
-        # Add listing type
-        if data.get('shop'):
-            data['listing_type'] = 'shop'
-            data['seller_id'] = str(data['shop']['id'])
-            data['seller_name'] = data['shop']['name']
-            data['shop_picture_url'] = get_media_url(product.shop.shop_picture) if product.shop else None
-        elif data.get('customer'):
-            data['listing_type'] = 'personal'
-            customer_data = data['customer']
-            if isinstance(customer_data, dict):
-                data['seller_id'] = customer_data.get('customer_id')
-                data['seller_name'] = f"{customer_data.get('first_name', '')} {customer_data.get('last_name', '')}".strip()
-                if not data['seller_name']:
-                    data['seller_name'] = customer_data.get('username', 'Unknown Seller')
-            else:
-                data['seller_id'] = str(data['customer'])
-                data['seller_name'] = 'Unknown Seller'
-        else:
-            data['listing_type'] = 'unknown'
-            data['seller_id'] = None
-            data['seller_name'] = 'Unknown Seller'
-        
         # Process variants with VAT calculations
         if 'variants' in data and data['variants']:
             # Sort variants by price
@@ -23265,6 +22412,97 @@ class PublicProducts(viewsets.ReadOnlyModelViewSet):
         
         return Response(data)
 
+    def _build_product_detail(self, request, pk):
+        """Build the viewer-independent product detail payload, or None if the product doesn't exist"""
+        try:
+            product = self.get_detail_queryset().get(pk=pk)
+        except Product.DoesNotExist:
+            return None
+
+        # Get the serializer data with full context
+        serializer = ProductSerializer(product, context={'request': request})
+        data = dict(serializer.data)
+
+        # Calculate average rating and review count from the Review model
+        reviews_aggregate = Review.objects.filter(
+            product=product,
+            average_rating__isnull=False
+        ).aggregate(
+            avg_rating=Avg('average_rating'),
+            review_count=Count('id')
+        )
+        
+        data['average_rating'] = round(reviews_aggregate['avg_rating'], 1) if reviews_aggregate['avg_rating'] else None
+        data['total_reviews'] = reviews_aggregate['review_count'] or 0
+        
+        # Also include the reviews list with media
+        reviews = Review.objects.filter(product=product).select_related('customer__customer').prefetch_related('medias').order_by('-created_at')
+        reviews_data = []
+        for review in reviews:
+            # Get customer name and profile picture
+            customer_name = None
+            profile_picture = None
+            if review.customer and review.customer.customer:
+                first = review.customer.customer.first_name or ''
+                last = review.customer.customer.last_name or ''
+                customer_name = f"{first} {last}".strip() or review.customer.customer.username
+                profile_picture = get_media_url(review.customer.customer.profile_picture)
+            
+            # Get media
+            media_data = []
+            for media in review.medias.all():
+                media_data.append({
+                    'id': str(media.id),
+                    'file_url': get_media_url(media.file_data),
+                    'file_data': get_media_url(media.file_data),
+                    'file_type': media.file_type,
+                })
+            
+            reviews_data.append({
+                'id': str(review.id),
+                'average_rating': review.average_rating,
+                'condition_rating': review.condition_rating,
+                'accuracy_rating': review.accuracy_rating,
+                'value_rating': review.value_rating,
+                'delivery_rating': review.delivery_rating,
+                'comment': review.comment,
+                'created_at': review.created_at.isoformat(),
+                'customer': {
+                    'id': str(review.customer.customer.id) if review.customer and review.customer.customer else None,
+                    'username': review.customer.customer.username if review.customer and review.customer.customer else None,
+                    'name': customer_name,
+                    'profile_picture': profile_picture,
+                },
+                'media': media_data,
+                'variant_title': review.variant.title if review.variant else None,
+            })
+        
+        data['reviews'] = reviews_data
+        
+        # Add listing type
+        if data.get('shop'):
+            data['listing_type'] = 'shop'
+            data['seller_id'] = str(data['shop']['id'])
+            data['seller_name'] = data['shop']['name']
+            data['shop_picture_url'] = get_media_url(product.shop.shop_picture) if product.shop else None
+        elif data.get('customer'):
+            data['listing_type'] = 'personal'
+            customer_data = data['customer']
+            if isinstance(customer_data, dict):
+                data['seller_id'] = customer_data.get('customer_id')
+                data['seller_name'] = f"{customer_data.get('first_name', '')} {customer_data.get('last_name', '')}".strip()
+                if not data['seller_name']:
+                    data['seller_name'] = customer_data.get('username', 'Unknown Seller')
+            else:
+                data['seller_id'] = str(data['customer'])
+                data['seller_name'] = 'Unknown Seller'
+        else:
+            data['listing_type'] = 'unknown'
+            data['seller_id'] = None
+            data['seller_name'] = 'Unknown Seller'
+
+        return data
+
     def _convert_to_public_url(self, url):
         """Helper function to convert URLs to public format"""
         if not url:
@@ -25261,12 +24499,14 @@ class CustomerBoostPlan(viewsets.ViewSet):
     @action(detail=False, methods=['get'])
     def get_boost_plans(self, request):
         try: 
-            plans = BoostPlan.objects.all()
-            serializer = BoostPlanSerializer(plans, many=True)
+            plans_data = get_or_build(
+                'boost_plans', 'all',
+                builder=lambda: list(BoostPlanSerializer(BoostPlan.objects.all(), many=True).data)
+            )
 
             return Response({
                 'success': True,
-                'plans': serializer.data 
+                'plans': plans_data 
             })
         except Exception as e:
             return Response({
@@ -25655,7 +24895,7 @@ class RiderDeliveryViewSet(viewsets.ViewSet):
                 'estimated_distance': delivery.distance_km,
                 'estimated_time': delivery.estimated_minutes,
                 'delivery_fee': delivery.delivery_fee,
-                'expires_at': (delivery.created_at + timedelta(minutes=10)).isoformat(),
+                'expires_at': (delivery.created_at + timedelta(seconds=get_offer_timeout())).isoformat(),
                 'created_at': delivery.created_at.isoformat()
             })
         
@@ -25744,36 +24984,8 @@ class SellerOrderList(viewsets.ViewSet):
 
 
     def _calculate_driving_distance(self, origin_lat, origin_lng, dest_lat, dest_lng):
-        """Calculate driving distance using Google Maps API"""
-        GOOGLE_MAPS_API_KEY = getattr(settings, 'GOOGLE_MAPS_API_KEY', None)
-        
-        if not GOOGLE_MAPS_API_KEY:
-            return self._haversine_distance(origin_lat, origin_lng, dest_lat, dest_lng)
-        
-        try:
-            url = "https://maps.googleapis.com/maps/api/distancematrix/json"
-            params = {
-                'origins': f"{origin_lat},{origin_lng}",
-                'destinations': f"{dest_lat},{dest_lng}",
-                'key': GOOGLE_MAPS_API_KEY,
-                'units': 'metric'
-            }
-            
-            response = requests.get(url, params=params, timeout=5)
-            data = response.json()
-            
-            if data.get('status') == 'OK':
-                rows = data.get('rows', [])
-                if rows:
-                    elements = rows[0].get('elements', [])
-                    if elements and elements[0].get('status') == 'OK':
-                        distance_meters = elements[0].get('distance', {}).get('value', 0)
-                        if distance_meters > 0:
-                            return distance_meters / 1000
-            
-            return self._haversine_distance(origin_lat, origin_lng, dest_lat, dest_lng)
-        except Exception:
-            return self._haversine_distance(origin_lat, origin_lng, dest_lat, dest_lng)
+        """Calculate driving distance via the shared distance service (cached, haversine fallback)"""
+        return driving_distance(origin_lat, origin_lng, dest_lat, dest_lng)
     
     def _haversine_distance(self, lat1, lng1, lat2, lng2):
         """Calculate straight-line distance using Haversine formula"""
@@ -26147,7 +25359,7 @@ class SellerOrderList(viewsets.ViewSet):
                 
                 message = "Delivery accepted successfully"
                 shop = order.checkout_set.first().cart_item.product.shop
-                Notification.objects.create(
+                notify(
                     user=shop.customer.customer,
                     title='Delivery Accepted',
                     type='delivery',
@@ -26167,13 +25379,274 @@ class SellerOrderList(viewsets.ViewSet):
         except Exception as e:
             return Response({"success": False, "message": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    def _resolve_shop_delivery_fee(self, order, shop, shop_id_str):
+        """
+        The shop's delivery fee for an order: order.shipping_fees_breakdown
+        first, then the checkout's shipping_fee. Returns (fee, source), or
+        (None, None) when it has to be calculated from the distance.
+        """
+        actual_delivery_fee = None
+        fee_source = None
+        
+        print(f"🔍 ORDER {order.order} - shipping_fees_breakdown: {order.shipping_fees_breakdown}")
+        print(f"🔍 Looking for shop_id: {shop_id_str}")
+        
+        # Method 1: Get from order.shipping_fees_breakdown (primary source)
+        if hasattr(order, 'shipping_fees_breakdown') and order.shipping_fees_breakdown:
+            if isinstance(order.shipping_fees_breakdown, dict):
+                # Try string version
+                shop_shipping_fee = order.shipping_fees_breakdown.get(shop_id_str)
+        
+                # If not found, try with the shop's UUID object as key
+                if shop_shipping_fee is None and shop:
+                    shop_shipping_fee = order.shipping_fees_breakdown.get(str(shop.id))
+        
+                # If still not found, try the original shop.id (UUID object)
+                if shop_shipping_fee is None and shop:
+                    shop_shipping_fee = order.shipping_fees_breakdown.get(shop.id)
+        
+                # Also check case-insensitive keys (some might have different case)
+                if shop_shipping_fee is None:
+                    for key, value in order.shipping_fees_breakdown.items():
+                        if str(key).lower() == shop_id_str.lower() or (shop and str(key).lower() == str(shop.id).lower()):
+                            shop_shipping_fee = value
+                            break
+        
+                if shop_shipping_fee is not None:
+                    try:
+                        actual_delivery_fee = Decimal(str(shop_shipping_fee))
+                        fee_source = "order.shipping_fees_breakdown"
+                        print(f"✅ Using shipping fee from order.shipping_fees_breakdown: ₱{actual_delivery_fee}")
+                    except (ValueError, TypeError) as e:
+                        print(f"⚠️ Error converting shipping fee: {e}")
+        
+        # Method 2: Fallback to checkout.shipping_fee
+        if actual_delivery_fee is None:
+            shop_checkouts = Checkout.objects.filter(
+                Q(order=order, cart_item__product__shop=shop) |
+                Q(order=order, direct_shop_id=shop_id_str)
+            )
+            for checkout in shop_checkouts:
+                if hasattr(checkout, 'shipping_fee') and checkout.shipping_fee and checkout.shipping_fee > 0:
+                    actual_delivery_fee = Decimal(str(checkout.shipping_fee))
+                    fee_source = "checkout.shipping_fee"
+                    print(f"✅ Using shipping fee from checkout: ₱{actual_delivery_fee}")
+                    break
+        
+        # Method 3: Calculate from distance (last resort)
+        if actual_delivery_fee is None:
+            print(f"⚠️ No shipping fee found in breakdown or checkout, will calculate from distance")
+        
+        return actual_delivery_fee, fee_source
+    
+    def _save_shop_delivery(self, order, shop, shop_id_str, nearest, delivery_fee, estimated_minutes, fee_source,
+                            pickup, destination, rider_comparison, extra_metadata=None):
+        """Create (or reuse) the shop's delivery for the selected rider, sync the checkout fee and notify the rider"""
+        selected_rider = nearest['rider']
+        total_distance = nearest['total_distance']
+        metadata = {
+            'distance_to_pickup': nearest['distance_to_pickup'],
+            'distance_pickup_to_dest': nearest['distance_pickup_to_dest'],
+            'pickup_location': pickup,
+            'destination_location': destination,
+            'all_riders_compared': rider_comparison,
+            'shop_id': shop_id_str,
+            'fee_source': fee_source or 'calculated_from_distance',
+            'nearest_rider': {
+                'name': f"{selected_rider.rider.first_name} {selected_rider.rider.last_name}".strip() or selected_rider.rider.username,
+                'username': selected_rider.rider.username,
+                'total_distance_km': round(total_distance, 2),
+                'delivery_fee': float(delivery_fee),
+                'estimated_minutes': estimated_minutes
+            },
+            **(extra_metadata or {})
+        }
+        
+        existing_delivery = Delivery.objects.filter(order=order, shop=shop).first()
+        
+        if existing_delivery:
+            existing_delivery.rider = selected_rider
+            existing_delivery.status = 'pending'
+            existing_delivery.distance_km = Decimal(str(total_distance))
+            existing_delivery.estimated_minutes = estimated_minutes
+            existing_delivery.delivery_fee = delivery_fee
+            existing_delivery.metadata = metadata
+            existing_delivery.save()
+            delivery = existing_delivery
+        else:
+            delivery = Delivery.objects.create(
+                order=order,
+                shop=shop,
+                rider=selected_rider,
+                status='pending',
+                distance_km=Decimal(str(total_distance)),
+                estimated_minutes=estimated_minutes,
+                delivery_fee=delivery_fee,
+                metadata=metadata
+            )
+        
+        # Update checkout's shipping_fee to match
+        shop_checkouts = Checkout.objects.filter(
+            Q(order=order, cart_item__product__shop=shop) |
+            Q(order=order, direct_shop_id=shop_id_str)
+        )
+        for checkout in shop_checkouts:
+            if checkout.shipping_fee != float(delivery_fee):
+                checkout.shipping_fee = float(delivery_fee)
+                checkout.save(update_fields=['shipping_fee'])
+                print(f"✅ Updated checkout {checkout.id} shipping_fee to ₱{delivery_fee}")
+        
+        notify(
+            user=selected_rider.rider,
+            title='New Delivery Assignment',
+            type='delivery',
+            message=f'You have been assigned to deliver order #{str(order.order)[:8]}. '
+                    f'Distance: {total_distance:.1f}km, Fee: ₱{delivery_fee:.2f}',
+            is_read=False
+        )
+        
+        order.status = 'rider_assigned'
+        order.save()
+        return delivery
+    
+    def _assign_shop_deliveries_optimally(self, order, shop, shop_id_str):
+        """
+        Batch mode: assign this order and every other order of the shop that
+        is waiting for a rider in one global assignment (least total distance
+        within each rider's capacity), and report the distance saved against
+        assigning them one at a time.
+        """
+        pickup_lat = float(shop.latitude) if shop.latitude else None
+        pickup_lng = float(shop.longitude) if shop.longitude else None
+        if not pickup_lat or not pickup_lng:
+            return Response({"success": False, "message": "Shop has no coordinates. Please update shop address."}, status=status.HTTP_400_BAD_REQUEST)
+        
+        available_riders = Rider.objects.filter(
+            verified=True,
+            availability_status='available',
+            is_accepting_deliveries=True
+        ).select_related('rider')
+        rider_pool = RiderPool(available_riders)
+        if not len(rider_pool):
+            return Response({"success": False, "message": "No available riders found"}, status=status.HTTP_404_NOT_FOUND)
+        
+        active_for_shop = Delivery.objects.filter(
+            order=OuterRef('pk'), shop=shop, status__in=['accepted', 'picked_up', 'in_progress']
+        )
+        waiting_orders = Order.objects.filter(
+            Q(checkout__cart_item__product__shop=shop) | Q(checkout__direct_shop_id=shop.id),
+            status__in=['ready_to_ship', 'waiting_for_rider', 'pending_rider']
+        ).exclude(Exists(active_for_shop)).exclude(pk=order.pk).select_related('shipping_address', 'user').distinct()
+        
+        orders = [order] + [
+            o for o in waiting_orders
+            if not (o.delivery_method and any(keyword in o.delivery_method.lower() for keyword in ['pickup', 'store', 'collect']))
+        ]
+        rejected_by_order = rejected_riders_by_order([o.pk for o in orders], statuses=['rejected', 'declined'])
+        
+        jobs = []
+        skipped = []
+        for o in orders:
+            if o.shipping_address and o.shipping_address.latitude and o.shipping_address.longitude:
+                destination = (float(o.shipping_address.latitude), float(o.shipping_address.longitude))
+            elif o.user.latitude and o.user.longitude:
+                destination = (float(o.user.latitude), float(o.user.longitude))
+            else:
+                skipped.append(str(o.order))
+                continue
+            jobs.append({
+                'order': o,
+                'pickup': (pickup_lat, pickup_lng),
+                'destination': destination,
+                'exclude': rejected_by_order.get(o.pk, set())
+            })
+        
+        plan = plan_assignments(jobs, rider_pool)
+        
+        assigned = []
+        for index, nearest in sorted(plan['assignments'].items()):
+            job = jobs[index]
+            total_distance = nearest['total_distance']
+            delivery_fee, fee_source = self._resolve_shop_delivery_fee(job['order'], shop, shop_id_str)
+            if delivery_fee is None:
+                delivery_fee = Decimal(str(self._calculate_delivery_fee(total_distance)))
+            estimated_minutes = self._calculate_estimated_time(total_distance)
+            
+            rider = nearest['rider']
+            rider_name = f"{rider.rider.first_name} {rider.rider.last_name}".strip() or rider.rider.username
+            summary = {
+                'rider_name': rider_name,
+                'rider_username': rider.rider.username,
+                'vehicle_type': rider.vehicle_type,
+                'plate_number': rider.plate_number,
+                'distance_to_pickup_km': round(nearest['distance_to_pickup'], 2),
+                'distance_pickup_to_dest_km': round(nearest['distance_pickup_to_dest'], 2),
+                'total_distance_km': round(total_distance, 2),
+                'delivery_fee': float(delivery_fee),
+                'estimated_minutes': estimated_minutes
+            }
+            delivery = self._save_shop_delivery(
+                job['order'], shop, shop_id_str, nearest,
+                delivery_fee=delivery_fee,
+                estimated_minutes=estimated_minutes,
+                fee_source=fee_source,
+                pickup={'lat': pickup_lat, 'lng': pickup_lng, 'name': shop.name},
+                destination={'lat': job['destination'][0], 'lng': job['destination'][1]},
+                rider_comparison=[summary],
+                extra_metadata={'assignment_mode': 'optimal'}
+            )
+            assigned.append({'order_id': str(job['order'].order), 'delivery_id': str(delivery.id), **summary})
+        
+        unassigned = []
+        for index in plan['unassigned']:
+            o = jobs[index]['order']
+            if index in plan['without_candidates']:
+                o.status = 'pending_rider'
+                o.save()
+            unassigned.append(str(o.order))
+        
+        return Response({
+            "success": True,
+            "message": f"Assigned riders to {len(assigned)} of {len(orders)} orders "
+                       f"({plan['km_saved']:.2f} km saved vs one at a time)",
+            "data": {
+                "assignment_mode": "optimal",
+                "shop_id": shop_id_str,
+                "shop_name": shop.name,
+                "assigned": assigned,
+                "unassigned": unassigned,
+                "skipped_without_coordinates": skipped,
+                "total_distance_km": round(plan['total_km'], 2),
+                "greedy_assigned": plan['greedy_assigned'],
+                "greedy_total_distance_km": round(plan['greedy_total_km'], 2),
+                "km_saved_vs_greedy": round(plan['km_saved'], 2)
+            }
+        }, status=status.HTTP_200_OK)
+    
     @action(detail=False, methods=['post'])
     def assign_deliveries(self, request):
+        """Queue rider assignment for an order; the matching runs in a Celery worker"""
         try:
             order_id = request.GET.get('order_id')
             if not order_id:
                 return Response({"success": False, "message": "Order ID is required"}, status=status.HTTP_400_BAD_REQUEST)
             
+            if not Order.objects.filter(order=order_id).exists():
+                return Response({"success": False, "message": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
+            
+            mode = request.GET.get('mode') or request.data.get('mode')
+            task = assign_order_delivery_task.delay(str(order_id), mode)
+            return Response({
+                "success": True,
+                "message": "Rider assignment queued",
+                "data": {"order_id": str(order_id), "task_id": task.id}
+            }, status=status.HTTP_202_ACCEPTED)
+        except Exception as e:
+            return Response({"success": False, "message": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    def _assign_order_delivery(self, order_id, mode=None):
+        """Assign the nearest rider to an order's shop delivery (run by assign_order_delivery_task)"""
+        try:
             try:
                 order = Order.objects.get(order=order_id)
             except Order.DoesNotExist:
@@ -26210,58 +25683,11 @@ class SellerOrderList(viewsets.ViewSet):
             if active_delivery:
                 return Response({"success": False, "message": "This shop already has an active delivery in progress"}, status=status.HTTP_400_BAD_REQUEST)
             
-            # ========== GET SHIPPING FEE FROM order.shipping_fees_breakdown ==========
-            actual_delivery_fee = None
-            fee_source = None
-            
-            print(f"🔍 ORDER {order.order} - shipping_fees_breakdown: {order.shipping_fees_breakdown}")
-            print(f"🔍 Looking for shop_id: {shop_id_str}")
+            if mode == 'optimal':
+                return self._assign_shop_deliveries_optimally(order, shop, shop_id_str)
             
-            # Method 1: Get from order.shipping_fees_breakdown (primary source)
-            if hasattr(order, 'shipping_fees_breakdown') and order.shipping_fees_breakdown:
-                if isinstance(order.shipping_fees_breakdown, dict):
-                    # Try string version
-                    shop_shipping_fee = order.shipping_fees_breakdown.get(shop_id_str)
-                    
-                    # If not found, try with the shop's UUID object as key
-                    if shop_shipping_fee is None and shop:
-                        shop_shipping_fee = order.shipping_fees_breakdown.get(str(shop.id))
-                    
-                    # If still not found, try the original shop.id (UUID object)
-                    if shop_shipping_fee is None and shop:
-                        shop_shipping_fee = order.shipping_fees_breakdown.get(shop.id)
-                    
-                    # Also check case-insensitive keys (some might have different case)
-                    if shop_shipping_fee is None:
-                        for key, value in order.shipping_fees_breakdown.items():
-                            if str(key).lower() == shop_id_str.lower() or (shop and str(key).lower() == str(shop.id).lower()):
-                                shop_shipping_fee = value
-                                break
-                    
-                    if shop_shipping_fee is not None:
-                        try:
-                            actual_delivery_fee = Decimal(str(shop_shipping_fee))
-                            fee_source = "order.shipping_fees_breakdown"
-                            print(f"✅ Using shipping fee from order.shipping_fees_breakdown: ₱{actual_delivery_fee}")
-                        except (ValueError, TypeError) as e:
-                            print(f"⚠️ Error converting shipping fee: {e}")
-            
-            # Method 2: Fallback to checkout.shipping_fee
-            if actual_delivery_fee is None:
-                shop_checkouts = Checkout.objects.filter(
-                    Q(order=order, cart_item__product__shop=shop) |
-                    Q(order=order, direct_shop_id=shop_id_str)
-                )
-                for checkout in shop_checkouts:
-                    if hasattr(checkout, 'shipping_fee') and checkout.shipping_fee and checkout.shipping_fee > 0:
-                        actual_delivery_fee = Decimal(str(checkout.shipping_fee))
-                        fee_source = "checkout.shipping_fee"
-                        print(f"✅ Using shipping fee from checkout: ₱{actual_delivery_fee}")
-                        break
-            
-            # Method 3: Calculate from distance (last resort)
-            if actual_delivery_fee is None:
-                print(f"⚠️ No shipping fee found in breakdown or checkout, will calculate from distance")
+            # ========== GET SHIPPING FEE FROM order.shipping_fees_breakdown ==========
+            actual_delivery_fee, fee_source = self._resolve_shop_delivery_fee(order, shop, shop_id_str)
             
             # Get available riders
             available_riders = Rider.objects.filter(
@@ -26298,25 +25724,26 @@ class SellerOrderList(viewsets.ViewSet):
             rider_distances = []
             rider_comparison = []
             
-            for rider in available_riders:
-                if not (rider.rider.latitude and rider.rider.longitude):
-                    continue
-                
-                rider_lat = float(rider.rider.latitude)
-                rider_lng = float(rider.rider.longitude)
-                
-                rejected_before = Delivery.objects.filter(
-                    order=order,
-                    rider=rider,
-                    status__in=['rejected', 'declined']
-                ).exists()
-                
-                if rejected_before:
+            rejected_rider_ids = set(Delivery.objects.filter(
+                order=order,
+                status__in=['rejected', 'declined']
+            ).values_list('rider_id', flat=True))
+            
+            # Live positions where riders are streaming them, else their saved location
+            rider_pool = RiderPool(available_riders)
+            eligible_riders = []
+            for rider in rider_pool.riders:
+                if rider.pk in rejected_rider_ids:
                     print(f"⚠️ Rider {rider.rider.username} previously rejected/declined this order - SKIPPING")
                     continue
-                
-                distance_to_pickup = self._calculate_driving_distance(rider_lat, rider_lng, pickup_lat, pickup_lng)
-                distance_pickup_to_dest = self._calculate_driving_distance(pickup_lat, pickup_lng, dest_lat, dest_lng)
+                eligible_riders.append(rider)
+            
+            # Every rider -> pickup leg in one batched lookup; the pickup -> destination leg once
+            rider_points = [rider_pool.position(rider) for rider in eligible_riders]
+            pickup_legs = distances_to(rider_points, (pickup_lat, pickup_lng))
+            distance_pickup_to_dest = self._calculate_driving_distance(pickup_lat, pickup_lng, dest_lat, dest_lng)
+            
+            for rider, (rider_lat, rider_lng), distance_to_pickup in zip(eligible_riders, rider_points, pickup_legs):
                 total_distance = distance_to_pickup + distance_pickup_to_dest
                 estimated_minutes = self._calculate_estimated_time(total_distance)
                 
@@ -26371,87 +25798,19 @@ class SellerOrderList(viewsets.ViewSet):
             nearest = rider_distances[0]
             selected_rider = nearest['rider']
             total_distance = nearest['total_distance']
-            distance_to_pickup = nearest['distance_to_pickup']
-            distance_pickup_to_dest = nearest['distance_pickup_to_dest']
             delivery_fee = nearest['delivery_fee']
             estimated_minutes = nearest['estimated_minutes']
             
-            existing_delivery = Delivery.objects.filter(order=order, shop=shop).first()
-
-            if existing_delivery:
-                existing_delivery.rider = selected_rider
-                existing_delivery.status = 'pending'
-                existing_delivery.distance_km = Decimal(str(total_distance))
-                existing_delivery.estimated_minutes = estimated_minutes
-                existing_delivery.delivery_fee = delivery_fee
-                existing_delivery.metadata = {
-                    'distance_to_pickup': distance_to_pickup,
-                    'distance_pickup_to_dest': distance_pickup_to_dest,
-                    'pickup_location': {'lat': pickup_lat, 'lng': pickup_lng, 'name': pickup_name},
-                    'destination_location': {'lat': dest_lat, 'lng': dest_lng},
-                    'all_riders_compared': rider_comparison,
-                    'shop_id': shop_id_str,
-                    'fee_source': fee_source or 'calculated_from_distance',
-                    'nearest_rider': {
-                        'name': f"{selected_rider.rider.first_name} {selected_rider.rider.last_name}".strip() or selected_rider.rider.username,
-                        'username': selected_rider.rider.username,
-                        'total_distance_km': round(total_distance, 2),
-                        'delivery_fee': float(delivery_fee),
-                        'estimated_minutes': estimated_minutes
-                    }
-                }
-                existing_delivery.save()
-                delivery = existing_delivery
-            else:
-                delivery = Delivery.objects.create(
-                    order=order,
-                    shop=shop,
-                    rider=selected_rider,
-                    status='pending',
-                    distance_km=Decimal(str(total_distance)),
-                    estimated_minutes=estimated_minutes,
-                    delivery_fee=delivery_fee,
-                    metadata={
-                        'distance_to_pickup': distance_to_pickup,
-                        'distance_pickup_to_dest': distance_pickup_to_dest,
-                        'pickup_location': {'lat': pickup_lat, 'lng': pickup_lng, 'name': pickup_name},
-                        'destination_location': {'lat': dest_lat, 'lng': dest_lng},
-                        'all_riders_compared': rider_comparison,
-                        'shop_id': shop_id_str,
-                        'fee_source': fee_source or 'calculated_from_distance',
-                        'nearest_rider': {
-                            'name': f"{selected_rider.rider.first_name} {selected_rider.rider.last_name}".strip() or selected_rider.rider.username,
-                            'username': selected_rider.rider.username,
-                            'total_distance_km': round(total_distance, 2),
-                            'delivery_fee': float(delivery_fee),
-                            'estimated_minutes': estimated_minutes
-                        }
-                    }
-                )
-            
-            # Update checkout's shipping_fee to match
-            shop_checkouts = Checkout.objects.filter(
-                Q(order=order, cart_item__product__shop=shop) |
-                Q(order=order, direct_shop_id=shop_id_str)
-            )
-            for checkout in shop_checkouts:
-                if checkout.shipping_fee != float(delivery_fee):
-                    checkout.shipping_fee = float(delivery_fee)
-                    checkout.save(update_fields=['shipping_fee'])
-                    print(f"✅ Updated checkout {checkout.id} shipping_fee to ₱{delivery_fee}")
-            
-            Notification.objects.create(
-                user=selected_rider.rider,
-                title='New Delivery Assignment',
-                type='delivery',
-                message=f'You have been assigned to deliver order #{str(order.order)[:8]}. '
-                        f'Distance: {total_distance:.1f}km, Fee: ₱{delivery_fee:.2f}',
-                is_read=False
+            delivery = self._save_shop_delivery(
+                order, shop, shop_id_str, nearest,
+                delivery_fee=delivery_fee,
+                estimated_minutes=estimated_minutes,
+                fee_source=fee_source,
+                pickup={'lat': pickup_lat, 'lng': pickup_lng, 'name': pickup_name},
+                destination={'lat': dest_lat, 'lng': dest_lng},
+                rider_comparison=rider_comparison
             )
             
-            order.status = 'rider_assigned'
-            order.save()
-            
             nearest_rider_name = f"{selected_rider.rider.first_name} {selected_rider.rider.last_name}".strip() or selected_rider.rider.username
             
             return Response({
@@ -26485,45 +25844,35 @@ class SellerOrderList(viewsets.ViewSet):
 
     @action(detail=False, methods=['post'])
     def check_delivery_responses(self, request):
+        """Queue settling an order's pending offers; runs in a Celery worker"""
         try:
             order_id = request.GET.get('order_id')
             if not order_id:
                 return Response({"success": False, "message": "Order ID is required"}, status=status.HTTP_400_BAD_REQUEST)
             
-            try:
-                order = Order.objects.get(order=order_id)
-            except Order.DoesNotExist:
+            if not Order.objects.filter(order=order_id).exists():
                 return Response({"success": False, "message": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
             
-            pending_deliveries = Delivery.objects.filter(order=order, status='pending').select_related('rider__rider')
-            responses = []
-            accepted_delivery = None
-                
-            for delivery in pending_deliveries:
-                response_info = {
-                    "delivery_id": str(delivery.id),
-                    "rider_name": f"{delivery.rider.rider.first_name} {delivery.rider.rider.last_name}" if delivery.rider else None,
-                    "status": delivery.status,
-                    "has_responded": False
-                }
-                responses.append(response_info)
-            
-            accepted_delivery = Delivery.objects.filter(order=order, status='accepted').first()
-            
-            if accepted_delivery:
-                Delivery.objects.filter(order=order, status='pending').update(status='cancelled')
-            
+            task = check_order_delivery_responses_task.delay(str(order_id))
             return Response({
                 "success": True,
-                "message": "Delivery responses checked",
-                "data": {
-                    "order_id": str(order_id),
-                    "accepted_delivery": str(accepted_delivery.id) if accepted_delivery else None,
-                    "responses": responses
-                }
-            }, status=status.HTTP_200_OK)
+                "message": "Delivery response check queued",
+                "data": {"order_id": str(order_id), "task_id": task.id}
+            }, status=status.HTTP_202_ACCEPTED)
         except Exception as e:
             return Response({"success": False, "message": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    def _settle_delivery_responses(self, order_id):
+        """Once a rider accepted, cancel the order's other pending offers (run by check_order_delivery_responses_task)"""
+        accepted_delivery = Delivery.objects.filter(order_id=order_id, status='accepted').first()
+        cancelled = 0
+        if accepted_delivery:
+            cancelled = Delivery.objects.filter(order_id=order_id, status='pending').update(status='cancelled')
+        return {
+            "order_id": str(order_id),
+            "accepted_delivery": str(accepted_delivery.id) if accepted_delivery else None,
+            "cancelled": cancelled
+        }
 
     @action(detail=False, methods=['get'])
     def order_list(self, request):
@@ -26959,26 +26308,27 @@ class SellerOrderList(viewsets.ViewSet):
                 rider_distances = []
                 rider_comparison = []
                 
-                for rider in available_riders:
-                    if not (rider.rider.latitude and rider.rider.longitude):
-                        continue
-                    
-                    rider_lat = float(rider.rider.latitude)
-                    rider_lng = float(rider.rider.longitude)
-                    
-                    # Skip riders who previously rejected/declined this order
-                    rejected_before = Delivery.objects.filter(
-                        order=order,
-                        rider=rider,
-                        status__in=['rejected', 'declined']
-                    ).exists()
-                    
-                    if rejected_before:
+                # Skip riders who previously rejected/declined this order
+                rejected_rider_ids = set(Delivery.objects.filter(
+                    order=order,
+                    status__in=['rejected', 'declined']
+                ).values_list('rider_id', flat=True))
+                
+                # Live positions where riders are streaming them, else their saved location
+                rider_pool = RiderPool(available_riders)
+                eligible_riders = []
+                for rider in rider_pool.riders:
+                    if rider.pk in rejected_rider_ids:
                         print(f"⚠️ Rider {rider.rider.username} previously rejected/declined this order - SKIPPING")
                         continue
-                    
-                    distance_to_pickup = self._calculate_driving_distance(rider_lat, rider_lng, pickup_lat, pickup_lng)
-                    distance_pickup_to_dest = self._calculate_driving_distance(pickup_lat, pickup_lng, dest_lat, dest_lng)
+                    eligible_riders.append(rider)
+                
+                # Every rider -> pickup leg in one batched lookup; the pickup -> destination leg once
+                rider_points = [rider_pool.position(rider) for rider in eligible_riders]
+                pickup_legs = distances_to(rider_points, (pickup_lat, pickup_lng))
+                distance_pickup_to_dest = self._calculate_driving_distance(pickup_lat, pickup_lng, dest_lat, dest_lng)
+                
+                for rider, (rider_lat, rider_lng), distance_to_pickup in zip(eligible_riders, rider_points, pickup_legs):
                     total_distance = distance_to_pickup + distance_pickup_to_dest
                     estimated_minutes = self._calculate_estimated_time(total_distance)
                     
@@ -27089,7 +26439,7 @@ class SellerOrderList(viewsets.ViewSet):
                         print(f"✅ Updated checkout {checkout.id} shipping_fee to ₱{delivery_fee}")
                 
                 # Send notification to the new rider
-                Notification.objects.create(
+                notify(
                     user=selected_rider.rider,
                     title='New Delivery Assignment',
                     type='delivery',
@@ -27260,7 +26610,7 @@ class SellerOrderList(viewsets.ViewSet):
             
             # Send notification to buyer
             notif_message = f'Your order status has been updated to: {order.status}'
-            Notification.objects.create(
+            notify(
                 user=order.user,
                 title=f'Order {str(order.order)[:8]} Updated',
                 type='order_update',
@@ -27573,7 +26923,7 @@ class SellerOrderList(viewsets.ViewSet):
             order.updated_at = timezone.now()
             order.save()
             
-            Notification.objects.create(
+            notify(
                 user=order.user,
                 title='Order Being Prepared',
                 type='order_update',
@@ -27885,42 +27235,11 @@ class CheckoutOrder(viewsets.ViewSet):
     
     def _get_google_maps_distance(self, origin_lat: float, origin_lng: float, dest_lat: float, dest_lng: float) -> float:
         """
-        Calculate actual driving distance using Google Maps Distance Matrix API
-        Returns distance in kilometers
+        Calculate actual driving distance using the shared distance service
+        (route cache, then Google Maps Distance Matrix API)
+        Returns distance in kilometers, or None when the provider can't resolve it
         """
-        GOOGLE_MAPS_API_KEY = getattr(settings, 'GOOGLE_MAPS_API_KEY', None)
-        
-        if not GOOGLE_MAPS_API_KEY:
-            logger.warning("Google Maps API key not configured, using Haversine fallback")
-            return None
-        
-        try:
-            url = "https://maps.googleapis.com/maps/api/distancematrix/json"
-            params = {
-                'origins': f"{origin_lat},{origin_lng}",
-                'destinations': f"{dest_lat},{dest_lng}",
-                'key': GOOGLE_MAPS_API_KEY,
-                'units': 'metric'
-            }
-            
-            response = requests.get(url, params=params, timeout=5)
-            data = response.json()
-            
-            if data.get('status') == 'OK':
-                rows = data.get('rows', [])
-                if rows:
-                    elements = rows[0].get('elements', [])
-                    if elements and elements[0].get('status') == 'OK':
-                        distance_meters = elements[0].get('distance', {}).get('value', 0)
-                        if distance_meters > 0:
-                            distance_km = distance_meters / 1000
-                            return distance_km
-            
-            return None
-            
-        except Exception as e:
-            logger.error(f"Google Maps API error: {str(e)}")
-            return None
+        return driving_distance(origin_lat, origin_lng, dest_lat, dest_lng, fallback=False)
     
     def _calculate_distance(self, origin_lat: float, origin_lng: float, dest_lat: float, dest_lng: float) -> float:
         """
@@ -31846,10 +31165,34 @@ class ViewShopAPIView(APIView):
     """View details of a single shop including products, categories, and followers"""
 
     def get(self, request, shop_id):
+        # The shop profile is the same for every viewer, so it is cached;
+        # only the follow state is resolved per request.
+        shop_data = get_or_build(
+            'shop_profile', shop_id,
+            builder=lambda: self._build_shop_profile(request, shop_id)
+        )
+        if shop_data is None:
+            return Response({'detail': 'Shop not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        # Add whether current user is following this shop
+        user_id = request.headers.get('X-User-Id')
+        is_following = False
+        try:
+            if user_id:
+                is_following = ShopFollow.objects.filter(shop_id=shop_id, customer__customer__id=user_id).exists()
+        except Exception as e:
+            print(f"Error checking follow status: {e}")
+
+        shop_data['is_following'] = is_following
+
+        return Response(shop_data, status=status.HTTP_200_OK)
+
+    def _build_shop_profile(self, request, shop_id):
+        """Build the viewer-independent part of the shop profile, or None if the shop doesn't exist"""
         # Fetch shop if exists (including suspended) so frontend can show suspended UI
         shop = Shop.objects.filter(id=shop_id).first()
         if not shop:
-            return Response({'detail': 'Shop not found'}, status=status.HTTP_404_NOT_FOUND)
+            return None
 
         # Build address string
         address_parts = [
@@ -31907,13 +31250,14 @@ class ViewShopAPIView(APIView):
         
         # Add total_stock and variant quantities to each product
         for product, product_data in zip(products, products_data):
-            # Calculate total stock from variants
-            total_stock = sum(v.quantity for v in product.variants.filter(is_active=True) if v.quantity) if product.variants.exists() else 0
+            # Calculate total stock from the prefetched variants
+            active_variants = [v for v in product.variants.all() if v.is_active]
+            total_stock = sum(v.quantity for v in active_variants if v.quantity)
             product_data['total_stock'] = total_stock
             
             # Also add stock info to each variant in the response
             if 'variants' in product_data and product_data['variants']:
-                for variant_data, variant_obj in zip(product_data['variants'], product.variants.filter(is_active=True)):
+                for variant_data, variant_obj in zip(product_data['variants'], active_variants):
                     variant_data['quantity'] = variant_obj.quantity
         
         shop_data['products'] = products_data
@@ -31922,19 +31266,6 @@ class ViewShopAPIView(APIView):
         category_qs = products.values_list('category__id', 'category__name').distinct()
         shop_data['categories'] = [{'id': str(c[0]), 'name': c[1]} for c in category_qs if c[0]]
 
-        # Add whether current user is following this shop
-        user_id = request.headers.get('X-User-Id')
-        is_following = False
-        try:
-            if user_id:
-                customer = Customer.objects.filter(customer__id=user_id).first()
-                if customer:
-                    is_following = ShopFollow.objects.filter(shop=shop, customer=customer).exists()
-        except Exception as e:
-            print(f"Error checking follow status: {e}")
-
-        shop_data['is_following'] = is_following
-
         # --- Additional metrics for frontend display ---
         try:
             # Ratings: average rating and review count for this shop
@@ -32036,7 +31367,7 @@ class ViewShopAPIView(APIView):
 
         shop_data['reviews'] = reviews_data
 
-        return Response(shop_data, status=status.HTTP_200_OK)
+        return shop_data
 
         
 
@@ -33958,7 +33289,7 @@ class RiderOrdersActive(viewsets.ViewSet):
                             return_request_item.updated_by = rider.rider
                         return_request_item.save()
                         
-                        Notification.objects.create(
+                        notify(
                             user=refund.requested_by,
                             title='Return Item Picked Up',
                             type='return_pickup',
@@ -33971,7 +33302,7 @@ class RiderOrdersActive(viewsets.ViewSet):
                             if checkout and checkout.cart_item and checkout.cart_item.product and checkout.cart_item.product.shop:
                                 shop = checkout.cart_item.product.shop
                                 if shop and shop.customer and shop.customer.customer:
-                                    Notification.objects.create(
+                                    notify(
                                         user=shop.customer.customer,
                                         title='Return Item Picked Up',
                                         type='return_pickup',
@@ -34193,7 +33524,7 @@ class RiderOrdersActive(viewsets.ViewSet):
             if checkout and checkout.cart_item and checkout.cart_item.product and checkout.cart_item.product.shop:
                 shop = checkout.cart_item.product.shop
                 if shop and shop.customer and shop.customer.customer:
-                    Notification.objects.create(
+                    notify(
                         user=shop.customer.customer,
                         title='Delivery Offer Declined',
                         type='delivery',
@@ -34329,7 +33660,7 @@ class RiderOrdersActive(viewsets.ViewSet):
             return_request_item.save()
             
             # Create notification for buyer
-            Notification.objects.create(
+            notify(
                 user=refund.requested_by,
                 title='Return Pickup Accepted',
                 type='return_pickup',
@@ -34343,7 +33674,7 @@ class RiderOrdersActive(viewsets.ViewSet):
                 if checkout and checkout.cart_item and checkout.cart_item.product and checkout.cart_item.product.shop:
                     shop = checkout.cart_item.product.shop
                     if shop and shop.customer and shop.customer.customer:
-                        Notification.objects.create(
+                        notify(
                             user=shop.customer.customer,
                             title='Return Pickup Accepted',
                             type='return_pickup',
@@ -34373,7 +33704,7 @@ class RiderOrdersActive(viewsets.ViewSet):
                 if checkout and checkout.cart_item and checkout.cart_item.product and checkout.cart_item.product.shop:
                     shop = checkout.cart_item.product.shop
                     if shop and shop.customer and shop.customer.customer:
-                        Notification.objects.create(
+                        notify(
                             user=shop.customer.customer,
                             title='Return Pickup Declined',
                             type='return_pickup',
@@ -34384,7 +33715,7 @@ class RiderOrdersActive(viewsets.ViewSet):
                 print(f"Error creating seller notification: {e}")
             
             # Notify the buyer
-            Notification.objects.create(
+            notify(
                 user=refund.requested_by,
                 title='Return Pickup Declined',
                 type='return_pickup',
@@ -34957,19 +34288,7 @@ class CustomerProductViewSet(viewsets.ViewSet):
     def global_categories(self, request):
         """Get all global categories (no shop) for customer products"""
         try:
-            categories = Category.objects.filter(shop__isnull=True).order_by('name')
-            categories_data = []
-            
-            for category in categories:
-                categories_data.append({
-                    "id": str(category.id),
-                    "name": category.name,
-                    "shop": None,
-                    "user": {
-                        "id": str(category.user.id),
-                        "username": category.user.username
-                    } if category.user else None,
-                })
+            categories_data = get_global_categories_data()
             
             return Response({
                 "success": True,
@@ -35344,8 +34663,6 @@ class CustomerProductViewSet(viewsets.ViewSet):
         try:
             import pandas as pd
             import numpy as np
-            import tensorflow as tf
-            import joblib
             import os
             
             CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -35355,10 +34672,9 @@ class CustomerProductViewSet(viewsets.ViewSet):
 
             # Load the trained models
             try:
-                category_le = joblib.load(os.path.join(MODEL_DIR, 'category_label_encoder.pkl'))
-                scaler = joblib.load(os.path.join(MODEL_DIR, 'scaler.pkl'))
-                model = tf.keras.models.load_model(os.path.join(MODEL_DIR, 'category_classifier.keras'))
-                feature_columns = joblib.load(os.path.join(MODEL_DIR, 'feature_columns.pkl'))
+                # Loaded once per process and shared; reloaded when the files change
+                predictor = get_text_category_model()
+                category_le, scaler, model, feature_columns = predictor.artifacts()
                 
                 print(f"✅ Models loaded successfully!")
                 
@@ -35447,7 +34763,7 @@ class CustomerProductViewSet(viewsets.ViewSet):
             except Exception:
                 X_scaled = X_item.values.astype(np.float32)
             
-            prediction_probs = model.predict(X_scaled, verbose=0)
+            prediction_probs = predictor.predict_proba(X_scaled)
             predicted_class = np.argmax(prediction_probs, axis=1)[0]
             confidence = np.max(prediction_probs, axis=1)[0]
             predicted_label = category_le.inverse_transform([predicted_class])[0]
@@ -36882,27 +36198,24 @@ class RefundViewSet(viewsets.ViewSet):
         rider_distances = []
         rider_comparison = []
         
-        for rider_obj in available_riders:
-            if not (rider_obj.rider.latitude and rider_obj.rider.longitude):
-                continue
-            
-            rider_lat = float(rider_obj.rider.latitude)
-            rider_lng = float(rider_obj.rider.longitude)
-            
-            # Check if this rider has rejected this return before
-            rejected_before = Delivery.objects.filter(
-                order=order,
-                rider=rider_obj,
-                delivery_type='return',
-                status__in=['rejected', 'declined']
-            ).exists()
-            
-            if rejected_before:
-                continue
-            
-            # Calculate distances
-            distance_to_pickup = seller_order_view._calculate_driving_distance(rider_lat, rider_lng, pickup_lat, pickup_lng)
-            distance_pickup_to_dest = seller_order_view._calculate_driving_distance(pickup_lat, pickup_lng, dest_lat, dest_lng)
+        # Riders who rejected this return before
+        rejected_rider_ids = set(Delivery.objects.filter(
+            order=order,
+            delivery_type='return',
+            status__in=['rejected', 'declined']
+        ).values_list('rider_id', flat=True))
+        
+        eligible_riders = [
+            rider_obj for rider_obj in available_riders
+            if rider_obj.rider.latitude and rider_obj.rider.longitude and rider_obj.pk not in rejected_rider_ids
+        ]
+        
+        # Calculate distances: every rider -> pickup leg in one batched lookup
+        rider_points = [(float(rider_obj.rider.latitude), float(rider_obj.rider.longitude)) for rider_obj in eligible_riders]
+        pickup_legs = distances_to(rider_points, (pickup_lat, pickup_lng))
+        distance_pickup_to_dest = seller_order_view._calculate_driving_distance(pickup_lat, pickup_lng, dest_lat, dest_lng)
+        
+        for rider_obj, distance_to_pickup in zip(eligible_riders, pickup_legs):
             total_distance = distance_to_pickup + distance_pickup_to_dest
             
             rider_distances.append({
@@ -36986,7 +36299,7 @@ class RefundViewSet(viewsets.ViewSet):
         return_request.save()
         
         # Notify the rider
-        Notification.objects.create(
+        notify(
             user=selected_rider.rider,
             title='New Return Pickup Assignment',
             type='return_pickup',
@@ -36997,7 +36310,7 @@ class RefundViewSet(viewsets.ViewSet):
         
         # Notify the seller
         if shop and shop.customer and shop.customer.customer:
-            Notification.objects.create(
+            notify(
                 user=shop.customer.customer,
                 title='Return Pickup Requested',
                 type='return_pickup',
@@ -37025,34 +36338,8 @@ class RefundViewSet(viewsets.ViewSet):
         }, status=status.HTTP_200_OK)
     
     def _calculate_driving_distance(self, origin_lat, origin_lng, dest_lat, dest_lng):
-        """Calculate driving distance using Google Maps API"""
-        GOOGLE_MAPS_API_KEY = getattr(settings, 'GOOGLE_MAPS_API_KEY', None)
-        
-        if not GOOGLE_MAPS_API_KEY:
-            return self._haversine_distance(origin_lat, origin_lng, dest_lat, dest_lng)
-        
-        try:
-            url = "https://maps.googleapis.com/maps/api/distancematrix/json"
-            params = {
-                'origins': f"{origin_lat},{origin_lng}",
-                'destinations': f"{dest_lat},{dest_lng}",
-                'key': GOOGLE_MAPS_API_KEY,
-                'units': 'metric'
-            }
-            response = requests.get(url, params=params, timeout=5)
-            data = response.json()
-            
-            if data.get('status') == 'OK':
-                rows = data.get('rows', [])
-                if rows:
-                    elements = rows[0].get('elements', [])
-                    if elements and elements[0].get('status') == 'OK':
-                        distance_meters = elements[0].get('distance', {}).get('value', 0)
-                        if distance_meters > 0:
-                            return distance_meters / 1000
-            return self._haversine_distance(origin_lat, origin_lng, dest_lat, dest_lng)
-        except Exception:
-            return self._haversine_distance(origin_lat, origin_lng, dest_lat, dest_lng)
+        """Calculate driving distance via the shared distance service (cached, haversine fallback)"""
+        return driving_distance(origin_lat, origin_lng, dest_lat, dest_lng)
 
     def _haversine_distance(self, lat1, lng1, lat2, lng2):
         """Calculate straight-line distance"""
@@ -37109,7 +36396,7 @@ class RefundViewSet(viewsets.ViewSet):
                 from .models import Delivery
                 delivery = Delivery.objects.filter(order=refund.order_id, delivery_type='return', status='accepted').first()
                 if delivery and delivery.rider:
-                    Notification.objects.create(
+                    notify(
                         user=delivery.rider.rider,
                         title='Return Item Ready for Pickup',
                         type='return_pickup',
@@ -38647,8 +37934,7 @@ class RefundViewSet(viewsets.ViewSet):
                     
                     # Notify the buyer
                     try:
-                        from .models import Notification
-                        Notification.objects.create(
+                        notify(
                             user=original_order.user,
                             title='Replacement Order Created',
                             type='replacement',
@@ -40741,7 +40027,7 @@ class DisputeViewSet(viewsets.ModelViewSet):
                         notification_title = "Dispute Partially Resolved"
                         notification_message = f"Your dispute has been partially resolved. {admin_notes or 'Please check your refund status for updates.'}"
                     
-                    Notification.objects.create(
+                    notify(
                         user=refund.requested_by,
                         title=notification_title,
                         message=notification_message,
@@ -40782,22 +40068,7 @@ class SellerGifts(viewsets.ModelViewSet):
         Fetch global categories (where shop_id is null/empty)
         """
         try:
-            # Fetch categories where shop is null (global categories)
-            global_categories = Category.objects.filter(shop__isnull=True).order_by('name')
-            
-            # Serialize the data
-            categories_data = []
-            for category in global_categories:
-                category_data = {
-                    "id": str(category.id),
-                    "name": category.name,
-                    "shop": None,  # Explicitly set to null since we're filtering for null shop
-                    "user": {
-                        "id": str(category.user.id),
-                        "username": category.user.username
-                    } if category.user else None,
-                }
-                categories_data.append(category_data)
+            categories_data = get_global_categories_data()
             
             return Response({
                 "success": True,
@@ -40822,8 +40093,6 @@ class SellerGifts(viewsets.ModelViewSet):
         try:
             import pandas as pd
             import numpy as np
-            import tensorflow as tf
-            import joblib
             import os
             
             CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -40833,12 +40102,9 @@ class SellerGifts(viewsets.ModelViewSet):
 
             # Load the trained models
             try:
-                category_le = joblib.load(os.path.join(MODEL_DIR, 'category_label_encoder.pkl'))
-                scaler = joblib.load(os.path.join(MODEL_DIR, 'scaler.pkl'))
-                model = tf.keras.models.load_model(os.path.join(MODEL_DIR, 'category_classifier.keras'))
-                
-                # Load the EXACT feature columns used during training
-                feature_columns = joblib.load(os.path.join(MODEL_DIR, 'feature_columns.pkl'))
+                # Loaded once per process and shared; reloaded when the files change
+                predictor = get_text_category_model()
+                category_le, scaler, model, feature_columns = predictor.artifacts()
                 
                 print(f"✅ Models loaded successfully!")
                 print(f"Model expects {len(feature_columns)} features: {feature_columns}")
@@ -41041,7 +40307,7 @@ class SellerGifts(viewsets.ModelViewSet):
                 X_scaled = X_item.values.astype(np.float32)
             
             # Make prediction
-            prediction_probs = model.predict(X_scaled, verbose=0)
+            prediction_probs = predictor.predict_proba(X_scaled)
             predicted_class = np.argmax(prediction_probs, axis=1)[0]
             confidence = np.max(prediction_probs, axis=1)[0]
             
@@ -41818,19 +41084,7 @@ class CustomerGiftViewSet(viewsets.ViewSet):
     def global_categories(self, request):
         """Get all global categories (no shop) for customer gifts"""
         try:
-            categories = Category.objects.filter(shop__isnull=True).order_by('name')
-            categories_data = []
-            
-            for category in categories:
-                categories_data.append({
-                    "id": str(category.id),
-                    "name": category.name,
-                    "shop": None,
-                    "user": {
-                        "id": str(category.user.id),
-                        "username": category.user.username
-                    } if category.user else None,
-                })
+            categories_data = get_global_categories_data()
             
             return Response({
                 "success": True,
@@ -42227,8 +41481,6 @@ class CustomerGiftViewSet(viewsets.ViewSet):
         try:
             import pandas as pd
             import numpy as np
-            import tensorflow as tf
-            import joblib
             import os
             
             CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -42236,10 +41488,9 @@ class CustomerGiftViewSet(viewsets.ViewSet):
             
             # Load models
             try:
-                category_le = joblib.load(os.path.join(MODEL_DIR, 'category_label_encoder.pkl'))
-                scaler = joblib.load(os.path.join(MODEL_DIR, 'scaler.pkl'))
-                model = tf.keras.models.load_model(os.path.join(MODEL_DIR, 'category_classifier.keras'))
-                feature_columns = joblib.load(os.path.join(MODEL_DIR, 'feature_columns.pkl'))
+                # Loaded once per process and shared; reloaded when the files change
+                predictor = get_text_category_model()
+                category_le, scaler, model, feature_columns = predictor.artifacts()
                 
             except FileNotFoundError as e:
                 return Response(
@@ -42372,7 +41623,7 @@ class CustomerGiftViewSet(viewsets.ViewSet):
                 X_scaled = X_item.values.astype(np.float32)
             
             # Make prediction
-            prediction_probs = model.predict(X_scaled, verbose=0)
+            prediction_probs = predictor.predict_proba(X_scaled)
             predicted_class = np.argmax(prediction_probs, axis=1)[0]
             confidence = np.max(prediction_probs, axis=1)[0]
             
@@ -48555,64 +47806,65 @@ class ConversationViewSet(viewsets.ViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Get messages for the conversation
-        messages = Message.objects.filter(
-            conversation_id=conv_id
-        ).select_related('sender', 'receiver').order_by('created_at')
-        
         # Mark messages as read for this user
-        messages.filter(
-            receiver=user,
-            read_at__isnull=True
-        ).update(
-            status='read',
-            read_at=timezone.now()
-        )
+        mark_messages_read(Message.objects.filter(conversation_id=conv_id, receiver=user))
         
-        # Prepare response data
-        data = []
-        for msg in messages:
-            # Skip if deleted for this user
-            if (msg.sender == user and msg.is_deleted_for_sender) or \
-               (msg.receiver == user and msg.is_deleted_for_receiver):
-                continue
-                
-            message_data = {
-                'id': str(msg.id),
-                'sender_id': str(msg.sender.id) if msg.sender else None,
-                'sender_name': msg.sender.username if msg.sender else 'Unknown',
-                'receiver_id': str(msg.receiver.id) if msg.receiver else None,
-                'receiver_name': msg.receiver.username if msg.receiver else 'Unknown',
-                'content': msg.content,
-                'message_type': msg.message_type,
-                'status': msg.status,
-                'timestamp': msg.created_at.isoformat(),
-                'delivered_at': msg.delivered_at.isoformat() if msg.delivered_at else None,
-                'read_at': msg.read_at.isoformat() if msg.read_at else None,
-                'is_edited': msg.is_edited,
-                'edited_at': msg.edited_at.isoformat() if msg.edited_at else None,
-            }
-            
-            # Add attachment info if present
-            if msg.attachment:
-                message_data['attachment'] = {
-                    'url': msg.attachment.url if msg.attachment else None,
-                    'name': msg.attachment_name,
-                    'size': msg.attachment_size,
-                    'mime_type': msg.attachment_mime_type,
-                }
-            
-            # Add reply info if present
-            if msg.reply_to:
-                message_data['reply_to'] = {
-                    'id': str(msg.reply_to.id),
-                    'content': msg.reply_to.content[:100] if msg.reply_to.content else '',
-                    'sender_name': msg.reply_to.sender.username if msg.reply_to.sender else 'Unknown',
-                }
-            
-            data.append(message_data)
+        # Messages deleted on the user's side are left out by the query
+        return Response(history_items(
+            visible_messages(conv_id, user.id).order_by('created_at', 'id')
+        ))
+    
+    @action(detail=False, methods=['get'], url_path=r'messages/(?P<conv_id>[^/]+)/history')
+    def history(self, request, conv_id=None):
+        """
+        GET /api/conversation/messages/{conv_id}/history/ - One page of messages,
+        newest page first and oldest first within a page. Pass
+        pagination.next_cursor back as ?cursor= for the next older page. The
+        first page also marks the user's received messages read.
+        """
+        user_id = request.headers.get('X-User-Id')
+        if not user_id:
+            return Response(
+                {'error': 'X-User-Id header required'}, 
+                status=status.HTTP_401_UNAUTHORIZED
+            )
         
-        return Response(data)
+        try:
+            user = User.objects.get(id=user_id)
+        except User.DoesNotExist:
+            return Response(
+                {'error': 'User not found'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        if not ConversationParticipant.objects.filter(conversation_id=conv_id, user=user).exists():
+            return Response(
+                {'error': 'User not in this conversation'}, 
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        page_size = parse_page_size(request.query_params.get('page_size'), default=HISTORY_PAGE_SIZE)
+        cursor = request.query_params.get('cursor')
+        if cursor and decode_cursor(cursor) is None:
+            return Response(
+                {'success': False, 'error': 'Invalid cursor'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if not cursor:
+            mark_messages_read(Message.objects.filter(conversation_id=conv_id, receiver=user))
+        
+        messages, next_cursor = history_page(conv_id, user.id, cursor, page_size)
+        
+        return Response({
+            'success': True,
+            'messages': messages,
+            'pagination': {
+                'page_size': page_size,
+                'has_next': next_cursor is not None,
+                'next_cursor': next_cursor,
+            }
+        })
     
     @action(detail=False, methods=['post'], url_path='send')
     def send_message(self, request):
@@ -48689,16 +47941,17 @@ class ConversationViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Create the message
-        message = Message.objects.create(
-            sender=sender,
-            receiver=receiver,
-            conversation_id=conversation.id,
-            content=content,
-            message_type=message_type,
-            status='sent',
-            created_at=timezone.now()
-        )
+        # Create the message (the receiver's unread counter moves with it)
+        with transaction.atomic():
+            message = Message.objects.create(
+                sender=sender,
+                receiver=receiver,
+                conversation_id=conversation.id,
+                content=content,
+                message_type=message_type,
+                status='sent',
+                created_at=timezone.now()
+            )
         
         # Update conversation's last message
         conversation.last_message = message
@@ -48801,64 +48054,58 @@ class ConversationViewSet(viewsets.ViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Get all conversations for user
-        conversations = Conversation.objects.filter(
-            participants=user
-        ).select_related('last_message').order_by('-last_message_at', '-created_at')
+        # One query for the conversations, one for the other participants
+        participants = list(inbox_queryset(user.id))
+        return Response(inbox_items(participants, user.id))
+    
+    @action(detail=False, methods=['get'], url_path='inbox')
+    def inbox(self, request):
+        """
+        GET /api/conversation/inbox/ - Keyset-paginated conversation list, most
+        recent activity first. Items have the same shape as list/; pass
+        pagination.next_cursor back as ?cursor= for the next page. ?archived=
+        true/false limits the page to archived or active conversations.
+        """
+        user_id = request.headers.get('X-User-Id')
+        if not user_id:
+            return Response(
+                {'error': 'X-User-Id header required'}, 
+                status=status.HTTP_401_UNAUTHORIZED
+            )
         
-        data = []
-        for conv in conversations:
-            # Get the other participant
-            other = conv.participants.exclude(id=user.id).first()
-            
-            # Get participant info
-            participant = ConversationParticipant.objects.filter(
-                conversation=conv,
-                user=user
-            ).first()
-            
-            # Get unread count
-            unread_count = 0
-            if participant:
-                if participant.last_read_message:
-                    unread_count = Message.objects.filter(
-                        conversation_id=conv.id,
-                        receiver=user,
-                        created_at__gt=participant.last_read_message.created_at,
-                        read_at__isnull=True
-                    ).exclude(sender=user).count()
-                else:
-                    unread_count = Message.objects.filter(
-                        conversation_id=conv.id,
-                        receiver=user,
-                        read_at__isnull=True
-                    ).exclude(sender=user).count()
-            
-            # Get last message
-            last_message = conv.last_message
-            last_message_content = None
-            last_message_time = None
-            
-            if last_message:
-                # Check if message is deleted for this user
-                if not ((last_message.sender == user and last_message.is_deleted_for_sender) or
-                        (last_message.receiver == user and last_message.is_deleted_for_receiver)):
-                    last_message_content = last_message.content
-                    last_message_time = last_message.created_at.isoformat()
-            
-            data.append({
-                'id': str(conv.id),
-                'participant_id': str(other.id) if other else None,
-                'participant_name': other.username if other else 'Unknown',
-                'participant_email': other.email if other else None,
-                'last_message': last_message_content,
-                'last_message_time': last_message_time,
-                'unread_count': unread_count,
-                'is_archived': participant.is_archived if participant else False,
-                'is_muted': participant.is_muted if participant else False,
-            })
+        try:
+            user = User.objects.get(id=user_id)
+        except User.DoesNotExist:
+            return Response(
+                {'error': 'User not found'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
         
-        return Response(data)
+        page_size = parse_page_size(request.query_params.get('page_size'))
+        cursor = request.query_params.get('cursor')
+        if cursor and decode_cursor(cursor) is None:
+            return Response(
+                {'success': False, 'error': 'Invalid cursor'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        archived = request.query_params.get('archived')
+        if archived is not None:
+            archived = archived.lower() in ('1', 'true', 'yes')
+        
+        participants, next_cursor = paginate_keyset(
+            inbox_queryset(user.id, archived=archived), cursor, page_size, created_field='activity_at'
+        )
+        
+        return Response({
+            'success': True,
+            'conversations': inbox_items(participants, user.id),
+            'pagination': {
+                'page_size': page_size,
+                'has_next': next_cursor is not None,
+                'next_cursor': next_cursor,
+            }
+        })
     
     @action(detail=False, methods=['get'], url_path='unread/count')
     def unread_count(self, request):
@@ -49712,7 +48959,7 @@ class CustomerOrderList(viewsets.ViewSet):
             order.refresh_from_db()
             
             # Create notification for the buyer
-            Notification.objects.create(
+            notify(
                 user=order.user,
                 title=f'Order {order.order} Updated',
                 type='order_update',
@@ -49868,7 +49115,7 @@ class CustomerOrderList(viewsets.ViewSet):
             order.refresh_from_db()
 
             # Create notification for the buyer
-            Notification.objects.create(
+            notify(
                 user=order.user,
                 title='Order Being Prepared',
                 type='order_update',
@@ -56456,10 +55703,7 @@ class NotificationViewSet(viewsets.ModelViewSet):
             return error_response
         
         # Get counts
-        unread_count = Notification.objects.filter(
-            user=user, 
-            is_read=False
-        ).count()
+        unread_count = user.unread_notification_count
         
         total_count = Notification.objects.filter(user=user).count()
         
@@ -56650,10 +55894,7 @@ class NotificationViewSet(viewsets.ModelViewSet):
         
         # Mark all as read
         if serializer.validated_data.get('mark_all_as_read'):
-            updated_count = Notification.objects.filter(
-                user=user, 
-                is_read=False
-            ).update(is_read=True, read_at=timezone.now())
+            updated_count = mark_notifications_read(Notification.objects.filter(user=user))
             
             return Response({
                 'message': f'Successfully marked {updated_count} notifications as read',
@@ -56689,10 +55930,7 @@ class NotificationViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            updated_count = user_notifications.filter(is_read=False).update(
-                is_read=True, 
-                read_at=timezone.now()
-            )
+            updated_count = mark_notifications_read(user_notifications)
             
             return Response({
                 'message': f'Successfully marked {updated_count} notifications as read',
@@ -56715,16 +55953,63 @@ class NotificationViewSet(viewsets.ModelViewSet):
         if error_response:
             return error_response
         
-        count = Notification.objects.filter(
-            user=user,
-            is_read=False
-        ).count()
+        count = user.unread_notification_count
         
         return Response({
             'unread_count': count,
             'has_unread': count > 0
         })
 
+    @action(detail=False, methods=['get', 'post', 'delete'], url_path='mutes')
+    def mutes(self, request):
+        """
+        Notification types the current user has muted. GET lists them, POST
+        {"type", "minutes"} mutes a type (for that many minutes, or until
+        unmuted), DELETE ?type= unmutes it. Muted types are not created.
+        """
+        # Get user from header
+        user, error_response = self.get_user_from_header(request)
+        if error_response:
+            return error_response
+        
+        if request.method == 'POST':
+            notification_type = request.data.get('type')
+            if not notification_type:
+                return Response(
+                    {'error': 'type is required'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            muted_until = None
+            if request.data.get('minutes'):
+                try:
+                    muted_until = timezone.now() + timedelta(minutes=int(request.data['minutes']))
+                except (TypeError, ValueError):
+                    return Response(
+                        {'error': 'minutes must be a whole number'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+            NotificationMute.objects.update_or_create(
+                user=user, type=notification_type, defaults={'muted_until': muted_until}
+            )
+        elif request.method == 'DELETE':
+            notification_type = request.query_params.get('type')
+            if not notification_type:
+                return Response(
+                    {'error': 'type is required'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            NotificationMute.objects.filter(user=user, type=notification_type).delete()
+        
+        mutes = NotificationMute.objects.filter(user=user).filter(
+            Q(muted_until__isnull=True) | Q(muted_until__gt=timezone.now())
+        ).order_by('type')
+        return Response({
+            'mutes': [{
+                'type': mute.type,
+                'muted_until': mute.muted_until.isoformat() if mute.muted_until else None,
+            } for mute in mutes]
+        })
+
     @action(detail=False, methods=['post'], url_path='mark-all-read')
     def mark_all_read(self, request):
         """
@@ -56735,10 +56020,7 @@ class NotificationViewSet(viewsets.ModelViewSet):
         if error_response:
             return error_response
         
-        updated_count = Notification.objects.filter(
-            user=user,
-            is_read=False
-        ).update(is_read=True, read_at=timezone.now())
+        updated_count = mark_notifications_read(Notification.objects.filter(user=user))
         
         return Response({
             'message': f'Successfully marked {updated_count} notifications as read',
@@ -57012,12 +56294,10 @@ class MessageViewSet(viewsets.ModelViewSet):
             conversation_id = request.query_params.get('conversation_id')
             unread_count = 0
             if conversation_id:
-                unread_count = Message.objects.filter(
+                unread_count = ConversationParticipant.objects.filter(
                     conversation_id=conversation_id,
-                    receiver_id=user.id,
-                    status__in=['sent', 'delivered'],
-                    read_at__isnull=True
-                ).count()
+                    user_id=user.id
+                ).values_list('unread_count', flat=True).first() or 0
             
             return self.get_paginated_response({
                 'messages': serializer.data,
@@ -57153,10 +56433,7 @@ class MessageViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(id__in=message_ids)
         
         # Update unread messages
-        updated_count = queryset.filter(
-            status__in=['sent', 'delivered'],
-            read_at__isnull=True
-        ).update(status='read', read_at=timezone.now())
+        updated_count = mark_messages_read(queryset.filter(status__in=['sent', 'delivered']))
         
         return Response({
             'message': f'Marked {updated_count} messages as read',
@@ -57185,9 +56462,7 @@ class MessageViewSet(viewsets.ModelViewSet):
             )
         
         if message.status in ['sent', 'delivered'] and not message.read_at:
-            message.status = 'read'
-            message.read_at = timezone.now()
-            message.save(update_fields=['status', 'read_at'])
+            message.mark_as_read()
         
         serializer = self.get_serializer(message)
         return Response(serializer.data)
@@ -57224,12 +56499,7 @@ class MessageViewSet(viewsets.ModelViewSet):
                 deleted_count += 1
             else:
                 # Soft delete for current user only
-                if str(message.sender_id) == str(user.id):
-                    message.is_deleted_for_sender = True
-                if str(message.receiver_id) == str(user.id):
-                    message.is_deleted_for_receiver = True
-                message.deleted_at = timezone.now()
-                message.save(update_fields=['is_deleted_for_sender', 'is_deleted_for_receiver', 'deleted_at'])
+                message.soft_delete_for_user(user)
                 deleted_count += 1
         
         return Response({
@@ -57257,12 +56527,7 @@ class MessageViewSet(viewsets.ModelViewSet):
         if delete_for_both:
             message.delete()
         else:
-            if str(message.sender_id) == str(user.id):
-                message.is_deleted_for_sender = True
-            if str(message.receiver_id) == str(user.id):
-                message.is_deleted_for_receiver = True
-            message.deleted_at = timezone.now()
-            message.save(update_fields=['is_deleted_for_sender', 'is_deleted_for_receiver', 'deleted_at'])
+            message.soft_delete_for_user(user)
         
         return Response(
             {'message': 'Message deleted successfully'},
@@ -57276,12 +56541,7 @@ class MessageViewSet(viewsets.ModelViewSet):
         if error_response:
             return error_response
         
-        count = Message.objects.filter(
-            receiver_id=user.id,
-            status__in=['sent', 'delivered'],
-            read_at__isnull=True,
-            is_deleted_for_receiver=False
-        ).count()
+        count = Message.get_unread_count(user.id)
         
         return Response({
             'unread_count': count,
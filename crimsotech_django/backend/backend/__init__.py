@@ -1,3 +1,8 @@
 # import pymysql
 
-# pymysql.install_as_MySQLdb()
\ No newline at end of file
+# pymysql.install_as_MySQLdb()
+
+# Load the Celery app with Django so shared_task binds to it
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
@@ -0,0 +1,16 @@
+"""
+Celery application for the background sweeps and jobs in api/tasks.py.
+
+Run a worker and the beat scheduler with:
+    celery -A backend worker -l info
+    celery -A backend beat -l info
+"""
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+app = Celery('backend')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
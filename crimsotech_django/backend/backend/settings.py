@@ -2,12 +2,14 @@
 Django settings for backend project.
 """
 import os
+import sys
 from pathlib import Path
 import environ
 import dj_database_url
 from corsheaders.defaults import default_headers
 import redis
 import base64
+from celery.schedules import crontab
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().resolve().parent.parent
@@ -59,6 +61,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.utils.notifications.NotificationBatchMiddleware',
 ]
 
 REST_FRAMEWORK = {
@@ -234,6 +237,33 @@ if DEBUG and not REDIS_URL:
         },
     }
 
+# Shared cache (cache-aside data such as categories, boost plans, shop profiles)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": REDIS_URL,
+        "KEY_PREFIX": "crimsotech",
+        "TIMEOUT": 300,
+        "OPTIONS": {
+            **REDIS_CONNECTION_KWARGS,
+            **({"ssl_cert_reqs": None} if REDIS_URL.startswith("rediss://") else {}),
+        },
+    },
+}
+
+# Local-memory fallback for tests and Redis-less development
+USE_LOCAL_CACHE = env.bool(
+    "USE_LOCAL_CACHE",
+    default=(DEBUG and not REDIS_URL) or "test" in sys.argv[1:2],
+)
+if USE_LOCAL_CACHE:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "crimsotech",
+        },
+    }
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -339,6 +369,104 @@ STORAGES = {
 
 MEDIA_URL = f"{env.str('SUPABASE_ENDPOINT')}/{env.str('SUPABASE_STORAGE_BUCKET')}/"
 
+# Seconds the precomputed landing page payload stays cached
+LANDING_CACHE_TTL = env.int("LANDING_CACHE_TTL", default=600)
+
+# Per-namespace TTL overrides (seconds) for api.utils.cache_helpers, e.g. {"shop_profile": 300}
+CACHE_TTLS = {}
+
+# Already rolled-up days the nightly metrics rollup recomputes (orders keep changing status)
+METRICS_ROLLUP_LOOKBACK_DAYS = env.int("METRICS_ROLLUP_LOOKBACK_DAYS", default=3)
+
+# Riders (nearest by straight line) whose driving distance is checked per order in the delivery sweeps
+RIDER_MATCH_CANDIDATES = env.int("RIDER_MATCH_CANDIDATES", default=5)
+# "greedy" (nearest rider per order in turn) or "optimal" (one global assignment per sweep)
+DELIVERY_ASSIGNMENT_MODE = env.str("DELIVERY_ASSIGNMENT_MODE", default="greedy")
+# Open offers/deliveries a rider may hold before the optimal mode stops offering them more
+RIDER_MAX_ACTIVE_DELIVERIES = env.int("RIDER_MAX_ACTIVE_DELIVERIES", default=1)
+
+# Seconds a streamed rider position stays live, and how often it is also saved to the database
+RIDER_LOCATION_TTL = env.int("RIDER_LOCATION_TTL", default=120)
+RIDER_LOCATION_DB_INTERVAL = env.int("RIDER_LOCATION_DB_INTERVAL", default=60)
+# Seconds the location token issued at login lets a rider stream positions
+RIDER_LOCATION_TOKEN_MAX_AGE = env.int("RIDER_LOCATION_TOKEN_MAX_AGE", default=7 * 24 * 3600)
+
+# Route distance cache: coordinates are rounded to this many decimals (4 ~ 11 m) and
+# provider distances are reused for ROUTE_CACHE_TTL seconds
+ROUTE_CACHE_PRECISION = env.int("ROUTE_CACHE_PRECISION", default=4)
+ROUTE_CACHE_TTL = env.int("ROUTE_CACHE_TTL", default=7 * 24 * 60 * 60)
+
+# Geocode backfill: geocoder calls per second, and how failed addresses are retried
+GEOCODE_RATE_LIMIT = env.float("GEOCODE_RATE_LIMIT", default=10)
+GEOCODE_RETRY_AFTER = env.int("GEOCODE_RETRY_AFTER", default=24 * 60 * 60)
+GEOCODE_MAX_ATTEMPTS = env.int("GEOCODE_MAX_ATTEMPTS", default=5)
+
+# Celery: Redis broker, periodic sweeps and jobs. Tests run tasks inline.
+CELERY_BROKER_URL = env.str("CELERY_BROKER_URL", default=REDIS_URL)
+CELERY_RESULT_BACKEND = env.str("CELERY_RESULT_BACKEND", default=REDIS_URL)
+CELERY_RESULT_EXPIRES = 60 * 60
+CELERY_TIMEZONE = TIME_ZONE
+CELERY_TASK_ALWAYS_EAGER = env.bool("CELERY_TASK_ALWAYS_EAGER", default="test" in sys.argv[1:2])
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# Seconds between delivery assignment sweeps
+DELIVERY_ASSIGN_INTERVAL = env.int("DELIVERY_ASSIGN_INTERVAL", default=60)
+# Offers and pickups time out through per-delivery timers; this sweep only catches lost timers
+DELIVERY_RESPONSE_CHECK_INTERVAL = env.int("DELIVERY_RESPONSE_CHECK_INTERVAL", default=15 * 60)
+# Seconds a rider has to answer an offer, and to pick up an accepted delivery
+DELIVERY_OFFER_TIMEOUT = env.int("DELIVERY_OFFER_TIMEOUT", default=10 * 60)
+DELIVERY_PICKUP_TIMEOUT = env.int("DELIVERY_PICKUP_TIMEOUT", default=30 * 60)
+# How long a task lock is held at most; also the hard time limit of the locked tasks
+TASK_LOCK_TIMEOUT = env.int("TASK_LOCK_TIMEOUT", default=10 * 60)
+# Geocoder calls each scheduled backfill run may make
+GEOCODE_BACKFILL_MAX_REQUESTS = env.int("GEOCODE_BACKFILL_MAX_REQUESTS", default=500)
+
+CELERY_BEAT_SCHEDULE = {
+    "assign-deliveries": {
+        "task": "api.tasks.assign_deliveries_task",
+        "schedule": DELIVERY_ASSIGN_INTERVAL,
+        # A sweep still queued when the next one fires is dropped
+        "options": {"expires": DELIVERY_ASSIGN_INTERVAL},
+    },
+    "check-delivery-responses": {
+        "task": "api.tasks.check_delivery_responses_task",
+        "schedule": DELIVERY_RESPONSE_CHECK_INTERVAL,
+        "options": {"expires": DELIVERY_RESPONSE_CHECK_INTERVAL},
+    },
+    "build-landing-cache": {
+        "task": "api.tasks.build_landing_cache_task",
+        # Refresh a little before the cached payload expires
+        "schedule": max(60, LANDING_CACHE_TTL - 60),
+    },
+    "rollup-daily-metrics": {
+        "task": "api.tasks.rollup_daily_metrics_task",
+        "schedule": crontab(hour=0, minute=15),
+    },
+    "geocode-backfill": {
+        "task": "api.tasks.geocode_backfill_task",
+        "schedule": crontab(minute="*/15"),
+        "kwargs": {"max_requests": GEOCODE_BACKFILL_MAX_REQUESTS},
+    },
+    "reconcile-unread-counts": {
+        "task": "api.tasks.reconcile_unread_counts_task",
+        "schedule": crontab(hour=3, minute=30),
+    },
+}
+
+# Image classifier micro-batching: largest batch and how long to wait to fill it
+INFERENCE_MAX_BATCH_SIZE = env.int("INFERENCE_MAX_BATCH_SIZE", default=16)
+INFERENCE_MAX_WAIT_MS = env.int("INFERENCE_MAX_WAIT_MS", default=5)
+
+# Chat write-behind: messages per insert, how long to wait to fill one, how many may queue,
+# and how many seconds a sender waits for room before being asked to resend
+CHAT_WRITE_BATCH_SIZE = env.int("CHAT_WRITE_BATCH_SIZE", default=100)
+CHAT_WRITE_MAX_WAIT_MS = env.int("CHAT_WRITE_MAX_WAIT_MS", default=20)
+CHAT_WRITE_QUEUE_SIZE = env.int("CHAT_WRITE_QUEUE_SIZE", default=1000)
+CHAT_WRITE_ENQUEUE_TIMEOUT = env.float("CHAT_WRITE_ENQUEUE_TIMEOUT", default=2)
+
+# A notification identical (recipient, type, title, message) to one sent this many seconds ago is dropped
+NOTIFICATION_DEDUPE_SECONDS = env.int("NOTIFICATION_DEDUPE_SECONDS", default=60)
+
 CHAT_MESSAGE_HISTORY_DAYS = env.int("CHAT_MESSAGE_HISTORY_DAYS", default=30)
 MAX_UPLOAD_SIZE = env.int("MAX_UPLOAD_SIZE", default=10485760)
 ALLOWED_CHAT_FILE_TYPES = ['.jpg', '.jpeg', '.png', '.gif', '.pdf', '.doc', '.docx', '.txt']
@@ -180,4 +180,6 @@ urlpatterns = [
     path('api/get-registration/', GetRegistration.as_view(), name='get-registration'),
     path('api/predict/', predict_image, name='predict'),
     path('api/classes/', get_classes, name='get_classes'),
+    path('api/predict/metrics/', get_inference_metrics, name='inference_metrics'),
+    path('api/tasks/metrics/', get_task_metrics, name='task_metrics'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file